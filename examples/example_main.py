@@ -97,6 +97,7 @@ def main():
         population_size,
         num_measured_parameters,
         data_dir,
+        wells=None,
     ):
         """
         The measurement function for measuring experimental products.
@@ -124,14 +125,19 @@ def main():
         data_dir : string
             The directory for storing the experimental data.
 
+        wells : np.ndarray, int[population_size, 3]
+            The (well plate index, row, column) of each well in the current
+            iteration.
+
         Returns
         -------
-        np.ndarray, float[population_size, num_measured_parameters]
-            The measured parameter values of the experimental products.
+        MeasurementResult
+            The measured parameter values of the experimental products, float[population_size,
+            num_measured_parameters] (see optobot.measurement).
         """
 
         return get_colours(
-            iteration_count, population_size, num_measured_parameters, data_dir
+            iteration_count, population_size, num_measured_parameters, data_dir, wells
         )
 
     # Define the automated optimisation loop.
@@ -1,23 +1,95 @@
 import datetime
+import functools
+import inspect
 import os
 import string
-import sys
+import time
 
 import numpy as np
 import pandas as pd
 
-from optobot.optimisation import optimisers
+from optobot.convergence import ConvergenceMonitor
+from optobot.labware import DEFAULT_LABWARE, get_plate_geometry, load_labware_definition
+from optobot.layout import WellAllocator
+from optobot.measurement import MeasurementResult
+from optobot.optimisation import initial_designs, optimisers
 from optobot.ot2_protocol import generate_script
 
 """
 image-file storing only worked when run from powershell - fix
-include error threshold to stop run
-fix different nr of population_size
 store and import previous optimisation data (to not have to repeat runs)
 
 """
 
 
+def call_measurement_function(
+    measurement_function,
+    liquid_volumes,
+    iteration_count,
+    num_measured_parameters,
+    data_dir,
+    wells,
+    plate,
+    slots=None,
+):
+    """
+    Calls a measurement function with the standard arguments. The wellplate positions of the wells
+    (an array of (wellplate index, row, column) per well), the plate geometry and the deck slots of the
+    wellplates are only passed to measurement functions that accept "wells", "plate" and "slots" arguments.
+    """
+
+    optional_kwargs = {"wells": wells, "plate": plate, "slots": slots}
+    parameters = inspect.signature(measurement_function).parameters
+    kwargs = {key: value for key, value in optional_kwargs.items() if key in parameters}
+
+    return measurement_function(
+        liquid_volumes,
+        iteration_count,
+        len(liquid_volumes),
+        num_measured_parameters,
+        data_dir,
+        **kwargs,
+    )
+
+
+def split_measurements(result):
+    """
+    Splits the result of a measurement function into the measurements, their uncertainty and the quality of the wells.
+
+    Measurement functions may return the measurements only, or a MeasurementResult (see optobot.measurement) with the
+    uncertainty of the measurements and/or the quality of the wells, e.g. get_colours. The uncertainty and quality are
+    None if not given.
+    """
+
+    if not isinstance(result, MeasurementResult):
+        result = MeasurementResult(result)
+
+    return result.measurements, result.uncertainty, result.quality
+
+
+def propagate_uncertainty(objective_function, measurements, uncertainty):
+    """
+    Estimates the standard deviation of the errors from that of the measurements, for any (vectorised) objective function.
+    Each measured parameter is moved by one standard deviation either way, and the resulting first- and second-order
+    changes of the error are combined as for independent normal measurement noise (exact for a squared error).
+    Measurements without an uncertainty (nan) are taken as exact.
+    """
+
+    uncertainty = np.nan_to_num(np.asarray(uncertainty, dtype=float))
+    error = objective_function(measurements)
+
+    variance = np.zeros(len(measurements))
+    for j in range(measurements.shape[1]):
+        step = np.zeros_like(measurements)
+        step[:, j] = uncertainty[:, j]
+        higher = objective_function(measurements + step)
+        lower = objective_function(measurements - step)
+        slope, curvature = (higher - lower) / 2, (higher + lower) / 2 - error
+        variance += slope**2 + 2 * curvature**2
+
+    return np.sqrt(variance)
+
+
 class OptimisationLoop:
     """
     A class to use the 96 well plate with optimisation algorithms.
@@ -25,12 +97,18 @@ class OptimisationLoop:
     Parameters:
         - objective_function (function):
             Function to calculate the error based the measured values obtained after using certain liquid-volumes in the experiment.
+            If it has a "target" argument, the target measurement is passed to it.
+        - target_measurement (array):
+            The measurement to aim for, or None if the objective function has no target. Several targets can be given as
+            an array of shape (num_targets, num_measured_parameters), to optimise them at once on the same wellplates (the
+            objective function then needs a "target" argument, see optimisers.multi_target).
         - exp_data_dir (string):
             directory to store the experimental data.
         - wellplate_shape (tuple):
-            tuple representing the shape (rows, columns) of the wellplate.
+            tuple representing the shape (rows, columns) of the wellplate. If None, it is taken from the labware.
         - population_size (int):
-            Number of wells used in each (optimization) iteration
+            Number of wells used in each (optimization) iteration. When a BudgetPlanner is passed to optimise,
+            this is only the default, and each iteration may use a different number of wells.
         - measurement_function (bool):
             boolean indicating whether the measured values should be manually added to the "measurements" csv file, or whether instead
             the "measure_colors" function should be called.
@@ -42,6 +120,27 @@ class OptimisationLoop:
             list containing the location of the wellplate(s) that want to be used.
         - total_volume:
             Total liquid volume per well.
+        - labware (string):
+            Opentrons load name of the wellplate (e.g. "corning_384_wellplate_112ul_flat"), or the path to a custom labware
+            definition. It sets the plate geometry used for protocol generation and colour extraction. A custom
+            definition is written into the generated protocols, as the robot does not know it.
+        - robot (OT2Client):
+            Client of the robot's HTTP API. If given, each generated protocol is uploaded and run automatically,
+            instead of waiting for the user to run it from the Opentrons App.
+        - max_repeats (int):
+            How many times the liquid volumes of a well that fails the quality checks (or has no valid measurement)
+            are repeated in the next iterations. Failed wells are never passed to the optimiser.
+        - noise_sigmas (float):
+            If the measurement function returns the uncertainty of the measurements, a measurement also counts as close
+            to the target if it is within this many standard deviations beyond the relative tolerance, so that the loop
+            does not keep chasing measurement noise. 0 (the default) only uses the relative tolerance.
+        - monitor (ConvergenceMonitor):
+            Decides when to stop, from the history of all wells (see optobot.convergence). The optimisation always stops
+            once a measurement is within the tolerance of the target (if there is a target). The monitor can add
+            plateau, expected improvement and budget rules. By default, only the tolerance is checked.
+        - reserved_wells (array):
+            (row, column) of wells on the first wellplate that are never used for experiments, e.g. the reference wells
+            of a colour calibration (calibration.reference_wells).
 
     """
 
@@ -55,9 +154,15 @@ class OptimisationLoop:
         population_size=12,
         name="experiment",
         measurement_function="manual",
-        wellplate_shape=[8, 12],
+        wellplate_shape=None,
         wellplate_locs=[5],
         total_volume=90.0,
+        labware=DEFAULT_LABWARE,
+        robot=None,
+        max_repeats=1,
+        noise_sigmas=0.0,
+        monitor=None,
+        reserved_wells=None,
     ):
 
         self.objective_function = objective_function
@@ -68,89 +173,354 @@ class OptimisationLoop:
         os.makedirs(exp_id, exist_ok=True)
         self.exp_data_dir = exp_id
 
-        self.wellplate_shape = wellplate_shape
+        # The plate geometry (rows, columns, well positions, ...) comes from the Opentrons labware definition
+        self.labware = labware
+        self.plate = get_plate_geometry(labware)
+        # The robot does not know custom labware, so its definition is written into the generated protocols
+        if isinstance(labware, str) and labware.endswith(".json"):
+            self.protocol_labware = load_labware_definition(labware)
+        else:
+            self.protocol_labware = self.plate["load_name"]
+        if wellplate_shape is None:
+            wellplate_shape = (self.plate["rows"], self.plate["columns"])
+        elif tuple(wellplate_shape) != (self.plate["rows"], self.plate["columns"]):
+            raise ValueError(
+                f"wellplate_shape {tuple(wellplate_shape)} does not match the labware '{self.plate['load_name']}' "
+                f"({self.plate['rows']}, {self.plate['columns']})."
+            )
+        self.wellplate_shape = tuple(wellplate_shape)
         self.iteration_count = 0  # Initialize iteration counter
+        self.num_wells_used = 0  # Number of wells filled so far, across all wellplates (rows used in all_data.csv)
+        self.planner = None  # Optional BudgetPlanner, set by optimise
         self.num_liquids = len(liquid_names)
         self.measured_parameter_names = measured_parameter_names
         self.num_measured_parameters = len(measured_parameter_names)
         self.population_size = population_size
         self.liquid_names = liquid_names
         self.measurement_function = measurement_function
+        self.robot = robot
         self.wellplate_locs = wellplate_locs
         self.num_wellplates = len(wellplate_locs)
         self.total_volume = total_volume
         self.blank_row_space = 1  # vertical space between wellplate data in CSV files (if more than one is used)
-        self.target_measurement = np.array(target_measurement)
+        self.target_measurement = (
+            None if target_measurement is None else np.array(target_measurement)
+        )
+
+        # With several targets, each well is scored against every target, and the error of a well is its error for the
+        # closest target that has not converged yet. A target converges once a measurement is within its tolerance.
+        self.num_targets = 1
+        targets = [self.target_measurement]
+        if self.target_measurement is not None and self.target_measurement.ndim == 2:
+            self.num_targets = len(self.target_measurement)
+            targets = list(self.target_measurement)
+        if "target" in inspect.signature(objective_function).parameters:
+            self.objectives = [functools.partial(objective_function, target=target) for target in targets]
+        elif self.num_targets > 1:
+            raise ValueError("With several targets, the objective function needs a 'target' argument.")
+        else:
+            self.objectives = [objective_function]
+        self.target_converged = np.zeros(self.num_targets, dtype=bool)
+        self.last_target_errors = None  # errors of the wells last returned for each target, shape (n_wells, num_targets)
+        self.last_target_error_std = None
         self.relative_tolerance = relative_tolerance
+        self.noise_sigmas = noise_sigmas
+        self.monitor = ConvergenceMonitor() if monitor is None else monitor
+        self.stopped = None  # the ConvergenceReached that ended the optimisation, if any
+        self.last_error_std = None  # uncertainty of the errors last returned (None without measurement uncertainty)
+        self.last_measurements = None  # measurements of the wells last returned (nan for wells that failed)
 
         # Initialize dataframes for storing experimental data
         self.liquid_volume_df, self.measurements_df, self.error_df, self.all_data_df = (
             self.init_dataframes()
         )
 
+        # Decides which wells each batch goes into, and keeps a map of the used wells
+        self.allocator = WellAllocator(
+            self.wellplate_shape,
+            self.num_wellplates,
+            f"{self.exp_data_dir}/well_occupancy.csv",
+            blank_row_space=self.blank_row_space,
+        )
+        self.allocator.save()
+        self.reserved_wells = reserved_wells
+        if reserved_wells is not None:
+            self.allocator.reserve(reserved_wells)
+
+        # Wells that failed the quality checks are repeated in the next iteration. The liquid volumes (without water)
+        # waiting to be repeated, how often each was measured already, and the results of the repeats for the optimiser.
+        self.max_repeats = max_repeats
+        self.requeued = np.empty((0, self.num_liquids - 1))
+        self.requeued_attempts = np.empty(0, dtype=int)
+        self.recovered = []
+        self.quality_df = None
+
     def __call__(self, liquid_volumes):
         """
         Executes one optimization iteration.
         1. Takes the input volumes of each liquid and calculates how much water to use to dilute each set.
         2. generates the opentrons-run script for this iteration,
-        3. Waits for the user to upload this script to the robot,
+        3. Runs this script on the robot (or waits for the user to upload it),
         4. Gathers the measurements (e.g. final colors if dyes are mixed) after the liquids have been combined in each well - either manually or by calling a measurement function,
         5. Computes the errors by calling the objective function that compares these measurements to an ideal, pre-defined measurement.
 
+        The wells of earlier iterations that failed the quality checks are repeated after the wells of this batch. Their
+        results are kept for the optimiser (see pop_recovered), and only the errors of this batch are returned. If the
+        measurements come with an uncertainty, that of the returned errors is left in last_error_std. The errors of the
+        batch for each target (with several targets) are left in last_target_errors, and its measurements in
+        last_measurements.
+
         Parameters:
         - liquid_volumes (ndarray):
             Array containing the volumes of each liquid that will be put in each of the wells of the current iteration.
-            Its shape is (population_size, num_liquids).
+            Its shape is (batch_size, num_liquids), where batch_size is usually the population_size.
 
         Returns:
         - errors (array):
-            Computed errors from the objective function.
+            Computed errors from the objective function (nan for wells that failed the quality checks).
 
         """
 
-        # Adds water so that it fills up to the same volume each time
-        water_vol = self.total_volume - np.sum(liquid_volumes, axis=1)
-        # water will now be the first liquid to be added
-        liquid_volumes = np.hstack([water_vol.reshape(-1, 1), liquid_volumes])
+        start_time = time.monotonic()
+
+        num_new = len(liquid_volumes)
+        repeats, attempts = self.take_requeued(self.allocator.free_wells() - num_new)
+        liquid_volumes = self.add_water(np.vstack([liquid_volumes, repeats]))
+        attempts = np.concatenate([np.zeros(num_new, dtype=int), attempts])
+
+        # choose the next free wells for this batch
+        wells = self.allocator.allocate(len(liquid_volumes), self.iteration_count + 1)
 
         # path where the generated script will be stored
         filepath = f"{self.exp_data_dir}/generated_ot2_script.py"
         generate_script(
             filepath,
-            self.iteration_count,
-            self.population_size,
+            self.allocator.well_names(wells),
             liquid_volumes,
             self.wellplate_locs,
+            self.protocol_labware,
         )
 
-        input("Upload script, wait for robot, and then press any key to continue: ")
+        self.run_protocol(filepath)
 
-        # obtain measurements either manually or automatically (in the case that color-recording wants to be done)
-        if self.measurement_function == "manual":
-            measurements = self.user_input()
-        else:
-            # measurements = self.measure_colors()
-            measurements = self.measurement_function(
-                liquid_volumes,
-                self.iteration_count,
-                self.population_size,
-                self.num_measured_parameters,
-                self.exp_data_dir,
+        measurements, uncertainty, quality = split_measurements(self.measure(wells, liquid_volumes))
+
+        errors = self.record(
+            wells,
+            liquid_volumes,
+            measurements,
+            time.monotonic() - start_time,
+            quality,
+            attempts,
+            uncertainty,
+        )
+
+        # the optimisers of several targets are told the errors of the repeated wells for every target
+        results = [errors, self.last_error_std]
+        if self.num_targets > 1:
+            results = [self.last_target_errors, self.last_target_error_std]
+        if len(repeats) > 0:
+            self.recovered.append(
+                (repeats,) + tuple(None if result is None else result[num_new:] for result in results)
             )
 
-        errors = self.objective_function(measurements)
+        if self.last_error_std is not None:
+            self.last_error_std = self.last_error_std[:num_new]
+            self.last_target_error_std = self.last_target_error_std[:num_new]
+        self.last_target_errors = self.last_target_errors[:num_new]
+        self.last_measurements = self.last_measurements[:num_new]
+
+        return errors[:num_new]
+
+    def wells_left(self):
+        """
+        Returns the number of free wells that are not needed for the wells waiting to be repeated.
+        """
+
+        return self.allocator.free_wells() - len(self.requeued)
+
+    def take_requeued(self, max_wells):
+        """
+        Removes up to max_wells of the wells waiting to be repeated from the queue, and returns their liquid volumes
+        (without water) and how often each was measured already.
+        """
+
+        max_wells = max(0, max_wells)
+        repeats, self.requeued = self.requeued[:max_wells], self.requeued[max_wells:]
+        attempts = self.requeued_attempts[:max_wells]
+        self.requeued_attempts = self.requeued_attempts[max_wells:]
+
+        return repeats, attempts
+
+    def pop_recovered(self):
+        """
+        Returns the (liquid volumes, errors, error uncertainty) of the repeated wells measured since the last call, for the
+        optimiser. The uncertainty is None if the measurements had none. With several targets, the errors and their
+        uncertainty are given for each target, of shape (n_wells, num_targets).
+        """
+
+        recovered, self.recovered = self.recovered, []
+        return recovered
+
+    def run_protocol(self, filepath):
+        """
+        Runs a generated protocol on the robot and waits for it to finish. Without a robot client,
+        waits for the user to upload and run the script.
+        """
+
+        if self.robot is None:
+            input("Upload script, wait for robot, and then press any key to continue: ")
+        else:
+            self.robot.run_protocol(filepath)
+
+    def add_water(self, liquid_volumes):
+        """
+        Adds the volume of water (the dilution agent) as the first liquid, so that each well fills up to the total volume.
+        """
+
+        water_vol = self.total_volume - np.sum(liquid_volumes, axis=1)
+        return np.hstack([water_vol.reshape(-1, 1), liquid_volumes])
+
+    def measure(self, wells, liquid_volumes):
+        """
+        Gathers the measurements of the wells of the current iteration, either manually or by calling the measurement function
+        (in the case that color-recording wants to be done).
+        """
+
+        if self.measurement_function == "manual":
+            return self.user_input(wells)
+
+        return call_measurement_function(
+            self.measurement_function,
+            liquid_volumes,
+            self.iteration_count,
+            self.num_measured_parameters,
+            self.exp_data_dir,
+            np.stack(self.allocator.positions(wells), axis=1),
+            self.plate,
+            self.wellplate_locs,
+        )
+
+    def record(
+        self,
+        wells,
+        liquid_volumes,
+        measurements,
+        elapsed=None,
+        quality=None,
+        attempts=None,
+        uncertainty=None,
+        iteration_number=None,
+    ):
+        """
+        Computes the errors of the measurements of one iteration, stores all its data, checks for convergence
+        and moves on to the next iteration.
+
+        Wells without a valid measurement (nan), or that failed the quality checks, are given a nan error, so that
+        they are not passed to the optimiser, and are queued to be repeated (up to max_repeats times).
+
+        If the uncertainty of the measurements is given, it is propagated to the errors (see propagate_uncertainty), both
+        are stored in "all_data.csv", and the uncertainty of the errors is left in last_error_std for the optimiser.
+
+        The wells are then added to the history of the convergence monitor, which raises ConvergenceReached if a stopping
+        rule is met. The history of the iterations is stored in "convergence.csv".
+
+        Parameters:
+        - wells (ndarray):
+            Global indices of the wells used (see WellAllocator).
+        - liquid_volumes (ndarray):
+            Volumes of each liquid (water first) put in each well.
+        - measurements (ndarray):
+            Measurements of each well, of shape (batch_size, num_measured_parameters).
+        - elapsed (float):
+            Duration of the iteration in seconds, recorded by the planner (if any).
+        - quality (DataFrame):
+            Quality metrics of each well, with a boolean "passed" column (see optobot.measurement), stored in "well_quality.csv".
+        - attempts (ndarray):
+            How often the liquid volumes of each well were measured before (0 for new wells).
+        - uncertainty (ndarray):
+            Standard deviation of each measurement, of the same shape as measurements.
+        - iteration_number (int):
+            The (1-based) iteration the wells were allocated to, stored with their data. If None, the next iteration
+            (iteration_count + 1). The BatchDispatcher passes the number of the batch, as batches can finish out of order.
+
+        Returns:
+        - errors (array):
+            Computed errors from the objective function (nan for wells that failed).
+
+        Raises:
+        - ConvergenceReached:
+            If a stopping rule of the convergence monitor is met.
+        """
+
+        batch_size = len(liquid_volumes)
+        measurements = np.asarray(measurements, dtype=float)
+        if attempts is None:
+            attempts = np.zeros(batch_size, dtype=int)
+        if iteration_number is None:
+            iteration_number = self.iteration_count + 1
+
+        passed = np.all(np.isfinite(measurements), axis=1)
+        if quality is not None:
+            passed &= quality["passed"].to_numpy(dtype=bool)
+
+        # the error of each well for each target, and for the closest of the targets that have not converged
+        target_errors = np.stack([objective(measurements) for objective in self.objectives], axis=1)
+        target_errors = np.where(passed[:, np.newaxis], target_errors, np.nan)
+        active = ~self.target_converged
+        if not active.any():
+            active[:] = True
+        closest = np.argmin(np.where(active, np.nan_to_num(target_errors, nan=np.inf), np.inf), axis=1)
+        errors = target_errors[np.arange(batch_size), closest]
+        self.last_target_errors = target_errors
+        self.last_measurements = np.where(passed[:, np.newaxis], measurements, np.nan)
+
+        self.last_error_std = self.last_target_error_std = None
+        if uncertainty is not None:
+            uncertainty = np.asarray(uncertainty, dtype=float).reshape(measurements.shape)
+            target_std = np.stack(
+                [propagate_uncertainty(objective, measurements, uncertainty) for objective in self.objectives],
+                axis=1,
+            )
+            self.last_target_error_std = np.where(passed[:, np.newaxis], target_std, np.nan)
+            self.last_error_std = self.last_target_error_std[np.arange(batch_size), closest]
 
         # Data storage
-        self.store_data(liquid_volumes, measurements, errors)
+        self.store_data(
+            wells,
+            liquid_volumes,
+            measurements,
+            errors,
+            uncertainty,
+            self.last_error_std,
+            target_errors if self.num_targets > 1 else None,
+            iteration_number,
+        )
+        if quality is not None:
+            self.store_quality(wells, quality, attempts, iteration_number)
+
+        self.requeue(liquid_volumes[~passed, 1:], attempts[~passed])
 
+        if self.planner is not None:
+            self.planner.record(liquid_volumes, elapsed)
 
-        if self.target_measurement is not None: 
-            # Terminate the optimisation loop if the measurements are close enough to the target measurement,
-            # based on the specified relative tolerance
-            self.check_convergence(measurements)
+        close_mask = None
+        if self.target_measurement is not None:
+            # whether each measurement is close enough to the target measurement, based on the specified relative tolerance
+            close_mask = np.zeros(batch_size, dtype=bool)
+            close_mask[passed] = self.check_targets(
+                measurements[passed], None if uncertainty is None else uncertainty[passed]
+            )
 
         # update the iteration count
         self.iteration_count += 1
+        self.num_wells_used += batch_size
+
+        # stop the optimisation loop if a stopping rule is met (the data of this iteration has been stored)
+        try:
+            self.monitor.update(liquid_volumes, errors, close_mask, elapsed)
+        finally:
+            self.save_convergence()
 
         return errors
 
@@ -189,8 +559,11 @@ class OptimisationLoop:
             ["iteration_number"]
             + [f"vol_{liquid_name}" for liquid_name in self.liquid_names]
             + self.measured_parameter_names
-            + ["error"]
+            + [f"{name}_std" for name in self.measured_parameter_names]
+            + ["error", "error_std"]
         )
+        if self.num_targets > 1:
+            all_data_columns += [f"error_target_{k + 1}" for k in range(self.num_targets)]
 
         total_rows = self.num_wellplates * wellplate_nr_rows + (
             self.blank_row_space * (self.num_wellplates - 1)
@@ -230,69 +603,124 @@ class OptimisationLoop:
 
         return liquid_volume_df, measurements_df, errors_df, all_data_df
 
-    def store_data(self, liquid_volumes, measurements, errors):
+    def store_data(
+        self,
+        wells,
+        liquid_volumes,
+        measurements,
+        errors,
+        uncertainty=None,
+        error_std=None,
+        target_errors=None,
+        iteration_number=None,
+    ):
         """
         Stores the data for the current iteration in csv files (which will also hold the data for the subsequent iterations of the experiment.)
+        The uncertainty of the measurements and errors, and the errors for each target (with several targets), are
+        stored in "all_data.csv" only (nan if not measured), labelled with iteration_number (by default the next
+        iteration).
 
         """
-        total_wells = self.wellplate_shape[0] * self.wellplate_shape[1]
-        raw_start_index = self.iteration_count * self.population_size
-        current_well_plate = raw_start_index // total_wells
+        batch_size = len(liquid_volumes)
 
-        # The start and end-indexes will be used on the flattened dataframes (in the case of volumes, errors, and measurement data), to correctly select the section
+        # The well indices will be used on the flattened dataframes (in the case of volumes, errors, and measurement data), to correctly select the wells
         # of the dataframe on which to save this iteration data (the original shape of the dataframes is preserved).
-        # Done this way, as the population_size may not be exactly the size of one row (even though with the default values it is).
-        start_index = (
-            raw_start_index
-            + current_well_plate * self.blank_row_space * self.wellplate_shape[1]
-        )
-        end_index = start_index + self.population_size
+        # Done this way, as the batch may be any size and need not fill whole rows.
+        well_indices = self.allocator.csv_indices(wells)
 
         # store the liquid-volume data into the dataframe for this iteration
-        self.liquid_volume_df.values.reshape(self.liquid_volume_df.size)[
-            start_index * self.num_liquids : end_index * self.num_liquids
-        ] = liquid_volumes.flatten()
+        self.liquid_volume_df.values.reshape(-1, self.num_liquids)[well_indices] = (
+            liquid_volumes
+        )
         self.liquid_volume_df.to_csv(f"{self.exp_data_dir}/liquid_volumes.csv")
 
         # store the error data for this iteration
-        self.error_df.values.reshape(self.error_df.size)[start_index:end_index] = errors
+        self.error_df.values.reshape(self.error_df.size)[well_indices] = errors
         self.error_df.to_csv(f"{self.exp_data_dir}/errors.csv")
 
         # only store the measurement data if it hasn't already been manually inputted into a csv.
         if self.measurement_function != "manual":
-            self.measurements_df.values.reshape(self.measurements_df.size)[
-                start_index
-                * self.num_measured_parameters : end_index
-                * self.num_measured_parameters
-            ] = measurements.flatten()
+            self.measurements_df.values.reshape(-1, self.num_measured_parameters)[
+                well_indices
+            ] = measurements
             self.measurements_df.to_csv(f"{self.exp_data_dir}/measurements.csv")
 
         # store all the data for one iteration together (each row has the data for one well)
-        iteration_idx = np.full((self.population_size, 1), self.iteration_count + 1)
+        if iteration_number is None:
+            iteration_number = self.iteration_count + 1
+        iteration_idx = np.full((batch_size, 1), iteration_number)
+        if uncertainty is None:
+            uncertainty = np.full(measurements.shape, np.nan)
+        if error_std is None:
+            error_std = np.full(batch_size, np.nan)
         all_data = np.concatenate(
-            [iteration_idx, liquid_volumes, measurements, errors[:, np.newaxis]], axis=1
+            [
+                iteration_idx,
+                liquid_volumes,
+                measurements,
+                uncertainty,
+                errors[:, np.newaxis],
+                error_std[:, np.newaxis],
+            ]
+            + ([] if target_errors is None else [target_errors]),
+            axis=1,
         )
-        start = self.iteration_count * self.population_size
-        end = start + self.population_size
+        start = self.num_wells_used
+        end = start + batch_size
         self.all_data_df.iloc[start:end, :] = all_data
         self.all_data_df.to_csv(f"{self.exp_data_dir}/all_data.csv")
 
-    def user_input(self):
+    def store_quality(self, wells, quality, attempts, iteration_number=None):
         """
-        Allows the user to manually input their measurement data into a csv.
+        Appends the quality metrics of the wells of the current iteration to "well_quality.csv", with the iteration
+        (iteration_number, by default the next iteration), the wellplate and well name, and how often the liquid
+        volumes of the well were measured before.
         """
 
-        total_wells = self.wellplate_shape[0] * self.wellplate_shape[1]
-        raw_start_index = self.iteration_count * self.population_size
-        current_well_plate = raw_start_index // total_wells
+        if iteration_number is None:
+            iteration_number = self.iteration_count + 1
+
+        plates, names = zip(*self.allocator.well_names(wells))
+        iteration_df = pd.DataFrame(
+            {
+                "iteration_number": iteration_number,
+                "wellplate": plates,
+                "well": names,
+                "repeat": attempts,
+            }
+        )
+        iteration_df = pd.concat(
+            [iteration_df, quality.reset_index(drop=True)], axis=1
+        )
+
+        self.quality_df = pd.concat([self.quality_df, iteration_df], ignore_index=True)
+        self.quality_df.to_csv(f"{self.exp_data_dir}/well_quality.csv")
+
+    def requeue(self, liquid_volumes, attempts):
+        """
+        Queues the liquid volumes (without water) of failed wells to be repeated in the next iteration, unless they
+        have been repeated max_repeats times already.
+        """
 
-        # get start- and end-indices to index the correct section of a flattened measurements dataframe (the original shape of which is preserved).
-        # Done this way, as the population_size may not be exactly the size of one row (even though with the default values it is).
-        start_index = (
-            raw_start_index
-            + current_well_plate * self.blank_row_space * self.wellplate_shape[1]
+        if len(liquid_volumes) == 0:
+            return
+
+        repeat = attempts < self.max_repeats
+        self.requeued = np.vstack([self.requeued, liquid_volumes[repeat]])
+        self.requeued_attempts = np.concatenate([self.requeued_attempts, attempts[repeat] + 1])
+
+        print(
+            f"{len(liquid_volumes)} well(s) failed the quality checks; "
+            f"{repeat.sum()} will be repeated in the next iteration."
         )
-        end_index = start_index + self.population_size
+
+    def user_input(self, wells):
+        """
+        Allows the user to manually input their measurement data into a csv.
+        """
+
+        # get the well indices to index the correct wells of a flattened measurements dataframe (the original shape of which is preserved).
+        well_indices = self.allocator.csv_indices(wells)
 
         input(
             "Open 'measurements.csv', input the measurements into the corresponding row, and press any key to continue: "
@@ -301,21 +729,58 @@ class OptimisationLoop:
             f"{self.exp_data_dir}/measurements.csv", skiprows=[0], index_col=0
         )
 
-        measurements = measurements_df.values.reshape(self.measurements_df.size)[
-            start_index
-            * self.num_measured_parameters : end_index
-            * self.num_measured_parameters
+        measurements = measurements_df.values.reshape(-1, self.num_measured_parameters)[
+            well_indices
         ]
-        measurements = measurements.reshape(
-            self.population_size, self.num_measured_parameters
-        )
         return measurements
 
-    def check_convergence(self, measurements):
+    def check_targets(self, measurements, uncertainty=None):
+        """
+        Returns whether each measurement counts as close to the target, for the convergence monitor. With several
+        targets, every target that has not converged yet is checked, and the measurements only count as close once
+        all targets have converged.
+        """
+
+        if self.num_targets == 1:
+            return self.check_convergence(measurements, uncertainty)
+
+        close_mask = np.zeros(len(measurements), dtype=bool)
+        for k in np.flatnonzero(~self.target_converged):
+            close = self.check_convergence(
+                measurements, uncertainty, self.target_measurement[k], f"target {k + 1}"
+            )
+            if close.any():
+                self.target_converged[k] = True
+                close_mask |= close
+                print(f"Target {k + 1} has converged ({self.target_converged.sum()} of {self.num_targets}).")
+
+        if not self.target_converged.all():
+            close_mask[:] = False
+
+        return close_mask
+
+    def check_convergence(self, measurements, uncertainty=None, target=None, target_name="the target"):
+        """
+        Returns whether each measurement is close to the target measurement (within the relative tolerance, plus
+        noise_sigmas standard deviations if the uncertainty of the measurements is given), and prints the close ones.
+        With several targets, the target to check is passed (with its name for the printout).
+        """
+
+        if target is None:
+            target = self.target_measurement
+
+        # with the uncertainty of the measurements, a measurement may also be off by noise_sigmas standard deviations
+        # beyond the relative tolerance (a measurement without uncertainty (nan) is taken as exact).
+        atol = 0.0
+        within = f"{self.relative_tolerance*100}%"
+        if uncertainty is not None and self.noise_sigmas > 0:
+            atol = self.noise_sigmas * np.nan_to_num(uncertainty)
+            within += f" plus {self.noise_sigmas} standard deviations"
+
         # close_mask is a boolean array that indicates which of the measurements fall within the
         # specified relative tolerance when compared to the target measurement.
         close_mask = np.isclose(
-            measurements, self.target_measurement, rtol=self.relative_tolerance
+            measurements, target, rtol=self.relative_tolerance, atol=atol
         )  # (12, 3) in the rgb default case
 
         # for example, if we're measuring RGB values, we want to know whether ALL three fall within the tolerance.
@@ -323,11 +788,10 @@ class OptimisationLoop:
         # only has one boolean "closeness" value.
         close_mask = np.all(close_mask, axis=-1)
 
-        # If any measurements fall within the specified tolerance, stop the optimisation loop
         if np.sum(close_mask) > 0:
 
             print(
-                f"\nStopping the optimization - measurements have been found that are close to the target (within {self.relative_tolerance*100}%): "
+                f"\nMeasurements have been found that are close to {target_name} (within {within}): "
             )
 
             well_row_positions = np.where(close_mask)[0]
@@ -340,8 +804,8 @@ class OptimisationLoop:
                 # the additional 1e-8 is in case the target_measurement is 0 - to avoid a zero division error
                 percent_diff = (
                     abs(
-                        (actual - self.target_measurement)
-                        / (self.target_measurement + 1e-8)
+                        (actual - target)
+                        / (target + 1e-8)
                     )
                     * 100
                 )
@@ -350,12 +814,130 @@ class OptimisationLoop:
                     f" - measurement = {actual}, percent differences of each value to the target values= {percent_diff}%"
                 )
 
-            sys.exit("Target measurement tolerance has been met — exiting the program.")
+        return close_mask
+
+    def check_surrogate(self, optimiser):
+        """
+        Checks the expected improvement rule of the convergence monitor, once the optimiser has been told the results
+        of the last iteration. Raises ConvergenceReached if it is met.
+        """
+
+        try:
+            self.monitor.check_expected_improvement(optimiser)
+        finally:
+            self.save_convergence()
+
+    def save_convergence(self):
+        self.monitor.history_df().to_csv(f"{self.exp_data_dir}/convergence.csv", index=False)
+
+    def finish(self, stop):
+        """
+        Ends the optimisation after a stopping rule was met (a ConvergenceReached), and reports the best well so far.
+        """
 
-    def optimise(self, search_space, optimiser, num_iterations=8):
+        self.stopped = stop
+        print(f"\nStopping the optimization - {stop}")
+        if stop.best_liquid_volumes is not None:
+            print(
+                f"Best error so far: {stop.best_error:.4g}, with liquid volumes "
+                f"{dict(zip(self.liquid_names, np.round(stop.best_liquid_volumes, 2)))}"
+            )
+
+    def optimise(
+        self,
+        search_space,
+        optimiser,
+        num_iterations=8,
+        initial_design=None,
+        seed_points=None,
+        planner=None,
+        warm_start=None,
+        prescreen=None,
+        random_state=None,
+    ):
+        """
+        Runs the optimisation loop with the chosen optimiser.
+
+        Parameters:
+        - search_space (list):
+            The search space of the liquid volumes, formatted as [[low, high] for i in num_liquids].
+        - optimiser (string):
+            The optimisation algorithm to use: "PSO", "GP" or "RF".
+        - num_iterations (int):
+            The number of iterations (plate batches) to run.
+        - initial_design (string):
+            The space-filling design used for the first iteration: "random", "sobol", "lhs" or "maximin".
+            If None, the optimiser's own initialisation is used.
+        - seed_points (ndarray):
+            Liquid volumes from earlier experiments to include in the first iteration (see initial_designs.load_seed_points).
+        - planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration from the remaining wells, reagents and time,
+            and num_iterations becomes a maximum. The remaining wells are the free wells of the allocator, less the
+            wells waiting to be repeated.
+        - warm_start (list):
+            Past experiment directories (or directories that contain them) with the same liquids and measured
+            parameters. If given, the "GP" or "RF" surrogate models the measurements rather than the errors, and is
+            pre-trained on the wells of these experiments, so that the objective of this experiment is optimised
+            through it from the first iteration (see optimisers.transfer_learning). Only for a single target.
+        - prescreen (Prescreener):
+            If given, the "GP" or "RF" optimiser chooses each batch from a large pool of candidate points scored with
+            its surrogate model, and only the best diverse points are sent to the robot (see
+            optobot.optimisation.prescreen). Candidates above the total volume of a well are discarded.
+        - random_state (int):
+            Seed of the "GP" or "RF" optimiser, so that the optimisation can be reproduced (the particle swarm and a
+            warm start ignore it). If None, every run differs.
+
+        Returns:
+        - stop (ConvergenceReached):
+            The stopping rule that ended the optimisation before num_iterations (see optobot.convergence), or None.
+        """
+
+        self.planner = planner
+        first_batch_size = self.population_size
+        if planner is not None:
+            planner.set_free_wells(self.wells_left)
+            if planner.max_well_volumes is None:
+                planner.set_volume_limits(search_space, self.total_volume)
+            if optimiser != "PSO":
+                first_batch_size = planner.next_batch_size(0.0)
+
+        if prescreen is not None:
+            if optimiser == "PSO":
+                raise ValueError("Pre-screening needs a surrogate model ('GP' or 'RF').")
+            if prescreen.total_volume is None:
+                prescreen.total_volume = self.total_volume
+
+        initial_points = None
+        if initial_design is not None or seed_points is not None:
+            initial_points = initial_designs.initial_design(
+                search_space,
+                first_batch_size,
+                method=initial_design or "sobol",
+                total_volume=self.total_volume,
+                seed_points=seed_points,
+            )
+
+        if warm_start is not None:
+            if optimiser not in ("GP", "RF") or self.num_targets > 1:
+                raise ValueError("A warm start needs the 'GP' or 'RF' optimiser and a single target.")
+            return optimisers.transfer_learning(
+                self, search_space, optimiser, num_iterations, warm_start, initial_points, planner, prescreen
+            )
+        if self.num_targets > 1:
+            if optimiser not in ("GP", "RF"):
+                raise ValueError("Several targets can only be optimised with 'GP' or 'RF'.")
+            return optimisers.multi_target(
+                self, search_space, optimiser, num_iterations, initial_points, planner, prescreen, random_state
+            )
         if optimiser == "PSO":
-            optimisers.particle_swarm(self, search_space, num_iterations)
+            return optimisers.particle_swarm(
+                self, search_space, num_iterations, initial_points, planner
+            )
         elif optimiser == "GP":
-            optimisers.guassian_process(self, search_space, num_iterations)
+            return optimisers.guassian_process(
+                self, search_space, num_iterations, initial_points, planner, prescreen, random_state
+            )
         elif optimiser == "RF":
-            optimisers.random_forest(self, search_space, num_iterations)
+            return optimisers.random_forest(
+                self, search_space, num_iterations, initial_points, planner, prescreen, random_state
+            )
@@ -0,0 +1,336 @@
+"""
+Contains code for correcting the colours measured by the camera for changes in
+lighting. A colour correction is fitted at the start of a run from reference
+wells (or the patches of a colour card) with known colours, cached on disk, and
+applied to the colours of all wells at once. Each iteration, the reference
+wells can be re-checked to detect drift, and the correction refitted if needed.
+"""
+
+# Import required libraries.
+import os
+
+import numpy as np
+
+# The colour correction models that can be fitted, and the smallest number of
+# reference colours each needs.
+MODELS = {"diagonal": 2, "linear": 3, "affine": 4}
+
+
+class ColourCalibration:
+    """
+    A class for a colour correction transform from camera RGB values to
+    reference RGB values.
+
+    The corrected colours are [r, g, b, 1] @ matrix, where matrix has shape
+    (4, 3). The "affine" model fits all of it, the "linear" model has no
+    offset, and the "diagonal" model scales and offsets each channel
+    separately (a white balance correction).
+
+    Parameters
+    ----------
+    matrix : np.ndarray, shape(4, 3), default = None
+        The correction matrix. If None, the colours are not changed.
+
+    reference_wells : np.ndarray, shape(n_references, 2), default = None
+        The (row, column) of the reference wells on the wellplate, used for
+        checking for drift.
+
+    reference_colours : np.ndarray, shape(n_references, 3), default = None
+        The known RGB colours of the reference wells.
+
+    model : str, default = "affine"
+        The model used when the correction is (re)fitted.
+
+    path : str, default = None
+        The .npz file the calibration is cached in. A correction refitted by
+        "check_drift" is saved to it.
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray = None,
+        reference_wells: np.ndarray = None,
+        reference_colours: np.ndarray = None,
+        model: str = "affine",
+        path: str = None,
+    ):
+
+        if model not in MODELS:
+            raise ValueError(f"model must be one of {list(MODELS)}.")
+
+        if matrix is None:
+            matrix = np.vstack([np.eye(3), np.zeros(3)])
+
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.reference_wells = (
+            None if reference_wells is None else np.asarray(reference_wells, dtype=int)
+        )
+        self.reference_colours = (
+            None if reference_colours is None else np.asarray(reference_colours, dtype=float)
+        )
+        self.model = model
+        self.path = path
+
+    @classmethod
+    def fit(
+        cls,
+        measured: np.ndarray,
+        reference: np.ndarray,
+        model: str = "affine",
+        reference_wells: np.ndarray = None,
+    ) -> "ColourCalibration":
+        """
+        Fits a colour correction by least squares.
+
+        Parameters
+        ----------
+        measured : np.ndarray, shape(n_references, 3)
+            The colours of the references as measured by the camera.
+
+        reference : np.ndarray, shape(n_references, 3)
+            The known colours of the references.
+
+        model : str, default = "affine"
+            "affine", "linear" or "diagonal".
+
+        reference_wells : np.ndarray, shape(n_references, 2), default = None
+            The (row, column) of the reference wells, if the references are wells.
+
+        Returns
+        -------
+        calibration : ColourCalibration
+            The fitted calibration.
+        """
+
+        measured = np.asarray(measured, dtype=float).reshape(-1, 3)
+        reference = np.asarray(reference, dtype=float).reshape(-1, 3)
+
+        if model not in MODELS:
+            raise ValueError(f"model must be one of {list(MODELS)}.")
+        if len(measured) < MODELS[model]:
+            raise ValueError(
+                f'The "{model}" model needs at least {MODELS[model]} reference colours.'
+            )
+
+        matrix = np.zeros((4, 3))
+        if model == "diagonal":
+            for c in range(3):
+                design = np.stack([measured[:, c], np.ones(len(measured))], axis=1)
+                (scale, offset), *_ = np.linalg.lstsq(design, reference[:, c], rcond=None)
+                matrix[c, c] = scale
+                matrix[3, c] = offset
+        elif model == "linear":
+            matrix[:3], *_ = np.linalg.lstsq(measured, reference, rcond=None)
+        else:
+            design = np.hstack([measured, np.ones((len(measured), 1))])
+            matrix, *_ = np.linalg.lstsq(design, reference, rcond=None)
+
+        return cls(matrix, reference_wells, reference, model)
+
+    def apply(self, colours: np.ndarray) -> np.ndarray:
+        """
+        Corrects colours of any shape (..., 3) in one step.
+        """
+
+        colours = np.asarray(colours, dtype=float)
+        return colours @ self.matrix[:3] + self.matrix[3]
+
+    def apply_std(self, std: np.ndarray) -> np.ndarray:
+        """
+        Propagates the standard deviation of colours of any shape (..., 3)
+        through the correction. The offset does not change it, and the errors
+        of the channels are taken to be independent, so the variance of each
+        corrected channel is the variance of the channels weighted by the
+        squares of its column of the matrix.
+        """
+
+        std = np.asarray(std, dtype=float)
+        return np.sqrt(std**2 @ self.matrix[:3] ** 2)
+
+    def error(self, measured: np.ndarray, reference: np.ndarray = None) -> float:
+        """
+        Returns the mean absolute difference (in colour levels) between the
+        corrected measured colours and the reference colours.
+        """
+
+        if reference is None:
+            reference = self.reference_colours
+
+        corrected = self.apply(np.asarray(measured).reshape(-1, 3))
+        return float(np.abs(corrected - np.asarray(reference).reshape(-1, 3)).mean())
+
+    def reference_colours_from(self, rgb_values: np.ndarray, columns: int) -> np.ndarray:
+        """
+        Picks out the colours of the reference wells from the (uncorrected)
+        colours of all wells of a wellplate, in row-major order.
+        """
+
+        flat_wells = self.reference_wells[:, 0] * columns + self.reference_wells[:, 1]
+        return np.asarray(rgb_values).reshape(-1, 3)[flat_wells]
+
+    def check_drift(
+        self, rgb_values: np.ndarray, columns: int, tolerance: float = 5.0, refit: bool = True
+    ) -> float:
+        """
+        Checks the reference wells of a new image for lighting drift. If the
+        corrected reference colours are off by more than tolerance, the
+        correction is refitted to the new image (if refit is True), and saved
+        to the cache file (if it has one).
+
+        Parameters
+        ----------
+        rgb_values : np.ndarray
+            The uncorrected colours of all wells of the wellplate.
+
+        columns : int
+            The number of columns of the wellplate.
+
+        tolerance : float, default = 5.0
+            The largest acceptable mean error of the reference wells, in colour levels.
+
+        refit : bool, default = True
+            Whether to refit the correction when the drift is too large.
+
+        Returns
+        -------
+        drift : float
+            The mean error of the corrected reference colours before any refit.
+        """
+
+        measured = self.reference_colours_from(rgb_values, columns)
+        drift = self.error(measured)
+
+        if drift > tolerance:
+            print(
+                f"Colour drift of {drift:.1f} levels detected in the reference wells"
+                + (", refitting the colour correction." if refit else ".")
+            )
+            if refit:
+                self.matrix = ColourCalibration.fit(
+                    measured, self.reference_colours, self.model
+                ).matrix
+                if self.path is not None:
+                    self.save(self.path)
+
+        return drift
+
+    def save(self, path: str) -> None:
+        """
+        Saves the calibration to a .npz file, which becomes its cache file.
+        """
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {"matrix": self.matrix, "model": np.array(self.model)}
+        if self.reference_wells is not None:
+            arrays["reference_wells"] = self.reference_wells
+        if self.reference_colours is not None:
+            arrays["reference_colours"] = self.reference_colours
+        np.savez(path, **arrays)
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str) -> "ColourCalibration":
+        """
+        Loads a calibration saved with "save".
+        """
+
+        with np.load(path) as data:
+            return cls(
+                data["matrix"],
+                data["reference_wells"] if "reference_wells" in data else None,
+                data["reference_colours"] if "reference_colours" in data else None,
+                str(data["model"]),
+                path,
+            )
+
+
+def calibrate_from_wells(
+    rgb_values: np.ndarray,
+    reference_wells: np.ndarray,
+    reference_colours: np.ndarray,
+    columns: int = 12,
+    model: str = "affine",
+    path: str = None,
+    tolerance: float = 5.0,
+) -> ColourCalibration:
+    """
+    Fits a colour correction from reference wells with known colours (e.g.
+    wells filled with stock dyes, or a colour card placed in the wellplate),
+    and caches it on disk.
+
+    A cached calibration is only reused if it was fitted with the same
+    reference wells, reference colours and model, and still corrects the
+    reference wells of this image to within tolerance. Otherwise it is
+    refitted, and the cache is overwritten.
+
+    Parameters
+    ----------
+    rgb_values : np.ndarray
+        The uncorrected colours of all wells of the wellplate, in row-major
+        order (as extracted from the first image of a run).
+
+    reference_wells : np.ndarray, shape(n_references, 2)
+        The (row, column) of the reference wells.
+
+    reference_colours : np.ndarray, shape(n_references, 3)
+        The known RGB colours of the reference wells, e.g. as measured in the
+        session in which the target measurement was taken.
+
+    columns : int, default = 12
+        The number of columns of the wellplate.
+
+    model : str, default = "affine"
+        "affine", "linear" or "diagonal".
+
+    path : str, default = None
+        The .npz file to cache the calibration in.
+
+    tolerance : float, default = 5.0
+        The largest mean error of the reference wells, in colour levels, for
+        which a cached calibration is reused.
+
+    Returns
+    -------
+    calibration : ColourCalibration
+        The calibration.
+    """
+
+    reference_wells = np.asarray(reference_wells, dtype=int)
+    reference_colours = np.asarray(reference_colours, dtype=float)
+    flat_wells = reference_wells[:, 0] * columns + reference_wells[:, 1]
+    measured = np.asarray(rgb_values).reshape(-1, 3)[flat_wells]
+
+    if path is not None and os.path.exists(path):
+        cached = ColourCalibration.load(path)
+        same_references = (
+            cached.model == model
+            and cached.reference_wells is not None
+            and cached.reference_colours is not None
+            and np.array_equal(cached.reference_wells, reference_wells)
+            and np.allclose(cached.reference_colours, reference_colours)
+        )
+        if same_references and cached.error(measured) <= tolerance:
+            return cached
+
+        print(
+            f"The cached colour calibration in {path} "
+            + (
+                f"is off by {cached.error(measured):.1f} levels in the reference wells"
+                if same_references
+                else "was fitted with other reference wells, colours or model"
+            )
+            + ", refitting it."
+        )
+
+    calibration = ColourCalibration.fit(
+        measured, reference_colours, model, reference_wells
+    )
+    print(
+        f"Colour calibration fitted with a mean error of "
+        f"{calibration.error(measured):.1f} levels."
+    )
+
+    if path is not None:
+        calibration.save(path)
+
+    return calibration
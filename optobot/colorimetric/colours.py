@@ -1,24 +1,259 @@
 import os
 
+import numpy as np
+import pandas as pd
+
+from optobot.colorimetric.image_capture.averaging import well_means, well_pixels, well_stds
+from optobot.colorimetric.image_capture.camera import CameraService
 from optobot.colorimetric.image_capture.photo import take_photo
+from optobot.colorimetric.image_capture.settling import wait_until_settled
 from optobot.colorimetric.image_processing.contours_adapted import well_detection
 from optobot.colorimetric.image_processing.extrapolated_grid import ExtrapolatedGrid
+from optobot.colorimetric.image_processing.fixed_grid import PLATE, get_well_centres
+from optobot.colorimetric.image_processing.localisation import (
+    draw_plates,
+    locate_plates,
+    plate_colours,
+)
+from optobot.colorimetric.image_processing.overlays import draw_wells, save_overlay
+from optobot.colorimetric.image_processing.quality import well_quality
+from optobot.measurement import MeasurementResult
 
 
-def get_colours(iteration_count, population_size, num_measured_parameters, data_dir):
+def get_colours(
+    iteration_count,
+    population_size,
+    num_measured_parameters,
+    data_dir,
+    wells=None,
+    plate=PLATE,
+    camera=1,
+    num_frames=1,
+    settle=False,
+    settle_timeout=600.0,
+    calibration=None,
+    drift_tolerance=5.0,
+    rectifier=None,
+    locator=None,
+    quality=None,
+    uncertainty=False,
+):
     """
     Assuming the webcam is mounted to the top of the robot and ready to go, this function takes a picture of the wellplate,
     extracts the rgb-values of each of the wells (even if not all are filled), and returns the colors of only the wells that are part of this iteration.
 
+    If wells is given (an array of (wellplate index, row, column) per well, as passed by OptimisationLoop), the colours of exactly
+    those wells are returned. Otherwise the wells are assumed to follow on from each other, population_size at a time.
+    plate is the geometry of the well plate (see optobot.labware.get_plate_geometry), 96 wells by default.
+    camera is the port number of the webcam, or a running CameraService (optobot.colorimetric.image_capture.camera)
+    that keeps the camera open, with its exposure locked, between iterations. With a CameraService, num_frames frames
+    are averaged into the photo to reduce sensor noise.
+    If settle is True (with a CameraService), the wells of this iteration are watched on the live feed and the photo is only
+    taken once their colours have stopped changing (or after settle_timeout seconds). Their colour trajectories are saved.
+    The wells are watched at the same centres as their colours are sampled at, so settle needs a rectifier or a locator.
+    If a calibration (optobot.colorimetric.calibration.ColourCalibration) is given, the returned colours are corrected for
+    lighting changes. If it has reference wells, these are first checked for drift, and the correction is refitted if they
+    are off by more than drift_tolerance colour levels.
+    If a rectifier (optobot.colorimetric.image_processing.rectification.Rectifier) is given, the photo is undistorted and
+    warped to a top-down view of the plate, and the colours are sampled at the fixed grid of well centres calculated from the
+    plate geometry, without detecting the wells (and without asking for a threshold).
+    Otherwise, if a locator (optobot.colorimetric.image_processing.localisation.PlateLocator) is given, the plate is found in
+    the photo automatically (once per session, and again only if it has moved), the photo is cropped to the plate's region of
+    interest, and the colours are sampled at the well lattice fitted when the plate was located (or at the fixed grid, if the
+    plate location was loaded from a file), without detecting the wells again (and without asking for a threshold).
+    If quality (optobot.colorimetric.image_processing.quality.QualityThresholds) is given, the quality metrics of the wells
+    (pixel spread, fill contrast, circularity and distance from the lattice) are measured as well, with whether they passed.
+    OptimisationLoop stores these metrics, and repeats the wells that failed instead of passing their colours to the optimiser.
+    If uncertainty is True, the standard error of the colour of each well of this iteration (the standard deviation of the
+    pixel colours around its centre, divided by the square root of their number) is measured as well. With a calibration,
+    it is propagated through the linear part of the correction, as the returned colours are.
+    OptimisationLoop stores it, and the GP optimiser uses it as the noise of each well.
+    For a camera that sees several wellplates at once, see get_multi_plate_colours.
+
+    Returns a MeasurementResult (optobot.measurement) with the colours of the wells of this iteration, and their uncertainty
+    and quality (None unless asked for).
+
+    """
+
+    if settle and rectifier is None and locator is None:
+        raise ValueError("settle needs a rectifier or a locator, to know where the wells are on the live feed.")
+
+    if settle and isinstance(camera, CameraService):
+        # the wells are watched at the same centres as their colours are sampled at
+        frame = camera.latest_frame()
+        if rectifier is not None:
+            positions = get_well_centres(rectifier.rectify(frame), plate)
+        else:
+            locator.update(frame)
+            centres = located_grid(locator)[0]
+            if centres is None:
+                positions = get_well_centres(locator.crop(frame), plate)
+            else:
+                positions = np.round(centres[..., ::-1]).astype(int)
+        wait_for_wells(
+            camera,
+            positions,
+            None if wells is None else wells[:, 1:],
+            data_dir,
+            iteration_count,
+            settle_timeout,
+            rectifier=rectifier,
+            locator=locator,
+        )
+
+    photo, detected_wells_figs_path = capture_photo(
+        camera, data_dir, iteration_count, num_frames, rectifier=rectifier, locator=locator
+    )
+
+    # the (centres, pitch, detected points) of the well grid
+    if rectifier is not None:
+        # the rectified photo is a top-down view of the plate, so the wells are at the fixed grid
+        rgb_values, grid = grid_colours(photo, detected_wells_figs_path, plate)
+    elif locator is not None:
+        # the photo is cropped to the located plate, so the wells are at the lattice fitted when it was located
+        rgb_values, grid = grid_colours(photo, detected_wells_figs_path, plate, *located_grid(locator))
+    else:
+        rgb_values, grid = detect_wells(photo, detected_wells_figs_path, plate)
+
+    flat_wells = iteration_wells(iteration_count, population_size, wells, plate)
+
+    # the photo shows the wellplate of the wells, which only holds the reference wells if it is the first
+    return measurement_result(
+        photo,
+        rgb_values,
+        [grid],
+        flat_wells,
+        num_measured_parameters,
+        plate,
+        calibration,
+        drift_tolerance,
+        quality,
+        uncertainty,
+        plate_indices=None if wells is None else wells[:, 0],
+    )
+
+
+def get_multi_plate_colours(
+    iteration_count,
+    population_size,
+    num_measured_parameters,
+    data_dir,
+    slots,
+    wells=None,
+    plate=PLATE,
+    camera=1,
+    num_frames=1,
+    settle=False,
+    settle_timeout=600.0,
+    calibration=None,
+    drift_tolerance=5.0,
+    quality=None,
+    uncertainty=False,
+):
+    """
+    As get_colours, for a camera that sees the wellplates in all the given deck slots at once (the slots as passed by
+    OptimisationLoop, e.g. wellplate_locs=[5, 8]). Every plate is located and labelled with its slot, and the colours of all
+    their wells are extracted in one pass from the same photo (and saved per slot). The wellplate index of each of the wells
+    is the index of its slot. The reference wells of a calibration are on the plate in the first slot.
+
+    Returns a MeasurementResult (optobot.measurement) with the colours of the wells of this iteration, and their uncertainty
+    and quality (None unless asked for).
+
+    """
+
+    if settle and isinstance(camera, CameraService):
+        # stack the wells of all plates as if they were the rows of one tall plate
+        lattices = locate_plates(camera.latest_frame(), slots, plate)
+        positions = np.concatenate(
+            [lattices[slot].centres[:, :, ::-1] for slot in slots]
+        ).round().astype(int)
+        settle_wells = None
+        if wells is not None:
+            settle_wells = np.stack([wells[:, 0] * plate["rows"] + wells[:, 1], wells[:, 2]], axis=1)
+        wait_for_wells(camera, positions, settle_wells, data_dir, iteration_count, settle_timeout)
+
+    photo, detected_wells_figs_path = capture_photo(camera, data_dir, iteration_count, num_frames)
+
+    rgb_values, lattices = multi_plate_colours(
+        photo, detected_wells_figs_path, iteration_count, data_dir, plate, slots
+    )
+    grids = [(lattice.centres, lattice.pitch, lattice.points) for lattice in lattices.values()]
+
+    # the photo shows all wells of the wellplates (one after the other, in the order of slots)
+    flat_wells = iteration_wells(iteration_count, population_size, wells, plate, len(slots))
+
+    return measurement_result(
+        photo,
+        rgb_values,
+        grids,
+        flat_wells,
+        num_measured_parameters,
+        plate,
+        calibration,
+        drift_tolerance,
+        quality,
+        uncertainty,
+    )
+
+
+def wait_for_wells(
+    camera, positions, wells, data_dir, iteration_count, settle_timeout, rectifier=None, locator=None
+):
     """
+    Watches the wells (as (row, column) in the grid of well positions) on the live feed of a CameraService until their
+    colours have stopped changing (or for settle_timeout seconds), and saves their colour trajectories in data_dir/settling.
+    """
+
+    detector = wait_until_settled(
+        camera,
+        positions,
+        wells,
+        timeout=settle_timeout,
+        rectifier=rectifier,
+        locator=locator,
+    )
+    os.makedirs(f"{data_dir}/settling", exist_ok=True)
+    times, trajectories = detector.trajectory()
+    np.savez(
+        f"{data_dir}/settling/trajectories_iteration_{iteration_count}.npz",
+        times=times,
+        colours=trajectories,
+    )
 
-    # get the start and end-indices to index a flattened color array. When the iteration count exceeds that of only one-wellplate, take the modulus such that the correct index is found.
-    start_index = (iteration_count * population_size) * num_measured_parameters
-    end_index = start_index + population_size * num_measured_parameters
+
+def capture_photo(camera, data_dir, iteration_count, num_frames=1, rectifier=None, locator=None):
+    """
+    Takes the photo of an iteration (see take_photo), saved in data_dir/captured_images.
+
+    Returns the photo (a Frame), and the path (without extension) of the figure of the detected wells.
+    """
 
     os.makedirs(f"{data_dir}/captured_images", exist_ok=True)
     filename = f"{data_dir}/captured_images/image_iteration_{iteration_count}.jpg"
-    take_photo(filename)
+
+    photo = take_photo(
+        filename,
+        camera,
+        num_frames=num_frames,
+        rectifier=rectifier,
+        locator=locator,
+    )
+    if photo is None:
+        raise RuntimeError("Could not capture the photo of the wellplate.")
+
+    os.makedirs(f"{data_dir}/detected_well_figs", exist_ok=True)
+
+    return photo, f"{data_dir}/detected_well_figs/fig_iteration_{iteration_count}"
+
+
+def detect_wells(photo, detected_wells_figs_path, plate):
+    """
+    Detects the wells of the photo with a threshold typed in by the user, until the user is happy with the detection (or
+    falls back to clicking the corner wells, see ExtrapolatedGrid).
+
+    Returns the colours of all wells, shape (n_rows, n_columns, 3), and the (centres, pitch, detected points) of the grid
+    (all None if no grid was fitted).
+    """
 
     # while loop for confirmation
     inp = ""
@@ -27,7 +262,17 @@ def get_colours(iteration_count, population_size, num_measured_parameters, data_
         # Repeats until desired result
         print("Type threshold (Default is 30):")
         threshold = int(input())
-        rgb_values = well_detection(filename, threshold)
+        rgb_values, lattice = well_detection(
+            photo,
+            detected_wells_figs_path,
+            threshold,
+            plate["columns"],
+            plate["rows"],
+            return_lattice=True,
+        )
+        centres, pitch, detected_points = None, None, None
+        if lattice is not None:
+            centres, pitch, detected_points = lattice.centres, lattice.pitch, lattice.points
 
         print("Happy with detection?")
         print(
@@ -37,11 +282,14 @@ def get_colours(iteration_count, population_size, num_measured_parameters, data_
         if user == "y":
             inp = user
         elif user == "b":
-            planB_processor = ExtrapolatedGrid(filename)
+            planB_processor = ExtrapolatedGrid(
+                photo,
+                detected_wells_figs_path,
+                grid_shape=(plate["rows"], plate["columns"]),
+            )
             rgb_values = planB_processor.run()
-            # accounts for overlap for multiple well plates
-            start_index = start_index % (96 * num_measured_parameters)
-            end_index = end_index % (96 * num_measured_parameters)
+            centres, pitch = planB_processor.well_centers, planB_processor.pitch
+            detected_points = None
             inp = "y"
         else:
             inp = ""
@@ -49,9 +297,170 @@ def get_colours(iteration_count, population_size, num_measured_parameters, data_
         # to check the script works without the robot/actual data, uncomment the line below and comment out the 4 lines above.
         # rgb_values = np.random.rand(self.wellplate_shape[0], self.wellplate_shape[1], 3)
 
-        iteration_colours = rgb_values.flatten()[start_index:end_index]
-        iteration_colours = iteration_colours.reshape(
-            population_size, num_measured_parameters
+    return rgb_values, (centres, pitch, detected_points)
+
+
+def measurement_result(
+    photo,
+    rgb_values,
+    grids,
+    flat_wells,
+    num_measured_parameters,
+    plate,
+    calibration=None,
+    drift_tolerance=5.0,
+    quality=None,
+    uncertainty=False,
+    plate_indices=None,
+):
+    """
+    Picks the colours of the wells of this iteration (flat_wells, see iteration_wells) out of the colours of all wells of
+    the photographed wellplates, corrects them with the calibration (if given), and measures their uncertainty and quality
+    (if asked for) at the well grid of each plate (its (centres, pitch, detected points)).
+
+    The reference wells of a calibration are on the first wellplate. If the photo shows a single wellplate, plate_indices
+    is the wellplate index of each well: only the wells on the first plate are checked against the reference wells, and
+    the references are only checked for drift if the first plate is the one photographed. If it is None, the photo shows
+    the first plate (or all plates, with flat_wells counting across them).
+
+    Returns a MeasurementResult (optobot.measurement).
+    """
+
+    if (quality is not None or uncertainty) and grids[0][0] is None:
+        raise RuntimeError("The quality and uncertainty of the wells cannot be measured without a fitted grid.")
+
+    iteration_colours = rgb_values.reshape(-1, num_measured_parameters)[flat_wells]
+
+    if calibration is not None:
+        if calibration.reference_wells is not None:
+            reference = calibration.reference_wells[:, 0] * plate["columns"] + calibration.reference_wells[:, 1]
+            on_first_plate = np.ones(len(flat_wells), dtype=bool)
+            if plate_indices is not None:
+                on_first_plate = np.asarray(plate_indices) == 0
+            if np.isin(flat_wells[on_first_plate], reference).any():
+                raise ValueError(
+                    "Wells of this iteration are reference wells of the colour calibration. Reserve them with "
+                    "reserved_wells=calibration.reference_wells in the OptimisationLoop."
+                )
+            # the reference wells of a calibration are on the first plate
+            if on_first_plate.any():
+                calibration.check_drift(rgb_values[: plate["rows"]], plate["columns"], drift_tolerance)
+        iteration_colours = calibration.apply(iteration_colours)
+
+    standard_error = well_quality_metrics = None
+    if uncertainty:
+        standard_error = np.concatenate(
+            [colour_standard_error(photo.bgr, centres) for centres, _, _ in grids]
+        )[flat_wells]
+        if calibration is not None:
+            # the standard error of the calibrated colours, not of the raw colours of the photo
+            standard_error = calibration.apply_std(standard_error)
+    if quality is not None:
+        metrics = pd.concat(
+            [well_quality(photo.bgr, *grid) for grid in grids], ignore_index=True
         )
+        well_quality_metrics = quality.assess(metrics).iloc[flat_wells].reset_index(drop=True)
+
+    return MeasurementResult(iteration_colours, standard_error, well_quality_metrics)
+
+
+def colour_standard_error(image, centres, radius=3):
+    """
+    Returns the standard error of the mean RGB colour of each well, i.e. the standard deviation of the pixel colours in the
+    square of (2 * radius + 1) ** 2 pixels around each well centre (as (x, y) pixel positions, e.g. of a lattice fit) divided
+    by the square root of the number of pixels, shape (n_wells, 3). This is the uncertainty of the colour that is returned
+    for the well, not the spread of its pixels.
+    """
+
+    positions = np.round(np.asarray(centres, dtype=float).reshape(1, -1, 2)[..., ::-1]).astype(int)
+    pixels, wells = well_pixels(image.shape, positions, radius)
+    stds = well_stds(image, pixels, wells, positions.shape[1])[:, ::-1]
+
+    return stds / np.sqrt((2 * radius + 1) ** 2)
+
+
+def grid_colours(
+    photo, detected_wells_figs_path, plate, centres=None, pitch=None, detected_points=None, radius=3
+):
+    """
+    Extracts the colours of all wells of one wellplate from a photo (a Frame) at known well centres, in one vectorised pass.
+    Without centres, the fixed grid of well centres calculated from the plate geometry is used, for a photo that shows
+    exactly the plate (e.g. rectified to a top-down view). The well centres are marked on the photo, which is saved in the
+    background.
+
+    Returns the colours of all wells, shape (n_rows, n_columns, 3), and the (centres, pitch, detected points) of the grid,
+    with the centres as (x, y) pixel positions (e.g. of a lattice fit, as are the detected points, nan if not detected).
+    """
+
+    if centres is None:
+        positions = get_well_centres(photo.bgr, plate)
+        centres = positions[..., ::-1].astype(float)
+        pitch = plate["column_spacing"] * photo.bgr.shape[1] / plate["width"]
+    else:
+        positions = np.round(np.asarray(centres, dtype=float)[..., ::-1]).astype(int)
+
+    pixels, wells = well_pixels(photo.bgr.shape, positions, radius)
+    colours = well_means(photo.bgr, pixels, wells, plate["rows"] * plate["columns"])[:, ::-1]
+
+    detected = None if detected_points is None else ~np.isnan(detected_points[..., 0])
+    save_overlay(f"{detected_wells_figs_path}.png", draw_wells, photo.bgr, centres, detected)
+
+    return colours.reshape(plate["rows"], plate["columns"], -1), (centres, pitch, detected_points)
+
+
+def located_grid(locator):
+    """
+    Returns the (centres, pitch, detected points) of the well lattice fitted when the plate was located by a PlateLocator,
+    shifted to the plate's region of interest (all None if the plate location was loaded from a file, in which case the
+    fixed grid of the cropped photo is used).
+    """
+
+    if locator.lattice is None:
+        return None, None, None
+
+    origin = np.array(locator.roi[:2], dtype=float)
+    detected_points = None
+    if locator.lattice.points is not None:
+        detected_points = locator.lattice.points - origin
+
+    return locator.lattice.centres - origin, locator.lattice.pitch, detected_points
+
+
+def iteration_wells(iteration_count, population_size, wells, plate, num_plates=1):
+    """
+    Returns the flat indices of the wells of one iteration among all wells of the photographed wellplates (the plates one
+    after the other, each in row-major order).
+
+    If wells is given (an array of (wellplate index, row, column) per well, as passed by OptimisationLoop), these are the
+    indices of exactly those wells. With one wellplate per photo, the wellplate index is ignored. Otherwise the wells are
+    assumed to follow on from each other, population_size at a time, and to wrap around once all wells are used.
+    """
+
+    num_wells = num_plates * plate["rows"] * plate["columns"]
+    if wells is None:
+        return (iteration_count * population_size + np.arange(population_size)) % num_wells
+
+    plate_index = wells[:, 0] if num_plates > 1 else 0
+    return (plate_index * plate["rows"] + wells[:, 1]) * plate["columns"] + wells[:, 2]
+
+
+def multi_plate_colours(photo, detected_wells_figs_path, iteration_count, data_dir, plate, slots):
+    """
+    Extracts the colours of all wells of the wellplates in the given deck slots from a photo (a Frame) that shows them all.
+    The colours are saved per slot in data_dir/plate_colours, and the annotated figure is saved in the background.
+
+    Returns the colours of all wells, shape (n_plates * n_rows, n_columns, 3), with the plates one after the other in the
+    order of slots (as the wellplate indices of the wells), and the fitted lattice of each plate, keyed by its slot.
+    """
+
+    lattices = locate_plates(photo.bgr, slots, plate)
+    colours = plate_colours(photo.bgr, lattices)
+    save_overlay(f"{detected_wells_figs_path}.png", draw_plates, photo.bgr, lattices)
+
+    os.makedirs(f"{data_dir}/plate_colours", exist_ok=True)
+    np.savez(
+        f"{data_dir}/plate_colours/colours_iteration_{iteration_count}.npz",
+        **{f"slot_{slot}": colours[slot] for slot in slots},
+    )
 
-    return iteration_colours
+    return np.concatenate([colours[slot] for slot in slots]), lattices
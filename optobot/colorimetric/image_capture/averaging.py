@@ -0,0 +1,458 @@
+"""
+Contains code for combining several camera frames into one low-noise image,
+accumulating the frames one at a time so that they are never all held in
+memory. The colour of each well is tracked across the frames, so that its
+variance can be reported along with its mean, and the noise floor reached
+with a given number of frames can be measured on a recorded sequence.
+"""
+
+# Import required libraries.
+import os
+
+import cv2 as cv
+import numpy as np
+
+
+def well_pixels(
+    shape: tuple, positions: np.ndarray, radius: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the pixels that belong to each well, using the same square of
+    (2 * radius + 1) ** 2 pixels around each centre as
+    "optobot.colorimetric.image_processing.fixed_grid.get_colours".
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the images (height, width, ...).
+
+    positions : np.ndarray, shape(n_rows, n_columns, 2)
+        The pixel positions (row, column) of the well centres.
+
+    radius : int, default = 0
+        The radius of pixels around each centre.
+
+    Returns
+    -------
+    pixels : np.ndarray
+        The flat indices of the well pixels in an image of the given shape.
+
+    wells : np.ndarray
+        The (flat) index of the well each of these pixels belongs to.
+    """
+
+    height, width = shape[:2]
+    centres = positions.reshape(-1, 2)
+    offsets = np.arange(-radius, radius + 1)
+
+    rows = centres[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+    columns = centres[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+    rows, columns = np.broadcast_arrays(rows, columns)
+
+    rows = np.clip(rows, 0, height - 1).reshape(len(centres), -1)
+    columns = np.clip(columns, 0, width - 1).reshape(len(centres), -1)
+
+    pixels = (rows * width + columns).ravel()
+    wells = np.repeat(np.arange(len(centres)), rows.shape[1])
+
+    return pixels, wells
+
+
+def well_means(
+    image: np.ndarray, pixels: np.ndarray, wells: np.ndarray, num_wells: int
+) -> np.ndarray:
+    """
+    Calculates the mean colour of every well in one vectorised pass.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        The image.
+
+    pixels, wells : np.ndarray
+        The well pixels, as returned by "well_pixels".
+
+    num_wells : int
+        The number of wells.
+
+    Returns
+    -------
+    colours : np.ndarray, shape(num_wells, n_channels)
+        The mean colour of each well.
+    """
+
+    values = image.reshape(len(image) * image.shape[1], -1)[pixels].astype(np.float64)
+    counts = np.bincount(wells, minlength=num_wells)[:, np.newaxis]
+
+    sums = np.stack(
+        [
+            np.bincount(wells, weights=values[:, c], minlength=num_wells)
+            for c in range(values.shape[1])
+        ],
+        axis=1,
+    )
+
+    return sums / counts
+
+
+def well_stds(
+    image: np.ndarray, pixels: np.ndarray, wells: np.ndarray, num_wells: int
+) -> np.ndarray:
+    """
+    Calculates the standard deviation of the pixel values of every well in one
+    vectorised pass (see "well_means").
+
+    Returns
+    -------
+    stds : np.ndarray, shape(num_wells, n_channels)
+        The standard deviation of the pixel values of each well.
+    """
+
+    means = well_means(image, pixels, wells, num_wells)
+    squares = well_means(image.astype(np.float64) ** 2, pixels, wells, num_wells)
+
+    return np.sqrt(np.maximum(squares - means**2, 0))
+
+
+def frame_shift(reference: np.ndarray, frame: np.ndarray) -> tuple[float, float]:
+    """
+    Estimates the (x, y) translation of a frame relative to a reference frame
+    (e.g. from camera vibration), using phase correlation.
+    """
+
+    def grey(image):
+        if image.ndim == 3:
+            image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        return image.astype(np.float32)
+
+    (dx, dy), _ = cv.phaseCorrelate(grey(reference), grey(frame))
+    return dx, dy
+
+
+def weighted_median(stack: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Calculates the per-pixel weighted median of a stack of images, given one
+    weight per image.
+    """
+
+    order = np.argsort(stack, axis=0)
+    sorted_stack = np.take_along_axis(stack, order, axis=0)
+    cumulative = np.cumsum(weights[order], axis=0)
+
+    index = (cumulative < cumulative[-1:] / 2).sum(axis=0, keepdims=True)
+    return np.take_along_axis(sorted_stack, index, axis=0)[0]
+
+
+class FrameAccumulator:
+    """
+    A class to combine frames into one low-noise image, one frame at a time.
+
+    The mean is accumulated as a running sum. The median is approximated with
+    the remedian (Rousseeuw & Bassett, 1990): frames are buffered in groups of
+    remedian_base, each full group is replaced by its median, and the medians
+    are grouped in the same way, so only about remedian_base * log(K) frames
+    are ever held in memory.
+
+    If well positions are given, the mean colour of each well in each frame is
+    also tracked, giving the variance of each well's colour across the frames.
+
+    Parameters
+    ----------
+    method : str, default = "mean"
+        "mean" or "median". The median is more robust to flicker and to
+        objects (e.g. the pipette) briefly passing the camera.
+
+    align : bool, default = False
+        Whether to align every frame to the reference frame before combining
+        them, to undo small camera movements.
+
+    positions : np.ndarray, shape(n_rows, n_columns, 2), default = None
+        The pixel positions of the well centres.
+
+    radius : int, default = 0
+        The radius of pixels around each well centre used for its colour.
+
+    remedian_base : int, default = 5
+        The group size of the remedian.
+
+    reference : np.ndarray, default = None
+        The frame to align to. If None, the first frame added is used.
+    """
+
+    def __init__(
+        self,
+        method: str = "mean",
+        align: bool = False,
+        positions: np.ndarray = None,
+        radius: int = 0,
+        remedian_base: int = 5,
+        reference: np.ndarray = None,
+    ):
+
+        if method not in ("mean", "median"):
+            raise ValueError('method must be either "mean" or "median".')
+
+        self.method = method
+        self.align = align
+        self.positions = positions
+        self.radius = radius
+        self.remedian_base = remedian_base
+
+        self.count = 0
+        self.reference = reference
+        self.shifts = []
+        self.total = None
+        self.levels = []
+
+        # running mean and sum of squared deviations of the well colours (Welford's algorithm)
+        self.pixels = None
+        self.well_mean = None
+        self.well_m2 = None
+
+    def add(self, frame: np.ndarray) -> None:
+        """
+        Adds a frame.
+        """
+
+        if self.reference is None:
+            self.reference = frame
+        elif self.align:
+            dx, dy = frame_shift(self.reference, frame)
+            self.shifts.append((dx, dy))
+            shift = np.float32([[1, 0, -dx], [0, 1, -dy]])
+            frame = cv.warpAffine(
+                frame,
+                shift,
+                (frame.shape[1], frame.shape[0]),
+                flags=cv.INTER_LINEAR,
+                borderMode=cv.BORDER_REPLICATE,
+            )
+
+        self.count += 1
+
+        if self.method == "mean":
+            if self.total is None:
+                self.total = np.zeros(frame.shape, dtype=np.float64)
+            self.total += frame
+        else:
+            self._add_to_remedian(frame.astype(np.float32), 0)
+
+        if self.positions is not None:
+            self._add_well_colours(frame)
+
+    def _add_to_remedian(self, frame, level):
+        if level == len(self.levels):
+            self.levels.append([])
+
+        buffer = self.levels[level]
+        buffer.append(frame)
+        if len(buffer) == self.remedian_base:
+            median = np.median(np.stack(buffer), axis=0)
+            buffer.clear()
+            self._add_to_remedian(median, level + 1)
+
+    def _add_well_colours(self, frame):
+        num_wells = self.positions.shape[0] * self.positions.shape[1]
+        if self.pixels is None:
+            self.pixels = well_pixels(frame.shape, self.positions, self.radius)
+            channels = frame.shape[2] if frame.ndim == 3 else 1
+            self.well_mean = np.zeros((num_wells, channels))
+            self.well_m2 = np.zeros((num_wells, channels))
+
+        colours = well_means(frame, *self.pixels, num_wells)
+        delta = colours - self.well_mean
+        self.well_mean += delta / self.count
+        self.well_m2 += delta * (colours - self.well_mean)
+
+    def result(self) -> np.ndarray:
+        """
+        Returns the combined image of the frames added so far.
+        """
+
+        if self.count == 0:
+            raise ValueError("No frames have been added.")
+
+        if self.method == "mean":
+            combined = self.total / self.count
+        else:
+            # weighted median of everything still buffered, each item standing for remedian_base ** level frames
+            stack = [item for buffer in self.levels for item in buffer]
+            weights = [
+                self.remedian_base**level
+                for level, buffer in enumerate(self.levels)
+                for _ in buffer
+            ]
+            combined = weighted_median(np.stack(stack), np.array(weights, dtype=float))
+
+        return np.clip(np.round(combined), 0, 255).astype(self.reference.dtype)
+
+    def well_colours(self) -> np.ndarray:
+        """
+        Returns the mean colour of each well across the frames, shape (n_rows, n_columns, n_channels).
+        """
+
+        return self.well_mean.reshape(self.positions.shape[:2] + (-1,))
+
+    def well_variance(self) -> np.ndarray:
+        """
+        Returns the variance of each well's colour across the frames, shape (n_rows, n_columns, n_channels).
+        The variance of the mean colour is this divided by the number of frames.
+        """
+
+        variance = self.well_m2 / max(self.count - 1, 1)
+        return variance.reshape(self.positions.shape[:2] + (-1,))
+
+
+def capture_averaged(
+    camera,
+    num_frames: int = 8,
+    method: str = "mean",
+    align: bool = False,
+    positions: np.ndarray = None,
+    radius: int = 0,
+) -> FrameAccumulator:
+    """
+    Combines the next num_frames frames of a running CameraService.
+
+    Returns
+    -------
+    accumulator : FrameAccumulator
+        The accumulator, with the combined image ("result") and, if positions
+        were given, the mean and variance of each well's colour.
+    """
+
+    accumulator = FrameAccumulator(method, align, positions, radius)
+    for _ in range(num_frames):
+        accumulator.add(camera.next_frame())
+
+    return accumulator
+
+
+def record_sequence(camera, directory: str, num_frames: int) -> str:
+    """
+    Records the next num_frames frames of a running CameraService as lossless
+    PNG images, for measuring the noise floor later.
+
+    Returns
+    -------
+    pattern : str
+        The file pattern of the frames, which can be passed to "read_frames".
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    pattern = f"{directory}/frame_%05d.png"
+    for i in range(num_frames):
+        cv.imwrite(pattern % i, camera.next_frame())
+
+    return pattern
+
+
+def read_frames(source):
+    """
+    Yields the frames of a recorded sequence: a video file, an image file
+    pattern (e.g. "frames/frame_%05d.png"), or a list of frames.
+    """
+
+    if not isinstance(source, str):
+        yield from source
+        return
+
+    video = cv.VideoCapture(source)
+    try:
+        while True:
+            check, frame = video.read()
+            if not check:
+                return
+            yield frame
+    finally:
+        video.release()
+
+
+def noise_floor(
+    source,
+    num_frames: list[int],
+    positions: np.ndarray,
+    radius: int = 0,
+    method: str = "mean",
+    align: bool = False,
+) -> dict:
+    """
+    Measures how much the well colours vary between repeated captures, when
+    each capture combines K frames, for each K in num_frames.
+
+    The recorded sequence is split into consecutive groups of K frames, each
+    group is combined into one image (rounded to the colour levels of the
+    frames, as a capture would be), and the standard deviation of the well
+    colours between the groups is averaged over all wells and channels. When
+    aligning, every group is aligned to the first frame of the sequence, so
+    that the groups are compared at the same position.
+
+    Parameters
+    ----------
+    source : str or list
+        The recorded sequence (see "read_frames").
+
+    num_frames : list[int]
+        The values of K to measure.
+
+    positions : np.ndarray, shape(n_rows, n_columns, 2)
+        The pixel positions of the well centres.
+
+    radius : int, default = 0
+        The radius of pixels around each well centre used for its colour.
+
+    method : str, default = "mean"
+        "mean" or "median".
+
+    align : bool, default = False
+        Whether to align the frames to the first frame of the sequence.
+
+    Returns
+    -------
+    noise : dict
+        The noise floor (in colour levels) for each K.
+    """
+
+    noise = {}
+    num_wells = positions.shape[0] * positions.shape[1]
+
+    for k in num_frames:
+        group_colours = []
+        pixels = None
+        accumulator = None
+
+        group_total = 0
+        count = 0
+
+        for frame in read_frames(source):
+            if pixels is None:
+                pixels, wells = well_pixels(frame.shape, positions, radius)
+                reference = frame
+
+            if method == "mean" and not align:
+                # only the well pixels of the mean image are needed, rounded as in FrameAccumulator.result
+                values = frame.reshape(frame.shape[0] * frame.shape[1], -1)[pixels]
+                group_total = group_total + values.astype(np.float64)
+                count += 1
+                if count == k:
+                    combined = np.clip(np.round(group_total / k), 0, 255)
+                    group_colours.append(
+                        well_means(combined[:, np.newaxis], np.arange(len(pixels)), wells, num_wells)
+                    )
+                    group_total = 0
+                    count = 0
+                continue
+
+            if accumulator is None:
+                accumulator = FrameAccumulator(method, align, reference=reference)
+            accumulator.add(frame)
+            if accumulator.count == k:
+                group_colours.append(well_means(accumulator.result(), pixels, wells, num_wells))
+                accumulator = None
+
+        if len(group_colours) < 2:
+            raise ValueError(f"The sequence is too short to measure K = {k}.")
+
+        noise[k] = float(np.std(group_colours, axis=0, ddof=1).mean())
+
+    return noise
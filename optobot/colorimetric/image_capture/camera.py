@@ -0,0 +1,276 @@
+"""
+Contains a camera service that keeps the webcam open between photos, reading
+frames on a background thread with its exposure and white balance locked, so
+that photos are taken without the camera's start-up time and badly exposed
+first frames. A fake video source stands in for the webcam in tests.
+"""
+
+# Import required libraries.
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.image_capture.averaging import FrameAccumulator
+
+
+class FakeVideoSource:
+    """
+    A stand-in for cv2.VideoCapture, for testing image capture without a webcam.
+
+    Frames are copies of a base image with Gaussian sensor noise. The first warmup_frames frames are too dark,
+    as when a real camera's auto-exposure is still settling, and while auto exposure is on, the brightness of
+    every frame flickers slightly. Optionally, the camera also shakes a little (jitter).
+    """
+
+    def __init__(
+        self,
+        image,
+        noise=4.0,
+        warmup_frames=10,
+        flicker=0.03,
+        fps=30.0,
+        jitter=0.0,
+        seed=None,
+    ):
+        """
+        Args:
+            image (str, np.ndarray or function): Path to an image, or the (BGR) image itself, that the fake camera sees.
+                Can also be a function returning the image at a given time (in seconds since the source was created),
+                to simulate a changing scene.
+            noise (float): Standard deviation of the per-pixel sensor noise.
+            warmup_frames (int): Number of badly exposed frames at the start.
+            flicker (float): Relative standard deviation of the frame brightness while auto exposure is on.
+            fps (float): Frame rate. read() blocks to keep to it.
+            jitter (float): Standard deviation of the random shift of each frame, in pixels.
+            seed (int): Seed of the random noise.
+        """
+        self.scene = image if callable(image) else None
+        if self.scene is not None:
+            image = self.scene(0.0)
+        self.image = cv2.imread(image) if isinstance(image, str) else image
+        if self.image is None:
+            raise ValueError(f"Could not read image {image}.")
+        self.image = self.image.astype(np.float32)
+        self.start_time = time.monotonic()
+        self.noise = noise
+        self.warmup_frames = warmup_frames
+        self.flicker = flicker
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+        self.frame_count = 0
+        self.opened = True
+        self.last_read = 0.0
+        self.properties = {
+            cv2.CAP_PROP_AUTO_EXPOSURE: 0.75,
+            cv2.CAP_PROP_EXPOSURE: -6.0,
+            cv2.CAP_PROP_AUTO_WB: 1.0,
+            cv2.CAP_PROP_WB_TEMPERATURE: 4600.0,
+        }
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        return self.properties.get(prop, 0.0)
+
+    def set(self, prop, value):
+        self.properties[prop] = float(value)
+        return True
+
+    def read(self):
+        if not self.opened:
+            return False, None
+
+        wait = self.last_read + self.frame_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_read = time.monotonic()
+
+        gain = 1.0
+        if self.frame_count < self.warmup_frames:
+            gain = 0.3 + 0.7 * self.frame_count / self.warmup_frames
+        if self.properties[cv2.CAP_PROP_AUTO_EXPOSURE] != 0.25:
+            gain *= 1.0 + self.rng.normal(0.0, self.flicker)
+        self.frame_count += 1
+
+        image = self.image
+        if self.scene is not None:
+            image = self.scene(time.monotonic() - self.start_time).astype(np.float32)
+        if self.jitter:
+            dx, dy = self.rng.normal(0.0, self.jitter, 2)
+            image = cv2.warpAffine(
+                image,
+                np.float32([[1, 0, dx], [0, 1, dy]]),
+                (image.shape[1], image.shape[0]),
+                borderMode=cv2.BORDER_REPLICATE,
+            )
+
+        frame = image * gain + self.rng.normal(0.0, self.noise, image.shape)
+        return True, np.clip(frame, 0, 255).astype(np.uint8)
+
+    def release(self):
+        self.opened = False
+
+
+class CameraService:
+    """
+    Keeps a camera open and reads frames from it continuously on a background thread, so that photos can be taken
+    without paying the camera's start-up time, and without the badly exposed first frames.
+
+    Can be used as a context manager:
+
+        with CameraService(camera=1) as camera:
+            camera.calibrate()
+            frame = camera.latest_frame()
+    """
+
+    def __init__(self, camera=1, source=None, warmup_frames=30, resolution=None):
+        """
+        Args:
+            camera (int): Port number of the webcam.
+            source: An already opened video source (e.g. a FakeVideoSource), used instead of the webcam.
+            warmup_frames (int): Number of frames discarded after the camera is opened.
+            resolution (tuple): (width, height) to request from the camera. If None, the camera's default is used.
+        """
+        self.camera = camera
+        self.source = source
+        self.warmup_frames = warmup_frames
+        self.resolution = resolution
+        self.settings = None
+
+        self.frame = None
+        self.frame_count = 0
+        self.condition = threading.Condition()
+        self.source_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """
+        Opens the camera and starts reading frames. Blocks until the warm-up frames have been discarded.
+        """
+        if self.running:
+            return self
+
+        if self.source is None:
+            self.source = cv2.VideoCapture(self.camera)
+        if not self.source.isOpened():
+            raise RuntimeError(f"Could not open camera {self.camera}.")
+
+        if self.resolution is not None:
+            self.source.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            self.source.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+
+        for _ in range(self.warmup_frames):
+            self.source.read()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._read_frames, daemon=True)
+        self.thread.start()
+        self.latest_frame()
+
+        return self
+
+    def _read_frames(self):
+        while self.running:
+            with self.source_lock:
+                check, frame = self.source.read()
+
+            if not check:
+                time.sleep(0.01)
+                continue
+
+            with self.condition:
+                self.frame = frame
+                self.frame_count += 1
+                self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops reading frames and releases the camera.
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.source is not None:
+            self.source.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def calibrate(self, settings=None, settle_time=2.0):
+        """
+        Locks the exposure and white balance, so that they do not change between photos.
+
+        Args:
+            settings (dict): Exposure and white balance to use, as returned by a previous calibration
+                (e.g. to use the same settings in a later session). If None, the camera's automatic
+                settings are used for settle_time seconds and then locked at their current values.
+            settle_time (float): Time in seconds to let the automatic exposure and white balance settle.
+
+        Returns:
+            dict: The locked settings, with keys "exposure" and "wb_temperature".
+        """
+        if settings is None:
+            with self.source_lock:
+                self.source.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.75)
+                self.source.set(cv2.CAP_PROP_AUTO_WB, 1)
+            time.sleep(settle_time)
+            with self.source_lock:
+                settings = {
+                    "exposure": self.source.get(cv2.CAP_PROP_EXPOSURE),
+                    "wb_temperature": self.source.get(cv2.CAP_PROP_WB_TEMPERATURE),
+                }
+
+        with self.source_lock:
+            # 0.25 selects manual exposure for V4L2 cameras
+            self.source.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)
+            self.source.set(cv2.CAP_PROP_EXPOSURE, settings["exposure"])
+            self.source.set(cv2.CAP_PROP_AUTO_WB, 0)
+            self.source.set(cv2.CAP_PROP_WB_TEMPERATURE, settings["wb_temperature"])
+
+        self.settings = settings
+        return settings
+
+    def latest_frame(self, timeout=5.0):
+        """
+        Returns a copy of the most recent frame.
+        """
+        with self.condition:
+            if self.frame is None and not self.condition.wait_for(
+                lambda: self.frame is not None, timeout
+            ):
+                raise TimeoutError("No frame received from the camera.")
+            return self.frame.copy()
+
+    def next_frame(self, timeout=5.0):
+        """
+        Waits for a frame newer than the current one and returns it, so that consecutive calls never return the same frame.
+        """
+        with self.condition:
+            count = self.frame_count
+            if not self.condition.wait_for(lambda: self.frame_count > count, timeout):
+                raise TimeoutError("No new frame received from the camera.")
+            return self.frame.copy()
+
+    def averaged_frame(self, num_frames=10, method="mean", align=False, timeout=5.0, roi=None):
+        """
+        Combines the next num_frames frames into one image, which has less sensor noise than a single frame.
+        method is "mean" or "median", and align aligns the frames to the first one (see FrameAccumulator).
+        If roi (x0, y0, x1, y1) is given, only that region of the frames is combined.
+        """
+        accumulator = FrameAccumulator(method, align)
+        for _ in range(num_frames):
+            frame = self.next_frame(timeout)
+            if roi is not None:
+                frame = frame[roi[1] : roi[3], roi[0] : roi[2]]
+            accumulator.add(frame)
+
+        return accumulator.result()
@@ -0,0 +1,87 @@
+"""
+Contains code for sharing one decoded photo between the steps of a
+measurement (well detection, colour sampling and annotation), so that the
+photo is decoded once, and its colour conversions are computed once.
+"""
+
+# Import required libraries.
+import cv2 as cv
+import numpy as np
+
+
+class Frame:
+    """
+    A photo, decoded once and shared between the steps of a measurement.
+
+    The image is read-only, so that no step can change it for the others;
+    steps that need to draw on it or modify it must copy it first.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        The (BGR) image, as captured by OpenCV.
+
+    path : str, default = None
+        The file the image was saved to or read from.
+    """
+
+    def __init__(self, image: np.ndarray, path: str = None):
+
+        # a read-only view, which leaves the caller's array writeable
+        self.bgr = image.view()
+        self.bgr.flags.writeable = False
+        self.path = path
+
+        self._rgb = None
+        self._grey = None
+
+    @classmethod
+    def read(cls, path: str) -> "Frame":
+        """
+        Decodes an image file.
+        """
+
+        image = cv.imread(path)
+        if image is None:
+            raise FileNotFoundError(f"Could not read image {path}.")
+
+        return cls(image, path)
+
+    @property
+    def shape(self) -> tuple:
+        return self.bgr.shape
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """
+        The image in RGB order (converted on first use).
+        """
+
+        if self._rgb is None:
+            self._rgb = cv.cvtColor(self.bgr, cv.COLOR_BGR2RGB)
+            self._rgb.flags.writeable = False
+        return self._rgb
+
+    @property
+    def grey(self) -> np.ndarray:
+        """
+        The image in grayscale (converted on first use).
+        """
+
+        if self._grey is None:
+            self._grey = cv.cvtColor(self.bgr, cv.COLOR_BGR2GRAY)
+            self._grey.flags.writeable = False
+        return self._grey
+
+
+def as_frame(image) -> Frame:
+    """
+    Returns a Frame for a Frame, an image file path, or a (BGR) image array.
+    """
+
+    if isinstance(image, Frame):
+        return image
+    if isinstance(image, str):
+        return Frame.read(image)
+
+    return Frame(np.asarray(image))
@@ -1,25 +1,62 @@
 import cv2
 import numpy as np
 
+from optobot.colorimetric.image_capture.camera import CameraService
+from optobot.colorimetric.image_capture.frame import Frame
 
-def take_photo(file="image.jpg", camera=1, crop_coords_file=None):
+
+def take_photo(
+    file="image.jpg",
+    camera=1,
+    crop_coords_file=None,
+    num_frames=1,
+    rectifier=None,
+    locator=None,
+):
     """
     Function to take photo from computer webcam.
     Saves image to the same directory as the instance of python.
 
     Args:
-        camera (int): port number of webcam. default is 0
+        camera (int or CameraService): port number of webcam, or a running CameraService, which keeps the
+            camera open between photos. default is 1
         file (string): filename of saved image
+        num_frames (int): number of frames averaged into the photo (only with a CameraService)
+        rectifier (Rectifier): if given, the photo is undistorted and rectified to a top-down view of the plate
+            (see optobot.colorimetric.image_processing.rectification), and crop_coords_file is not needed
+        locator (PlateLocator): if given (and no rectifier), the plate is located automatically, or checked not
+            to have moved, and the photo is cropped to it
+            (see optobot.colorimetric.image_processing.localisation), and crop_coords_file is not needed
+
+    Returns:
+        Frame: the photo, so that it does not have to be decoded from the file again
+            (see optobot.colorimetric.image_capture.frame), or None if it could not be captured
     """
-    webcam = cv2.VideoCapture(camera)
-    check, frame = webcam.read()
-    webcam.release()
+    averaged_roi = None
+    if isinstance(camera, CameraService):
+        if num_frames > 1:
+            if locator is not None and rectifier is None:
+                # locate the plate first, so that only the plate is averaged
+                averaged_roi = locator.update(camera.latest_frame())
+            frame = camera.averaged_frame(num_frames, roi=averaged_roi)
+        else:
+            frame = camera.latest_frame()
+    else:
+        webcam = cv2.VideoCapture(camera)
+        check, frame = webcam.read()
+        webcam.release()
 
-    if not check:
-        print("Error: Could not capture image.")
-        return
+        if not check:
+            print("Error: Could not capture image.")
+            return
 
-    if crop_coords_file is not None:
+    if rectifier is not None:
+        frame = rectifier.rectify(frame)
+    elif locator is not None:
+        if averaged_roi is None:
+            locator.update(frame)
+            frame = locator.crop(frame)
+    elif crop_coords_file is not None:
         # extract cropped co-ordinates and apply to image taken
         cropped_region = np.load(crop_coords_file)
         start_x, start_y, end_x, end_y = cropped_region
@@ -27,3 +64,5 @@ def take_photo(file="image.jpg", camera=1, crop_coords_file=None):
         frame = cropped_frame
 
     cv2.imwrite(filename=file, img=frame)
+
+    return Frame(frame, file)
@@ -1,9 +1,13 @@
 import cv2
 import numpy as np
 
+from optobot.colorimetric.image_capture.camera import CameraService
+
 
 def select_crop_region():
-    """can manually select a region of interest and retake"""
+    """can manually select a region of interest and retake.
+    The plate can instead be found automatically with
+    optobot.colorimetric.image_processing.localisation.PlateLocator"""
 
     global start_x, start_y, end_x, end_y, cropping, crop_selected, frame
 
@@ -76,18 +80,22 @@ def select_crop_region():
                 crop_selected = False
 
 
-def take_photo(cropped_region):
-    """Captures a cropped photo using the stored coordinates."""
+def take_photo(cropped_region, camera=1):
+    """Captures a cropped photo using the stored coordinates.
+    camera is the port number of the webcam, or a running CameraService."""
 
-    # open webcam
-    webcam = cv2.VideoCapture(1)
-    ret, frame = webcam.read()
-    # close after capture
-    webcam.release()
+    if isinstance(camera, CameraService):
+        frame = camera.latest_frame()
+    else:
+        # open webcam
+        webcam = cv2.VideoCapture(camera)
+        ret, frame = webcam.read()
+        # close after capture
+        webcam.release()
 
-    if not ret:
-        print("Error: Could not capture image.")
-        return
+        if not ret:
+            print("Error: Could not capture image.")
+            return
     # frame = cv2.imread("dye_example.jpg")
 
     # extract cropped co-ordinates and apply to image taken
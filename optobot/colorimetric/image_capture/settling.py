@@ -0,0 +1,192 @@
+"""
+Contains code for waiting until the colours of the wells have stopped changing
+(e.g. while dyes are still diffusing after mixing), by sampling the wells of
+the current iteration from the live camera feed, instead of waiting a fixed
+time before taking the photo.
+"""
+
+# Import required libraries.
+import time
+from collections import deque
+
+import numpy as np
+
+from optobot.colorimetric.image_capture.averaging import well_means, well_pixels
+
+
+class SettlingDetector:
+    """
+    A class to track the colour trajectories of wells and decide when they
+    have settled.
+
+    A well has settled when its colour has stayed within tolerance (in every
+    channel) over the last window seconds.
+
+    Parameters
+    ----------
+    positions : np.ndarray, shape(n_rows, n_columns, 2)
+        The pixel positions of the well centres.
+
+    wells : np.ndarray, shape(n_wells, 2), default = None
+        The (row, column) of the wells to track, e.g. the wells of the current
+        iteration. If None, all wells are tracked.
+
+    radius : int, default = 3
+        The radius of pixels around each well centre used for its colour.
+
+    tolerance : float, default = 2.0
+        The largest change in colour (in colour levels) that still counts as
+        settled.
+
+    window : float, default = 10.0
+        The time in seconds over which the colours must stay within tolerance.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        wells: np.ndarray = None,
+        radius: int = 3,
+        tolerance: float = 2.0,
+        window: float = 10.0,
+    ):
+
+        if wells is not None:
+            wells = np.asarray(wells)
+            positions = positions[wells[:, 0], wells[:, 1]][np.newaxis]
+
+        self.positions = positions.reshape(1, -1, 2)
+        self.num_wells = self.positions.shape[1]
+        self.radius = radius
+        self.tolerance = tolerance
+        self.window = window
+
+        self.pixels = None
+        self.times = []
+        self.trajectories = []
+        self.recent = deque()
+
+    def update(self, frame: np.ndarray, timestamp: float) -> bool:
+        """
+        Adds a frame to the colour trajectories.
+
+        Returns
+        -------
+        settled : bool
+            Whether every tracked well has settled.
+        """
+
+        if self.pixels is None:
+            self.pixels = well_pixels(frame.shape, self.positions, self.radius)
+
+        colours = well_means(frame, *self.pixels, self.num_wells)
+        self.times.append(timestamp)
+        self.trajectories.append(colours)
+
+        # keep the samples of the last window seconds, and the one just before them
+        self.recent.append((timestamp, colours))
+        while len(self.recent) > 1 and timestamp - self.recent[1][0] >= self.window:
+            self.recent.popleft()
+
+        return self.settled()
+
+    def unsettled_wells(self) -> np.ndarray:
+        """
+        Returns a boolean array marking the tracked wells that have not settled yet.
+        """
+
+        if not self.recent or self.recent[-1][0] - self.recent[0][0] < self.window:
+            return np.ones(self.num_wells, dtype=bool)
+
+        recent = np.stack([colours for _, colours in self.recent])
+        spread = recent.max(axis=0) - recent.min(axis=0)
+
+        return (spread > self.tolerance).any(axis=1)
+
+    def settled(self) -> bool:
+        return not self.unsettled_wells().any()
+
+    def colours(self) -> np.ndarray:
+        """
+        Returns the latest colour of each tracked well, shape (n_wells, n_channels).
+        """
+
+        return self.trajectories[-1]
+
+    def trajectory(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sample times and the colours of the tracked wells at those
+        times, shape (n_samples, n_wells, n_channels).
+        """
+
+        return np.array(self.times), np.stack(self.trajectories)
+
+
+def wait_until_settled(
+    camera,
+    positions: np.ndarray,
+    wells: np.ndarray = None,
+    radius: int = 3,
+    tolerance: float = 2.0,
+    window: float = 10.0,
+    sample_interval: float = 0.5,
+    timeout: float = 600.0,
+    rectifier=None,
+    locator=None,
+) -> SettlingDetector:
+    """
+    Samples the wells from a running CameraService until their colours have
+    settled, or until the timeout.
+
+    Parameters
+    ----------
+    camera : CameraService
+        The running camera service.
+
+    positions, wells, radius, tolerance, window
+        See "SettlingDetector".
+
+    sample_interval : float, default = 0.5
+        The time in seconds between samples.
+
+    timeout : float, default = 600.0
+        The longest time in seconds to wait.
+
+    rectifier : Rectifier, default = None
+        If given, every frame is rectified before the wells are sampled (the
+        positions are then positions in the rectified frames).
+
+    locator : PlateLocator, default = None
+        If given (and no rectifier), every frame is cropped to the located
+        plate before the wells are sampled (the positions are then positions
+        in the cropped frames).
+
+    Returns
+    -------
+    detector : SettlingDetector
+        The detector, with the colour trajectories of the wells. Its "settled"
+        method tells whether the wells settled before the timeout.
+    """
+
+    detector = SettlingDetector(positions, wells, radius, tolerance, window)
+    start_time = time.monotonic()
+
+    while True:
+        elapsed = time.monotonic() - start_time
+        frame = camera.next_frame()
+        if rectifier is not None:
+            frame = rectifier.rectify(frame)
+        elif locator is not None:
+            frame = locator.crop(frame)
+        if detector.update(frame, elapsed):
+            print(f"Well colours settled after {elapsed:.1f} s.")
+            return detector
+
+        if elapsed > timeout:
+            print(
+                f"Warning: {detector.unsettled_wells().sum()} well(s) had not settled "
+                f"after {timeout:.0f} s. Measuring anyway."
+            )
+            return detector
+
+        time.sleep(sample_interval)
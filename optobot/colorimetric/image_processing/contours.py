@@ -2,6 +2,9 @@ import cv2 as cv
 import matplotlib.pyplot as plt
 import numpy as np
 
+from optobot.colorimetric.image_processing.lattice import fit_lattice
+from optobot.colorimetric.image_processing.localisation import find_lattice
+
 
 class ContourDetection:
     def __init__(self, image_path, expected_grid=(8, 12)):
@@ -17,43 +20,21 @@ class ContourDetection:
         self.image = cv.imread(image_path)
         # Placeholder for detected circles
         self.best_circles = None
-
-    def filter_circular_contours(self, contours):
-        """
-        Filters contours to keep only those that are  circular.
-
-        Args:
-            contours (list): List of contours detected in the image.
-
-        Returns:
-            list: List of radii of contours that are  circular.
-        """
-        # List to store radii of valid circular contours
-        valid_circle = []
-        for cont in contours:
-            # Calculate the perimeter of the contour
-            perimeter = cv.arcLength(cont, True)
-
-            # Calculate the area of the contour
-            area = cv.contourArea(cont)
-            # Avoid division by zero
-            if perimeter == 0:
-                continue
-            circularity = 4 * np.pi * (area / (perimeter**2))
-            if 0.8 < circularity < 1.2:
-                _, radius = cv.minEnclosingCircle(cont)
-                valid_circle.append(radius)
-        return valid_circle
+        # Placeholder for the fitted well plate lattice
+        self.lattice = None
 
     def enforce_grid_pattern(self, circles):
         """
         Enforces a grid pattern on the detected circles to align them with the expected well plate layout.
+        The well plate lattice is fitted to the circles (see "lattice.fit_lattice"), which ignores circles
+        that are not on the lattice and places wells that were not detected. The fit is stored in self.lattice.
 
         Args:
             circles (np.ndarray): Detected circles, represented as (x, y and radius).
 
         Returns:
-            np.ndarray: Array of circles aligned in a grid pattern.
+            np.ndarray: Array of circles at the sub-pixel centres of all wells, in row-major order,
+            or None if no lattice could be fitted.
         """
         # Check circles are valid
         if circles is None or len(circles[0]) < 2:
@@ -62,67 +43,23 @@ class ContourDetection:
         # Extract (x, y, radius) positions of the circles. Selects all circles and their first 3 values (x, y, radius)
         circle_positions = circles[0, :, :3]
 
-        # Sort circles by Y-coordinate (row-wise sorting).
-        # Circles are processed from top to bottom
-        sorted_by_y = sorted(circle_positions, key=lambda p: p[1])
-
-        # Group circles into rows based on distance to Y-coordinates.
-        rows = []
-        # Differences in y-coordinates.
-        y_differences = np.diff([p[1] for p in sorted_by_y])
-        # Median difference between circles in Y-direction
-        median_diff = np.median(y_differences)
-        # Threshold to organise circles into rows
-        row_threshold = median_diff + np.std(y_differences)
-        # Initialise first row ith first circle.
-        current_row = [sorted_by_y[0]]
-
-        # Iterate through the remaining circles to organise them into rows
-        for i in range(1, len(sorted_by_y)):
-            # Check if the current circle is close enough in Y-coordinate to be part of the current row
-            if abs(sorted_by_y[i][1] - current_row[-1][1]) < row_threshold:
-                current_row.append(sorted_by_y[i])
-
-            # If not, finish  current row by sorting it by X-coordinate.
-            else:
-                rows.append(sorted(current_row, key=lambda p: p[0]))
-                current_row = [sorted_by_y[i]]
-
-        # Add the last row to the list of rows
-        rows.append(sorted(current_row, key=lambda p: p[0]))  # Add the last row
-
-        # Confirm numbers of circles
-        corrected_rows = []
-        for row in rows:
-            if len(row) == 12:
-                corrected_rows.append(row)
-            # If the row has too many circles. Sort row by X-coord and keep the first correct
-            # 12 circles
-            elif len(row) > 12:
-                sorted_row = sorted(row, key=lambda p: p[0])
-                corrected_rows.append(sorted_row[:12])
-            else:
-                continue
+        try:
+            self.lattice = fit_lattice(circle_positions[:, :2], self.expected_grid)
+        except ValueError as error:
+            print(error)
+            return None
 
-        # Flatten corrected rows back into a single array
-        sorted_circles = np.array([circle for row in corrected_rows for circle in row])
-
-        length_rows = [len(row) for row in rows]
-        t = np.sum(length_rows)
-        sorted_circles = np.array(
-            [
-                circle
-                for row in rows
-                if len(row) >= self.expected_grid[1]
-                for circle in row
-            ]
+        print(
+            f"Grid fitted to {self.lattice.detected.sum()} detected wells "
+            f"(residual {self.lattice.residual:.2f} px, quality {self.lattice.quality:.2f})."
         )
 
-        # Limit to expected number of wells (8x12 = 96)
-        # if len(sorted_circles) > self.expected_grid[0] * self.expected_grid[1]:
-        #   sorted_circles = sorted_circles[:self.expected_grid[0] * self.expected_grid[1]]
+        # All wells get the median radius of the matched circles.
+        radius = np.median(circle_positions[self.lattice.inliers, 2])
+        centres = self.lattice.centres.reshape(-1, 2)
+        grid_circles = np.hstack([centres, np.full((len(centres), 1), radius)])
 
-        return np.array([sorted_circles], dtype=np.float32)
+        return np.array([grid_circles], dtype=np.float32)
 
     def extract_rgb_values(self, circles, radius=1):
         """
@@ -143,7 +80,7 @@ class ContourDetection:
 
         # Iterate through all detected circles to extract RGB values
         for circle in circles[0, :]:
-            x, y, r = int(circle[0]), int(circle[1]), int(circle[2])
+            x, y, r = int(round(circle[0])), int(round(circle[1])), int(circle[2])
             rgb = np.zeros(3, dtype=np.float32)
             count = 0
 
@@ -166,10 +103,79 @@ class ContourDetection:
         )
         return rgb_values
 
+    def coarse_circle_detection(self, blurred, max_width=400):
+        """
+        Finds the plate and its well pitch on a downscaled copy of the image: circles are detected with a loose
+        threshold on a pyramid level at most max_width pixels wide, and the well plate lattice is fitted to them,
+        which rejects the false circles.
+
+        Args:
+            blurred (np.ndarray): Blurred grayscale image at full resolution.
+            max_width (int): Largest width of the pyramid level used.
+
+        Returns:
+            tuple: The fitted lattice (in full-resolution pixels) and the estimated well radius in pixels,
+            or None if no lattice could be fitted.
+        """
+        # Build the image pyramid down to the coarse level
+        coarse = blurred
+        scale = 1
+        while coarse.shape[1] > max_width:
+            coarse = cv.pyrDown(coarse)
+            scale *= 2
+
+        return find_lattice(coarse, scale, self.expected_grid)
+
+    def refine_circles(self, blurred, lattice, radius):
+        """
+        Detects each well at full resolution in a small region around its coarse centre.
+
+        Args:
+            blurred (np.ndarray): Blurred grayscale image at full resolution.
+            lattice (LatticeFit): The lattice found by coarse_circle_detection.
+            radius (float): The estimated well radius in pixels.
+
+        Returns:
+            np.ndarray: Refined circles (x, y, radius) of the wells that were found, shaped (1, n, 3).
+        """
+        half_size = int(np.ceil(0.6 * lattice.pitch))
+        height, width = blurred.shape
+        refined = []
+
+        for x, y in lattice.centres.reshape(-1, 2):
+            x0, y0 = int(round(x)) - half_size, int(round(y)) - half_size
+            x1, y1 = x0 + 2 * half_size + 1, y0 + 2 * half_size + 1
+            if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+                continue
+
+            circles = cv.HoughCircles(
+                blurred[y0:y1, x0:x1],
+                cv.HOUGH_GRADIENT,
+                dp=1,
+                minDist=lattice.pitch,
+                param1=50,
+                param2=15,
+                minRadius=int(0.7 * radius),
+                maxRadius=int(np.ceil(1.3 * radius)),
+            )
+            if circles is None:
+                continue
+
+            cx, cy, r = circles[0, 0]
+            # Keep the circle only if it is the well expected here
+            if np.hypot(cx + x0 - x, cy + y0 - y) < 0.3 * lattice.pitch:
+                refined.append((cx + x0, cy + y0, r))
+
+        return np.array([refined], dtype=np.float32).reshape(1, -1, 3)
+
     def auto_hough_circle_detection(self):
         """
         Detects circles in an image and extracts RGB values.
 
+        The circles are found coarse-to-fine: the plate and its pitch are found on a downscaled pyramid level,
+        then each well is refined in a small region at full resolution, and the well plate lattice is fitted to
+        the refined circles.
+
         Returns:
             np.ndarray: Array of RGB values for each detected circle, or None if detection fails.
         """
@@ -183,59 +189,21 @@ class ContourDetection:
         # Apply median blur to reduce noise
         blurred = cv.medianBlur(gray, 5)
 
-        # Detect edges using the Canny edge detector
-        edges = cv.Canny(blurred, 50, 150)
-
-        # Find contours in the edge-detected image
-        contours, _ = cv.findContours(edges, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
-
-        if not contours:
-            print("No contours found. Check image quality.")
-            return None
-
-        # Filter circular contours only
-        valid_circle = self.filter_circular_contours(contours)
-
-        if len(valid_circle) < 5:
-            print("Not enough valid circles detected from contours.")
+        coarse = self.coarse_circle_detection(blurred)
+        if coarse is None:
+            print("Circle detection failed: no well plate found.")
             return None
 
-        # Controls threshold for detecting circles and is adjusted to optimise detection.
-        param2 = 50
-        best_circles = None
-
-        # Loop progressively lowers param2 to increase sensitivity
-        while param2 >= 10:
-            # Circle detection using Hough Circles
-            circles = cv.HoughCircles(
-                blurred,
-                cv.HOUGH_GRADIENT,
-                dp=1,
-                minDist=15,
-                param1=50,
-                param2=param2,
-                minRadius=15,
-                maxRadius=25,
-            )
-
-            # Compare circles with well plate
-            if (
-                circles is not None
-                and circles.shape[1] >= self.expected_grid[0] * self.expected_grid[1]
-            ):
-                best_circles = circles
-                break
-            param2 -= 5
+        circles = self.refine_circles(blurred, *coarse)
 
-        # If circles are detected, enforce grid pattern to remove outliers
+        # Fit the grid to the refined circles (this also places wells that were not found)
+        best_circles = self.enforce_grid_pattern(circles)
         if best_circles is not None:
-            best_circles = self.enforce_grid_pattern(best_circles)
-            if best_circles is not None:
-                rgb_values = self.extract_rgb_values(best_circles)
-                self.best_circles = best_circles
+            rgb_values = self.extract_rgb_values(best_circles)
+            self.best_circles = best_circles
 
-                # Return the array of RGB values
-                return rgb_values
+            # Return the array of RGB values
+            return rgb_values
 
         print("Circle detection failed.")
         return None
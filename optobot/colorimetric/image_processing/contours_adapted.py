@@ -1,17 +1,47 @@
 import cv2 as cv
-import matplotlib.pyplot as plt
 import numpy as np
 
-
-def well_detection(captured_im_path, detected_wells_figs_path, thresh=30):
+from optobot.colorimetric.image_capture.frame import as_frame
+from optobot.colorimetric.image_processing.lattice import fit_lattice
+from optobot.colorimetric.image_processing.overlays import (
+    draw_wells,
+    gui_available,
+    save_overlay,
+)
+
+
+def well_detection(
+    captured_im_path,
+    detected_wells_figs_path,
+    thresh=30,
+    columns=12,
+    rows=8,
+    show=None,
+    return_lattice=False,
+):
     """
     Takes an image of a well plate with coloured dyes in the well, and returns a sorted
     array of the rgb values in each well
 
+    The well plate lattice is fitted to the detected wells (see lattice.fit_lattice), so wells
+    that were not detected are still sampled at their expected centres.
+
+    The annotated figure of the detected wells is drawn and saved (as a .png) on a background thread,
+    so that it does not delay the measurement, unless it is shown.
+
     args:
-        image (array): cv2 image of the well plate
+        captured_im_path (str or Frame): path to the image of the well plate, or the already decoded photo
+            (see optobot.colorimetric.image_capture.frame)
+        detected_wells_figs_path (str): path of the annotated figure, without the extension
+        columns (int): number of columns of the well plate (e.g. 12 for 96 wells, 24 for 384 wells)
+        rows (int): number of rows of the well plate (e.g. 8 for 96 wells, 16 for 384 wells)
+        show (bool): whether to show the figure in a window. By default it is shown if there is a display.
+        return_lattice (bool): whether to also return the fitted lattice (e.g. for the quality metrics of the wells,
+            see optobot.colorimetric.image_processing.quality)
     returns:
-        rgb_list (array): a number of detected wells x 3 array of rgb values
+        rgb_list (array): a (rows * columns) x 3 array of rgb values, in row-major order
+            (all nan if no grid could be fitted)
+        lattice (LatticeFit): the fitted lattice (None if no grid could be fitted), only if return_lattice is True
     """
 
     # modifiable parameters
@@ -22,14 +52,12 @@ def well_detection(captured_im_path, detected_wells_figs_path, thresh=30):
 
     # Sets all pixels to white if they are grey
     # Done by finding the median and checking if pixels are within a certain threshold of that median
-    image = cv.imread(captured_im_path)
-    for i in range(np.shape(image)[0]):
-        for j in range(np.shape(image)[1]):
-            pixel = image[i, j]
-            median = np.median(pixel)
-            if np.all(median - thresh < pixel) and np.all(median + thresh > pixel):
-                # currently changes all pixels to white, black may be better
-                image[i, j] = [255, 255, 255]
+    frame = as_frame(captured_im_path)
+    image = frame.bgr.copy()
+    median = np.median(image, axis=2, keepdims=True)
+    grey = np.all(np.abs(image - median) < thresh, axis=2)
+    # currently changes all pixels to white, black may be better
+    image[grey] = 255
 
     # Convert the image to grayscale
     gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
@@ -66,26 +94,28 @@ def well_detection(captured_im_path, detected_wells_figs_path, thresh=30):
             valid_circle.append(r)
 
     coords = np.array(coords)
-    num_rows = ((len(coords) - 1) // 12) + 1
-
-    # sorting coordinates: sort by y first, split it by 12 to get rows
-    # then sort by x to get it in order
-    sort_coords = [None for i in range(num_rows)]
-    for i in range(num_rows):
-        sort_row = coords[coords[:, 1].argsort()]
-        if i * 12 <= len(coords):
-            row_split = sort_row[i * 12 : i * 12 + 12]
-        else:
-            row_split = sort_row[i * 12 :]
-        sort_col = row_split[row_split[:, 0].argsort()]
-        sort_coords[i] = sort_col
-    sort_coords = np.vstack(sort_coords)
+
+    # fit the well plate grid to the detected wells, which orders them and fills in the missed ones
+    try:
+        lattice = fit_lattice(coords, (rows, columns))
+    except ValueError as error:
+        print(f"{error} Try another threshold.")
+        rgb_list = np.full((rows * columns, 3), np.nan)
+        return (rgb_list, None) if return_lattice else rgb_list
+
+    print(
+        f"Grid fitted to {lattice.detected.sum()} of {rows * columns} wells "
+        f"(residual {lattice.residual:.2f} px, quality {lattice.quality:.2f})."
+    )
+    sort_coords = lattice.centres.reshape(-1, 2)
 
     image_rgb = cv.cvtColor(image, cv.COLOR_BGR2RGB)
     rgb_list = []
+    height, width = image_rgb.shape[:2]
     for x, y in sort_coords:
-        x = int(x)
-        y = int(y)
+        # wells placed by the grid can lie near (or past) the edge of the image
+        x = int(np.clip(round(x), radius, width - radius - 1))
+        y = int(np.clip(round(y), radius, height - radius - 1))
         count = 0
         rgb = np.zeros(3)
         for i in range(-radius, radius + 1):
@@ -95,12 +125,22 @@ def well_detection(captured_im_path, detected_wells_figs_path, thresh=30):
         rgb /= count
         rgb_list.append(rgb)
 
-    cv.drawContours(image, contours, -1, (0, 255, 0), 2)
-    image_display = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-    plt.imshow(image_display)
-    plt.savefig(detected_wells_figs_path)
-    plt.show()
+    # mark the fitted well centres: red for detected wells, blue for wells placed by the grid
+    figure_path = f"{detected_wells_figs_path}.png"
+    if show is None:
+        show = gui_available()
+    if show:
+        import matplotlib.pyplot as plt
+
+        annotated = draw_wells(image, sort_coords, lattice.detected, contours)
+        cv.imwrite(figure_path, annotated)
+        plt.imshow(cv.cvtColor(annotated, cv.COLOR_BGR2RGB))
+        plt.show()
+    else:
+        save_overlay(figure_path, draw_wells, image, sort_coords, lattice.detected, contours)
 
     rgb_list = np.array(rgb_list)
 
+    if return_lattice:
+        return rgb_list, lattice
     return rgb_list
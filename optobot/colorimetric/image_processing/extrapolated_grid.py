@@ -4,13 +4,19 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.backend_bases import MouseEvent
 
+from optobot.colorimetric.image_capture.frame import as_frame
+from optobot.colorimetric.image_processing.overlays import gui_available
+
 
 class ExtrapolatedGrid:
-    def __init__(self, captured_image_path, detected_well_figs_path):
+    def __init__(self, captured_image_path, detected_well_figs_path, grid_shape=(8, 12)):
+        """captured_image_path is the path to the photo, or the already decoded photo (a Frame)"""
         self.detected_well_figs_path = detected_well_figs_path
-        self.image = plt.imread(captured_image_path)
+        self.rows, self.cols = grid_shape
+        self.image = as_frame(captured_image_path).rgb
         self.clicked_points = []
         self.rgb_values = None
+        self.well_centers, self.pitch = None, None
         self.fig, self.ax = None, None
 
     def get_rgb_at_center(self, x, y):
@@ -46,20 +52,27 @@ class ExtrapolatedGrid:
 
             if len(self.clicked_points) == 2:
                 first_click, second_click = self.clicked_points
-                well_centers = self.calculate_well_centers(first_click, second_click)
+                well_centers = self.calculate_well_centers(
+                    first_click, second_click, self.rows, self.cols
+                )
                 self.plot_well_centers(well_centers)
+                self.well_centers = np.array(well_centers)
+                self.pitch = dist(first_click, second_click)
 
                 # Extract RGB values for each well center
-                self.rgb_values = np.zeros((8, 12, 3), dtype=np.uint8)
-                for i in range(8):
-                    for j in range(12):
-                        x, y = well_centers[i * 12 + j]
+                self.rgb_values = np.zeros((self.rows, self.cols, 3), dtype=np.uint8)
+                for i in range(self.rows):
+                    for j in range(self.cols):
+                        x, y = well_centers[i * self.cols + j]
                         self.rgb_values[i, j] = self.get_rgb_at_center(x, y)
 
                 self.clicked_points = []  # reset points after processing
 
     def run(self):
         """Displays the image and allows user interaction to define the grid"""
+        if not gui_available():
+            raise RuntimeError("The manual grid needs a display to click on.")
+
         while True:
             # reset
             self.clicked_points = []
@@ -7,9 +7,12 @@ dimensions. Also contains code for extracting RGB values at these positions.
 import cv2 as cv
 import numpy as np
 
-# Create a dict to store the dimensions of a well plate with 96 wells.
-# TODO: Move this to a CSV file.
+from optobot.labware import DEFAULT_LABWARE
+
+# Create a dict to store the measured dimensions of the default well plate with 96 wells.
+# The dimensions of other plates can be obtained with "optobot.labware.get_plate_geometry".
 PLATE = {
+    "load_name": DEFAULT_LABWARE,
     "wells": 96,
     "rows": 8,
     "columns": 12,
@@ -39,7 +42,8 @@ def get_well_centres(
         The image of the well plate.
 
     plate : dict, default = PLATE
-        A dictionary containing measurements of the well plate.
+        A dictionary containing measurements of the well plate (see
+        "optobot.labware.get_plate_geometry").
 
     row_distort : float, default = 0
         A coefficient for scaling well plate centres in the vertical direction
@@ -0,0 +1,290 @@
+"""
+Contains code for fitting the regular lattice of a well plate to detected well
+positions. The lattice is found with RANSAC, so that spurious detections do
+not disturb it, and refined by least squares to an affine map from (column,
+row) indices to pixels. This gives sub-pixel centres for all wells, including
+those that were not detected, and a residual that scores the fit.
+"""
+
+# Import required libraries.
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class LatticeFit:
+    """
+    The result of fitting a well plate lattice.
+
+    Attributes
+    ----------
+    centres : np.ndarray, shape(n_rows, n_columns, 2)
+        The sub-pixel (x, y) centres of all wells.
+
+    affine : np.ndarray, shape(2, 3)
+        The affine map from [column, row, 1] to (x, y).
+
+    detected : np.ndarray, shape(n_rows, n_columns)
+        Whether a detected point was matched to each well.
+
+    inliers : np.ndarray, shape(n_points)
+        Whether each detected point was matched to a well.
+
+    residual : float
+        The root-mean-square distance (in pixels) between the matched points
+        and their well centres.
+
+    pitch : float
+        The mean distance between neighbouring wells in pixels.
+
+    points : np.ndarray, shape(n_rows, n_columns, 2)
+        The detected point matched to each well (nan for wells that were not
+        detected).
+    """
+
+    def __init__(self, centres, affine, detected, inliers, residual, pitch, points=None):
+
+        self.centres = centres
+        self.affine = affine
+        self.detected = detected
+        self.inliers = inliers
+        self.residual = residual
+        self.pitch = pitch
+        self.points = points
+
+    @property
+    def quality(self) -> float:
+        """
+        A score of the fit between 0 and 1: the fraction of wells that were
+        detected, reduced by the residual relative to the pitch.
+        """
+
+        return float(self.detected.mean() * max(0.0, 1.0 - self.residual / (0.25 * self.pitch)))
+
+
+def _lattice_indices(points, origin, basis):
+    """
+    Returns the (fractional) lattice indices of points for a lattice with the
+    given origin and basis vectors (the columns of basis).
+    """
+
+    return np.linalg.solve(basis, (points - origin).T).T
+
+
+def _ransac_basis(points, tolerance, num_iterations, rng):
+    """
+    Finds the origin and basis vectors of the lattice that the most points fit.
+    Each hypothesis takes a random point and two of its nearest neighbours in
+    different directions as the lattice vectors.
+    """
+
+    tree = cKDTree(points)
+    k = min(5, len(points))
+    distances, neighbours = tree.query(points, k=k)
+
+    best_count, best = -1, None
+    for _ in range(num_iterations):
+        i = rng.integers(len(points))
+        vectors = points[neighbours[i, 1:]] - points[i]
+        a, b = rng.choice(len(vectors), 2, replace=False)
+        u, v = vectors[a], vectors[b]
+
+        # the two vectors must be clearly non-parallel and of similar length
+        cross = abs(u[0] * v[1] - u[1] * v[0])
+        lengths = np.linalg.norm(u) * np.linalg.norm(v)
+        if cross < 0.7 * lengths or not 0.8 < np.linalg.norm(u) / np.linalg.norm(v) < 1.25:
+            continue
+
+        basis = np.stack([u, v], axis=1)
+        indices = _lattice_indices(points, points[i], basis)
+        errors = np.linalg.norm((indices - np.round(indices)) @ basis.T, axis=1)
+        count = np.sum(errors < tolerance * min(np.linalg.norm(u), np.linalg.norm(v)))
+
+        if count > best_count:
+            best_count, best = count, (points[i], basis)
+
+    return best
+
+
+def _match_wells(points, origin, basis, grid_shape, tolerance):
+    """
+    Refines a lattice hypothesis on the points that fit it, and places a window
+    of the size of the plate where it holds the most of them. Returns which
+    points were matched, their (column, row) well indices and their distances
+    from the well centres.
+    """
+
+    rows, columns = grid_shape
+
+    # Orient the basis so that the first vector points along the columns (+x) and the second down the rows (+y).
+    if abs(basis[0, 0]) < abs(basis[0, 1]):
+        basis = basis[:, ::-1]
+    basis = basis * np.sign([basis[0, 0], basis[1, 1]])
+
+    # The basis from two neighbours is too rough to extrapolate across the plate, so refine it by least squares
+    # on the points that fit, and match the points again, until the matches no longer change.
+    inliers = None
+    for _ in range(10):
+        indices = _lattice_indices(points, origin, basis)
+        rounded = np.round(indices).astype(int)
+        pitch = np.linalg.norm(basis, axis=0).mean()
+        errors = np.linalg.norm((indices - rounded) @ basis.T, axis=1)
+        new_inliers = errors < tolerance * pitch
+        if inliers is not None and np.array_equal(new_inliers, inliers):
+            break
+        inliers = new_inliers
+        if inliers.sum() < 3:
+            raise ValueError("Could not find a regular grid in the detected wells.")
+
+        design = np.hstack([rounded[inliers], np.ones((inliers.sum(), 1))])
+        solution, *_ = np.linalg.lstsq(design, points[inliers], rcond=None)
+        basis = solution[:2].T
+        origin = solution[2]
+
+    # Slide a window of the size of the plate over the matched indices, to find which index is column 1 and row A.
+    def window_starts(lowest, highest, size):
+        # The window may extend past the matched indices if some rows or columns were not detected at all
+        # (e.g. empty wells). Between equally good windows, prefer the one starting at the first detected
+        # row or column, as wells are filled from A1.
+        first, last = sorted([lowest, highest - size + 1])
+        starts = np.arange(first, last + 1)
+        return starts[np.argsort(np.abs(starts - lowest), kind="stable")]
+
+    column_range = window_starts(rounded[inliers, 0].min(), rounded[inliers, 0].max(), columns)
+    row_range = window_starts(rounded[inliers, 1].min(), rounded[inliers, 1].max(), rows)
+
+    best_count = -1
+    for first_column in column_range:
+        for first_row in row_range:
+            inside = (
+                inliers
+                & (rounded[:, 0] >= first_column)
+                & (rounded[:, 0] < first_column + columns)
+                & (rounded[:, 1] >= first_row)
+                & (rounded[:, 1] < first_row + rows)
+            )
+            if inside.sum() > best_count:
+                best_count, offset, matched = inside.sum(), (first_column, first_row), inside
+
+    grid_indices = rounded[matched] - offset
+    distances = np.linalg.norm((indices[matched] - rounded[matched]) @ basis.T, axis=1)
+
+    return matched, grid_indices, distances
+
+
+def fit_lattice(
+    points: np.ndarray,
+    grid_shape: tuple[int] = (8, 12),
+    tolerance: float = 0.25,
+    num_iterations: int = 300,
+    min_inliers: int = None,
+    seed: int = 0,
+) -> LatticeFit:
+    """
+    Fits the lattice of a well plate to detected well positions.
+
+    Parameters
+    ----------
+    points : np.ndarray, shape(n_points, 2)
+        The (x, y) pixel positions of the detected wells. Missing wells and
+        spurious detections are allowed.
+
+    grid_shape : tuple[int], default = (8, 12)
+        The (rows, columns) of the well plate. Well A1 is assumed to be at the
+        top-left of the image.
+
+    tolerance : float, default = 0.25
+        The largest distance from a well centre, as a fraction of the pitch,
+        for a point to be matched to the well.
+
+    num_iterations : int, default = 300
+        The number of RANSAC hypotheses.
+
+    min_inliers : int, default = None
+        The fewest matched points for a valid fit. Defaults to a quarter of
+        the wells (and at least 6).
+
+    seed : int, default = 0
+        The seed of the random sampling.
+
+    Returns
+    -------
+    fit : LatticeFit
+        The fitted lattice.
+    """
+
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    rows, columns = grid_shape
+    if min_inliers is None:
+        min_inliers = max(6, (rows * columns) // 4)
+
+    if len(points) < min_inliers:
+        raise ValueError(
+            f"Only {len(points)} wells were detected; at least {min_inliers} are needed to fit the grid."
+        )
+
+    best = _ransac_basis(points, tolerance, num_iterations, np.random.default_rng(seed))
+    if best is None:
+        raise ValueError("Could not find a regular grid in the detected wells.")
+    origin, basis = best
+
+    # The wells and the gaps between groups of four wells together form a square lattice turned by 45 degrees,
+    # with a pitch sqrt(2) smaller, which fits more points than the wells alone. So the lattices along the
+    # diagonals, through either set of points, are tried as well, and the one that matches the most wells is kept.
+    diagonals = basis @ np.array([[1, 1], [1, -1]])
+    candidates = [(origin, basis), (origin, diagonals), (origin + basis[:, 0], diagonals)]
+
+    best_count, errors = -1, []
+    for candidate_origin, candidate_basis in candidates:
+        try:
+            match = _match_wells(points, candidate_origin, candidate_basis, grid_shape, tolerance)
+        except ValueError as error:
+            errors.append(error)
+            continue
+        if match[0].sum() > best_count:
+            best_count, (matched, grid_indices, distances) = match[0].sum(), match
+
+    if best_count < 0:
+        raise errors[0]
+    if best_count < min_inliers:
+        raise ValueError(
+            f"Only {best_count} detected wells fit a regular grid; at least {min_inliers} are needed."
+        )
+
+    # Two points can be matched to the same well; keep the closer one.
+    order = np.argsort(distances)
+    _, first = np.unique(grid_indices[order] @ [1, columns], return_index=True)
+    keep = order[first]
+    grid_indices = grid_indices[keep]
+    matched_points = points[matched][keep]
+
+    # Refine by least squares: (x, y) = affine @ [column, row, 1].
+    design = np.hstack([grid_indices, np.ones((len(grid_indices), 1))])
+    solution, *_ = np.linalg.lstsq(design, matched_points, rcond=None)
+    affine = solution.T
+
+    residuals = matched_points - design @ solution
+    residual = float(np.sqrt((residuals**2).sum(axis=1).mean()))
+
+    column_index, row_index = np.meshgrid(np.arange(columns), np.arange(rows))
+    all_indices = np.stack(
+        [column_index.ravel(), row_index.ravel(), np.ones(rows * columns)], axis=1
+    )
+    centres = (all_indices @ affine.T).reshape(rows, columns, 2)
+
+    detected = np.zeros((rows, columns), dtype=bool)
+    detected[grid_indices[:, 1], grid_indices[:, 0]] = True
+    detected_points = np.full((rows, columns, 2), np.nan)
+    detected_points[grid_indices[:, 1], grid_indices[:, 0]] = matched_points
+
+    inlier_mask = np.zeros(len(points), dtype=bool)
+    inlier_mask[np.flatnonzero(matched)[keep]] = True
+
+    return LatticeFit(
+        centres=centres,
+        affine=affine,
+        detected=detected,
+        inliers=inlier_mask,
+        residual=residual,
+        pitch=float(np.linalg.norm(affine[:, :2], axis=0).mean()),
+        points=detected_points,
+    )
@@ -0,0 +1,488 @@
+"""
+Contains code for finding the well plate in a camera frame automatically, so
+that it does not have to be cropped by hand. The plate is located once per
+session by fitting its well lattice on a downscaled copy of the frame, which
+also gives its outline from the plate dimensions. Later frames are checked
+cheaply against a small template of the plate, and the plate is only located
+again if it has moved. All later detection and sampling can then run on the
+plate's region of interest only.
+
+When the camera sees the plates in several deck slots at once, they are all
+located in the same frame, labelled with their slots, and the colours of all
+their wells are extracted in one pass.
+"""
+
+# Import required libraries.
+import os
+
+import cv2 as cv
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from optobot.colorimetric.image_capture.averaging import well_means, well_pixels
+from optobot.colorimetric.image_processing.fixed_grid import PLATE
+from optobot.colorimetric.image_processing.lattice import fit_lattice
+
+
+def find_circles(
+    coarse: np.ndarray, grid_shape: tuple[int] = (8, 12), num_plates: int = 1
+) -> np.ndarray:
+    """
+    Detects circles with a loose threshold on a downscaled, blurred grayscale
+    image, which shows num_plates well plates. Many of the circles are false,
+    and are rejected by fitting the lattice.
+
+    Returns
+    -------
+    circles : np.ndarray, shape(n_circles, 3)
+        The (x, y, radius) of the circles in coarse pixels, or None if no
+        circles were found.
+    """
+
+    # Each plate fills at least a third of its share of the image width, so the pitch is at least this
+    min_pitch = coarse.shape[1] / (3 * grid_shape[1] * num_plates)
+    # and each plate fits inside the image, so a well is at most half the pitch of a plate that fills it
+    max_radius = min(coarse.shape[1] / grid_shape[1], coarse.shape[0] / grid_shape[0]) / 2
+    circles = cv.HoughCircles(
+        coarse,
+        cv.HOUGH_GRADIENT,
+        dp=1,
+        minDist=0.8 * min_pitch,
+        param1=50,
+        param2=12,
+        minRadius=max(2, int(0.2 * min_pitch)),
+        maxRadius=int(max_radius),
+    )
+
+    return None if circles is None else circles[0]
+
+
+def find_lattice(coarse: np.ndarray, scale: float, grid_shape: tuple[int] = (8, 12)):
+    """
+    Detects circles on a downscaled, blurred grayscale image of a well plate
+    (see "find_circles"), and fits the well plate lattice to them.
+
+    Parameters
+    ----------
+    coarse : np.ndarray
+        The downscaled, blurred grayscale image.
+
+    scale : float
+        The factor between full-resolution and coarse pixels.
+
+    grid_shape : tuple[int], default = (8, 12)
+        The (rows, columns) of the well plate.
+
+    Returns
+    -------
+    lattice : LatticeFit
+        The fitted lattice, in full-resolution pixels.
+
+    radius : float
+        The median radius of the matched circles, in full-resolution pixels.
+
+    Or None if no lattice could be fitted.
+    """
+
+    circles = find_circles(coarse, grid_shape)
+    if circles is None:
+        return None
+
+    try:
+        lattice = fit_lattice(circles[:, :2] * scale, grid_shape)
+    except ValueError:
+        return None
+
+    radius = np.median(circles[lattice.inliers, 2]) * scale
+    return lattice, radius
+
+
+def plate_corners(lattice, plate: dict = PLATE) -> np.ndarray:
+    """
+    Returns the (x, y) pixel positions of the outer corners of the plate, in
+    the order top-left, top-right, bottom-right, bottom-left, by extending the
+    fitted well lattice to the plate dimensions.
+    """
+
+    # the plate corners in units of well spacings from well A1
+    columns = (np.array([0, plate["width"]]) - plate["column_offset"]) / plate["column_spacing"]
+    rows = (np.array([0, plate["height"]]) - plate["row_offset"]) / plate["row_spacing"]
+    corners = np.array(
+        [
+            [columns[0], rows[0], 1],
+            [columns[1], rows[0], 1],
+            [columns[1], rows[1], 1],
+            [columns[0], rows[1], 1],
+        ]
+    )
+
+    return corners @ lattice.affine.T
+
+
+class PlateLocator:
+    """
+    A class to find the well plate in camera frames and crop them to it.
+
+    Parameters
+    ----------
+    plate : dict, default = PLATE
+        The geometry of the plate (see "optobot.labware.get_plate_geometry").
+
+    max_width : int, default = 400
+        The largest width of the downscaled frames the plate is located and
+        verified on.
+
+    min_score : float, default = 0.6
+        The smallest normalised correlation with the plate template for which
+        the plate counts as not moved.
+
+    search : float, default = 0.05
+        The distance, as a fraction of the plate size, over which the template
+        is searched when verifying.
+
+    Attributes
+    ----------
+    corners : np.ndarray, shape(4, 2)
+        The (x, y) pixel positions of the outer corners of the plate. They can
+        be passed to "rectification.get_rectifier" as the plate corners.
+
+    roi : tuple[int]
+        The region of interest (x0, y0, x1, y1) of the plate in the frames.
+    """
+
+    def __init__(
+        self,
+        plate: dict = PLATE,
+        max_width: int = 400,
+        min_score: float = 0.6,
+        search: float = 0.05,
+    ):
+
+        self.plate = plate
+        self.max_width = max_width
+        self.min_score = min_score
+        self.search = search
+
+        self.corners = None
+        self.roi = None
+        self.lattice = None
+        self.scale = None
+        self.template = None
+
+    def _coarse(self, frame: np.ndarray) -> np.ndarray:
+        grey = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        for _ in range(int(np.log2(self.scale))):
+            grey = cv.pyrDown(grey)
+        return grey
+
+    def _coarse_roi(self) -> tuple[int]:
+        return tuple(int(round(value / self.scale)) for value in self.roi)
+
+    def locate(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Finds the plate in a frame. This takes a few tens of milliseconds, and
+        is needed once per session (or when the plate has moved).
+
+        Returns
+        -------
+        corners : np.ndarray, shape(4, 2)
+            The (x, y) pixel positions of the outer corners of the plate.
+        """
+
+        self.scale = 1
+        while frame.shape[1] / self.scale > self.max_width:
+            self.scale *= 2
+        coarse = self._coarse(frame)
+
+        # enhance the contrast and reduce noise, as for the full-resolution detection
+        clahe = cv.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        blurred = cv.medianBlur(clahe.apply(coarse), 3)
+
+        found = find_lattice(blurred, self.scale, (self.plate["rows"], self.plate["columns"]))
+        if found is None:
+            raise ValueError("The well plate could not be found in the frame.")
+        self.lattice = found[0]
+        self.corners = plate_corners(self.lattice, self.plate)
+
+        height, width = frame.shape[:2]
+        x0, y0 = np.floor(self.corners.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(self.corners.max(axis=0)).astype(int)
+        if x0 < 0 or y0 < 0 or x1 > width or y1 > height:
+            print("Warning: the well plate extends past the edge of the frame.")
+        self.roi = (max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))
+
+        cx0, cy0, cx1, cy1 = self._coarse_roi()
+        self.template = coarse[cy0:cy1, cx0:cx1].copy()
+
+        print(
+            f"Well plate found at {self.roi} ({self.lattice.detected.sum()} wells detected, "
+            f"quality {self.lattice.quality:.2f})."
+        )
+        return self.corners
+
+    def verify(self, frame: np.ndarray) -> bool:
+        """
+        Checks cheaply whether the plate is still where it was located, by
+        matching the plate template on the downscaled frame around its region
+        of interest. The template is refreshed when the check passes, to follow
+        the wells changing colour.
+
+        Returns
+        -------
+        verified : bool
+            Whether the plate has not moved.
+        """
+
+        coarse = self._coarse(frame)
+        cx0, cy0, cx1, cy1 = self._coarse_roi()
+        pad = max(1, int(self.search * max(cx1 - cx0, cy1 - cy0)))
+        sx0, sy0 = max(cx0 - pad, 0), max(cy0 - pad, 0)
+        region = coarse[sy0 : cy1 + pad, sx0 : cx1 + pad]
+        if region.shape[0] < self.template.shape[0] or region.shape[1] < self.template.shape[1]:
+            return False
+
+        result = cv.matchTemplate(region, self.template, cv.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv.minMaxLoc(result)
+        if score < self.min_score or (x + sx0, y + sy0) != (cx0, cy0):
+            return False
+
+        self.template = coarse[cy0:cy1, cx0:cx1].copy()
+        return True
+
+    def update(self, frame: np.ndarray) -> tuple[int]:
+        """
+        Locates the plate if it has not been located yet, or verifies it and
+        locates it again if it has moved.
+
+        Returns
+        -------
+        roi : tuple[int]
+            The region of interest (x0, y0, x1, y1) of the plate.
+        """
+
+        if self.roi is None:
+            self.locate(frame)
+        elif not self.verify(frame):
+            print("The well plate has moved, locating it again.")
+            self.locate(frame)
+
+        return self.roi
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Crops a frame to the region of interest of the plate.
+        """
+
+        if self.roi is None:
+            raise ValueError("The well plate has not been located yet.")
+
+        x0, y0, x1, y1 = self.roi
+        return frame[y0:y1, x0:x1]
+
+    def save(self, path: str) -> None:
+        """
+        Saves the plate location (replacing the "crop_coords.npy" of the
+        manual crop) in a .npz file.
+        """
+
+        if self.roi is None:
+            raise ValueError("The well plate has not been located yet.")
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            corners=self.corners,
+            roi=np.array(self.roi),
+            scale=np.array(self.scale),
+            template=self.template,
+        )
+
+    @classmethod
+    def load(cls, path: str, plate: dict = PLATE, **kwargs) -> "PlateLocator":
+        """
+        Loads a saved plate location. It is verified on the first frame it is
+        updated with, like any other.
+        """
+
+        locator = cls(plate, **kwargs)
+        with np.load(path) as data:
+            locator.corners = data["corners"]
+            locator.roi = tuple(int(value) for value in data["roi"])
+            locator.scale = int(data["scale"])
+            locator.template = data["template"]
+
+        return locator
+
+
+# The spacing of the OT-2 deck slots in mm (left to right, and front to back).
+SLOT_SPACING = (132.5, 90.5)
+
+
+def deck_position(slot: int) -> np.ndarray:
+    """
+    Returns the (x, y) position in mm of an OT-2 deck slot, as seen by a camera
+    above the deck with the back of the deck at the top of the image (so that
+    well A1 of each plate is at its top-left). Slots 1 to 3 are the front row,
+    from left to right.
+    """
+
+    row, column = divmod(slot - 1, 3)
+    return np.array([column * SLOT_SPACING[0], -row * SLOT_SPACING[1]])
+
+
+def assign_slots(lattices: list, slots: list) -> dict:
+    """
+    Labels plates found in a frame with their deck slots, by matching the
+    layout of the plates in the image to the layout of the slots on the deck.
+    """
+
+    def normalise(points):
+        points = points - points.mean(axis=0)
+        size = np.abs(points).max()
+        return points / size if size > 0 else points
+
+    centres = np.array([lattice.centres.reshape(-1, 2).mean(axis=0) for lattice in lattices])
+    deck = np.array([deck_position(slot) for slot in slots])
+    costs = np.linalg.norm(
+        normalise(deck)[:, np.newaxis] - normalise(centres)[np.newaxis], axis=2
+    )
+    slot_indices, plate_indices = linear_sum_assignment(costs)
+
+    labelled = dict(zip(slot_indices, plate_indices))
+    return {slots[i]: lattices[labelled[i]] for i in range(len(slots))}
+
+
+def locate_plates(
+    frame: np.ndarray, slots: list, plate: dict = PLATE, max_width: int = 400
+) -> dict:
+    """
+    Finds every plate in a frame that shows the plates in several deck slots,
+    and labels them with their slots. The circles are detected once, on a
+    downscaled copy of the frame, and the lattices of the plates are fitted to
+    them one after the other.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        The camera frame.
+
+    slots : list
+        The deck slots of the plates in the frame (e.g. the wellplate_locs of
+        OptimisationLoop).
+
+    plate : dict, default = PLATE
+        The geometry of the plates.
+
+    max_width : int, default = 400
+        The largest width per plate of the downscaled frame.
+
+    Returns
+    -------
+    lattices : dict
+        The fitted lattice (in full-resolution pixels) of each plate, keyed by
+        its deck slot, in the order of slots.
+    """
+
+    grid_shape = (plate["rows"], plate["columns"])
+    num_plates = len(slots)
+
+    grey = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    scale = 1
+    while grey.shape[1] > max_width * num_plates:
+        grey = cv.pyrDown(grey)
+        scale *= 2
+
+    clahe = cv.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    blurred = cv.medianBlur(clahe.apply(grey), 3)
+
+    circles = find_circles(blurred, grid_shape, num_plates)
+    points = np.empty((0, 2)) if circles is None else circles[:, :2] * scale
+
+    lattices = []
+    for _ in range(num_plates):
+        try:
+            lattice = fit_lattice(points, grid_shape)
+        except ValueError:
+            break
+        lattices.append(lattice)
+
+        # remove the circles on this plate before fitting the next one
+        outline = plate_corners(lattice, plate).astype(np.float32)
+        on_plate = np.array(
+            [cv.pointPolygonTest(outline, (float(x), float(y)), False) >= 0 for x, y in points],
+            dtype=bool,
+        )
+        points = points[~(on_plate | lattice.inliers)]
+
+    if len(lattices) < num_plates:
+        raise ValueError(
+            f"Only {len(lattices)} of the {num_plates} well plates were found in the frame."
+        )
+
+    return assign_slots(lattices, slots)
+
+
+def plate_colours(frame: np.ndarray, lattices: dict, radius: int = 3) -> dict:
+    """
+    Extracts the colours of all wells of all plates in one vectorised pass.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        The (BGR) camera frame.
+
+    lattices : dict
+        The fitted lattice of each plate, keyed by deck slot (see
+        "locate_plates").
+
+    radius : int, default = 3
+        The radius of pixels around each well centre used for its colour.
+
+    Returns
+    -------
+    colours : dict
+        The RGB colours of the wells of each plate, shape (n_rows, n_columns, 3),
+        keyed by deck slot.
+    """
+
+    slots = list(lattices)
+    shape = next(iter(lattices.values())).centres.shape[:2]
+
+    # (row, column) pixel positions of the wells of all plates, one plate after the other
+    centres = np.concatenate([lattices[slot].centres.reshape(-1, 2) for slot in slots])
+    positions = np.round(centres[:, ::-1]).astype(int)[np.newaxis]
+
+    pixels, wells = well_pixels(frame.shape, positions, radius)
+    colours = well_means(frame, pixels, wells, positions.shape[1])[:, ::-1]
+    colours = colours.reshape(len(slots), shape[0], shape[1], -1)
+
+    return {slot: colours[i] for i, slot in enumerate(slots)}
+
+
+def draw_plates(frame: np.ndarray, lattices: dict) -> np.ndarray:
+    """
+    Returns a copy of the frame with the located wells of each plate circled,
+    and each plate labelled with its deck slot.
+    """
+
+    image = frame.copy()
+    for slot, lattice in lattices.items():
+        radius = max(2, int(0.35 * lattice.pitch))
+        for (x, y), detected in zip(
+            lattice.centres.reshape(-1, 2), lattice.detected.ravel()
+        ):
+            colour = (0, 255, 0) if detected else (0, 165, 255)
+            cv.circle(image, (int(round(x)), int(round(y))), radius, colour, 2)
+
+        x, y = lattice.centres[0, 0]
+        cv.putText(
+            image,
+            f"Slot {slot}",
+            (int(x), max(int(y - lattice.pitch), 15)),
+            cv.FONT_HERSHEY_SIMPLEX,
+            0.8,
+            (255, 0, 0),
+            2,
+        )
+
+    return image
@@ -0,0 +1,128 @@
+"""
+Contains code for saving annotated figures of the detected wells without
+slowing down the measurements: the overlays are drawn with OpenCV and written
+on a background thread, and no window is opened when there is no display.
+"""
+
+# Import required libraries.
+import atexit
+import os
+import queue
+import sys
+import threading
+
+import cv2 as cv
+import numpy as np
+
+# The matplotlib backends that cannot open windows.
+NON_INTERACTIVE_BACKENDS = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+
+
+def gui_available() -> bool:
+    """
+    Returns whether windows can be shown: False on Linux without a display, or
+    when matplotlib uses a non-interactive backend (e.g. with MPLBACKEND=Agg).
+    """
+
+    if sys.platform.startswith("linux") and not (
+        os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")
+    ):
+        return False
+
+    backend = os.environ.get("MPLBACKEND")
+    if backend is None and "matplotlib" in sys.modules:
+        backend = sys.modules["matplotlib"].get_backend()
+
+    return backend is None or backend.lower() not in NON_INTERACTIVE_BACKENDS
+
+
+class OverlayWriter:
+    """
+    A class to draw and save overlays on a background thread, in the order
+    they are submitted.
+    """
+
+    def __init__(self):
+
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            draw, path, args = self.queue.get()
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                cv.imwrite(path, draw(*args))
+            except Exception as error:
+                print(f"Warning: could not save the overlay {path}: {error}")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, path: str, draw, *args) -> None:
+        """
+        Queues an overlay: draw(*args) must return the annotated (BGR) image,
+        which is saved to path. The arguments must not be changed afterwards.
+        """
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+        self.queue.put((draw, path, args))
+
+    def wait(self) -> None:
+        """
+        Waits until all queued overlays have been saved.
+        """
+
+        self.queue.join()
+
+
+# The overlay writer shared by all measurements. Queued overlays are saved before Python exits.
+WRITER = OverlayWriter()
+atexit.register(WRITER.wait)
+
+
+def save_overlay(path: str, draw, *args) -> None:
+    """
+    Draws and saves an overlay on the background thread (see "OverlayWriter.submit").
+    """
+
+    WRITER.submit(path, draw, *args)
+
+
+def wait_for_overlays() -> None:
+    """
+    Waits until all queued overlays have been saved.
+    """
+
+    WRITER.wait()
+
+
+def draw_wells(
+    image: np.ndarray,
+    centres: np.ndarray,
+    detected: np.ndarray = None,
+    contours: list = None,
+    radius: int = 4,
+) -> np.ndarray:
+    """
+    Returns a copy of an image with the well centres marked: red for detected
+    wells, and blue for wells placed by the lattice fit. The detected contours
+    are drawn in green, if given.
+    """
+
+    image = image.copy()
+    if contours is not None:
+        cv.drawContours(image, contours, -1, (0, 255, 0), 2)
+
+    centres = np.asarray(centres).reshape(-1, 2)
+    if detected is None:
+        detected = np.ones(len(centres), dtype=bool)
+    for (x, y), found in zip(centres, np.ravel(detected)):
+        colour = (0, 0, 255) if found else (255, 0, 0)
+        cv.circle(image, (int(round(x)), int(round(y))), radius, colour, -1)
+
+    return image
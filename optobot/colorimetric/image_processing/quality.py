@@ -0,0 +1,228 @@
+"""
+Contains code for scoring how far the colour measured in each well can be
+trusted, so that wells spoiled by a bubble, a missed dispense or a misplaced
+well centre can be repeated instead of misleading the optimiser. Four metrics
+are measured per well:
+
+- the spread of the pixel colours inside the well (bubbles, glare, debris),
+- the contrast between the well and the plate surface around it (empty wells),
+- the circularity of the region of the well's colour (misplaced centres, and
+  bubbles that cut into the liquid),
+- the distance between the detected well and its lattice position.
+"""
+
+# Import required libraries.
+import cv2 as cv
+import numpy as np
+import pandas as pd
+
+# The metrics of each well, in the order of the columns of "well_quality".
+QUALITY_COLUMNS = ["pixel_std", "fill_contrast", "circularity", "lattice_offset"]
+
+
+def _ring_offsets(inner: float, outer: float) -> np.ndarray:
+    """
+    Returns the (row, column) offsets of the pixels whose distance from the
+    origin is between inner and outer.
+    """
+
+    size = int(np.ceil(outer))
+    rows, columns = np.mgrid[-size : size + 1, -size : size + 1]
+    distances = np.hypot(rows, columns)
+    inside = (distances >= inner) & (distances <= outer)
+
+    return np.stack([rows[inside], columns[inside]], axis=1)
+
+
+def _sample(image: np.ndarray, positions: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Returns the pixel values at the given offsets around each (row, column)
+    position, shape (n_wells, n_offsets, n_channels).
+    """
+
+    height, width = image.shape[:2]
+    rows = np.clip(positions[:, 0, np.newaxis] + offsets[:, 0], 0, height - 1)
+    columns = np.clip(positions[:, 1, np.newaxis] + offsets[:, 1], 0, width - 1)
+
+    return image[rows, columns].reshape(len(positions), len(offsets), -1).astype(np.float64)
+
+
+def _circularity(
+    image: np.ndarray, position: np.ndarray, colour: np.ndarray, tolerance: float, size: int
+) -> float:
+    """
+    Returns the circularity (4 pi area / perimeter ** 2) of the connected region
+    of pixels around a well centre whose colour is within tolerance of the
+    well's colour. Holes in the region (e.g. a bubble) count against its area.
+    A centre outside the region (e.g. on a bubble) gives 0.
+    """
+
+    height, width = image.shape[:2]
+    row, column = position
+    row0, row1 = max(row - size, 0), min(row + size + 1, height)
+    column0, column1 = max(column - size, 0), min(column + size + 1, width)
+    window = image[row0:row1, column0:column1].astype(np.float64)
+
+    mask = (np.linalg.norm(window - colour, axis=2) < tolerance).astype(np.uint8)
+    # remove thin fringes, e.g. of a well wall of nearly the same colour as the liquid
+    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (2 * (size // 8) + 1,) * 2)
+    mask = cv.morphologyEx(mask, cv.MORPH_OPEN, kernel)
+    _, labels = cv.connectedComponents(mask)
+    label = labels[row - row0, column - column0]
+    if label == 0:
+        return 0.0
+    region = (labels == label).astype(np.uint8)
+
+    contours, _ = cv.findContours(region, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
+    perimeter = cv.arcLength(max(contours, key=cv.contourArea), True)
+    if perimeter == 0:
+        return 0.0
+
+    return float(4 * np.pi * region.sum() / perimeter**2)
+
+
+def well_quality(
+    image: np.ndarray,
+    centres: np.ndarray,
+    pitch: float,
+    detected_points: np.ndarray = None,
+) -> pd.DataFrame:
+    """
+    Measures the quality metrics of every well in a photo.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        The (BGR) photo of the plate.
+
+    centres : np.ndarray, shape(n_wells, 2)
+        The (x, y) pixel centres of the wells, e.g. from the lattice fit.
+
+    pitch : float
+        The distance between neighbouring wells in pixels.
+
+    detected_points : np.ndarray, shape(n_wells, 2), default = None
+        The (x, y) position at which each well was detected (nan for wells that
+        were not detected), e.g. "LatticeFit.points". Without it, the lattice
+        offsets are nan.
+
+    Returns
+    -------
+    metrics : pd.DataFrame
+        One row per well, with the columns of QUALITY_COLUMNS:
+
+        - pixel_std: the standard deviation of the pixel colours within the
+          central part of the well, averaged over the channels.
+        - fill_contrast: the distance between the median colour of the well and
+          that of the plate surface around it.
+        - circularity: the circularity of the region of the well's colour (close to
+          1 for a cleanly filled well).
+        - lattice_offset: the distance between the detected and the lattice
+          centre of the well, as a fraction of the pitch.
+    """
+
+    centres = np.asarray(centres, dtype=float).reshape(-1, 2)
+    positions = np.round(centres[:, ::-1]).astype(int)
+
+    # The central part of the well, from which its colour is taken, and a ring of the plate surface between
+    # the wells (the walls of narrow wells, e.g. of PCR plates, are at 0.3 pitches from the centre, and those
+    # of wide wells at 0.4, so the neighbouring wells start at 0.6 pitches or more).
+    inside = _sample(image, positions, _ring_offsets(0, 0.15 * pitch))
+    surface = _sample(image, positions, _ring_offsets(0.45 * pitch, 0.55 * pitch))
+
+    well_colours = np.median(inside, axis=1)
+    pixel_std = inside.std(axis=1).mean(axis=1)
+    fill_contrast = np.linalg.norm(well_colours - np.median(surface, axis=1), axis=1)
+
+    # The region of the well's colour is grown within a pitch around the centre, with a colour tolerance of
+    # several times the camera noise. The noise is estimated robustly (from the median absolute deviation),
+    # so that a bubble does not widen the tolerance enough to be counted as part of the liquid.
+    noise = 1.4826 * np.median(np.abs(inside - well_colours[:, np.newaxis]), axis=1).mean(axis=1)
+    tolerance = np.maximum(15.0, 6 * noise)
+    size = int(round(0.6 * pitch))
+    circularity = np.array(
+        [
+            _circularity(image, position, colour, tol, size)
+            for position, colour, tol in zip(positions, well_colours, tolerance)
+        ]
+    )
+
+    lattice_offset = np.full(len(centres), np.nan)
+    if detected_points is not None:
+        detected_points = np.asarray(detected_points, dtype=float).reshape(-1, 2)
+        lattice_offset = np.linalg.norm(detected_points - centres, axis=1) / pitch
+
+    return pd.DataFrame(
+        {
+            "pixel_std": pixel_std,
+            "fill_contrast": fill_contrast,
+            "circularity": circularity,
+            "lattice_offset": lattice_offset,
+        }
+    )
+
+
+class QualityThresholds:
+    """
+    The limits that the quality metrics of a well (see "well_quality") must be
+    within for its colour to be used. A limit of None is not checked.
+
+    Parameters
+    ----------
+    max_pixel_std : float, default = 12.0
+        The largest spread of the pixel colours inside the well.
+
+    min_fill_contrast : float, default = 12.0
+        The smallest contrast between the well and the plate surface. Lower it
+        for experiments with very pale wells.
+
+    min_circularity : float, default = 0.6
+        The smallest circularity of the region of the well's colour.
+
+    max_lattice_offset : float, default = 0.2
+        The largest distance between the detected and the lattice centre of
+        the well, as a fraction of the pitch.
+    """
+
+    def __init__(
+        self,
+        max_pixel_std: float = 12.0,
+        min_fill_contrast: float = 12.0,
+        min_circularity: float = 0.6,
+        max_lattice_offset: float = 0.2,
+    ):
+
+        self.max_pixel_std = max_pixel_std
+        self.min_fill_contrast = min_fill_contrast
+        self.min_circularity = min_circularity
+        self.max_lattice_offset = max_lattice_offset
+
+    def passed(self, metrics: pd.DataFrame) -> np.ndarray:
+        """
+        Returns whether each well is within all the limits. A missing metric
+        (nan, e.g. the lattice offset of a well that was not detected) is not
+        held against the well.
+        """
+
+        limits = [
+            ("pixel_std", self.max_pixel_std, np.greater),
+            ("fill_contrast", self.min_fill_contrast, np.less),
+            ("circularity", self.min_circularity, np.less),
+            ("lattice_offset", self.max_lattice_offset, np.greater),
+        ]
+
+        passed = np.ones(len(metrics), dtype=bool)
+        for column, limit, fails in limits:
+            if limit is not None:
+                passed &= ~fails(metrics[column].to_numpy(), limit)
+
+        return passed
+
+    def assess(self, metrics: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns a copy of the metrics with a "passed" column added.
+        """
+
+        metrics = metrics.copy()
+        metrics["passed"] = self.passed(metrics)
+        return metrics
@@ -0,0 +1,312 @@
+"""
+Contains code for rectifying camera images of a well plate: lens distortion is
+removed and the plate is warped to a top-down view in which it fills the whole
+image, so that the well centres calculated by "fixed_grid.get_well_centres"
+land on the wells. Both steps are combined into one pair of pixel maps, which
+are cached on disk, so each frame only needs a single "cv.remap".
+"""
+
+# Import required libraries.
+import json
+import os
+
+import cv2 as cv
+import numpy as np
+
+from optobot.colorimetric.image_processing.fixed_grid import PLATE
+
+
+def calibrate_lens(
+    images: list, pattern_size: tuple[int] = (9, 6), square_size: float = 1.0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calibrates the camera lens from images of a chessboard pattern.
+
+    Parameters
+    ----------
+    images : list
+        Images (or paths to images) of the chessboard in different positions.
+
+    pattern_size : tuple[int], default = (9, 6)
+        The number of inner corners of the chessboard (columns, rows).
+
+    square_size : float, default = 1.0
+        The size of the chessboard squares (any unit).
+
+    Returns
+    -------
+    camera_matrix : np.ndarray, shape(3, 3)
+        The camera matrix.
+
+    dist_coeffs : np.ndarray
+        The lens distortion coefficients.
+    """
+
+    pattern = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+    pattern[:, :2] = np.mgrid[0 : pattern_size[0], 0 : pattern_size[1]].T.reshape(-1, 2)
+    pattern *= square_size
+
+    object_points, image_points = [], []
+    image_size = None
+    for image in images:
+        if isinstance(image, str):
+            image = cv.imread(image)
+        grey = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        image_size = grey.shape[::-1]
+
+        found, corners = cv.findChessboardCorners(grey, pattern_size)
+        if not found:
+            continue
+        corners = cv.cornerSubPix(
+            grey,
+            corners,
+            (11, 11),
+            (-1, -1),
+            (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.001),
+        )
+        object_points.append(pattern)
+        image_points.append(corners)
+
+    if len(object_points) < 3:
+        raise ValueError(
+            f"The chessboard was only found in {len(object_points)} image(s); at least 3 are needed."
+        )
+
+    _, camera_matrix, dist_coeffs, _, _ = cv.calibrateCamera(
+        object_points, image_points, image_size, None, None
+    )
+
+    return camera_matrix, dist_coeffs
+
+
+def select_plate_corners(image: np.ndarray) -> np.ndarray:
+    """
+    Lets the user click on the four outer corners of the well plate in an
+    image, in the order top-left, top-right, bottom-right, bottom-left (with
+    well A1 at the top-left).
+
+    Returns
+    -------
+    corners : np.ndarray, shape(4, 2)
+        The (x, y) pixel positions of the corners.
+    """
+
+    import matplotlib.pyplot as plt
+
+    plt.imshow(cv.cvtColor(image, cv.COLOR_BGR2RGB))
+    plt.title("Click the plate corners: top-left, top-right, bottom-right, bottom-left")
+    corners = np.array(plt.ginput(4, timeout=0))
+    plt.close()
+
+    return corners
+
+
+class Rectifier:
+    """
+    A class to undistort and rectify images of a well plate with one remap.
+
+    Parameters
+    ----------
+    image_size : tuple[int]
+        The (width, height) of the camera images.
+
+    plate_corners : np.ndarray, shape(4, 2)
+        The (x, y) pixel positions of the outer corners of the plate in the
+        camera images, in the order top-left, top-right, bottom-right,
+        bottom-left.
+
+    camera_matrix : np.ndarray, shape(3, 3), default = None
+        The camera matrix (see "calibrate_lens"). If None, the lens distortion
+        is not corrected.
+
+    dist_coeffs : np.ndarray, default = None
+        The lens distortion coefficients.
+
+    plate : dict, default = PLATE
+        The geometry of the plate, which sets the aspect ratio of the output.
+
+    pixels_per_mm : float, default = 10.0
+        The resolution of the rectified images.
+    """
+
+    def __init__(
+        self,
+        image_size: tuple[int],
+        plate_corners: np.ndarray,
+        camera_matrix: np.ndarray = None,
+        dist_coeffs: np.ndarray = None,
+        plate: dict = PLATE,
+        pixels_per_mm: float = 10.0,
+    ):
+
+        self.image_size = tuple(int(size) for size in image_size)
+        self.plate_corners = np.asarray(plate_corners, dtype=np.float32)
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+        self.plate = plate
+        self.pixels_per_mm = pixels_per_mm
+        self.output_size = (
+            int(round(plate["width"] * pixels_per_mm)),
+            int(round(plate["height"] * pixels_per_mm)),
+        )
+
+        self.map1, self.map2 = self._build_maps()
+
+    def _build_maps(self) -> tuple[np.ndarray, np.ndarray]:
+        width, height = self.output_size
+
+        # The plate corners are given in the distorted camera image, so undistort them first.
+        corners = self.plate_corners
+        if self.camera_matrix is not None:
+            corners = cv.undistortPoints(
+                corners.reshape(-1, 1, 2),
+                self.camera_matrix,
+                self.dist_coeffs,
+                P=self.camera_matrix,
+            ).reshape(-1, 2)
+
+        output_corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        homography = cv.getPerspectiveTransform(output_corners, corners.astype(np.float32))
+
+        # For every output pixel, find the undistorted camera pixel it comes from.
+        x, y = np.meshgrid(
+            np.arange(width, dtype=np.float32) + 0.5,
+            np.arange(height, dtype=np.float32) + 0.5,
+        )
+        points = np.stack([x.ravel(), y.ravel()], axis=1).reshape(-1, 1, 2)
+        undistorted = cv.perspectiveTransform(points, homography).reshape(-1, 2)
+
+        # Then find where that pixel is in the distorted camera image.
+        if self.camera_matrix is not None:
+            normalised = (undistorted - self.camera_matrix[:2, 2]) / np.diag(
+                self.camera_matrix
+            )[:2]
+            normalised = np.hstack([normalised, np.ones((len(normalised), 1))])
+            source, _ = cv.projectPoints(
+                normalised,
+                np.zeros(3),
+                np.zeros(3),
+                self.camera_matrix,
+                self.dist_coeffs,
+            )
+            source = source.reshape(-1, 2)
+        else:
+            source = undistorted
+
+        # remap samples at integer pixel positions, so shift back by half a pixel
+        source = (source - 0.5).reshape(height, width, 2).astype(np.float32)
+
+        # Fixed-point maps make cv.remap faster.
+        return cv.convertMaps(source, None, cv.CV_16SC2)
+
+    def rectify(self, image: np.ndarray) -> np.ndarray:
+        """
+        Undistorts and rectifies an image.
+        """
+
+        return cv.remap(
+            image,
+            self.map1,
+            self.map2,
+            interpolation=cv.INTER_LINEAR,
+            borderMode=cv.BORDER_CONSTANT,
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Caches the maps (and the parameters they were built from) in a .npz file.
+        """
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            map1=self.map1,
+            map2=self.map2,
+            image_size=np.array(self.image_size),
+            output_size=np.array(self.output_size),
+            plate_corners=self.plate_corners,
+            camera_matrix=(
+                np.array([]) if self.camera_matrix is None else self.camera_matrix
+            ),
+            dist_coeffs=np.array([]) if self.dist_coeffs is None else self.dist_coeffs,
+            plate=np.array(json.dumps(self.plate, default=lambda value: value.item())),
+            pixels_per_mm=np.array(self.pixels_per_mm),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Rectifier":
+        """
+        Loads cached maps, without rebuilding them.
+        """
+
+        rectifier = cls.__new__(cls)
+        with np.load(path) as data:
+            rectifier.map1 = data["map1"]
+            rectifier.map2 = data["map2"]
+            rectifier.image_size = tuple(int(size) for size in data["image_size"])
+            rectifier.output_size = tuple(int(size) for size in data["output_size"])
+            rectifier.plate_corners = data["plate_corners"]
+            rectifier.camera_matrix = (
+                data["camera_matrix"] if data["camera_matrix"].size else None
+            )
+            rectifier.dist_coeffs = (
+                data["dist_coeffs"] if data["dist_coeffs"].size else None
+            )
+            # maps cached before the plate and resolution were saved are never reused for building
+            rectifier.plate = json.loads(str(data["plate"])) if "plate" in data else None
+            rectifier.pixels_per_mm = (
+                float(data["pixels_per_mm"]) if "pixels_per_mm" in data else None
+            )
+
+        return rectifier
+
+
+def get_rectifier(
+    path: str,
+    image_size: tuple[int] = None,
+    plate_corners: np.ndarray = None,
+    camera_matrix: np.ndarray = None,
+    dist_coeffs: np.ndarray = None,
+    plate: dict = PLATE,
+    pixels_per_mm: float = 10.0,
+) -> Rectifier:
+    """
+    Loads the cached rectification maps at path, or builds them (from the
+    other arguments) and caches them if there are none yet, or if they were
+    built from different parameters (image size, plate corners, lens
+    calibration, plate geometry or resolution). With only the path, the cached
+    maps are loaded as they are.
+    """
+
+    def same_array(given, cached):
+        if given is None or cached is None:
+            return given is None and cached is None
+        given = np.asarray(given, dtype=float)
+        return given.shape == cached.shape and np.allclose(given, cached)
+
+    if os.path.exists(path):
+        rectifier = Rectifier.load(path)
+        if image_size is None and plate_corners is None:
+            return rectifier
+        if (
+            (image_size is None or tuple(image_size) == rectifier.image_size)
+            and (plate_corners is None or same_array(plate_corners, rectifier.plate_corners))
+            and same_array(camera_matrix, rectifier.camera_matrix)
+            and same_array(dist_coeffs, rectifier.dist_coeffs)
+            and plate == rectifier.plate
+            and pixels_per_mm == rectifier.pixels_per_mm
+        ):
+            return rectifier
+
+    if image_size is None or plate_corners is None:
+        raise ValueError(
+            f"The rectification maps at {path} were built from other parameters, or there are none; "
+            "image_size and plate_corners are needed to build them."
+        )
+
+    rectifier = Rectifier(
+        image_size, plate_corners, camera_matrix, dist_coeffs, plate, pixels_per_mm
+    )
+    rectifier.save(path)
+
+    return rectifier
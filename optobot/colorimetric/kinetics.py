@@ -0,0 +1,355 @@
+"""
+Contains code for kinetic measurements, e.g. of enzyme activity assays: a
+sequence of frames is captured over a time window into a memory-mapped frame
+store on disk, the colour time series of every well is extracted from it in
+streaming, vectorised chunks, and each series is reduced to rate features that
+the objective function can use.
+"""
+
+# Import required libraries.
+import os
+import time
+
+import numpy as np
+
+from optobot.colorimetric.image_capture.averaging import well_pixels
+from optobot.colorimetric.image_processing.fixed_grid import PLATE, get_well_centres
+
+# The rate features that can be extracted from each colour channel of a well.
+FEATURES = ("initial_rate", "rate", "change")
+
+
+class FrameStore:
+    """
+    A class to store a sequence of frames in a memory-mapped .npy file, so
+    that long sequences do not have to be held in memory.
+
+    Parameters
+    ----------
+    path : str
+        The path of the .npy file of the frames. The timestamps are saved next
+        to it, with "_times" added to the name.
+
+    frame_shape : tuple, default = None
+        The shape of each frame. If None, an existing store is opened.
+
+    max_frames : int, default = None
+        The largest number of frames that can be stored.
+    """
+
+    def __init__(self, path: str, frame_shape: tuple = None, max_frames: int = None):
+
+        self.path = path
+        self.times_path = path.replace(".npy", "_times.npy")
+
+        if frame_shape is None:
+            self.frames = np.load(path, mmap_mode="r")
+            self.times = np.load(self.times_path)
+            self.count = len(self.times)
+        else:
+            self.frames = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.uint8, shape=(max_frames,) + tuple(frame_shape)
+            )
+            self.times = np.zeros(max_frames)
+            self.count = 0
+
+    def append(self, frame: np.ndarray, timestamp: float) -> None:
+        if self.count == len(self.frames):
+            raise ValueError("The frame store is full.")
+
+        self.frames[self.count] = frame
+        self.times[self.count] = timestamp
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Writes the frames and timestamps to disk.
+        """
+
+        self.frames.flush()
+        np.save(self.times_path, self.times[: self.count])
+
+    def chunks(self, chunk_size: int = 32):
+        """
+        Yields the stored frames in chunks of chunk_size frames.
+        """
+
+        for start in range(0, self.count, chunk_size):
+            yield self.frames[start : min(start + chunk_size, self.count)]
+
+    def delete(self) -> None:
+        """
+        Deletes the files of the store. The frames can no longer be read.
+        """
+
+        self.frames = None
+        for path in (self.path, self.times_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def record_frames(
+    camera,
+    path: str,
+    duration: float,
+    interval: float = 5.0,
+    rectifier=None,
+    locator=None,
+) -> FrameStore:
+    """
+    Captures a frame from a running CameraService every interval seconds for
+    duration seconds, into a FrameStore. If a Rectifier is given, the
+    rectified frames are stored, or if a PlateLocator is given, only the
+    plate's region of interest is stored.
+    """
+
+    if locator is not None and rectifier is None:
+        locator.update(camera.latest_frame())
+
+    def capture():
+        frame = camera.next_frame()
+        if rectifier is not None:
+            return rectifier.rectify(frame)
+        return frame if locator is None else locator.crop(frame)
+
+    max_frames = int(np.floor(duration / interval)) + 1
+    first = capture()
+    store = FrameStore(path, first.shape, max_frames)
+
+    start_time = time.monotonic()
+    store.append(first, 0.0)
+    for i in range(1, max_frames):
+        time.sleep(max(start_time + i * interval - time.monotonic(), 0.0))
+        store.append(capture(), time.monotonic() - start_time)
+
+    store.close()
+    return store
+
+
+def well_time_series(
+    store: FrameStore, positions: np.ndarray, radius: int = 3, chunk_size: int = 32
+) -> np.ndarray:
+    """
+    Extracts the mean colour of every well in every stored frame, reading the
+    frames in chunks.
+
+    Parameters
+    ----------
+    store : FrameStore
+        The stored frames (BGR, as captured by OpenCV).
+
+    positions : np.ndarray, shape(n_rows, n_columns, 2)
+        The pixel positions of the well centres.
+
+    radius : int, default = 3
+        The radius of pixels around each well centre used for its colour.
+
+    chunk_size : int, default = 32
+        The number of frames read at once.
+
+    Returns
+    -------
+    series : np.ndarray, shape(n_frames, n_rows * n_columns, 3)
+        The RGB colour of each well in each frame.
+    """
+
+    num_wells = positions.shape[0] * positions.shape[1]
+    pixels, _ = well_pixels(store.frames.shape[1:], positions, radius)
+    series = []
+
+    for chunk in store.chunks(chunk_size):
+        # every well has the same number of pixels, stored one well after the other
+        values = chunk.reshape(len(chunk), -1, chunk.shape[-1])[:, pixels]
+        series.append(values.reshape(len(chunk), num_wells, -1, values.shape[-1]).mean(axis=2))
+
+    return np.concatenate(series)[:, :, ::-1]
+
+
+def rate_features(
+    times: np.ndarray,
+    series: np.ndarray,
+    features: tuple = ("initial_rate",),
+    initial_fraction: float = 0.25,
+) -> np.ndarray:
+    """
+    Reduces colour time series to rate features, for all wells at once.
+
+    The features are:
+        - "initial_rate": the slope of a straight-line fit to the first
+          initial_fraction of the series (colour levels per second).
+        - "rate": the slope of a straight-line fit to the whole series.
+        - "change": the difference between the last and first colours.
+
+    Parameters
+    ----------
+    times : np.ndarray, shape(n_frames)
+        The times of the frames in seconds.
+
+    series : np.ndarray, shape(n_frames, n_wells, n_channels)
+        The colour time series of the wells.
+
+    features : tuple, default = ("initial_rate",)
+        The features to extract.
+
+    initial_fraction : float, default = 0.25
+        The fraction of the series used for the initial rate.
+
+    Returns
+    -------
+    features : np.ndarray, shape(n_wells, n_features * n_channels)
+        The features of each well, in the order of features, each for every
+        channel.
+    """
+
+    def slope(t, y):
+        t = t - t.mean()
+        return np.tensordot(t, y - y.mean(axis=0), axes=(0, 0)) / (t**2).sum()
+
+    num_initial = max(int(round(initial_fraction * len(times))), 2)
+    results = []
+    for feature in features:
+        if feature == "initial_rate":
+            results.append(slope(times[:num_initial], series[:num_initial]))
+        elif feature == "rate":
+            results.append(slope(times, series))
+        elif feature == "change":
+            results.append(series[-1] - series[0])
+        else:
+            raise ValueError(f"Unknown feature '{feature}'. Choose from {FEATURES}.")
+
+    return np.concatenate(results, axis=1)
+
+
+def feature_names(features: tuple = ("initial_rate",), channels=("red", "green", "blue")):
+    """
+    Returns the names of the features returned by "rate_features", e.g. to use
+    as the measured_parameter_names of an OptimisationLoop.
+    """
+
+    return [f"{feature}_{channel}" for feature in features for channel in channels]
+
+
+class KineticMeasurement:
+    """
+    A measurement function for OptimisationLoop that follows the colours of
+    the wells over time and returns their rate features.
+
+    Each iteration, frames are captured every interval seconds for duration
+    seconds into a memory-mapped store in the experiment directory, the colour
+    time series of the wells are extracted and saved, and the wells of the
+    iteration are reduced to rate features. The frames themselves are deleted
+    once the time series are saved, unless keep_frames is True. The measured_parameter_names of
+    the loop should be "feature_names(features)".
+
+    Parameters
+    ----------
+    camera : CameraService
+        A running camera service looking at the (cropped) wellplate.
+
+    duration : float, default = 300.0
+        The length of the time window in seconds.
+
+    interval : float, default = 5.0
+        The time between frames in seconds.
+
+    features : tuple, default = ("initial_rate",)
+        The rate features to return (see "rate_features").
+
+    radius : int, default = 3
+        The radius of pixels around each well centre used for its colour.
+
+    initial_fraction : float, default = 0.25
+        The fraction of the window used for the initial rate.
+
+    rectifier : Rectifier, default = None
+        If given, the frames are undistorted and rectified before they are
+        stored (see "optobot.colorimetric.image_processing.rectification").
+
+    locator : PlateLocator, default = None
+        If given (and no rectifier), the plate is located (or checked not to
+        have moved) before each recording, and only the plate's region of
+        interest is stored (see
+        "optobot.colorimetric.image_processing.localisation").
+
+    keep_frames : bool, default = False
+        Whether to keep the full-resolution frames of every iteration on disk
+        (about 3 MB per frame for a 1280 x 720 camera).
+    """
+
+    def __init__(
+        self,
+        camera,
+        duration: float = 300.0,
+        interval: float = 5.0,
+        features: tuple = ("initial_rate",),
+        radius: int = 3,
+        initial_fraction: float = 0.25,
+        rectifier=None,
+        locator=None,
+        keep_frames: bool = False,
+    ):
+
+        self.camera = camera
+        self.duration = duration
+        self.interval = interval
+        self.features = features
+        self.radius = radius
+        self.initial_fraction = initial_fraction
+        self.rectifier = rectifier
+        self.locator = locator
+        self.keep_frames = keep_frames
+
+    def __call__(
+        self,
+        liquid_volumes,
+        iteration_count,
+        population_size,
+        num_measured_parameters,
+        data_dir,
+        wells=None,
+        plate=PLATE,
+    ):
+
+        os.makedirs(f"{data_dir}/kinetics", exist_ok=True)
+        path = f"{data_dir}/kinetics/frames_iteration_{iteration_count}.npy"
+
+        print(f"Recording the wells for {self.duration:.0f} s...")
+        store = record_frames(
+            self.camera,
+            path,
+            self.duration,
+            self.interval,
+            self.rectifier,
+            self.locator,
+        )
+
+        positions = get_well_centres(store.frames[0], plate)
+        series = well_time_series(store, positions, self.radius)
+        times = store.times[: store.count]
+        np.savez(
+            f"{data_dir}/kinetics/series_iteration_{iteration_count}.npz",
+            times=times,
+            colours=series,
+        )
+        if not self.keep_frames:
+            store.delete()
+
+        if wells is not None:
+            # each image shows one wellplate, so index the wells by their row and column only
+            flat_wells = wells[:, 1] * plate["columns"] + wells[:, 2]
+        else:
+            start = (iteration_count * population_size) % plate["wells"]
+            flat_wells = np.arange(start, start + population_size) % plate["wells"]
+
+        measurements = rate_features(
+            times, series[:, flat_wells], self.features, self.initial_fraction
+        )
+
+        if measurements.shape[1] != num_measured_parameters:
+            raise ValueError(
+                f"The kinetic measurement returns {measurements.shape[1]} features per well, "
+                f"but the loop expects {num_measured_parameters}. Use feature_names(features) "
+                "as the measured_parameter_names."
+            )
+
+        return measurements
@@ -0,0 +1,198 @@
+"""
+Contains a convergence monitor that decides when an optimisation should stop,
+from the full history of its wells, and the signal it raises to stop the
+optimisation loop cleanly.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class ConvergenceReached(Exception):
+    """
+    Raised by the ConvergenceMonitor when a stopping rule is met. The optimiser drivers (run_optimisation, the
+    CampaignScheduler and the BatchDispatcher) catch it to stop handing out batches. All data of the iteration that met
+    the rule has been stored by the time it is raised.
+
+    Parameters:
+        - rule (string):
+            The stopping rule that was met: "tolerance", "plateau", "expected_improvement" or "budget".
+        - message (string):
+            Why the optimisation stopped.
+        - iteration (int):
+            The number of iterations recorded when the rule was met.
+        - best_error (float):
+            The smallest error measured so far (nan if there is none).
+        - best_liquid_volumes (ndarray):
+            The liquid volumes (dilution agent first) of the well with the smallest error (None if there is none).
+
+    """
+
+    def __init__(self, rule, message, iteration, best_error, best_liquid_volumes):
+
+        super().__init__(message)
+        self.rule = rule
+        self.message = message
+        self.iteration = iteration
+        self.best_error = best_error
+        self.best_liquid_volumes = best_liquid_volumes
+
+
+class ConvergenceMonitor:
+    """
+    A class to decide when an optimisation should stop, from the history of all wells measured so far (including the
+    repeats of wells that failed the quality checks). The rules are checked after every iteration, and the first one
+    that is met raises ConvergenceReached.
+
+    - tolerance: a measurement is within the tolerance of the target (see OptimisationLoop.check_convergence).
+    - budget: max_wells wells, or max_seconds of robot and measurement time, have been used.
+    - plateau: the best error has not improved by more than min_improvement (relative) over the last
+      plateau_iterations iterations.
+    - expected_improvement: the surrogate model of the optimiser expects no well in the search space to improve on the
+      best error by more than min_expected_improvement (checked by the optimiser drivers after each tell).
+
+    Parameters:
+        - plateau_iterations (int):
+            Number of iterations without improvement after which to stop. If None, the plateau rule is not used.
+        - min_improvement (float):
+            Smallest relative decrease of the best error over plateau_iterations iterations that counts as improvement.
+        - min_expected_improvement (float):
+            Smallest expected improvement of the best error (in the units of the error) worth another iteration.
+            If None, the expected improvement rule is not used.
+        - max_wells (int):
+            Largest number of wells to use. If None, the number of wells is not limited.
+        - max_seconds (float):
+            Largest total duration of the iterations, in seconds. If None, time is not limited.
+
+    """
+
+    def __init__(
+        self,
+        plateau_iterations=None,
+        min_improvement=0.01,
+        min_expected_improvement=None,
+        max_wells=None,
+        max_seconds=None,
+    ):
+
+        self.plateau_iterations = plateau_iterations
+        self.min_improvement = min_improvement
+        self.min_expected_improvement = min_expected_improvement
+        self.max_wells = max_wells
+        self.max_seconds = max_seconds
+
+        # History of all wells, and of each iteration
+        self.liquid_volumes = None
+        self.errors = np.empty(0)
+        self.num_close = 0
+        self.time_used = 0.0
+        self.history = []
+
+    @property
+    def best_error(self):
+        finite = np.isfinite(self.errors)
+        return float(np.min(self.errors[finite])) if finite.any() else np.nan
+
+    def best_liquid_volumes(self):
+        finite = np.isfinite(self.errors)
+        if not finite.any():
+            return None
+        return self.liquid_volumes[np.flatnonzero(finite)[np.argmin(self.errors[finite])]]
+
+    def stop(self, rule, message):
+        return ConvergenceReached(
+            rule, message, len(self.history), self.best_error, self.best_liquid_volumes()
+        )
+
+    def update(self, liquid_volumes, errors, close_mask=None, elapsed=None):
+        """
+        Adds the wells of one iteration to the history and checks the tolerance, budget and plateau rules.
+
+        Parameters:
+        - liquid_volumes (ndarray):
+            Volumes of each liquid (dilution agent first) in each well of the iteration.
+        - errors (array):
+            Errors of the wells (nan for wells that failed).
+        - close_mask (array):
+            Whether each well's measurement is within the tolerance of the target. If None, no well is.
+        - elapsed (float):
+            Duration of the iteration in seconds.
+
+        Raises:
+        - ConvergenceReached:
+            If a rule is met.
+        """
+
+        liquid_volumes = np.asarray(liquid_volumes, dtype=float)
+        if self.liquid_volumes is None:
+            self.liquid_volumes = np.empty((0, liquid_volumes.shape[1]))
+        self.liquid_volumes = np.vstack([self.liquid_volumes, liquid_volumes])
+        self.errors = np.concatenate([self.errors, np.asarray(errors, dtype=float)])
+        if close_mask is not None:
+            self.num_close += int(np.sum(close_mask))
+        self.time_used += elapsed or 0.0
+
+        self.history.append(
+            {
+                "iteration_number": len(self.history) + 1,
+                "wells": len(self.errors),
+                "best_error": self.best_error,
+                "num_close": self.num_close,
+                "time_used": self.time_used,
+                "expected_improvement": np.nan,
+            }
+        )
+
+        if self.num_close > 0:
+            raise self.stop("tolerance", "measurements have been found that are close to the target.")
+
+        if self.max_wells is not None and len(self.errors) >= self.max_wells:
+            raise self.stop(
+                "budget", f"{len(self.errors)} wells have been used (budget of {self.max_wells})."
+            )
+        if self.max_seconds is not None and self.time_used >= self.max_seconds:
+            raise self.stop(
+                "budget",
+                f"{self.time_used:.0f} seconds have been used (budget of {self.max_seconds:.0f}).",
+            )
+
+        n = self.plateau_iterations
+        if n is not None and len(self.history) > n:
+            before = self.history[-1 - n]["best_error"]
+            now = self.history[-1]["best_error"]
+            if np.isfinite(before) and not before - now > self.min_improvement * abs(before):
+                raise self.stop(
+                    "plateau",
+                    f"the best error ({now:.4g}) has not improved by more than {self.min_improvement:.0%} "
+                    f"in the last {n} iterations.",
+                )
+
+    def check_expected_improvement(self, optimiser):
+        """
+        Checks the expected improvement rule with the surrogate model of the optimiser, after it has been told the
+        results of the last iteration. Optimisers without a surrogate model (e.g. the particle swarm) are not checked.
+
+        Raises:
+        - ConvergenceReached:
+            If the largest expected improvement is below min_expected_improvement.
+        """
+
+        if self.min_expected_improvement is None or not self.history:
+            return
+
+        expected_improvement = optimiser.expected_improvement()
+        self.history[-1]["expected_improvement"] = expected_improvement
+        if expected_improvement < self.min_expected_improvement:
+            raise self.stop(
+                "expected_improvement",
+                f"the largest expected improvement of the best error ({expected_improvement:.4g}) is below "
+                f"{self.min_expected_improvement:.4g}.",
+            )
+
+    def history_df(self):
+        """
+        Returns the history of the iterations (wells used, best error, number of wells within the tolerance, time used
+        and the largest expected improvement, if checked) as a DataFrame.
+        """
+
+        return pd.DataFrame(self.history)
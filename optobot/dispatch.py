@@ -0,0 +1,239 @@
+"""
+Contains a dispatcher that shares one optimiser between several OT-2 robots.
+Batches are handed out as soon as a robot is free, and the results are told
+to the optimiser in whatever order the robots finish.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from optobot.automate import split_measurements
+from optobot.convergence import ConvergenceReached
+from optobot.optimisation.optimisers import SkoptAskTell
+from optobot.ot2_protocol import generate_script
+
+
+class LocalRobotWorker:
+    """
+    A stand-in for a robot and its measurement set-up, for testing the dispatcher offline.
+    Running a batch sleeps for the simulated run time and returns simulated measurements.
+
+    Parameters:
+        - name (string):
+            Name of the robot.
+        - measurement_function (function):
+            Function that takes the liquid volumes of a batch (water first) and returns the simulated measurements,
+            of shape (batch_size, num_measured_parameters).
+        - wellplate_locs (list of ints):
+            Location(s) of the wellplate(s) on the deck of this robot.
+        - run_time (float):
+            Simulated fixed time per run in seconds (e.g. deck set-up and measurement).
+        - seconds_per_well (float):
+            Simulated pipetting time per well in seconds.
+
+    """
+
+    def __init__(
+        self,
+        name,
+        measurement_function,
+        wellplate_locs=[5],
+        run_time=1.0,
+        seconds_per_well=0.0,
+    ):
+
+        self.name = name
+        self.measurement_function = measurement_function
+        self.wellplate_locs = wellplate_locs
+        self.run_time = run_time
+        self.seconds_per_well = seconds_per_well
+
+    def run_batch(self, protocol_path, liquid_volumes, wells):
+        """
+        Runs one batch and returns the measurements of its wells.
+
+        Parameters:
+        - protocol_path (string):
+            Path of the generated OT-2 protocol for this robot.
+        - liquid_volumes (ndarray):
+            Volumes of each liquid (water first) put in each well.
+        - wells (ndarray):
+            (wellplate index on this robot, row, column) of each well.
+        """
+
+        time.sleep(self.run_time + self.seconds_per_well * len(liquid_volumes))
+        return np.asarray(self.measurement_function(liquid_volumes))
+
+
+class BatchDispatcher:
+    """
+    A class to run one optimisation across several robots asynchronously.
+
+    The wellplates of the OptimisationLoop are split between the robots in order: with two robots that each have
+    wellplate_locs=[5], the loop should be created with two wellplates (e.g. wellplate_locs=[5, 5]), the first of which
+    is on the first robot. Each robot gets its own generated protocol, with only its own wellplates.
+
+    Parameters:
+        - loop (OptimisationLoop):
+            The optimisation loop, used for its objective function, data storage and well allocation.
+        - optimiser (SkoptAskTell):
+            The shared ask-and-tell optimiser. It must accept a variable set of pending points (GP, RF or
+            TransferAskTell). Optimisers that model the measurements are told them as well.
+        - robots (list):
+            The robot workers. Each needs a name, its wellplate_locs, and a run_batch(protocol_path, liquid_volumes, wells)
+            method that blocks until the run has finished and returns the measurements (or a MeasurementResult with
+            their uncertainty and the quality of the wells, see optobot.measurement).
+
+    """
+
+    def __init__(self, loop, optimiser, robots):
+
+        if not optimiser.variable_batch_size:
+            raise ValueError(
+                "The dispatcher needs an optimiser that can propose batches around pending points (GP or RF)."
+            )
+
+        num_robot_plates = sum(len(robot.wellplate_locs) for robot in robots)
+        if num_robot_plates != loop.num_wellplates:
+            raise ValueError(
+                f"The robots have {num_robot_plates} wellplates between them, but the loop has {loop.num_wellplates}."
+            )
+
+        # the space-filling batches handed out before any result is back must fit in a well
+        if isinstance(optimiser, SkoptAskTell) and optimiser.total_volume is None:
+            optimiser.total_volume = loop.total_volume
+
+        self.loop = loop
+        self.optimiser = optimiser
+        self.robots = robots
+
+        # global wellplate indices of each robot
+        self.robot_plates = {}
+        first_plate = 0
+        for robot in robots:
+            self.robot_plates[robot.name] = list(
+                range(first_plate, first_plate + len(robot.wellplate_locs))
+            )
+            first_plate += len(robot.wellplate_locs)
+
+    def submit(self, pool, robot, batch_count, pending_points):
+        """
+        Asks the optimiser for a batch for a free robot, allocates its wells, writes its protocol and starts the run.
+        Wells of earlier batches that failed the quality checks are repeated after the new points, if there is room.
+        """
+
+        loop = self.loop
+        plates = self.robot_plates[robot.name]
+        batch_size = min(loop.population_size, loop.allocator.free_wells(plates))
+        if batch_size == 0:
+            return None
+
+        points = self.optimiser.ask(batch_size, pending=pending_points)
+        repeats, attempts = loop.take_requeued(loop.allocator.free_wells(plates) - len(points))
+        liquid_volumes = loop.add_water(np.vstack([points, repeats]))
+        attempts = np.concatenate([np.zeros(len(points), dtype=int), attempts])
+        wells = loop.allocator.allocate(len(liquid_volumes), batch_count + 1, plates=plates)
+
+        # the protocol only knows about this robot's wellplates, so renumber them from 1
+        plate, row, column = loop.allocator.positions(wells)
+        local_plate = plate - plates[0]
+        well_names = [
+            (local + 1, name[1])
+            for local, name in zip(local_plate, loop.allocator.well_names(wells))
+        ]
+        filepath = f"{loop.exp_data_dir}/generated_ot2_script_{robot.name}.py"
+        generate_script(
+            filepath,
+            well_names,
+            liquid_volumes,
+            robot.wellplate_locs,
+            loop.protocol_labware,
+        )
+
+        local_wells = np.stack([local_plate, row, column], axis=1)
+        future = pool.submit(robot.run_batch, filepath, liquid_volumes, local_wells)
+
+        return future, (robot, batch_count + 1, points, wells, liquid_volumes, attempts, time.monotonic())
+
+    def run(self, num_batches):
+        """
+        Runs num_batches batches in total, keeping every robot busy until they have all been handed out. If a stopping
+        rule of the loop's convergence monitor is met, no more batches are handed out, and the batches that are still
+        running are recorded (the stopping rule is left in loop.stopped).
+
+        Returns:
+        - wall_time (float):
+            The wall-clock time of the whole run in seconds.
+        """
+
+        start_time = time.monotonic()
+        idle = list(self.robots)
+        running = {}
+        batch_count = 0
+
+        with ThreadPoolExecutor(max_workers=len(self.robots)) as pool:
+            while batch_count < num_batches or running:
+
+                # hand out batches to every free robot
+                while idle and batch_count < num_batches:
+                    robot = idle.pop(0)
+                    pending_points = [batch[2] for batch in running.values()]
+                    pending_points = (
+                        np.vstack(pending_points) if pending_points else None
+                    )
+                    submitted = self.submit(pool, robot, batch_count, pending_points)
+                    if submitted is None:
+                        print(f"No free wells left on robot '{robot.name}'.")
+                        continue
+
+                    future, batch = submitted
+                    running[future] = batch
+                    batch_count += 1
+                    print(f"Batch {batch_count} sent to robot '{robot.name}'.")
+
+                if not running:
+                    break
+
+                # collect the results of whichever robots finish first
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    robot, batch_number, points, wells, liquid_volumes, attempts, submit_time = (
+                        running.pop(future)
+                    )
+                    measurements, uncertainty, quality = split_measurements(future.result())
+                    idle.append(robot)
+
+                    try:
+                        errors = self.loop.record(
+                            wells,
+                            liquid_volumes,
+                            measurements,
+                            time.monotonic() - submit_time,
+                            quality,
+                            attempts,
+                            uncertainty,
+                            batch_number,
+                        )
+                        # the repeated wells follow the new points, and their results are told as well
+                        if self.optimiser.models_measurements:
+                            self.optimiser.tell(
+                                liquid_volumes[:, 1:],
+                                errors,
+                                self.loop.last_error_std,
+                                measurements=self.loop.last_measurements,
+                            )
+                        else:
+                            self.optimiser.tell(
+                                liquid_volumes[:, 1:], errors, self.loop.last_error_std
+                            )
+                        self.loop.check_surrogate(self.optimiser)
+
+                    except ConvergenceReached as stop:
+                        # hand out no more batches, but record the batches that are still running
+                        if self.loop.stopped is None:
+                            self.loop.finish(stop)
+                        num_batches = batch_count
+
+        return time.monotonic() - start_time
@@ -0,0 +1,161 @@
+"""
+Contains code for getting the geometry of a well plate from its Opentrons
+labware definition. The geometry is used for generating OT-2 protocols,
+calculating well centres in images and extracting well colours, so that any
+plate format (e.g. 96 or 384 wells) can be used.
+"""
+
+import json
+import os
+
+# The labware used when no other labware is specified.
+DEFAULT_LABWARE = "nest_96_wellplate_100ul_pcr_full_skirt"
+
+# Geometries of common plates, taken from the Opentrons labware definitions.
+# These are used when the opentrons package (and so its labware library) is not installed.
+BUILTIN_PLATES = {
+    "nest_96_wellplate_100ul_pcr_full_skirt": {
+        "load_name": "nest_96_wellplate_100ul_pcr_full_skirt",
+        "wells": 96,
+        "rows": 8,
+        "columns": 12,
+        "height": 85.48,
+        "width": 127.76,
+        "row_offset": 11.24,
+        "column_offset": 14.38,
+        "row_spacing": 9.00,
+        "column_spacing": 9.00,
+        "well_diameter": 5.34,
+    },
+    "corning_384_wellplate_112ul_flat": {
+        "load_name": "corning_384_wellplate_112ul_flat",
+        "wells": 384,
+        "rows": 16,
+        "columns": 24,
+        "height": 85.47,
+        "width": 127.76,
+        "row_offset": 8.98,
+        "column_offset": 12.12,
+        "row_spacing": 4.50,
+        "column_spacing": 4.50,
+        "well_diameter": 3.63,
+    },
+}
+
+
+def load_labware_definition(labware, version=None):
+    """
+    Loads an Opentrons labware definition.
+
+    Parameters
+    ----------
+    labware : str
+        The load name of a labware in the Opentrons labware library (e.g.
+        "corning_384_wellplate_112ul_flat"), or the path to the JSON file of a
+        custom labware definition.
+
+    version : int, default = None
+        The version of the definition in the labware library. If None, the
+        latest version is used.
+
+    Returns
+    -------
+    definition : dict
+        The labware definition.
+    """
+
+    if labware.endswith(".json") and os.path.exists(labware):
+        with open(labware) as file:
+            return json.load(file)
+
+    from opentrons_shared_data.labware import load_definition
+
+    if version is not None:
+        return load_definition(labware, version)
+
+    # Find the latest version of the definition.
+    version = 1
+    definition = load_definition(labware, version)
+    while True:
+        try:
+            definition = load_definition(labware, version + 1)
+        except FileNotFoundError:
+            return definition
+        version += 1
+
+
+def plate_geometry_from_definition(definition):
+    """
+    Calculates the geometry of a well plate from its Opentrons labware
+    definition.
+
+    Parameters
+    ----------
+    definition : dict
+        The labware definition.
+
+    Returns
+    -------
+    plate : dict
+        The plate geometry, with the same keys as
+        "optobot.colorimetric.image_processing.fixed_grid.PLATE". Lengths are in
+        mm, with rows measured from the back edge of the plate (the top of an
+        image) and columns from the left edge.
+    """
+
+    # The ordering is a list of columns, each containing the names of its wells.
+    ordering = definition["ordering"]
+    wells = definition["wells"]
+    dimensions = definition["dimensions"]
+
+    first = wells[ordering[0][0]]
+    row_spacing = first["y"] - wells[ordering[0][1]]["y"] if len(ordering[0]) > 1 else 0
+    column_spacing = wells[ordering[1][0]]["x"] - first["x"] if len(ordering) > 1 else 0
+
+    if first["shape"] == "circular":
+        well_diameter = first["diameter"]
+    else:
+        well_diameter = min(first["xDimension"], first["yDimension"])
+
+    return {
+        "load_name": definition["parameters"]["loadName"],
+        "wells": sum(len(column) for column in ordering),
+        "rows": len(ordering[0]),
+        "columns": len(ordering),
+        "height": dimensions["yDimension"],
+        "width": dimensions["xDimension"],
+        "row_offset": round(dimensions["yDimension"] - first["y"], 2),
+        "column_offset": first["x"],
+        "row_spacing": round(row_spacing, 2),
+        "column_spacing": round(column_spacing, 2),
+        "well_diameter": well_diameter,
+    }
+
+
+def get_plate_geometry(labware=DEFAULT_LABWARE):
+    """
+    Gets the geometry of a well plate.
+
+    Parameters
+    ----------
+    labware : str or dict, default = DEFAULT_LABWARE
+        The load name of the labware, the path to a custom labware definition,
+        or a plate geometry (which is returned as it is).
+
+    Returns
+    -------
+    plate : dict
+        The plate geometry (see "plate_geometry_from_definition").
+    """
+
+    if isinstance(labware, dict):
+        return labware
+
+    try:
+        definition = load_labware_definition(labware)
+    except ImportError:
+        if labware in BUILTIN_PLATES:
+            return dict(BUILTIN_PLATES[labware])
+        raise
+
+    return plate_geometry_from_definition(definition)
@@ -0,0 +1,221 @@
+"""
+Contains the well allocator that decides which wells of which wellplate are
+used by each iteration. It is shared by the protocol generation, the slicing of
+measurements and the storing of data, and keeps an occupancy map of the
+wellplates on disk.
+"""
+
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+
+class WellAllocator:
+    """
+    A class to allocate the wells of one or more wellplates to batches of any size.
+
+    Wells are identified by a global index, counting the wells of the first wellplate first (in row-major order:
+    A1, A2, ..., A12, B1, ...), then those of the second wellplate, and so on.
+
+    Parameters:
+        - wellplate_shape (tuple):
+            tuple representing the shape (rows, columns) of the wellplate.
+        - num_wellplates (int):
+            Number of wellplates used.
+        - filepath (string):
+            Path of the CSV file the occupancy map is saved to. If None, the map is not saved.
+        - fill_order (string):
+            "rows" to fill A1 - A12, then B1 - B12, ..., or "columns" to fill A1 - H1, then A2 - H2, ...
+        - blank_row_space (int):
+            Vertical space between wellplate data in the CSV files (if more than one is used).
+
+    """
+
+    def __init__(
+        self,
+        wellplate_shape,
+        num_wellplates,
+        filepath=None,
+        fill_order="rows",
+        blank_row_space=1,
+    ):
+
+        if fill_order not in ("rows", "columns"):
+            raise ValueError('fill_order must be either "rows" or "columns".')
+
+        self.wellplate_shape = tuple(wellplate_shape)
+        self.num_wellplates = num_wellplates
+        self.wells_per_plate = self.wellplate_shape[0] * self.wellplate_shape[1]
+        self.filepath = filepath
+        self.fill_order = fill_order
+        self.blank_row_space = blank_row_space
+
+        # 0 marks a free well, -1 a reserved well, otherwise the (1-based) iteration number that used the well.
+        self.occupancy = np.zeros(
+            (num_wellplates, self.wellplate_shape[0], self.wellplate_shape[1]), dtype=int
+        )
+
+        if filepath is not None and os.path.exists(filepath):
+            self.load()
+
+    def _fill_sequence(self):
+        """
+        Returns the global indices of all wells in the order in which they are filled.
+        """
+
+        rows, columns = self.wellplate_shape
+        plate_wells = np.arange(self.wells_per_plate).reshape(rows, columns)
+        if self.fill_order == "columns":
+            plate_wells = plate_wells.T
+
+        offsets = np.arange(self.num_wellplates)[:, np.newaxis] * self.wells_per_plate
+        return (offsets + plate_wells.ravel()).ravel()
+
+    def _free_sequence(self, plates=None):
+        """
+        Returns the global indices of the free wells in fill order, optionally only on the given wellplates.
+        """
+
+        sequence = self._fill_sequence()
+        if plates is not None:
+            sequence = sequence[np.isin(sequence // self.wells_per_plate, plates)]
+
+        return sequence[self.occupancy.ravel()[sequence] == 0]
+
+    def free_wells(self, plates=None):
+        """
+        Returns the number of wells that are still free across all wellplates (or only the given wellplate indices).
+        """
+
+        return len(self._free_sequence(plates))
+
+    def allocate(self, batch_size, iteration_number, plates=None):
+        """
+        Allocates the next free wells to a batch, and saves the occupancy map.
+
+        Parameters:
+        - batch_size (int):
+            Number of wells needed.
+        - iteration_number (int):
+            The (1-based) iteration the wells are used in.
+        - plates (list of ints):
+            If given, only wells on these wellplates (0-based indices) are allocated, e.g. the plates of one robot.
+
+        Returns:
+        - wells (ndarray):
+            Global indices of the allocated wells, in the order of the batch.
+        """
+
+        free = self._free_sequence(plates)
+
+        if len(free) < batch_size:
+            raise ValueError(
+                f"Not enough free wells: {batch_size} requested, {len(free)} left."
+            )
+
+        wells = free[:batch_size]
+        self.occupancy.reshape(-1)[wells] = iteration_number
+        self.save()
+
+        return wells
+
+    def reserve(self, positions, plate=0):
+        """
+        Reserves wells that must not be used for experiments (e.g. the reference wells of a colour calibration),
+        so that they are never allocated to a batch, and saves the occupancy map.
+
+        Parameters:
+        - positions (array):
+            (row, column) of each well to reserve.
+        - plate (int):
+            The (0-based) index of the wellplate the wells are on.
+        """
+
+        positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+        wells = plate * self.wells_per_plate + positions[:, 0] * self.wellplate_shape[1] + positions[:, 1]
+
+        used = self.occupancy.ravel()[wells] > 0
+        if used.any():
+            names = [name for _, name in self.well_names(wells[used])]
+            raise ValueError(
+                f"Cannot reserve wells {', '.join(names)} of wellplate {plate + 1}: they are already used by an iteration."
+            )
+
+        self.occupancy.reshape(-1)[wells] = -1
+        self.save()
+
+    def positions(self, wells):
+        """
+        Returns the (wellplate index, row, column) of each well, as three arrays.
+        """
+
+        wells = np.asarray(wells)
+        plate, plate_well = np.divmod(wells, self.wells_per_plate)
+        row, column = np.divmod(plate_well, self.wellplate_shape[1])
+
+        return plate, row, column
+
+    def well_names(self, wells):
+        """
+        Returns (wellplate number, well name) for each well, e.g. (1, "A1"), as used by the generated OT-2 protocols.
+        """
+
+        plate, row, column = self.positions(wells)
+        return [
+            (int(p) + 1, f"{string.ascii_uppercase[r]}{c + 1}")
+            for p, r, c in zip(plate, row, column)
+        ]
+
+    def csv_indices(self, wells):
+        """
+        Returns the positions of the wells in the flattened wellplate-shaped dataframes,
+        taking into account the blank rows between the data of different wellplates.
+        """
+
+        plate, _, _ = self.positions(wells)
+        return np.asarray(wells) + plate * self.blank_row_space * self.wellplate_shape[1]
+
+    def _csv_index(self):
+        wellplate_rows = [
+            string.ascii_uppercase[i % 26] for i in range(self.wellplate_shape[0])
+        ]
+        index = []
+        for i in range(self.num_wellplates):
+            index.extend(wellplate_rows)
+            if i != self.num_wellplates - 1:
+                index.extend([""] * self.blank_row_space)
+        return index
+
+    def save(self):
+        """
+        Saves the occupancy map to a wellplate-shaped CSV, with the iteration number that used each well (0 if free,
+        -1 if reserved).
+        """
+
+        if self.filepath is None:
+            return
+
+        blank = np.zeros((self.blank_row_space, self.wellplate_shape[1]), dtype=int)
+        blocks = []
+        for i, plate in enumerate(self.occupancy):
+            blocks.append(plate)
+            if i != self.num_wellplates - 1:
+                blocks.append(blank)
+
+        occupancy_df = pd.DataFrame(
+            np.vstack(blocks),
+            index=self._csv_index(),
+            columns=np.arange(1, self.wellplate_shape[1] + 1),
+        )
+        occupancy_df.to_csv(self.filepath)
+
+    def load(self):
+        """
+        Loads the occupancy map saved by a previous run (e.g. to continue an experiment).
+        """
+
+        occupancy_df = pd.read_csv(self.filepath, index_col=0)
+        occupancy_df = occupancy_df[occupancy_df.index.notna()]
+        self.occupancy = occupancy_df.values.astype(int).reshape(self.occupancy.shape)
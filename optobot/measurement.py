@@ -0,0 +1,42 @@
+"""
+Contains the result of a measurement function: the measurements of the wells
+of one iteration, with their uncertainty and quality when these were measured.
+"""
+
+import numpy as np
+
+
+class MeasurementResult:
+    """
+    The measurements of the wells of one iteration. Measurement functions may return one of these (as get_colours does)
+    instead of the measurements alone, to pass the uncertainty of the measurements and the quality of the wells to the
+    OptimisationLoop.
+
+    Parameters:
+        - measurements (ndarray):
+            The measurements of each well, shape (n_wells, n_measured_parameters).
+        - uncertainty (ndarray):
+            The standard deviation of the measurements (e.g. the standard error of a well's colour, or the spread of
+            replicates), of the same shape, or None if it was not measured. The loop propagates it to the errors, and
+            the GP optimiser uses it as the noise of each well.
+        - quality (DataFrame):
+            The quality metrics of each well, one row per well, with a boolean "passed" column, or None if it was not
+            measured. The loop repeats the wells that failed instead of passing their measurements to the optimiser.
+
+    """
+
+    def __init__(self, measurements, uncertainty=None, quality=None):
+
+        self.measurements = np.asarray(measurements, dtype=float)
+        self.uncertainty = None if uncertainty is None else np.asarray(uncertainty, dtype=float)
+        self.quality = quality
+
+        if self.uncertainty is not None and self.uncertainty.shape != self.measurements.shape:
+            raise ValueError(
+                f"The uncertainty has shape {self.uncertainty.shape}, but the measurements have shape "
+                f"{self.measurements.shape}."
+            )
+        if self.quality is not None and len(self.quality) != len(self.measurements):
+            raise ValueError(
+                f"The quality has {len(self.quality)} rows, but there are {len(self.measurements)} measurements."
+            )
@@ -0,0 +1,256 @@
+"""
+Contains a persistent index of the wells of past experiments, for looking up
+the recipes whose measurements came closest to a new target, and seeding the
+first iteration of a new experiment with them.
+"""
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+def read_wells(filepath, volume_columns, measured_parameter_names):
+    """
+    Returns the (liquid volumes, measurements) of the valid wells of an
+    "all_data.csv" file, or None if it is for other liquids or measurements.
+
+    Parameters
+    ----------
+    filepath : str
+        The "all_data.csv" file of an experiment.
+
+    volume_columns : list of str
+        The liquid volume columns ("vol_" and the liquid name), dilution
+        agent first.
+
+    measured_parameter_names : list of str
+        The names of the elements of one measurement.
+
+    Returns
+    -------
+    wells : tuple of np.ndarray, or None
+        The liquid volumes, shape(n_wells, n_liquids), and measurements,
+        shape(n_wells, n_measured_parameters), of the valid wells.
+    """
+
+    all_data_df = pd.read_csv(filepath, index_col=0)
+    columns = list(volume_columns) + list(measured_parameter_names)
+    if not set(columns).issubset(all_data_df.columns):
+        return None
+
+    # Rows of wells that have not been used yet are all zeros, and wells that failed the quality checks
+    # have no error.
+    valid = (all_data_df["iteration_number"] > 0) & all_data_df["error"].notna()
+    all_data_df = all_data_df.loc[valid, columns].dropna()
+
+    return (
+        all_data_df[list(volume_columns)].to_numpy(dtype=float),
+        all_data_df[list(measured_parameter_names)].to_numpy(dtype=float),
+    )
+
+
+class HistoricalIndex:
+    """
+    An index of the liquid volumes and measurements of every valid well in the
+    "all_data.csv" files of past experiments, with a KD-tree over the
+    measurements for nearest-neighbour lookups.
+
+    Only experiments with the same liquids and measured parameters are indexed.
+    The index is saved to a file, and "update" only reads the experiments that
+    are new or have changed since (e.g. runs that have finished since the last
+    update).
+
+    Parameters
+    ----------
+    path : str
+        The file (.npz) in which the index is saved. It is loaded if it exists.
+
+    liquid_names : list of str
+        The names of the liquids, with the dilution agent first (as passed to
+        OptimisationLoop).
+
+    measured_parameter_names : list of str
+        The names of the elements of one measurement (as passed to
+        OptimisationLoop).
+    """
+
+    def __init__(self, path, liquid_names, measured_parameter_names):
+
+        self.path = path
+        self.volume_columns = [f"vol_{liquid_name}" for liquid_name in liquid_names]
+        self.measured_parameter_names = list(measured_parameter_names)
+
+        # the wells of each indexed experiment, and the modification time of its all_data.csv when it was read
+        self.experiments = {}
+        self.volumes = np.empty((0, len(self.volume_columns)))
+        self.measurements = np.empty((0, len(self.measured_parameter_names)))
+        self.sources = np.empty(0, dtype=object)
+        self.tree = None
+
+        if os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.measurements)
+
+    def load(self):
+        """
+        Loads the saved index (if it was built for the same liquids and measured parameters).
+        """
+
+        data = np.load(self.path, allow_pickle=True)
+        if list(data["volume_columns"]) != self.volume_columns or list(
+            data["measured_parameter_names"]
+        ) != self.measured_parameter_names:
+            print(f"The index in {self.path} is for other liquids or measurements, and is rebuilt.")
+            return
+
+        for exp_data_dir, mtime, volumes, measurements in zip(
+            data["directories"], data["mtimes"], data["volumes"], data["measurements"]
+        ):
+            self.experiments[exp_data_dir] = (float(mtime), volumes, measurements)
+        self._build()
+
+    def save(self):
+        directories = list(self.experiments)
+        entries = [self.experiments[exp_data_dir] for exp_data_dir in directories]
+
+        # object arrays, as the experiments have different numbers of wells
+        volumes = np.empty(len(entries), dtype=object)
+        measurements = np.empty(len(entries), dtype=object)
+        volumes[:] = [entry[1] for entry in entries]
+        measurements[:] = [entry[2] for entry in entries]
+
+        np.savez(
+            self.path,
+            volume_columns=np.array(self.volume_columns),
+            measured_parameter_names=np.array(self.measured_parameter_names),
+            directories=np.array(directories, dtype=object),
+            mtimes=np.array([entry[0] for entry in entries]),
+            volumes=volumes,
+            measurements=measurements,
+        )
+
+    def update(self, root_dirs):
+        """
+        Indexes the experiments in (or below) the given directories that are
+        new or have changed since they were last indexed, and saves the index.
+
+        Parameters
+        ----------
+        root_dirs : list of str
+            Experiment directories, or directories that contain them.
+
+        Returns
+        -------
+        num_read : int
+            The number of "all_data.csv" files that were read.
+        """
+
+        num_read = 0
+        for root_dir in root_dirs:
+            for filepath in sorted(glob.glob(f"{root_dir}/**/all_data.csv", recursive=True)):
+                exp_data_dir = os.path.normpath(os.path.dirname(filepath))
+                mtime = os.path.getmtime(filepath)
+                if exp_data_dir in self.experiments and self.experiments[exp_data_dir][0] == mtime:
+                    continue
+
+                wells = self._read(filepath)
+                num_read += 1
+                if wells is None:
+                    continue
+                self.experiments[exp_data_dir] = (mtime,) + wells
+
+        if num_read > 0:
+            self._build()
+            self.save()
+
+        return num_read
+
+    def _read(self, filepath):
+        return read_wells(filepath, self.volume_columns, self.measured_parameter_names)
+
+    def _build(self):
+        entries = list(self.experiments.items())
+        if not entries:
+            return
+
+        self.volumes = np.vstack([entry[1] for _, entry in entries])
+        self.measurements = np.vstack([entry[2] for _, entry in entries])
+        self.sources = np.concatenate(
+            [np.full(len(entry[2]), exp_data_dir, dtype=object) for exp_data_dir, entry in entries]
+        )
+        self.tree = cKDTree(self.measurements) if len(self.measurements) > 0 else None
+
+    def nearest(self, target_measurement, k=1):
+        """
+        Returns the k wells whose measurements are closest to the target.
+
+        Parameters
+        ----------
+        target_measurement : array-like, shape(n_measured_parameters,)
+            The target measurement.
+
+        k : int, default = 1
+            The number of wells to return.
+
+        Returns
+        -------
+        nearest : pd.DataFrame
+            The liquid volumes, measurements, distance to the target and
+            experiment directory of each well, closest first.
+        """
+
+        columns = self.volume_columns + self.measured_parameter_names + ["distance", "experiment"]
+        if self.tree is None:
+            return pd.DataFrame(columns=columns)
+
+        k = min(k, len(self))
+        distances, indices = self.tree.query(np.asarray(target_measurement, dtype=float), k=[*range(1, k + 1)])
+
+        nearest = pd.DataFrame(
+            np.hstack([self.volumes[indices], self.measurements[indices]]),
+            columns=self.volume_columns + self.measured_parameter_names,
+        )
+        nearest["distance"] = distances
+        nearest["experiment"] = self.sources[indices]
+
+        return nearest
+
+    def seed_points(self, target_measurement, n):
+        """
+        Returns the liquid volumes (without the dilution agent) of the n wells
+        closest to the target, to pass as the seed_points of
+        OptimisationLoop.optimise. With several targets (one per row), the
+        closest wells of the targets are taken in turn.
+
+        Parameters
+        ----------
+        target_measurement : array-like, shape(n_measured_parameters,) or shape(n_targets, n_measured_parameters)
+            The target measurement(s).
+
+        n : int
+            The maximum number of seed points.
+
+        Returns
+        -------
+        seed_points : np.ndarray, shape(<=n, n_liquids - 1)
+            The liquid volumes of the closest wells, without duplicates.
+        """
+
+        targets = np.atleast_2d(np.asarray(target_measurement, dtype=float))
+        if self.tree is None or n <= 0:
+            return np.empty((0, len(self.volume_columns) - 1))
+
+        k = min(n, len(self))
+        _, indices = self.tree.query(targets, k=[*range(1, k + 1)])
+
+        # take the closest well of each target in turn, skipping wells already taken
+        order = indices.T.ravel()
+        _, first = np.unique(order, return_index=True)
+        order = order[np.sort(first)][:n]
+
+        return self.volumes[order, 1:]
@@ -0,0 +1,283 @@
+"""
+Contains space-filling initial designs for the first iteration of the
+optimisation backends, and code for seeding these designs with the results of
+earlier experiments.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+# The names of the initial designs that can be selected.
+DESIGNS = ("random", "sobol", "lhs", "maximin")
+
+
+def _unit_samples(method, n, dims, rng):
+    """
+    Draws n samples in the unit hypercube using the given design method.
+    """
+
+    if method == "random":
+        return rng.random((n, dims))
+
+    if method == "sobol":
+        # Sobol sequences are balanced for powers of 2, so draw the next power
+        # of 2 and keep the first n points (a prefix keeps low discrepancy).
+        m = int(np.ceil(np.log2(max(n, 1))))
+        sampler = qmc.Sobol(d=dims, scramble=True, seed=rng)
+        return sampler.random_base2(m)[:n]
+
+    if method == "lhs":
+        sampler = qmc.LatinHypercube(d=dims, seed=rng)
+        return sampler.random(n)
+
+    raise ValueError(f"Unknown initial design '{method}'. Choose from {DESIGNS}.")
+
+
+def enforce_total_volume(points, lower_bounds, total_volume):
+    """
+    Scales the points that exceed the total volume back towards the lower
+    bounds of the search space, so that the liquids (excluding the dilution
+    agent) never add up to more than the total volume of a well.
+
+    Parameters
+    ----------
+    points : np.ndarray, shape(n_points, n_liquids)
+        The liquid volumes of each point.
+
+    lower_bounds : np.ndarray, shape(n_liquids,)
+        The lower bounds of the search space.
+
+    total_volume : float
+        The total liquid volume per well.
+
+    Returns
+    -------
+    points : np.ndarray, shape(n_points, n_liquids)
+        The liquid volumes with every point inside the total volume.
+    """
+
+    points = np.array(points, dtype=float)
+    excess = points - lower_bounds
+    available = total_volume - np.sum(lower_bounds)
+
+    if available < 0:
+        raise ValueError(
+            "The lower bounds of the search space exceed the total volume of a well."
+        )
+
+    # Only shrink the points that are over the total volume.
+    excess_sum = np.sum(excess, axis=1)
+    scale = np.ones(len(points))
+    over = excess_sum > available
+    scale[over] = available / excess_sum[over]
+
+    return lower_bounds + excess * scale[:, np.newaxis]
+
+
+def maximin_design(
+    n, search_space, total_volume=None, seed_points=None, n_candidates=2048, rng=None
+):
+    """
+    Greedily selects n points from a Sobol candidate pool, each time picking
+    the candidate that is furthest from every point selected so far (including
+    any seed points).
+
+    Parameters
+    ----------
+    n : int
+        The number of points to select.
+
+    search_space : list
+        The search space, formatted as [[low, high] for i in num_liquids].
+
+    total_volume : float, default = None
+        The total liquid volume per well. Candidates above it are discarded.
+
+    seed_points : np.ndarray, default = None
+        Points that are already part of the design.
+
+    n_candidates : int, default = 2048
+        The size of the candidate pool.
+
+    rng : np.random.Generator, default = None
+        The random number generator.
+
+    Returns
+    -------
+    design : np.ndarray, shape(n, n_liquids)
+        The selected points.
+    """
+
+    rng = np.random.default_rng(rng)
+    search_space = np.array(search_space, dtype=float)
+    low, high = search_space[:, 0], search_space[:, 1]
+    span = np.where(high > low, high - low, 1.0)
+
+    candidates = low + _unit_samples("sobol", n_candidates, len(low), rng) * (high - low)
+    if total_volume is not None:
+        feasible = np.sum(candidates, axis=1) <= total_volume
+        if np.sum(feasible) >= n:
+            candidates = candidates[feasible]
+        else:
+            candidates = enforce_total_volume(candidates, low, total_volume)
+
+    # Distances are measured in the unit hypercube, so that each liquid counts equally.
+    unit_candidates = (candidates - low) / span
+    min_dist = np.full(len(candidates), np.inf)
+
+    if seed_points is not None and len(seed_points) > 0:
+        unit_seeds = (np.asarray(seed_points, dtype=float) - low) / span
+        dists = np.linalg.norm(
+            unit_candidates[:, np.newaxis, :] - unit_seeds[np.newaxis, :, :], axis=-1
+        )
+        min_dist = np.min(dists, axis=1)
+        selected = []
+    else:
+        # Start from the candidate closest to the centre of the search space.
+        first = np.argmin(np.linalg.norm(unit_candidates - 0.5, axis=1))
+        selected = [first]
+        min_dist = np.linalg.norm(unit_candidates - unit_candidates[first], axis=1)
+
+    while len(selected) < n:
+        idx = int(np.argmax(min_dist))
+        selected.append(idx)
+        new_dist = np.linalg.norm(unit_candidates - unit_candidates[idx], axis=1)
+        min_dist = np.minimum(min_dist, new_dist)
+
+    return candidates[selected]
+
+
+def initial_design(
+    search_space,
+    population_size,
+    method="sobol",
+    total_volume=None,
+    seed_points=None,
+    random_state=None,
+):
+    """
+    Generates the liquid volumes for the first iteration of an optimisation.
+
+    Parameters
+    ----------
+    search_space : list
+        The search space, formatted as [[low, high] for i in num_liquids].
+
+    population_size : int
+        The number of wells in the first iteration.
+
+    method : str, default = "sobol"
+        The initial design. One of "random", "sobol", "lhs" (Latin hypercube)
+        or "maximin".
+
+    total_volume : float, default = None
+        The total liquid volume per well. If given, no point will contain
+        more liquid than fits in a well.
+
+    seed_points : np.ndarray, default = None
+        Points from earlier experiments to include in the design. They take
+        up the first places of the design, and the rest of the design is
+        filled with space-filling points.
+
+    random_state : int, default = None
+        The seed of the random number generator.
+
+    Returns
+    -------
+    design : np.ndarray, shape(population_size, n_liquids)
+        The liquid volumes of each well in the first iteration.
+    """
+
+    rng = np.random.default_rng(random_state)
+    search_space = np.array(search_space, dtype=float)
+    low, high = search_space[:, 0], search_space[:, 1]
+
+    if seed_points is not None and len(seed_points) > 0:
+        seed_points = np.clip(np.asarray(seed_points, dtype=float), low, high)
+        seed_points = seed_points[:population_size]
+        if total_volume is not None:
+            seed_points = enforce_total_volume(seed_points, low, total_volume)
+    else:
+        seed_points = np.empty((0, len(low)))
+
+    n_new = population_size - len(seed_points)
+    if n_new == 0:
+        return seed_points
+
+    if method == "maximin":
+        new_points = maximin_design(
+            n_new, search_space, total_volume, seed_points, rng=rng
+        )
+    else:
+        new_points = low + _unit_samples(method, n_new, len(low), rng) * (high - low)
+        if total_volume is not None:
+            new_points = enforce_total_volume(new_points, low, total_volume)
+
+    return np.vstack([seed_points, new_points])
+
+
+def load_seed_points(exp_data_dirs, liquid_names, n, objective_function=None):
+    """
+    Loads the best liquid volumes from the "all_data.csv" files of earlier
+    experiments, to seed the initial design of a new experiment.
+
+    Parameters
+    ----------
+    exp_data_dirs : list of str
+        The directories of the earlier experiments.
+
+    liquid_names : list of str
+        The names of the liquids, with the dilution agent first (as passed to
+        OptimisationLoop). The dilution agent is not part of the seed points.
+
+    n : int
+        The maximum number of seed points to return.
+
+    objective_function : function, default = None
+        If given, the stored measurements are re-scored with this function,
+        so that the seed points are the best for the new objective. Otherwise
+        the stored errors are used.
+
+    Returns
+    -------
+    seed_points : np.ndarray, shape(<=n, n_liquids - 1)
+        The liquid volumes of the best wells.
+    """
+
+    volume_columns = [f"vol_{liquid_name}" for liquid_name in liquid_names[1:]]
+
+    volumes, scores = [], []
+    for exp_data_dir in exp_data_dirs:
+        all_data_df = pd.read_csv(f"{exp_data_dir}/all_data.csv", index_col=0)
+
+        # Rows of wells that have not been used yet are all zeros, and wells that failed the quality checks
+        # have no error.
+        all_data_df = all_data_df[
+            (all_data_df["iteration_number"] > 0) & all_data_df["error"].notna()
+        ]
+        if all_data_df.empty:
+            continue
+
+        if objective_function is not None:
+            measured_columns = [
+                column
+                for column in all_data_df.columns
+                if column != "iteration_number"
+                and not column.startswith(("vol_", "error"))
+                and not column.endswith("_std")
+            ]
+            score = objective_function(all_data_df[measured_columns].values)
+        else:
+            score = all_data_df["error"].values
+
+        volumes.append(all_data_df[volume_columns].values)
+        scores.append(np.asarray(score, dtype=float))
+
+    if not volumes:
+        return np.empty((0, len(volume_columns)))
+
+    volumes = np.vstack(volumes)
+    scores = np.concatenate(scores)
+
+    return volumes[np.argsort(scores)[:n]]
@@ -1,44 +1,508 @@
 import numpy as np
 import pyswarms as ps
+from pyswarms.backend.operators import compute_pbest
 from skopt import Optimizer
+from skopt.acquisition import gaussian_ei
+from skopt.learning import GaussianProcessRegressor
 
+from optobot.convergence import ConvergenceReached
+from optobot.optimisation.initial_designs import maximin_design
+from optobot.optimisation.transfer import TransferAskTell, load_experiments
 
-def particle_swarm(model, search_space, num_iterations):
+
+class SwarmAskTell:
     """
-    Performs well plate optimisation using particle swarm
+    Ask-and-tell interface to a pyswarms global-best particle swarm, so that the swarm can be
+    stepped one well plate batch at a time.
+
+    Args:
+        search_space (list):
+            A list of the search space for the algorithms.
+            formatted as [[low, high] for i in num_liquids]
+        population_size (int):
+            Number of particles (wells per iteration). The swarm size is fixed.
+        initial_points (ndarray):
+            Starting positions of the swarm, of shape (population_size, num_liquids).
+            If None, the swarm is initialised uniformly at random.
+    """
+
+    variable_batch_size = False
+    # the swarm has moved on by the time a repeated well is measured, so results of extra points cannot be used
+    accepts_extra_points = False
+    models_measurements = False
+
+    def __init__(self, search_space, population_size, initial_points=None):
+
+        search_space = np.array(search_space)
+        max_bound = search_space[:, 1]
+        min_bound = search_space[:, 0]
+        bounds = (min_bound, max_bound)
+
+        self.population_size = population_size
+
+        # initialising swarm
+        options = {"c1": 0.3, "c2": 0.5, "w": 0.1}
+
+        # Call instance of PSO with bounds argument
+        self.optimiser = ps.single.GlobalBestPSO(
+            n_particles=population_size,
+            dimensions=len(search_space),
+            options=options,
+            bounds=bounds,
+            init_pos=initial_points,
+        )
+        self.optimiser.bh.memory = self.optimiser.swarm.position
+        self.optimiser.vh.memory = self.optimiser.swarm.position
+        self.optimiser.swarm.pbest_cost = np.full(population_size, np.inf)
+
+    def ask(self, batch_size=None):
+        """
+        Returns the current positions of the swarm (one row of liquid volumes per particle).
+        """
+
+        if batch_size is not None and batch_size != self.population_size:
+            raise ValueError("The particle swarm can only ask for population_size points.")
+
+        return self.optimiser.swarm.position.copy()
+
+    def tell(self, points, errors, error_std=None):
+        """
+        Updates the personal and global bests with the errors of the current positions, and moves the swarm.
+        Particles with a nan error (e.g. wells that failed the quality checks) keep their personal bests.
+        The swarm has no noise model, so the uncertainty of the errors is not used.
+        """
+
+        optimiser = self.optimiser
+        swarm = optimiser.swarm
+
+        errors = np.asarray(errors, dtype=float)
+        swarm.current_cost = np.where(np.isnan(errors), np.inf, errors)
+        swarm.pbest_pos, swarm.pbest_cost = compute_pbest(swarm)
+        swarm.best_pos, swarm.best_cost = optimiser.top.compute_gbest(swarm)
+
+        # Perform velocity and position updates
+        swarm.velocity = optimiser.top.compute_velocity(
+            swarm, optimiser.velocity_clamp, optimiser.vh, optimiser.bounds
+        )
+        swarm.position = optimiser.top.compute_position(
+            swarm, optimiser.bounds, optimiser.bh
+        )
+
+    def confidence(self):
+        # The swarm has no surrogate model.
+        return 0.0
+
+    def expected_improvement(self):
+        # Without a surrogate model, an improvement can always be expected.
+        return np.inf
+
+
+class NoisyGaussianProcess(GaussianProcessRegressor):
+    """
+    skopt's Gaussian process regressor, with a known noise variance for each training point (in addition to the noise
+    it fits), so that noisy points pull the surrogate less than precise ones.
+
+    Args:
+        point_noise (list):
+            The noise variance of the first training points, in the order they are fitted. Further points (e.g. the
+            "lies" of pending points) are taken as exact. The list is read at each fit, so it can be extended as
+            points are added. (For the other arguments, see skopt.learning.GaussianProcessRegressor.)
+    """
+
+    def __init__(
+        self,
+        kernel=None,
+        alpha=1e-10,
+        optimizer="fmin_l_bfgs_b",
+        n_restarts_optimizer=0,
+        normalize_y=False,
+        copy_X_train=True,
+        random_state=None,
+        noise=None,
+        point_noise=None,
+    ):
+        self.point_noise = point_noise
+        super().__init__(
+            kernel=kernel,
+            alpha=alpha,
+            optimizer=optimizer,
+            n_restarts_optimizer=n_restarts_optimizer,
+            normalize_y=normalize_y,
+            copy_X_train=copy_X_train,
+            random_state=random_state,
+            noise=noise,
+        )
+
+    def fit(self, X, y):
+        variance = np.zeros(len(y))
+        if self.point_noise is not None:
+            known = np.asarray(self.point_noise, dtype=float)[: len(y)]
+            variance[: len(known)] = known
+
+        # with normalize_y, the GP is fitted to the errors divided by their standard deviation
+        if self.normalize_y and np.var(y) > 0:
+            variance = variance / np.var(y)
+
+        alpha = self.alpha
+        self.alpha = alpha + variance
+        try:
+            return super().fit(X, y)
+        finally:
+            self.alpha = alpha
+
+
+class SkoptAskTell:
+    """
+    Ask-and-tell interface to skopt's Bayesian Optimizer.
 
     Args:
-        model (Class):
-            Well plate class, from wellplate_classes
         search_space (list):
             A list of the search space for the algorithms.
             formatted as [[low, high] for i in num_liquids]
+        base_estimator (string):
+            The surrogate model, "GP" or "RF".
+        population_size (int):
+            Number of wells per iteration (also the number of random initial points).
+        initial_points (ndarray):
+            Liquid volumes for the first iteration, of shape (n_points, num_liquids).
+            If None, skopt's default random initial points are used.
+        prescreen (Prescreener):
+            If given, once the surrogate model is fitted, each batch is chosen from a large pool of candidate points
+            scored by their expected improvement (see optobot.optimisation.prescreen), instead of by skopt's ask.
+        random_state (int):
+            Seed of skopt's Optimizer (its random initial points and the fitting of the surrogate model), so that
+            an optimisation can be reproduced. If None, every run differs.
+        total_volume (float):
+            The total liquid volume per well. Points of the space-filling batches handed out around pending points
+            before any result has been told are kept below it (the BatchDispatcher sets it from the loop if None).
+
+    With the GP, the uncertainty of the errors (if told) is added to the noise of each point (heteroscedastic noise),
+    so that noisy wells pull the surrogate less than precise ones. The random forest does not use it.
+    """
+
+    variable_batch_size = True
+    accepts_extra_points = True
+    models_measurements = False
+
+    def __init__(
+        self,
+        search_space,
+        base_estimator,
+        population_size,
+        initial_points=None,
+        prescreen=None,
+        random_state=None,
+        total_volume=None,
+    ):
+
+        self.search_space = search_space
+        self.population_size = population_size
+        self.prescreen = prescreen
+        self.total_volume = total_volume
+        self.initial_points = None
+        if initial_points is not None:
+            self.initial_points = np.asarray(initial_points, dtype=float)
+            population_size = len(initial_points)
+
+        self.opt = Optimizer(
+            search_space,
+            base_estimator=base_estimator,
+            n_initial_points=population_size,
+            random_state=random_state,
+        )
+        # the variance of the error of each told point (0 if unknown), in the order of opt.yi
+        self.noise = []
+        if isinstance(self.opt.base_estimator_, GaussianProcessRegressor):
+            self.opt.base_estimator_ = NoisyGaussianProcess(
+                point_noise=self.noise, **self.opt.base_estimator_.get_params(deep=False)
+            )
+
+    def ask(self, batch_size=None, pending=None):
+        """
+        Returns the liquid volumes of the next batch (the initial points first, if given).
+
+        Points that have been handed out but whose results have not been told yet can be passed as pending.
+        They are given the best error seen so far (a "constant liar"), so that the new batch is not proposed
+        on top of them. Before any results have been told, there is no error to give them, so the batch is instead
+        a fresh space-filling design that keeps away from the pending points.
+        """
+
+        if self.initial_points is not None:
+            points, self.initial_points = self.initial_points, None
+            return points
+
+        batch_size = batch_size or self.population_size
+
+        opt = self.opt
+        if pending is not None and len(pending) > 0 and len(self.opt.yi) == 0:
+            # skopt caches its random initial batch until a result is told, so it would hand out the same points
+            rng = self.opt.rng.randint(0, np.iinfo(np.int32).max)
+            return maximin_design(
+                batch_size, self.search_space, self.total_volume, seed_points=pending, rng=rng
+            )
+
+        if pending is not None and len(pending) > 0:
+            opt = self.opt.copy(random_state=self.opt.rng.randint(0, np.iinfo(np.int32).max))
+            opt.tell(np.asarray(pending).tolist(), [min(self.opt.yi)] * len(pending))
+
+        if self.prescreen is not None and opt.models:
+            model, best_error = opt.models[-1], np.min(opt.yi)
+
+            def score(points):
+                return -gaussian_ei(opt.space.transform(points.tolist()), model, best_error, xi=0.01)
+
+            return self.prescreen.select(self.search_space, score, batch_size, pending)
+
+        return np.array(opt.ask(batch_size), dtype=float)
+
+    def tell(self, points, errors, error_std=None):
+        """
+        Adds the results of a batch to the surrogate model. Points with a nan error (e.g. wells that failed the
+        quality checks) are left out. error_std is the standard deviation of each error (nan or None if unknown).
+        """
+
+        errors = np.asarray(errors, dtype=float)
+        valid = np.isfinite(errors)
+        if not valid.any():
+            return
+
+        variance = np.zeros(len(errors))
+        if error_std is not None:
+            variance = np.nan_to_num(np.asarray(error_std, dtype=float)) ** 2
+
+        self.noise.extend(variance[valid].tolist())
+        self.opt.tell(np.asarray(points)[valid].tolist(), errors[valid].tolist())
+
+    def confidence(self):
+        return surrogate_confidence(self.opt)
+
+    def expected_improvement(self, n_samples=1024):
+        """
+        Returns the largest improvement of the best error that the surrogate model expects at random points of the
+        search space (inf if there is no model yet).
+        """
+
+        if not self.opt.models:
+            return np.inf
+
+        samples = self.opt.space.transform(self.opt.space.rvs(n_samples, random_state=0))
+        return float(np.max(gaussian_ei(samples, self.opt.models[-1], np.min(self.opt.yi), xi=0.0)))
+
+
+def make_optimiser(
+    optimiser, search_space, population_size, initial_points=None, prescreen=None, random_state=None
+):
+    """
+    Creates the ask-and-tell optimiser of the given name.
+
+    Args:
+        optimiser (string):
+            The optimisation algorithm: "PSO", "GP" or "RF".
+        (for the other arguments, see SkoptAskTell; the particle swarm ignores random_state)
+    """
+
+    if optimiser == "PSO":
+        if prescreen is not None:
+            raise ValueError("Pre-screening needs a surrogate model ('GP' or 'RF').")
+        return SwarmAskTell(search_space, population_size, initial_points)
+    if optimiser in ("GP", "RF"):
+        return SkoptAskTell(search_space, optimiser, population_size, initial_points, prescreen, random_state)
+
+    raise ValueError(f"Unknown optimiser '{optimiser}'. Choose from 'PSO', 'GP' or 'RF'.")
+
+
+def run_optimisation(model, optimiser, num_iterations, planner=None):
+    """
+    Runs the ask-and-tell loop between an optimiser and the well plate model.
+
+    Args:
+        model (Class):
+            Well plate class (OptimisationLoop), called with the liquid volumes of each batch.
+        optimiser (SwarmAskTell, SkoptAskTell or TransferAskTell):
+            The ask-and-tell optimiser.
         num_iterations (int):
             Total number of iterations for the optimisation algorithm.
+        planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration (for optimisers that allow it),
+            and the optimisation stops when the budget is used up (num_iterations is then a maximum).
+
+    Returns:
+        stop (ConvergenceReached):
+            The stopping rule that ended the optimisation early (see optobot.convergence), or None.
     """
 
-    search_space = np.array(search_space)
-    max_bound = search_space[:, 1]
-    min_bound = search_space[:, 0]
-    bounds = (min_bound, max_bound)
+    try:
+        for i in range(num_iterations):
+            batch_size = optimiser.population_size
+            if planner is not None:
+                if optimiser.variable_batch_size:
+                    batch_size = planner.next_batch_size(optimiser.confidence())
+                elif planner.num_iterations(batch_size) == 0:
+                    batch_size = 0
+                if batch_size == 0:
+                    print("Stopping the optimization - the experiment budget has been used up.")
+                    break
 
-    population_size = model.population_size
+            params = optimiser.ask(batch_size)
+            result = model(np.array(params))
+            if optimiser.models_measurements:
+                optimiser.tell(params, result, model.last_error_std, measurements=model.last_measurements)
+            else:
+                optimiser.tell(params, result, model.last_error_std)
 
-    # initialising swarm
-    options = {"c1": 0.3, "c2": 0.5, "w": 0.1}
+            # results of wells of earlier batches that were repeated because they failed the quality checks
+            for points, errors, error_std in model.pop_recovered():
+                if optimiser.accepts_extra_points:
+                    optimiser.tell(points, errors, error_std)
 
-    # Call instance of PSO with bounds argument
-    optimiser = ps.single.GlobalBestPSO(
-        n_particles=population_size, dimensions=3, options=options, bounds=bounds
-    )
+            model.check_surrogate(optimiser)
+
+    except ConvergenceReached as stop:
+        model.finish(stop)
+        return stop
 
-    # Perform optimization
-    cost, pos = optimiser.optimize(model, iters=num_iterations)
+    return None
 
 
-def guassian_process(model, search_space, num_iterations):
+def split_batch(batch_size, expected_improvements):
     """
-    Performs well plate optimisation using guassian optimisation
+    Splits the wells of a batch among several targets in proportion to the improvement that the surrogate model of
+    each target expects. Targets without a model yet (an infinite expected improvement) share the batch equally, and
+    every target gets at least one well while there are wells left.
+
+    Returns:
+        counts (ndarray):
+            The number of wells of each target.
+    """
+
+    weights = np.asarray(expected_improvements, dtype=float)
+    if np.isinf(weights).any():
+        weights = np.isinf(weights).astype(float)
+    if not weights.sum() > 0:
+        weights = np.ones(len(weights))
+
+    counts = np.zeros(len(weights), dtype=int)
+    counts[np.argsort(-weights)[: min(batch_size, len(weights))]] = 1
+
+    # share out the rest by largest remainder
+    shares = (batch_size - counts.sum()) * weights / weights.sum()
+    counts += np.floor(shares).astype(int)
+    remainder = batch_size - counts.sum()
+    counts[np.argsort(-(shares - np.floor(shares)))[:remainder]] += 1
+
+    return counts
+
+
+def run_multi_target(model, optimisers, num_iterations, initial_points=None, planner=None):
+    """
+    Runs the ask-and-tell loop of several targets that share the wells of each batch (see OptimisationLoop with
+    several target measurements). Every target has its own optimiser, and every optimiser is told the errors of all
+    wells for its target. Each batch is split among the targets that have not converged yet by the improvement their
+    surrogate models expect (see split_batch). The points of the other targets are passed to each optimiser as
+    pending, so that the targets do not propose the same wells.
+
+    Args:
+        model (Class):
+            Well plate class (OptimisationLoop) with several target measurements.
+        optimisers (list of SkoptAskTell):
+            The ask-and-tell optimiser of each target.
+        num_iterations (int):
+            Total number of iterations.
+        initial_points (ndarray):
+            Liquid volumes of the first batch, shared by all targets. If None, the first batch is split equally.
+        planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration from the mean confidence of the surrogates of
+            the active targets, and the optimisation stops when the budget is used up.
+
+    Returns:
+        stop (ConvergenceReached):
+            The stopping rule that ended the optimisation early (e.g. all targets have converged), or None.
+    """
+
+    try:
+        for i in range(num_iterations):
+            active = np.flatnonzero(~model.target_converged)
+
+            batch_size = model.population_size
+            if planner is not None:
+                batch_size = planner.next_batch_size(
+                    np.mean([optimisers[k].confidence() for k in active])
+                )
+                if batch_size == 0:
+                    print("Stopping the optimization - the experiment budget has been used up.")
+                    break
+
+            if i == 0 and initial_points is not None:
+                params = np.asarray(initial_points, dtype=float)
+            else:
+                counts = split_batch(
+                    batch_size, [optimisers[k].expected_improvement() for k in active]
+                )
+                print(
+                    "Wells per target: "
+                    + ", ".join(f"{k + 1}: {count}" for k, count in zip(active, counts))
+                )
+                batches = []
+                for k, count in zip(active, counts):
+                    if count == 0:
+                        continue
+                    pending = np.vstack(batches) if batches else None
+                    batches.append(optimisers[k].ask(int(count), pending=pending))
+                params = np.vstack(batches)
+
+            model(params)
+            for k, optimiser in enumerate(optimisers):
+                error_std = None
+                if model.last_target_error_std is not None:
+                    error_std = model.last_target_error_std[:, k]
+                optimiser.tell(params, model.last_target_errors[:, k], error_std)
+
+            # results of wells of earlier batches that were repeated because they failed the quality checks
+            for points, errors, error_std in model.pop_recovered():
+                for k, optimiser in enumerate(optimisers):
+                    optimiser.tell(points, errors[:, k], None if error_std is None else error_std[:, k])
+
+    except ConvergenceReached as stop:
+        model.finish(stop)
+        return stop
+
+    return None
+
+
+def multi_target(
+    model,
+    search_space,
+    base_estimator,
+    num_iterations,
+    initial_points=None,
+    planner=None,
+    prescreen=None,
+    random_state=None,
+):
+    """
+    Performs well plate optimisation of several targets at once, with a Bayesian optimiser ("GP" or "RF") per target.
+    (For the arguments, see run_multi_target and SkoptAskTell. The optimiser of the k-th target is seeded with
+    random_state + k, so that the targets do not start from the same random points.)
+    """
+
+    optimisers = [
+        SkoptAskTell(
+            search_space,
+            base_estimator,
+            model.population_size,
+            prescreen=prescreen,
+            random_state=None if random_state is None else random_state + k,
+        )
+        for k in range(model.num_targets)
+    ]
+    return run_multi_target(model, optimisers, num_iterations, initial_points, planner)
+
+
+def particle_swarm(
+    model, search_space, num_iterations, initial_points=None, planner=None
+):
+    """
+    Performs well plate optimisation using particle swarm
 
     Args:
         model (Class):
@@ -48,20 +512,53 @@ def guassian_process(model, search_space, num_iterations):
             formatted as [[low, high] for i in num_liquids]
         num_iterations (int):
             Total number of iterations for the optimisation algorithm.
+        initial_points (ndarray):
+            Starting positions of the swarm, of shape (population_size, num_liquids).
+            If None, the swarm is initialised uniformly at random.
+        planner (BudgetPlanner):
+            If given, the number of iterations is limited to what fits in the budget.
+            The swarm size is fixed, so every iteration uses population_size wells.
     """
 
-    population_size = model.population_size
+    optimiser = SwarmAskTell(search_space, model.population_size, initial_points)
+    return run_optimisation(model, optimiser, num_iterations, planner)
 
-    opt = Optimizer(search_space, base_estimator="GP", n_initial_points=population_size)
 
-    for i in range(num_iterations):
-        params = opt.ask(population_size)
-        result = model(np.array(params))
-        for i in range(population_size):
-            opt.tell(params[i], result[i])
+def guassian_process(
+    model, search_space, num_iterations, initial_points=None, planner=None, prescreen=None, random_state=None
+):
+    """
+    Performs well plate optimisation using guassian optimisation
+
+    Args:
+        model (Class):
+            Well plate class, from wellplate_classes
+        search_space (list):
+            A list of the search space for the algorithms.
+            formatted as [[low, high] for i in num_liquids]
+        num_iterations (int):
+            Total number of iterations for the optimisation algorithm.
+        initial_points (ndarray):
+            Liquid volumes for the first iteration, of shape (population_size, num_liquids).
+            If None, skopt's default random initial points are used.
+        planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration, and the optimisation
+            stops when the budget is used up (num_iterations is then a maximum).
+        prescreen (Prescreener):
+            If given, each batch is chosen from a large pool of candidates scored with the surrogate model.
+        random_state (int):
+            Seed of the optimiser, so that the optimisation can be reproduced. If None, every run differs.
+    """
+
+    optimiser = SkoptAskTell(
+        search_space, "GP", model.population_size, initial_points, prescreen, random_state
+    )
+    return run_optimisation(model, optimiser, num_iterations, planner)
 
 
-def random_forest(model, search_space, num_iterations):
+def random_forest(
+    model, search_space, num_iterations, initial_points=None, planner=None, prescreen=None, random_state=None
+):
     """
     Performs well plate optimisation using random forest
 
@@ -73,17 +570,102 @@ def random_forest(model, search_space, num_iterations):
             formatted as [[low, high] for i in num_liquids]
         num_iterations (int):
             Total number of iterations for the optimisation algorithm.
+        initial_points (ndarray):
+            Liquid volumes for the first iteration, of shape (population_size, num_liquids).
+            If None, skopt's default random initial points are used.
+        planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration, and the optimisation
+            stops when the budget is used up (num_iterations is then a maximum).
+        prescreen (Prescreener):
+            If given, each batch is chosen from a large pool of candidates scored with the surrogate model.
+        random_state (int):
+            Seed of the optimiser, so that the optimisation can be reproduced. If None, every run differs.
     """
 
-    population_size = model.population_size
+    optimiser = SkoptAskTell(
+        search_space, "RF", model.population_size, initial_points, prescreen, random_state
+    )
+    return run_optimisation(model, optimiser, num_iterations, planner)
 
-    opt = Optimizer(search_space, base_estimator="RF", n_initial_points=population_size)
 
-    for i in range(num_iterations):
-        params = opt.ask(population_size)
-        result = model(np.array(params))
-        for i in range(population_size):
-            opt.tell(params[i], result[i])
+def transfer_learning(
+    model,
+    search_space,
+    base_estimator,
+    num_iterations,
+    past_dirs,
+    initial_points=None,
+    planner=None,
+    prescreen=None,
+):
+    """
+    Performs well plate optimisation through a model of the measurements ("GP" or "RF") that is pre-trained on the
+    wells of past experiments with the same liquids and measured parameters (see TransferAskTell). Without initial
+    points, the first iteration is already chosen by the pre-trained model.
+
+    Args:
+        model (Class):
+            Well plate class (OptimisationLoop) with a single target.
+        search_space (list):
+            A list of the search space for the algorithms.
+            formatted as [[low, high] for i in num_liquids]
+        base_estimator (string):
+            The model of the measurements, "GP" or "RF".
+        num_iterations (int):
+            Total number of iterations for the optimisation algorithm.
+        past_dirs (list):
+            Past experiment directories, or directories that contain them.
+        initial_points (ndarray):
+            Liquid volumes for the first iteration, of shape (n_points, num_liquids).
+        planner (BudgetPlanner):
+            If given, chooses the number of wells of each iteration, and the optimisation
+            stops when the budget is used up (num_iterations is then a maximum).
+        prescreen (Prescreener):
+            The candidate pool and selection of each batch. If None, a pool of 4096 candidates is used.
+    """
+
+    past_volumes, past_measurements = load_experiments(
+        past_dirs, model.liquid_names, model.measured_parameter_names
+    )
+    print(f"Pre-training the {base_estimator} model of the measurements on {len(past_volumes)} past wells.")
+
+    optimiser = TransferAskTell(
+        search_space,
+        model.objectives[0],
+        model.population_size,
+        past_volumes,
+        past_measurements,
+        base_estimator,
+        initial_points,
+        prescreen,
+    )
+    return run_optimisation(model, optimiser, num_iterations, planner)
+
+
+def surrogate_confidence(opt, n_samples=256):
+    """
+    Estimates how confident the surrogate model of a skopt Optimizer is, as one minus the
+    ratio between the average predicted standard deviation over the search space and the
+    spread of the observed errors.
+
+    Args:
+        opt (skopt.Optimizer):
+            The optimiser.
+        n_samples (int):
+            The number of random points of the search space to average over.
+
+    Returns:
+        confidence (float):
+            Between 0 (no model yet, or no information) and 1 (fully confident).
+    """
+
+    if not opt.models or len(opt.yi) < 2 or np.std(opt.yi) == 0:
+        return 0.0
+
+    samples = opt.space.transform(opt.space.rvs(n_samples, random_state=0))
+    _, std = opt.models[-1].predict(samples, return_std=True)
+
+    return float(np.clip(1 - np.mean(std) / np.std(opt.yi), 0, 1))
 
 
 """
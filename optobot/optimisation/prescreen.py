@@ -0,0 +1,169 @@
+"""
+Contains an in-silico pre-screening stage for the optimisers with a surrogate
+model: a large pool of candidate points is scored with the surrogate, and only
+the best points that are spread out are sent to the robot.
+"""
+
+import numpy as np
+
+from optobot.optimisation.initial_designs import _unit_samples
+
+
+def select_diverse(unit_candidates, scores, n, min_distance, unit_pending=None):
+    """
+    Greedily selects the n best-scoring candidates (lowest score first),
+    skipping candidates closer than min_distance to a candidate already
+    selected or to a pending point. If fewer than n candidates are far enough
+    apart, the rest are the best of the remaining candidates.
+
+    Parameters
+    ----------
+    unit_candidates : np.ndarray, shape(n_candidates, n_liquids)
+        The candidates, scaled to the unit hypercube.
+
+    scores : np.ndarray, shape(n_candidates,)
+        The score of each candidate (lower is better).
+
+    n : int
+        The number of candidates to select.
+
+    min_distance : float
+        The smallest distance between selected points, in the unit hypercube.
+
+    unit_pending : np.ndarray, default = None
+        Points that have been handed out already, scaled to the unit hypercube.
+
+    Returns
+    -------
+    selected : np.ndarray, shape(n,)
+        The indices of the selected candidates, best first.
+    """
+
+    order = np.argsort(scores)
+    sorted_candidates = unit_candidates[order]
+
+    # the distance of each candidate (in order of score) to the closest selected or pending point
+    min_dist = np.full(len(order), np.inf)
+    if unit_pending is not None and len(unit_pending) > 0:
+        for point in np.asarray(unit_pending, dtype=float):
+            min_dist = np.minimum(min_dist, np.linalg.norm(sorted_candidates - point, axis=1))
+
+    selected = []
+    available = np.ones(len(order), dtype=bool)
+    while len(selected) < min(n, len(order)):
+        far = available & (min_dist >= min_distance)
+        i = int(np.argmax(far)) if far.any() else int(np.argmax(available))
+        selected.append(i)
+        available[i] = False
+        min_dist = np.minimum(min_dist, np.linalg.norm(sorted_candidates - sorted_candidates[i], axis=1))
+
+    return order[selected]
+
+
+class Prescreener:
+    """
+    Chooses the points of a batch from a large Sobol pool of candidate points,
+    scored with the surrogate model of an optimiser in chunks (each chunk is
+    scored with one vectorised call), instead of asking the optimiser for the
+    batch directly. Only the best points that are at least min_distance apart
+    (in the unit hypercube) are returned, so that the wells of a batch are not
+    spent on near-duplicates.
+
+    Parameters
+    ----------
+    n_candidates : int, default = 50000
+        The size of the candidate pool drawn for each batch.
+
+    chunk_size : int, default = 8192
+        The number of candidates scored at once, which bounds the memory used.
+
+    min_distance : float, default = 0.05
+        The smallest distance between the points of a batch, and between them
+        and pending points, in the unit hypercube.
+
+    total_volume : float, default = None
+        The total liquid volume per well. Candidates above it are discarded.
+        OptimisationLoop.optimise sets it to the total volume of the loop if
+        it is not given.
+
+    random_state : int, default = 0
+        The seed of the candidate pools.
+    """
+
+    def __init__(
+        self, n_candidates=50000, chunk_size=8192, min_distance=0.05, total_volume=None, random_state=0
+    ):
+
+        self.n_candidates = n_candidates
+        self.chunk_size = chunk_size
+        self.min_distance = min_distance
+        self.total_volume = total_volume
+        self.rng = np.random.default_rng(random_state)
+
+    def candidates(self, search_space):
+        """
+        Returns a Sobol pool of n_candidates points of the search space (fewer
+        if some exceed the total volume).
+        """
+
+        search_space = np.asarray(search_space, dtype=float)
+        low, high = search_space[:, 0], search_space[:, 1]
+        candidates = low + _unit_samples("sobol", self.n_candidates, len(low), self.rng) * (high - low)
+
+        if self.total_volume is not None:
+            feasible = np.sum(candidates, axis=1) <= self.total_volume
+            if feasible.any():
+                candidates = candidates[feasible]
+
+        return candidates
+
+    def score(self, score_function, candidates):
+        """
+        Returns the scores of the candidates, calling score_function on one
+        chunk of candidates at a time.
+        """
+
+        return np.concatenate(
+            [
+                np.asarray(score_function(candidates[start : start + self.chunk_size]), dtype=float)
+                for start in range(0, len(candidates), self.chunk_size)
+            ]
+        )
+
+    def select(self, search_space, score_function, n, pending=None):
+        """
+        Scores a new candidate pool and returns the best n diverse candidates.
+
+        Parameters
+        ----------
+        search_space : list
+            The search space, formatted as [[low, high] for i in num_liquids].
+
+        score_function : callable
+            Returns the score of each row of liquid volumes (lower is better),
+            e.g. the negative expected improvement of a surrogate model.
+
+        n : int
+            The number of points to return.
+
+        pending : np.ndarray, default = None
+            Points that have been handed out but not measured yet.
+
+        Returns
+        -------
+        points : np.ndarray, shape(n, n_liquids)
+            The liquid volumes of the selected candidates, best first.
+        """
+
+        search_space = np.asarray(search_space, dtype=float)
+        low, high = search_space[:, 0], search_space[:, 1]
+        span = np.where(high > low, high - low, 1.0)
+
+        candidates = self.candidates(search_space)
+        scores = self.score(score_function, candidates)
+        unit_pending = None
+        if pending is not None and len(pending) > 0:
+            unit_pending = (np.asarray(pending, dtype=float) - low) / span
+
+        selected = select_diverse((candidates - low) / span, scores, n, self.min_distance, unit_pending)
+        return candidates[selected]
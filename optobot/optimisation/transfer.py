@@ -0,0 +1,320 @@
+"""
+Contains a surrogate model of the measurements (rather than the errors) of the
+wells, which can be pre-trained on the data of past experiments with the same
+liquids, and an ask-and-tell optimiser that optimises the objective of a new
+experiment through it from the first iteration (transfer learning).
+"""
+
+import glob
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+from optobot.optimisation.history import read_wells
+from optobot.optimisation.prescreen import Prescreener
+
+
+def load_experiments(root_dirs, liquid_names, measured_parameter_names):
+    """
+    Returns the liquid volumes (without the dilution agent) and measurements of
+    the valid wells of every past experiment in (or below) the given
+    directories. Experiments with other liquids or measured parameters are
+    skipped.
+
+    Parameters
+    ----------
+    root_dirs : list of str
+        Experiment directories, or directories that contain them.
+
+    liquid_names : list of str
+        The names of the liquids, with the dilution agent first (as passed to
+        OptimisationLoop).
+
+    measured_parameter_names : list of str
+        The names of the elements of one measurement.
+
+    Returns
+    -------
+    volumes : np.ndarray, shape(n_wells, n_liquids - 1)
+        The liquid volumes of the wells, without the dilution agent.
+
+    measurements : np.ndarray, shape(n_wells, n_measured_parameters)
+        The measurements of the wells.
+    """
+
+    volume_columns = [f"vol_{liquid_name}" for liquid_name in liquid_names]
+    volumes = [np.empty((0, len(volume_columns)))]
+    measurements = [np.empty((0, len(measured_parameter_names)))]
+
+    for root_dir in root_dirs:
+        for filepath in sorted(glob.glob(f"{root_dir}/**/all_data.csv", recursive=True)):
+            wells = read_wells(filepath, volume_columns, measured_parameter_names)
+            if wells is None:
+                continue
+            volumes.append(wells[0])
+            measurements.append(wells[1])
+
+    return np.vstack(volumes)[:, 1:], np.vstack(measurements)
+
+
+class MeasurementSurrogate:
+    """
+    A regression model from the liquid volumes of a well to each of its
+    measured parameters, with the uncertainty of its predictions. Because it
+    models the measurements, it does not depend on the objective function or
+    target, and the data of any past experiment with the same liquids can be
+    used to train it.
+
+    Parameters
+    ----------
+    search_space : list
+        The search space of the liquid volumes, formatted as
+        [[low, high] for i in num_liquids]. The volumes are scaled to the unit
+        cube before fitting.
+
+    base_estimator : str, default = "GP"
+        "GP" for a Gaussian process with a Matern kernel (shared by the
+        measured parameters), or "RF" for a random forest, whose uncertainty is
+        the spread of the predictions of its trees.
+
+    random_state : int, default = 0
+        The seed of the model.
+    """
+
+    def __init__(self, search_space, base_estimator="GP", random_state=0):
+
+        if base_estimator not in ("GP", "RF"):
+            raise ValueError(f"Unknown surrogate model '{base_estimator}'. Choose from 'GP' or 'RF'.")
+
+        search_space = np.asarray(search_space, dtype=float)
+        self.low = search_space[:, 0]
+        self.high = search_space[:, 1]
+        self.base_estimator = base_estimator
+
+        num_dims = len(search_space)
+        if base_estimator == "GP":
+            kernel = ConstantKernel(1.0, (1e-2, 1e2)) * Matern(
+                length_scale=np.ones(num_dims), length_scale_bounds=(1e-2, 1e2), nu=2.5
+            ) + WhiteKernel(1e-3, (1e-6, 1.0))
+            self.model = GaussianProcessRegressor(kernel, normalize_y=True, random_state=random_state)
+        else:
+            self.model = RandomForestRegressor(
+                n_estimators=100, min_samples_leaf=3, random_state=random_state
+            )
+        self.fitted = False
+
+    def scale(self, volumes):
+        return (np.asarray(volumes, dtype=float) - self.low) / (self.high - self.low)
+
+    def fit(self, volumes, measurements):
+        """
+        Fits the model to the measurements of the wells.
+
+        Parameters
+        ----------
+        volumes : np.ndarray, shape(n_wells, n_liquids - 1)
+            The liquid volumes of the wells, without the dilution agent.
+
+        measurements : np.ndarray, shape(n_wells, n_measured_parameters)
+            The measurements of the wells.
+        """
+
+        measurements = np.asarray(measurements, dtype=float)
+        if measurements.shape[1] == 1:
+            measurements = measurements.ravel()
+
+        self.model.fit(self.scale(volumes), measurements)
+        self.fitted = True
+
+    def predict(self, volumes):
+        """
+        Returns the predicted mean and standard deviation of each measured
+        parameter, both of shape(n_wells, n_measured_parameters).
+        """
+
+        X = self.scale(volumes)
+        if self.base_estimator == "GP":
+            mean, std = self.model.predict(X, return_std=True)
+        else:
+            predictions = np.stack([tree.predict(X) for tree in self.model.estimators_])
+            mean, std = predictions.mean(axis=0), predictions.std(axis=0)
+
+        # a single measured parameter comes back as one column
+        return mean.reshape(len(X), -1), std.reshape(len(X), -1)
+
+
+class TransferAskTell:
+    """
+    Ask-and-tell optimiser that models the measurements of the wells (see
+    MeasurementSurrogate), pre-trained on the wells of past experiments, and
+    optimises the objective of the new experiment through the model from the
+    first iteration. The model is refitted to the past and new wells after each
+    tell.
+
+    Each batch is chosen from a pool of candidate points of the search space
+    (see optobot.optimisation.prescreen) by a lower confidence bound of their
+    error: the predicted measurements are sampled from the model, passed
+    through the objective function, and the mean minus kappa standard
+    deviations of the sampled errors is minimised. The best candidates that are
+    spread out (also from pending points) make up the batch.
+
+    Parameters
+    ----------
+    search_space : list
+        The search space of the liquid volumes, formatted as
+        [[low, high] for i in num_liquids].
+
+    objective_function : callable
+        Returns the error of each row of measurements (e.g. one of
+        OptimisationLoop.objectives).
+
+    population_size : int
+        The number of wells per iteration.
+
+    past_volumes : np.ndarray, shape(n_wells, n_liquids - 1)
+        The liquid volumes (without the dilution agent) of the past wells.
+
+    past_measurements : np.ndarray, shape(n_wells, n_measured_parameters)
+        The measurements of the past wells.
+
+    base_estimator : str, default = "GP"
+        The model of the measurements, "GP" or "RF".
+
+    initial_points : np.ndarray, default = None
+        Liquid volumes for the first iteration. If None, the first iteration
+        is chosen by the pre-trained model.
+
+    prescreen : Prescreener, default = None
+        The candidate pool and selection of each batch. If None, a pool of
+        4096 candidates is used.
+
+    n_samples : int, default = 32
+        The number of samples of the predicted measurements of each candidate.
+
+    kappa : float, default = 1.96
+        The weight of the uncertainty of the error in the lower confidence bound.
+
+    random_state : int, default = 0
+        The seed of the candidates and samples.
+    """
+
+    variable_batch_size = True
+    # a repeated well is told without its measurements, which the model needs
+    accepts_extra_points = False
+    models_measurements = True
+
+    def __init__(
+        self,
+        search_space,
+        objective_function,
+        population_size,
+        past_volumes,
+        past_measurements,
+        base_estimator="GP",
+        initial_points=None,
+        prescreen=None,
+        n_samples=32,
+        kappa=1.96,
+        random_state=0,
+    ):
+
+        self.search_space = np.asarray(search_space, dtype=float)
+        self.objective_function = objective_function
+        self.population_size = population_size
+        self.initial_points = None
+        if initial_points is not None:
+            self.initial_points = np.asarray(initial_points, dtype=float)
+        self.prescreen = prescreen
+        if prescreen is None:
+            self.prescreen = Prescreener(n_candidates=4096, random_state=random_state)
+        self.n_samples = n_samples
+        self.kappa = kappa
+        self.rng = np.random.default_rng(random_state)
+
+        self.volumes = np.asarray(past_volumes, dtype=float)
+        self.measurements = np.asarray(past_measurements, dtype=float)
+        self.errors = np.empty(0)  # errors of the wells of the new experiment
+
+        self.surrogate = MeasurementSurrogate(search_space, base_estimator, random_state)
+        if len(self.volumes) > 0:
+            self.surrogate.fit(self.volumes, self.measurements)
+
+    def candidates(self, n):
+        return self.rng.uniform(self.search_space[:, 0], self.search_space[:, 1], (n, len(self.search_space)))
+
+    def sample_errors(self, points):
+        """
+        Returns the errors of samples of the predicted measurements of the points, of shape(n_samples, n_points).
+        """
+
+        mean, std = self.surrogate.predict(points)
+        samples = mean + std * self.rng.standard_normal((self.n_samples,) + mean.shape)
+        errors = self.objective_function(samples.reshape(-1, mean.shape[1]))
+        return np.asarray(errors, dtype=float).reshape(self.n_samples, len(points))
+
+    def ask(self, batch_size=None, pending=None):
+        """
+        Returns the liquid volumes of the next batch (the initial points first, if given). Points that have been
+        handed out but not told yet can be passed as pending, so that the batch keeps its distance from them.
+        """
+
+        if self.initial_points is not None:
+            points, self.initial_points = self.initial_points, None
+            return points
+
+        batch_size = batch_size or self.population_size
+        if not self.surrogate.fitted:
+            return self.candidates(batch_size)
+
+        def lower_confidence_bound(points):
+            errors = self.sample_errors(points)
+            return errors.mean(axis=0) - self.kappa * errors.std(axis=0)
+
+        return self.prescreen.select(self.search_space, lower_confidence_bound, batch_size, pending)
+
+    def tell(self, points, errors, error_std=None, measurements=None):
+        """
+        Adds the measurements of a batch to the model, and refits it. Wells with a nan error or measurement (e.g.
+        wells that failed the quality checks) are left out. The uncertainty of the errors is not used, as the model
+        fits the noise of the measurements.
+        """
+
+        if measurements is None:
+            raise ValueError("The transfer learning optimiser needs the measurements of the wells.")
+
+        errors = np.asarray(errors, dtype=float)
+        measurements = np.asarray(measurements, dtype=float)
+        valid = np.isfinite(errors) & np.all(np.isfinite(measurements), axis=1)
+        if not valid.any():
+            return
+
+        self.volumes = np.vstack([self.volumes, np.asarray(points, dtype=float)[valid]])
+        self.measurements = np.vstack([self.measurements, measurements[valid]])
+        self.errors = np.concatenate([self.errors, errors[valid]])
+        self.surrogate.fit(self.volumes, self.measurements)
+
+    def confidence(self, n_samples=256):
+        """
+        Returns one minus the ratio between the average predicted standard deviation of the error over the search
+        space and the spread of the errors of the new experiment (0 before two wells have been told).
+        """
+
+        if len(self.errors) < 2 or np.std(self.errors) == 0:
+            return 0.0
+
+        errors = self.sample_errors(self.candidates(n_samples))
+        return float(np.clip(1 - np.mean(errors.std(axis=0)) / np.std(self.errors), 0, 1))
+
+    def expected_improvement(self, n_samples=1024):
+        """
+        Returns the largest improvement of the best error of the new experiment that the model expects at random
+        points of the search space (inf before any well has been told).
+        """
+
+        if len(self.errors) == 0:
+            return np.inf
+
+        errors = self.sample_errors(self.candidates(n_samples))
+        return float(np.max(np.mean(np.maximum(np.min(self.errors) - errors, 0), axis=0)))
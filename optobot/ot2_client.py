@@ -0,0 +1,216 @@
+"""
+Contains a client for the HTTP API of the Opentrons OT-2 robot server, used to
+upload a generated protocol, start a run and wait for it to finish, without
+going through the Opentrons App.
+"""
+
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+class OT2Error(Exception):
+    """Raised when the robot server returns an error or cannot be reached."""
+
+
+class OT2RunError(OT2Error):
+    """Raised when a protocol run fails or is stopped."""
+
+
+class OT2Client:
+    """
+    A class to upload and run protocols on an OT-2 over its HTTP API.
+
+    Parameters:
+        - host (string):
+            IP address or hostname of the robot (shown in the Opentrons App).
+        - port (int):
+            Port of the robot server. 31950 for the OT-2.
+        - request_timeout (float):
+            Timeout of each HTTP request, in seconds.
+
+    """
+
+    # Statuses after which a run will not change any more
+    FINISHED_STATUSES = ("succeeded", "failed", "stopped")
+
+    def __init__(self, host, port=31950, request_timeout=10.0):
+
+        self.base_url = f"http://{host}:{port}"
+        self.request_timeout = request_timeout
+
+    def _request(self, method, path, body=None, content_type="application/json"):
+        """
+        Sends a request to the robot server and returns the decoded JSON response.
+        """
+
+        headers = {"Opentrons-Version": "3"}
+        if body is not None:
+            if content_type == "application/json":
+                body = json.dumps(body).encode()
+            headers["Content-Type"] = content_type
+
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+                return json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as error:
+            detail = error.read().decode(errors="replace")
+            raise OT2Error(f"{method} {path} failed with status {error.code}: {detail}")
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as error:
+            raise OT2Error(f"Could not reach the robot at {self.base_url}: {error}")
+
+    def health(self):
+        """
+        Returns the robot's health information (name, API version, ...). Useful to check the connection.
+        """
+
+        return self._request("GET", "/health")
+
+    def upload_protocol(self, filepath):
+        """
+        Uploads a protocol file and returns its protocol id.
+        """
+
+        boundary = uuid.uuid4().hex
+        with open(filepath, "rb") as file:
+            content = file.read()
+
+        body = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{os.path.basename(filepath)}"\r\n'
+            "Content-Type: text/x-python\r\n\r\n"
+        ).encode()
+        body += content + f"\r\n--{boundary}--\r\n".encode()
+
+        response = self._request(
+            "POST", "/protocols", body, f"multipart/form-data; boundary={boundary}"
+        )
+        return response["data"]["id"]
+
+    def create_run(self, protocol_id):
+        """
+        Creates a run of an uploaded protocol and returns its run id.
+        """
+
+        response = self._request("POST", "/runs", {"data": {"protocolId": protocol_id}})
+        return response["data"]["id"]
+
+    def play(self, run_id):
+        """
+        Starts (or resumes) a run.
+        """
+
+        self._request(
+            "POST", f"/runs/{run_id}/actions", {"data": {"actionType": "play"}}
+        )
+
+    def stop(self, run_id):
+        """
+        Stops a run. A stopped run cannot be resumed.
+        """
+
+        self._request(
+            "POST", f"/runs/{run_id}/actions", {"data": {"actionType": "stop"}}
+        )
+
+    def get_run(self, run_id):
+        """
+        Returns the data of a run, including its "status" and "errors".
+        """
+
+        return self._request("GET", f"/runs/{run_id}")["data"]
+
+    def wait_for_run(
+        self,
+        run_id,
+        timeout=3600.0,
+        poll_interval=1.0,
+        max_poll_interval=30.0,
+        backoff=1.5,
+        max_poll_errors=5,
+    ):
+        """
+        Polls a run until it has finished, waiting a little longer between each poll.
+        If the run has not finished within the timeout, it is stopped.
+
+        Parameters:
+        - run_id (string):
+            The id of the run.
+        - timeout (float):
+            Maximum time to wait, in seconds.
+        - poll_interval (float):
+            Time before the first poll, in seconds.
+        - max_poll_interval (float):
+            Longest time between two polls, in seconds.
+        - backoff (float):
+            Factor by which the time between polls grows.
+        - max_poll_errors (int):
+            Number of polls in a row that may fail (e.g. a dropped connection) before giving up.
+            Failed polls are retried with the same backoff.
+
+        Returns:
+        - run (dict):
+            The data of the run once it has succeeded.
+        """
+
+        deadline = time.monotonic() + timeout
+        interval = poll_interval
+        status = None
+        poll_errors = 0
+
+        while True:
+            try:
+                run = self.get_run(run_id)
+            except OT2Error as error:
+                poll_errors += 1
+                if poll_errors >= max_poll_errors:
+                    raise
+                print(f"Polling run {run_id} failed ({error}), retrying...")
+            else:
+                poll_errors = 0
+                status = run["status"]
+
+                if status == "succeeded":
+                    return run
+                if status in self.FINISHED_STATUSES:
+                    errors = "; ".join(
+                        error.get("detail", str(error)) for error in run.get("errors", [])
+                    )
+                    raise OT2RunError(f"Run {run_id} {status}. {errors}".strip())
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # leave the robot free for the next run
+                message = f"Run {run_id} did not finish within {timeout} s (last status: {status})."
+                try:
+                    self.stop(run_id)
+                except OT2Error as error:
+                    raise TimeoutError(f"{message} It could not be stopped: {error}")
+                raise TimeoutError(f"{message} It was stopped.")
+
+            time.sleep(min(interval, remaining))
+            interval = min(interval * backoff, max_poll_interval)
+
+    def run_protocol(self, filepath, timeout=3600.0):
+        """
+        Uploads a protocol, runs it and waits for the run to finish.
+
+        Returns:
+        - run_id (string):
+            The id of the finished run.
+        """
+
+        protocol_id = self.upload_protocol(filepath)
+        run_id = self.create_run(protocol_id)
+        self.play(run_id)
+        print(f"Run {run_id} started on the robot, waiting for it to finish...")
+        self.wait_for_run(run_id, timeout=timeout)
+
+        return run_id
@@ -0,0 +1,194 @@
+"""
+Contains a mock of the OT-2 robot server, implementing the parts of its HTTP
+API used by the OT2Client, for testing the automated loop offline. Runs "take"
+a fixed amount of time and then succeed (or fail, if asked to).
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOT2Server:
+    """
+    A class to run a mock OT-2 robot server in a background thread.
+
+    Parameters:
+        - host (string):
+            Address to listen on.
+        - port (int):
+            Port to listen on. 0 picks a free port (see the port attribute).
+        - run_duration (float):
+            Time in seconds that each run takes.
+        - fail_runs (bool):
+            If True, every run fails instead of succeeding.
+        - fail_polls (int):
+            Number of the following requests for the status of a run that fail (with status 503), to test the
+            retries of the client. Can be set again at any time.
+
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, run_duration=1.0, fail_runs=False, fail_polls=0
+    ):
+
+        self.run_duration = run_duration
+        self.fail_runs = fail_runs
+        self.fail_polls = fail_polls
+        self.protocols = {}
+        self.runs = {}
+        self.lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def run_status(self, run):
+        """
+        Returns the current status of a run, based on when it was started.
+        """
+
+        if run["stopped"]:
+            return "stopped"
+        if run["started"] is None:
+            return "idle"
+        if time.monotonic() - run["started"] < self.run_duration:
+            return "running"
+        return "failed" if self.fail_runs else "succeeded"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _error(self, code, detail):
+                self._send(code, {"errors": [{"detail": detail}]})
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _check_version(self):
+                # the real robot server rejects requests without this header
+                if "Opentrons-Version" not in self.headers:
+                    self._error(400, "Missing header Opentrons-Version.")
+                    return False
+                return True
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._send(200, {"name": "mock-ot2", "api_version": "mock"})
+                    return
+                if not self._check_version():
+                    return
+
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "runs":
+                    with server.lock:
+                        run = server.runs.get(parts[1])
+                        failed_poll = server.fail_polls > 0
+                        server.fail_polls = max(server.fail_polls - 1, 0)
+                    if failed_poll:
+                        self._error(503, "Mock robot server busy.")
+                        return
+                    if run is None:
+                        self._error(404, f"Run {parts[1]} not found.")
+                        return
+
+                    status = server.run_status(run)
+                    errors = []
+                    if status == "failed":
+                        errors = [{"detail": "Mock run failure."}]
+                    self._send(
+                        200,
+                        {
+                            "data": {
+                                "id": parts[1],
+                                "protocolId": run["protocolId"],
+                                "status": status,
+                                "errors": errors,
+                            }
+                        },
+                    )
+                    return
+
+                self._error(404, f"{self.path} not found.")
+
+            def do_POST(self):
+                if not self._check_version():
+                    return
+
+                body = self._body()
+                parts = self.path.strip("/").split("/")
+
+                if parts == ["protocols"]:
+                    if not self.headers.get("Content-Type", "").startswith(
+                        "multipart/form-data"
+                    ):
+                        self._error(422, "Protocols must be uploaded as form data.")
+                        return
+                    protocol_id = uuid.uuid4().hex
+                    with server.lock:
+                        server.protocols[protocol_id] = body
+                    self._send(201, {"data": {"id": protocol_id}})
+                    return
+
+                data = json.loads(body or b"{}").get("data", {})
+
+                if parts == ["runs"]:
+                    protocol_id = data.get("protocolId")
+                    if protocol_id not in server.protocols:
+                        self._error(404, f"Protocol {protocol_id} not found.")
+                        return
+                    run_id = uuid.uuid4().hex
+                    with server.lock:
+                        server.runs[run_id] = {
+                            "protocolId": protocol_id,
+                            "started": None,
+                            "stopped": False,
+                        }
+                    self._send(201, {"data": {"id": run_id, "status": "idle"}})
+                    return
+
+                if len(parts) == 3 and parts[0] == "runs" and parts[2] == "actions":
+                    with server.lock:
+                        run = server.runs.get(parts[1])
+                        if run is None:
+                            self._error(404, f"Run {parts[1]} not found.")
+                            return
+                        if data.get("actionType") == "play" and run["started"] is None:
+                            run["started"] = time.monotonic()
+                        if data.get("actionType") == "stop":
+                            run["stopped"] = True
+                    self._send(201, {"data": {"actionType": data.get("actionType")}})
+                    return
+
+                self._error(404, f"{self.path} not found.")
+
+        return Handler
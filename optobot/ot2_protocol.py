@@ -10,37 +10,52 @@ import numpy as np
 
 
 def generate_script(
-    filepath, iter_count, wells_per_iteration, liquid_volumes, well_locs
+    filepath,
+    target_wells,
+    liquid_volumes,
+    well_locs,
+    labware="nest_96_wellplate_100ul_pcr_full_skirt",
 ):
     """
     Generates an opentrons script for one iteration
 
     params:
-        iter_count (int):
-            the current iteration number the program is on, used for calculating which wells to pippette into
+        target_wells (list of tuples):
+            (wellplate number, well name) of each well to pipette into, e.g. (1, "A1") for well A1 of
+            the first wellplate in well_locs. One entry per row of volume.
         volume (ndarray):
             array containing volume of each liquid in uL.
-            row size = iteration count
+            row size = number of wells in the iteration
             column size = number of liquids
         well_loc (int):
             Position of the well plate in the OT2. Default: 5 (the middle of the robot).
-        total_volume (float):
-            Total volume to be pipetted in each well. Default: 150uL.
+        labware (string or dict):
+            Opentrons load name of the well plate(s), or the labware definition of a custom well plate. The robot
+            does not know custom labware, so its definition is written into the script.
     """
 
     # This is used so that it works with .npy files, might need to be changed if we call this function from wellplate_classes
     array_str = np.array2string(liquid_volumes, separator=", ".replace("\n", ""))
+
+    if isinstance(labware, dict):
+        labware_definition = f"labware_definition = {labware!r}"
+        load_plate = "protocol.load_labware_from_definition(labware_definition, loc)"
+    else:
+        labware_definition = ""
+        load_plate = f'protocol.load_labware("{labware}", loc)'
+
     code_template = f"""
 from opentrons import protocol_api
 import numpy as np
 
 requirements = {{"robotType": "OT-2", "apiLevel": "2.16"}}
 
+{labware_definition}
+
 def run(protocol: protocol_api.ProtocolContext):
 
-    iteration_count = {iter_count}
-    wells_per_iteration = {wells_per_iteration}
     volumes = np.array({array_str})
+    well_positions = {list(target_wells)}
 
     #location selected by user when wellplate class created
     well_locs = {well_locs}
@@ -56,7 +71,7 @@ def run(protocol: protocol_api.ProtocolContext):
         
         plates = {{}}
         for idx, loc in enumerate(well_locs):
-            plates[f"plate_{{idx+1}}"] = protocol.load_labware("nest_96_wellplate_100ul_pcr_full_skirt", loc)
+            plates[f"plate_{{idx+1}}"] = {load_plate}
         
         left_pipette = protocol.load_instrument("p1000_single_gen2", "right", tip_racks=[tips])
     
@@ -67,13 +82,6 @@ def run(protocol: protocol_api.ProtocolContext):
         plates = {{f"plate_{{idx+1}}": protocol.deck[loc] for idx, loc in enumerate(well_locs)}}
         left_pipette = protocol.loaded_instruments["right"]
 
-    start_index = (iteration_count * wells_per_iteration) 
-    current_plate_idx = start_index // 96
-    plate = plates[f"plate_{{current_plate_idx+1}}"]  # Get the correct plate
-    print(f"plate_{{current_plate_idx+1}}")
-
-    well_count = iteration_count - current_plate_idx*8
-
     for liquid in range(num_liquids): 
 
         left_pipette.pick_up_tip() #one tip for each dye-distribution into all the wells. then a new tip for another color distribution into all the wells. 
@@ -81,10 +89,9 @@ def run(protocol: protocol_api.ProtocolContext):
         target_wells = []
         for well, volume_set in enumerate(volumes):
 
-            #multiplying by factor of 8: this way we first fill A1 - A12, then B1-B12. instead of A1-H1, then A2-H2.... 
-            well_index = well * 8 + well_count
-
-            target_well = plate.wells()[well_index] 
+            #the wells are chosen by the optimisation loop: first A1 - A12, then B1-B12, ... moving on to the next plate when one is full.
+            plate_number, well_name = well_positions[well]
+            target_well = plates[f"plate_{{plate_number}}"][well_name]
             target_wells.append(target_well)
 
             
@@ -0,0 +1,234 @@
+"""
+Contains a budget planner that chooses the number of wells used in each
+iteration of the optimisation loop, based on the wells, reagents and robot time
+that are still available.
+"""
+
+import numpy as np
+
+
+class BudgetPlanner:
+    """
+    A class to plan the batch size of each iteration of an optimisation.
+
+    Early iterations use large batches to explore the search space. As the
+    surrogate model of the optimiser becomes confident, the batches shrink
+    towards the minimum batch size. Batch sizes are always a multiple of the
+    granularity (e.g. the number of columns of a well plate), and the last
+    batch takes up whatever is left, so that no wells are left unused.
+
+    Parameters:
+        - wells_available (int):
+            Total number of wells across all the well plates (e.g. 96 * len(wellplate_locs)), or a smaller budget of
+            wells. OptimisationLoop.optimise also limits the planner to the free wells of the loop (see set_free_wells).
+        - min_batch_size (int):
+            Smallest number of wells in one iteration.
+        - max_batch_size (int):
+            Largest number of wells in one iteration (used when the surrogate has no confidence).
+        - granularity (int):
+            Batch sizes are multiples of this number.
+        - reagent_volumes (list of floats):
+            Volume of each liquid available in the reservoir (in the same order as liquid_names). If None, reagents are not limiting.
+        - max_well_volumes (list of floats):
+            Largest volume of each liquid that can go into one well. Set from the search space by OptimisationLoop.optimise if None.
+        - time_budget (float):
+            Robot and measurement time available for the whole experiment, in seconds. If None, time is not limiting.
+        - seconds_per_well (float):
+            Estimated pipetting time per well.
+        - seconds_per_iteration (float):
+            Estimated fixed time per iteration (uploading the protocol, measuring, etc.).
+
+    """
+
+    def __init__(
+        self,
+        wells_available,
+        min_batch_size=4,
+        max_batch_size=24,
+        granularity=1,
+        reagent_volumes=None,
+        max_well_volumes=None,
+        time_budget=None,
+        seconds_per_well=20.0,
+        seconds_per_iteration=300.0,
+    ):
+
+        if min_batch_size > max_batch_size:
+            raise ValueError("min_batch_size cannot be larger than max_batch_size.")
+
+        self.wells_available = wells_available
+        self.granularity = granularity
+        self.min_batch_size = self._round_up(min_batch_size)
+        self.max_batch_size = max(self._round_down(max_batch_size), self.min_batch_size)
+        self.reagent_volumes = (
+            None if reagent_volumes is None else np.array(reagent_volumes, dtype=float)
+        )
+        self.max_well_volumes = (
+            None if max_well_volumes is None else np.array(max_well_volumes, dtype=float)
+        )
+        self.time_budget = time_budget
+        self.seconds_per_well = seconds_per_well
+        self.seconds_per_iteration = seconds_per_iteration
+
+        # Resources used so far
+        self.wells_used = 0
+        self.time_used = 0.0
+        self.batch_sizes = []
+
+        self.free_wells = None  # Optional function returning the number of wells that can still be used
+        self.projected_wells = 0  # Wells of the batches projected by plan
+
+    def _round_down(self, n):
+        return int(n // self.granularity) * self.granularity
+
+    def _round_up(self, n):
+        return int(np.ceil(n / self.granularity)) * self.granularity
+
+    def set_volume_limits(self, search_space, total_volume):
+        """
+        Sets the largest volume of each liquid per well from the search space
+        (the dilution agent first, which tops up the well to the total volume).
+        """
+
+        search_space = np.array(search_space, dtype=float)
+        water = total_volume - np.sum(search_space[:, 0])
+        self.max_well_volumes = np.concatenate([[water], search_space[:, 1]])
+
+    def set_free_wells(self, free_wells):
+        """
+        Limits the wells that can still be used to free_wells (a function
+        returning their number), as well as to wells_available less the wells
+        used so far. OptimisationLoop.optimise passes the free wells of its well
+        allocator, less the wells waiting to be repeated, so that reserved wells
+        and repeats are not planned for.
+        """
+
+        self.free_wells = free_wells
+
+    def wells_remaining(self):
+        """
+        Returns the number of wells that can still be used, limited by the free
+        wells, the reagents in the reservoir and the remaining time budget.
+        """
+
+        remaining = self.wells_available - self.wells_used
+        if self.free_wells is not None:
+            remaining = min(remaining, self.free_wells())
+        remaining -= self.projected_wells
+
+        if self.reagent_volumes is not None and self.max_well_volumes is not None:
+            per_well = np.where(self.max_well_volumes > 0, self.max_well_volumes, np.nan)
+            reagent_wells = np.nanmin(self.reagent_volumes / per_well)
+            if np.isfinite(reagent_wells):
+                remaining = min(remaining, int(reagent_wells))
+
+        if self.time_budget is not None:
+            time_left = self.time_budget - self.time_used - self.seconds_per_iteration
+            remaining = min(remaining, int(max(time_left, 0) // self.seconds_per_well))
+
+        return self._round_down(max(remaining, 0))
+
+    def next_batch_size(self, confidence=0.0):
+        """
+        Chooses the number of wells for the next iteration.
+
+        Parameters:
+        - confidence (float):
+            Confidence of the surrogate model, between 0 (no information, explore) and 1 (fully confident).
+
+        Returns:
+        - batch_size (int):
+            Number of wells to use in the next iteration. 0 if the budget has been used up.
+        """
+
+        remaining = self.wells_remaining()
+        if remaining < self.min_batch_size:
+            return 0
+
+        confidence = float(np.clip(confidence, 0, 1))
+        batch_size = self.max_batch_size - confidence * (
+            self.max_batch_size - self.min_batch_size
+        )
+        batch_size = max(self._round_down(batch_size), self.min_batch_size)
+        batch_size = min(batch_size, remaining)
+
+        # If the leftover wells would be too few for another batch, use them now.
+        if 0 < remaining - batch_size < self.min_batch_size:
+            batch_size = remaining
+
+        return batch_size
+
+    def num_iterations(self, batch_size):
+        """
+        Returns how many iterations of a fixed batch size fit in the remaining budget.
+        """
+
+        return len(self.plan(batch_size=batch_size))
+
+    def record(self, liquid_volumes, elapsed=None):
+        """
+        Records the resources used by one iteration.
+
+        Parameters:
+        - liquid_volumes (ndarray):
+            Volumes of each liquid (dilution agent first) put in each well of the iteration.
+        - elapsed (float):
+            Measured duration of the iteration in seconds. If None, the estimate is used.
+        """
+
+        batch_size = len(liquid_volumes)
+        self.batch_sizes.append(batch_size)
+        self.wells_used += batch_size
+
+        if self.reagent_volumes is not None:
+            self.reagent_volumes = self.reagent_volumes - np.sum(liquid_volumes, axis=0)
+
+        if elapsed is None:
+            elapsed = self.seconds_per_iteration + self.seconds_per_well * batch_size
+        self.time_used += elapsed
+
+    def plan(self, confidences=None, batch_size=None):
+        """
+        Projects a schedule of batch sizes for the rest of the budget, without
+        recording it.
+
+        Parameters:
+        - confidences (list of floats):
+            Expected surrogate confidence at each future iteration. By default, it is assumed to rise linearly from 0 to 1
+            over the iterations that would be needed at the largest batch size.
+        - batch_size (int):
+            If given, every iteration uses this many wells (e.g. for a fixed swarm size) instead.
+
+        Returns:
+        - batch_sizes (list of ints):
+            Planned number of wells in each future iteration.
+        """
+
+        time_used = self.time_used
+        reagent_volumes = self.reagent_volumes
+        batch_sizes = []
+
+        if confidences is None:
+            n_steps = max(self.wells_remaining() // self.max_batch_size, 1)
+            confidences = np.linspace(0, 1, n_steps + 1)
+
+        while True:
+            step = len(batch_sizes)
+            confidence = confidences[min(step, len(confidences) - 1)]
+            if batch_size is None:
+                size = self.next_batch_size(confidence)
+            else:
+                size = batch_size if self.wells_remaining() >= batch_size else 0
+            if size == 0:
+                break
+
+            batch_sizes.append(size)
+            self.projected_wells += size
+            self.time_used += self.seconds_per_iteration + self.seconds_per_well * size
+            if self.reagent_volumes is not None and self.max_well_volumes is not None:
+                self.reagent_volumes = self.reagent_volumes - self.max_well_volumes * size
+
+        self.projected_wells, self.time_used = 0, time_used
+        self.reagent_volumes = reagent_volumes
+
+        return batch_sizes
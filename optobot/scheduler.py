@@ -0,0 +1,292 @@
+"""
+Contains a scheduler that runs several independent optimisation campaigns on
+the same well plates, merging their batches into one OT-2 protocol per round
+and routing each well's measurement back to the campaign it belongs to.
+"""
+
+import datetime
+import os
+import time
+
+import numpy as np
+
+from optobot.automate import call_measurement_function, split_measurements
+from optobot.convergence import ConvergenceReached
+from optobot.layout import WellAllocator
+from optobot.optimisation import initial_designs, optimisers
+from optobot.ot2_protocol import generate_script
+
+
+class Campaign:
+    """
+    One optimisation campaign run by the CampaignScheduler.
+
+    Parameters:
+        - loop (OptimisationLoop):
+            The optimisation loop of the campaign (its objective function, target, data directory, ...).
+        - search_space (list):
+            The search space of the liquid volumes, formatted as [[low, high] for i in num_liquids].
+        - optimiser (string):
+            The optimisation algorithm to use: "PSO", "GP" or "RF".
+        - num_iterations (int):
+            The number of iterations of the campaign.
+        - initial_design (string):
+            The space-filling design used for the first iteration (see OptimisationLoop.optimise).
+
+    """
+
+    def __init__(
+        self, loop, search_space, optimiser="GP", num_iterations=8, initial_design=None
+    ):
+
+        self.loop = loop
+        self.num_iterations = num_iterations
+
+        initial_points = None
+        if initial_design is not None:
+            initial_points = initial_designs.initial_design(
+                search_space,
+                loop.population_size,
+                method=initial_design,
+                total_volume=loop.total_volume,
+            )
+        self.optimiser = optimisers.make_optimiser(
+            optimiser, search_space, loop.population_size, initial_points
+        )
+        self.finished = False
+
+    @property
+    def name(self):
+        return os.path.basename(self.loop.exp_data_dir)
+
+
+class CampaignScheduler:
+    """
+    A class to interleave several OptimisationLoop campaigns (e.g. with different targets or objective functions)
+    on the same wellplates.
+
+    In each round, every active campaign proposes a batch, the batches are allocated to free wells of the shared
+    wellplates and merged into one OT-2 protocol, and after the run each well's measurement is handed back to its
+    campaign. All campaigns must use the same liquids (in the same reservoir order), wellplate locations and labware.
+
+    Parameters:
+        - campaigns (list of Campaign):
+            The campaigns to run.
+        - name (string):
+            Name of the directory in which the merged protocol and the shared occupancy map are stored.
+        - measurement_function (function or string):
+            Measurement function called once per round for all wells (same signature as for OptimisationLoop),
+            or "manual" to let each campaign ask for its own measurements.
+        - robot (OT2Client):
+            Client of the robot's HTTP API. If given, the merged protocol of each round is run automatically.
+
+    """
+
+    def __init__(self, campaigns, name="campaigns", measurement_function="manual", robot=None):
+
+        if not campaigns:
+            raise ValueError("At least one campaign is needed.")
+
+        first = campaigns[0].loop
+        for campaign in campaigns[1:]:
+            loop = campaign.loop
+            if (
+                loop.liquid_names != first.liquid_names
+                or list(loop.wellplate_locs) != list(first.wellplate_locs)
+                or loop.plate != first.plate
+                or loop.wellplate_shape != first.wellplate_shape
+            ):
+                raise ValueError(
+                    f"Campaign '{campaign.name}' does not use the same liquids, wellplate locations and labware "
+                    f"as campaign '{campaigns[0].name}'."
+                )
+
+        self.campaigns = campaigns
+        self.measurement_function = measurement_function
+        self.robot = robot
+        self.round_count = 0
+
+        current_datetime = datetime.datetime.now().strftime("%a-%d-%b-%Y-at-%I-%M-%S%p")
+        self.exp_data_dir = f"{name}_{current_datetime}"
+        os.makedirs(self.exp_data_dir, exist_ok=True)
+
+        # One allocator for the shared wellplates. Every campaign stores its data through it, so that the
+        # wellplate-shaped CSVs of each campaign show its wells at their real positions.
+        self.allocator = WellAllocator(
+            first.wellplate_shape,
+            first.num_wellplates,
+            f"{self.exp_data_dir}/well_occupancy.csv",
+            blank_row_space=first.blank_row_space,
+        )
+        self.allocator.save()
+        for campaign in campaigns:
+            # the occupancy map that the loop wrote for its own allocator would never be updated
+            if campaign.loop.allocator is not self.allocator and os.path.exists(campaign.loop.allocator.filepath):
+                os.remove(campaign.loop.allocator.filepath)
+            campaign.loop.allocator = self.allocator
+            if campaign.loop.reserved_wells is not None:
+                self.allocator.reserve(campaign.loop.reserved_wells)
+
+    def active_campaigns(self):
+        return [
+            campaign
+            for campaign in self.campaigns
+            if not campaign.finished
+            and campaign.loop.iteration_count < campaign.num_iterations
+        ]
+
+    def propose(self):
+        """
+        Asks every active campaign for its next batch and allocates wells to it. The wells of the campaign that
+        failed the quality checks in earlier rounds are repeated after its new points, if there are enough free wells.
+
+        Returns:
+        - batches (list of tuples):
+            (campaign, points, wells, liquid_volumes, attempts) for each campaign with a batch in this round, where
+            points are the new points of the optimiser, and attempts is how often the liquid volumes of each well
+            were measured before (0 for the new points).
+        """
+
+        batches = []
+        for campaign in self.active_campaigns():
+            points = campaign.optimiser.ask()
+            if len(points) > self.allocator.free_wells():
+                print(f"Not enough free wells left for campaign '{campaign.name}'.")
+                campaign.finished = True
+                continue
+
+            loop = campaign.loop
+            repeats, attempts = loop.take_requeued(self.allocator.free_wells() - len(points))
+            liquid_volumes = loop.add_water(np.vstack([points, repeats]))
+            attempts = np.concatenate([np.zeros(len(points), dtype=int), attempts])
+            wells = self.allocator.allocate(len(liquid_volumes), self.round_count + 1)
+            batches.append((campaign, points, wells, liquid_volumes, attempts))
+
+        return batches
+
+    def write_protocol(self, batches):
+        """
+        Writes one OT-2 protocol that fills the wells of every batch of the round.
+        """
+
+        wells = np.concatenate([batch[2] for batch in batches])
+        liquid_volumes = np.vstack([batch[3] for batch in batches])
+        loop = batches[0][0].loop
+
+        filepath = f"{self.exp_data_dir}/generated_ot2_script.py"
+        generate_script(
+            filepath,
+            self.allocator.well_names(wells),
+            liquid_volumes,
+            loop.wellplate_locs,
+            loop.protocol_labware,
+        )
+        return filepath
+
+    def measure(self, batches):
+        """
+        Measures all wells of the round, and splits the measurements (and their uncertainty and the quality of the wells,
+        if the measurement function returns them) by campaign.
+
+        Returns:
+        - results (list of tuples):
+            (measurements, uncertainty, quality) for each batch, where uncertainty and quality are None if not measured.
+        """
+
+        if self.measurement_function == "manual":
+            return [(batch[0].loop.user_input(batch[2]), None, None) for batch in batches]
+
+        wells = np.concatenate([batch[2] for batch in batches])
+        liquid_volumes = np.vstack([batch[3] for batch in batches])
+        loop = batches[0][0].loop
+
+        result = call_measurement_function(
+            self.measurement_function,
+            liquid_volumes,
+            self.round_count,
+            loop.num_measured_parameters,
+            self.exp_data_dir,
+            np.stack(self.allocator.positions(wells), axis=1),
+            loop.plate,
+            loop.wellplate_locs,
+        )
+        measurements, uncertainty, quality = split_measurements(result)
+
+        # route each well's measurement back to its campaign
+        split_indices = np.cumsum([len(batch[2]) for batch in batches])[:-1]
+        measurements = np.split(measurements, split_indices)
+        uncertainty = [None] * len(batches) if uncertainty is None else np.split(uncertainty, split_indices)
+        if quality is None:
+            quality = [None] * len(batches)
+        else:
+            quality = np.split(quality.reset_index(drop=True), split_indices)
+
+        return list(zip(measurements, uncertainty, quality))
+
+    def run_round(self, batches):
+        """
+        Runs the protocol of one round and tells every campaign the results of its wells.
+        """
+
+        start_time = time.monotonic()
+        filepath = self.write_protocol(batches)
+
+        if self.robot is None:
+            input("Upload script, wait for robot, and then press any key to continue: ")
+        else:
+            self.robot.run_protocol(filepath)
+
+        results = self.measure(batches)
+        elapsed = time.monotonic() - start_time
+
+        for (campaign, points, wells, liquid_volumes, attempts), (
+            campaign_measurements,
+            uncertainty,
+            quality,
+        ) in zip(batches, results):
+            try:
+                errors = campaign.loop.record(
+                    wells,
+                    liquid_volumes,
+                    campaign_measurements,
+                    elapsed,
+                    quality,
+                    attempts,
+                    uncertainty,
+                )
+
+                # the repeated wells follow the new points of the optimiser
+                num_new = len(points)
+                error_std = campaign.loop.last_error_std
+                if error_std is None:
+                    error_std = np.full(len(errors), np.nan)
+                campaign.optimiser.tell(points, errors[:num_new], error_std[:num_new])
+                if len(errors) > num_new and campaign.optimiser.accepts_extra_points:
+                    campaign.optimiser.tell(
+                        liquid_volumes[num_new:, 1:], errors[num_new:], error_std[num_new:]
+                    )
+                campaign.loop.check_surrogate(campaign.optimiser)
+
+            except ConvergenceReached as stop:
+                # The campaign has met a stopping rule; the others carry on.
+                campaign.loop.finish(stop)
+                campaign.finished = True
+
+    def run(self):
+        """
+        Runs rounds until every campaign has finished its iterations, met a stopping rule, or run out of wells.
+        """
+
+        while True:
+            batches = self.propose()
+            if not batches:
+                break
+
+            print(
+                f"\nRound {self.round_count + 1}: "
+                + ", ".join(f"{batch[0].name} ({len(batch[1])} wells)" for batch in batches)
+            )
+            self.run_round(batches)
+            self.round_count += 1
+
+        print("All campaigns have finished.")
@@ -0,0 +1,82 @@
+"""
+A script to time the steps of one colour measurement on the test image, as
+they were (the photo decoded once by OpenCV and again by matplotlib, the grey
+pixels whitened one at a time, and a full matplotlib figure saved before the
+colours are returned) and as they are now (the captured photo shared as a
+Frame, the grey pixels whitened in one vectorised step, and the overlay drawn
+with OpenCV on a background thread). No windows are opened.
+
+Run on the command line as: python -m tests.benchmark_frame
+
+"""
+
+import os
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import cv2 as cv
+import matplotlib.pyplot as plt
+import numpy as np
+
+from optobot.colorimetric.image_capture.frame import Frame
+from optobot.colorimetric.image_processing.contours_adapted import well_detection
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+
+IMAGE = "tests/test_data/test_image.jpg"
+OUTPUT_DIR = "tests/test_results_data"
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, 1000 * (time.perf_counter() - start)
+
+
+def whiten_pixel_by_pixel(image, thresh=30, num_rows=72):
+    # the previous loop, on the first num_rows rows only (the whole image takes several seconds)
+    for i in range(num_rows):
+        for j in range(image.shape[1]):
+            pixel = image[i, j]
+            median = np.median(pixel)
+            if np.all(median - thresh < pixel) and np.all(median + thresh > pixel):
+                image[i, j] = [255, 255, 255]
+
+
+def main():
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    figure_path = f"{OUTPUT_DIR}/benchmark_frame"
+
+    print("Previous steps:")
+    image, cv_time = timed(cv.imread, IMAGE)
+    _, plt_time = timed(plt.imread, IMAGE)
+    print(f"  Decoding the photo twice: {cv_time:.1f} ms + {plt_time:.1f} ms")
+
+    _, loop_time = timed(whiten_pixel_by_pixel, image.copy())
+    print(f"  Whitening grey pixels one at a time: {loop_time * image.shape[0] / 72:.0f} ms")
+
+    def save_figure():
+        plt.imshow(cv.cvtColor(image, cv.COLOR_BGR2RGB))
+        plt.savefig(figure_path)
+        plt.close()
+
+    _, figure_time = timed(save_figure)
+    print(f"  Saving the matplotlib figure: {figure_time:.1f} ms")
+
+    print("\nCurrent steps:")
+    photo = Frame(image, IMAGE)
+    print("  Decoding the photo: 0 ms (shared from the capture)")
+
+    _, detection_time = timed(well_detection, photo, figure_path, 30, 12, 8, False)
+    _, overlay_time = timed(wait_for_overlays)
+    print(f"  Well detection, including the vectorised whitening: {detection_time:.1f} ms")
+    print(f"  Overlay finished in the background {overlay_time:.1f} ms later")
+
+    os.remove(f"{figure_path}.png")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+A script to compare the coarse-to-fine circle detection of the optobot package
+with the previous method, which swept the Hough accumulator threshold over the
+whole full-resolution image until enough circles were found. Both methods are
+timed on the test image, and the number of wells each finds is printed.
+
+Run on the command line as: python -m tests.benchmark_hough
+
+"""
+
+import time
+
+import cv2 as cv
+
+from optobot.colorimetric.image_processing.contours import ContourDetection
+
+IMAGE_PATH = "tests/test_data/test_image.jpg"
+
+
+def threshold_sweep(blurred, expected_wells=96):
+    # The previous method: lower param2 from 50 to 10 until enough circles are found.
+    param2 = 50
+    circles = None
+    while param2 >= 10:
+        circles = cv.HoughCircles(
+            blurred,
+            cv.HOUGH_GRADIENT,
+            dp=1,
+            minDist=15,
+            param1=50,
+            param2=param2,
+            minRadius=15,
+            maxRadius=25,
+        )
+        if circles is not None and circles.shape[1] >= expected_wells:
+            break
+        param2 -= 5
+
+    return circles
+
+
+def main(repeats=5):
+
+    detector = ContourDetection(IMAGE_PATH)
+    gray = cv.cvtColor(detector.image, cv.COLOR_BGR2GRAY)
+    gray = cv.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    blurred = cv.medianBlur(gray, 5)
+    print(f"Image size: {detector.image.shape[1]} x {detector.image.shape[0]}")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        circles = threshold_sweep(blurred)
+    sweep_time = (time.perf_counter() - start) / repeats
+    found = 0 if circles is None else circles.shape[1]
+    print(f"Threshold sweep: {1000 * sweep_time:.1f} ms, {found} circles found")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        coarse = detector.coarse_circle_detection(blurred)
+        circles = None if coarse is None else detector.refine_circles(blurred, *coarse)
+    coarse_time = (time.perf_counter() - start) / repeats
+    found = 0 if circles is None else circles.shape[1]
+    print(f"Coarse-to-fine:  {1000 * coarse_time:.1f} ms, {found} wells found")
+
+    rgb_values = detector.auto_hough_circle_detection()
+    if rgb_values is not None:
+        print(f"Colours extracted for {rgb_values.shape[0]} x {rgb_values.shape[1]} wells.")
+
+
+if __name__ == "__main__":
+    main()
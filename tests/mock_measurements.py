@@ -0,0 +1,11 @@
+"""
+Measurement functions shared by the scripts that run optimisations on a mock
+robot, without a camera.
+"""
+
+
+def volume_measurement(
+    liquid_volumes, iteration_count, population_size, num_measured_parameters, exp_data_dir
+):
+    # the liquid volumes (without water) serve as the measurements
+    return liquid_volumes[:, 1:]
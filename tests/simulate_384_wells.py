@@ -0,0 +1,175 @@
+"""
+A script to test a 384-well plate with the optobot package on a mock robot.
+The plate geometry is read from the built-in labware geometry and from a
+custom labware definition file, and the two are compared, and the custom
+definition is checked to be written into the protocol. An optimisation is
+then run on the 384-well plate, with a measurement function that draws a photo
+of the plate (each well coloured from its liquid volumes) and reads the
+colours back at the well centres calculated from the geometry. The script
+checks that every colour is read back from the right well, and that the
+protocol and the stored data use the 384-well layout.
+
+Run on the command line as: python -m tests.simulate_384_wells
+
+"""
+
+import ast
+import json
+import os
+import shutil
+import warnings
+
+import cv2 as cv
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.colorimetric.image_processing.fixed_grid import get_colours, get_well_centres
+from optobot.labware import get_plate_geometry, load_labware_definition
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from optobot.ot2_protocol import generate_script
+
+DATA_DIR = "tests/test_results_data/384_wells"
+
+LABWARE = "corning_384_wellplate_112ul_flat"
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+PIXELS_PER_MM = 10
+
+
+def volume_colours(liquid_volumes):
+    # the colour of a well, from its liquid volumes (without water)
+    return np.round(liquid_volumes[:, 1:] * 8).astype(int)
+
+
+def photo_measurement(
+    liquid_volumes,
+    iteration_count,
+    population_size,
+    num_measured_parameters,
+    exp_data_dir,
+    wells=None,
+    plate=None,
+):
+    """
+    Draws a photo of the plate with the wells of this batch coloured, and reads their colours back at the well centres.
+    """
+
+    height, width = round(plate["height"] * PIXELS_PER_MM), round(plate["width"] * PIXELS_PER_MM)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    centres = get_well_centres(image, plate)
+    radius = round(plate["well_diameter"] * PIXELS_PER_MM / 2)
+
+    _, rows, columns = wells.T
+    for (row, column), colour in zip(zip(rows, columns), volume_colours(liquid_volumes)):
+        y, x = centres[row, column]
+        cv.circle(image, (int(x), int(y)), radius, tuple(int(value) for value in colour), -1)
+
+    colours = get_colours(image, centres)
+    return colours[rows, columns].astype(float)
+
+
+def write_definition(plate, filepath):
+    """
+    Writes a minimal Opentrons labware definition of a plate geometry, with its wells measured from the front left
+    corner of the plate (as in Opentrons definitions).
+    """
+
+    rows = [chr(ord("A") + row) for row in range(plate["rows"])]
+    ordering = [[f"{row}{column + 1}" for row in rows] for column in range(plate["columns"])]
+    wells = {
+        f"{row}{column + 1}": {
+            "x": plate["column_offset"] + column * plate["column_spacing"],
+            "y": plate["height"] - plate["row_offset"] - r * plate["row_spacing"],
+            "shape": "circular",
+            "diameter": plate["well_diameter"],
+        }
+        for r, row in enumerate(rows)
+        for column in range(plate["columns"])
+    }
+    definition = {
+        "parameters": {"loadName": plate["load_name"]},
+        "ordering": ordering,
+        "wells": wells,
+        "dimensions": {"xDimension": plate["width"], "yDimension": plate["height"]},
+    }
+    with open(filepath, "w") as file:
+        json.dump(definition, file)
+
+
+def main():
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    plate = get_plate_geometry(LABWARE)
+    print(f"{LABWARE}: {plate['rows']} x {plate['columns']} wells, {plate['row_spacing']} mm apart")
+    assert (plate["rows"], plate["columns"], plate["wells"]) == (16, 24, 384)
+
+    # a custom definition file gives the same geometry
+    definition_path = f"{DATA_DIR}/custom_384.json"
+    write_definition(plate, definition_path)
+    custom = get_plate_geometry(definition_path)
+    assert custom.keys() == plate.keys()
+    assert all(np.isclose(custom[key], plate[key]) for key in plate if key != "load_name")
+    print(f"The geometry read from {definition_path} matches.")
+
+    # the robot does not know the custom labware, so its definition is written into the protocol
+    script_path = f"{DATA_DIR}/custom_ot2_script.py"
+    definition = load_labware_definition(definition_path)
+    generate_script(script_path, [(1, "A1")], np.array([[10.0, 20.0, 30.0, 40.0]]), [5], definition)
+    with open(script_path) as file:
+        script = file.read()
+    compile(script, script_path, "exec")
+    line = next(line for line in script.splitlines() if line.startswith("labware_definition ="))
+    assert ast.literal_eval(line.split("=", 1)[1].strip()) == definition
+    assert "load_labware_from_definition(labware_definition, loc)" in script
+    print("The custom definition is written into the protocol.")
+
+    with MockOT2Server(run_duration=0.05) as server:
+        model = OptimisationLoop(
+            objective_function=lambda measurements: ((measurements - 120.0) ** 2).sum(axis=1),
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=[120.0, 120.0, 120.0],
+            relative_tolerance=0.0,
+            population_size=30,
+            name=f"{DATA_DIR}/optimisation",
+            measurement_function=photo_measurement,
+            robot=OT2Client(server.host, server.port),
+            labware=LABWARE,
+        )
+        model.optimise(SEARCH_SPACE, optimiser="PSO", num_iterations=2)
+
+    assert model.wellplate_shape == (16, 24)
+
+    # every colour was read back from its own well
+    all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+    all_data = all_data[all_data["iteration_number"] > 0]
+    painted = volume_colours(all_data[["vol_water", "vol_blue", "vol_yellow", "vol_red"]].to_numpy())
+    measured = all_data[["measured_red", "measured_green", "measured_blue"]].to_numpy()
+    print(
+        f"\nLargest difference between drawn and measured colours of {len(measured)} wells: "
+        f"{np.abs(measured - painted).max():.1f}"
+    )
+    assert np.abs(measured - painted).max() <= 1
+
+    # the second batch of 30 wells continues from B7 (24 wells per row), on the 384-well labware
+    with open(f"{model.exp_data_dir}/generated_ot2_script.py") as file:
+        script = file.read()
+    line = next(line for line in script.splitlines() if "well_positions =" in line)
+    positions = ast.literal_eval(line.split("=", 1)[1].strip())
+    print(f"Last protocol: {positions[0][1]} ... {positions[-1][1]} on {LABWARE}")
+    assert f'load_labware("{LABWARE}"' in script
+    assert positions[0] == (1, "B7") and positions[-1] == (1, "C12")
+
+    errors = pd.read_csv(f"{model.exp_data_dir}/errors.csv", index_col=0)
+    print(f"errors.csv is {errors.shape[0]} x {errors.shape[1]}, rows {errors.index[0]} - {errors.index[-1]}")
+    assert errors.shape == (16, 24) and errors.index[-1] == "P"
+
+    print("\nAll 384-well checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+A script to test the well allocator of the optobot package. Batches of
+different sizes are packed onto two 96-well plates, and the script checks
+that no well is used twice, that a batch that does not fit on one plate
+continues on the next, that the allocator refuses a batch when the plates are
+full, and that the occupancy map survives a reload. An optimisation with
+batches that span both plates is then run on a mock robot, and the wells of
+its last protocol and of its stored data are checked.
+
+Run on the command line as: python -m tests.simulate_allocator
+
+"""
+
+import ast
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.layout import WellAllocator
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/allocator"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+
+
+def main():
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filepath = f"{DATA_DIR}/well_occupancy.csv"
+
+    allocator = WellAllocator((8, 12), 2, filepath)
+    batches = [allocator.allocate(batch_size, i + 1) for i, batch_size in enumerate([40, 60, 90])]
+    wells = np.concatenate(batches)
+    assert len(np.unique(wells)) == len(wells) == 190
+    assert allocator.free_wells() == 2
+
+    # the second batch fills the first plate and continues on the second
+    names = allocator.well_names(batches[1])
+    print(f"Batch 2 (60 wells): {names[0]} ... {names[55]}, {names[56]} ... {names[-1]}")
+    assert names[55] == (1, "H12") and names[56] == (2, "A1")
+
+    try:
+        allocator.allocate(10, 4)
+    except ValueError as error:
+        print(f"A batch that does not fit is refused: {error}")
+    else:
+        raise AssertionError("A batch of 10 wells was allocated with 2 free wells.")
+
+    # wells can be limited to some plates (e.g. those of one robot), and filled column by column
+    columns = WellAllocator((8, 12), 2, fill_order="columns")
+    columns.allocate(4, 1)
+    names = columns.well_names(columns.allocate(10, 2, plates=[1]))
+    print(f"10 wells on the second plate, by columns: {names[0]} ... {names[-1]}")
+    assert names[0] == (2, "A1") and names[8] == (2, "A2")
+    assert columns.free_wells(plates=[0]) == 92
+
+    reloaded = WellAllocator((8, 12), 2, filepath)
+    assert np.array_equal(reloaded.occupancy, allocator.occupancy)
+    print(f"The occupancy map is reloaded from {filepath}, with {reloaded.free_wells()} free wells.")
+
+    # an optimisation with batches of 40 wells on two plates
+    with MockOT2Server(run_duration=0.05) as server:
+        model = OptimisationLoop(
+            objective_function=lambda measurements: ((measurements - 15.0) ** 2).sum(axis=1),
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=[15.0, 15.0, 15.0],
+            relative_tolerance=0.0,
+            population_size=40,
+            name=f"{DATA_DIR}/two_plates",
+            measurement_function=volume_measurement,
+            robot=OT2Client(server.host, server.port),
+            wellplate_locs=[5, 8],
+        )
+        model.optimise(SEARCH_SPACE, optimiser="PSO", num_iterations=3)
+
+    # the last protocol fills the last 16 wells of the first plate (from G9) and 24 of the second
+    with open(f"{model.exp_data_dir}/generated_ot2_script.py") as file:
+        script = file.read()
+    line = next(line for line in script.splitlines() if "well_positions =" in line)
+    positions = ast.literal_eval(line.split("=", 1)[1].strip())
+    plates = [plate for plate, _ in positions]
+    print(f"\nLast protocol: {plates.count(1)} wells on plate 1 ({positions[0][1]} ...), {plates.count(2)} on plate 2")
+    assert positions[0] == (1, "G9") and plates.count(1) == 16 and plates.count(2) == 24
+
+    # the wellplate-shaped data has both plates, with an error for every used well
+    errors = pd.read_csv(f"{model.exp_data_dir}/errors.csv", index_col=0)
+    used = errors.notna() & (errors != 0)
+    print(f"Wells with an error in errors.csv: {int(used.to_numpy().sum())} of {2 * 96}")
+    assert used.to_numpy().sum() == 120
+
+    print("\nAll allocator checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+A script to measure the noise floor of the multi-frame capture of the optobot
+package without a webcam, using a fake video source that "films" the test image
+with sensor noise, flicker and a little camera shake.
+
+A sequence of frames is recorded to disk, and the variation of the well colours
+between captures is measured for captures that combine K = 1, 2, 4 and 8
+frames, using the mean or the median, with and without aligning the frames.
+The same measurement can be run on a sequence recorded with a real camera by
+passing its file pattern (or a video file) to "noise_floor".
+
+Run on the command line as: python -m tests.simulate_averaging
+
+"""
+
+import shutil
+
+import cv2
+
+from optobot.colorimetric.image_capture.averaging import (
+    capture_averaged,
+    noise_floor,
+    record_sequence,
+)
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.fixed_grid import get_well_centres
+
+IMAGE = "tests/test_data/test_image.jpg"
+RECORDING_DIR = "tests/test_results_data/recorded_frames"
+
+
+def main():
+
+    image = cv2.imread(IMAGE)
+    positions = get_well_centres(image)
+    num_frames = [1, 2, 4, 8]
+
+    source = FakeVideoSource(IMAGE, noise=6.0, fps=0, jitter=0.5, seed=0)
+    with CameraService(source=source, warmup_frames=10) as camera:
+        camera.calibrate(settle_time=0.0)
+
+        accumulator = capture_averaged(camera, 16, positions=positions, radius=3)
+        print(
+            "Well A1 over 16 frames: mean "
+            f"{accumulator.well_colours()[0, 0].round(1)}, variance "
+            f"{accumulator.well_variance()[0, 0].round(1)}\n"
+        )
+
+        pattern = record_sequence(camera, RECORDING_DIR, 64)
+
+    print("Noise floor (standard deviation of well colours between captures):")
+    print(f"{'K':<15}" + "".join(f"{k:>8}" for k in num_frames))
+    for method in ["mean", "median"]:
+        for align in [False, True]:
+            noise = noise_floor(
+                pattern, num_frames, positions, radius=3, method=method, align=align
+            )
+            label = f"{method}{' aligned' if align else ''}"
+            print(f"{label:<15}" + "".join(f"{noise[k]:8.2f}" for k in num_frames))
+
+    shutil.rmtree(RECORDING_DIR)
+
+
+if __name__ == "__main__":
+    main()
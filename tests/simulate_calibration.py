@@ -0,0 +1,128 @@
+"""
+A script to test the colour calibration of the optobot package without a
+camera, using simulated well colours seen under changing lighting.
+
+A colour correction is fitted from 8 reference wells with known colours, and
+applied to all 96 wells. The lighting then drifts, which is detected from the
+reference wells and corrected by refitting. The script checks that the refit
+is written to the cache, that a cached calibration is only reused for the same
+reference wells and colours, that the reference wells are only checked on the
+first plate, and that a well allocator with the reference wells reserved never
+hands them out to experiments.
+
+Run on the command line as: python -m tests.simulate_calibration
+
+"""
+
+import shutil
+import time
+
+import numpy as np
+
+from optobot.colorimetric.calibration import ColourCalibration, calibrate_from_wells
+from optobot.colorimetric.colours import measurement_result
+from optobot.colorimetric.image_processing.fixed_grid import PLATE
+from optobot.layout import WellAllocator
+
+DATA_DIR = "tests/test_results_data/calibration"
+
+
+def main():
+
+    rng = np.random.default_rng(0)
+    true_colours = rng.uniform(20, 235, (8, 12, 3))
+
+    # reference wells in the four corners and the middle of the outer columns
+    reference_wells = np.array(
+        [[0, 0], [0, 11], [7, 0], [7, 11], [3, 0], [4, 0], [3, 11], [4, 11]]
+    )
+    reference_colours = true_colours[reference_wells[:, 0], reference_wells[:, 1]]
+
+    def camera(lighting, offset):
+        # the camera sees the colours through the lighting, plus noise
+        seen = true_colours @ lighting + offset + rng.normal(0, 1.0, true_colours.shape)
+        return np.clip(seen, 0, 255)
+
+    lighting = np.array([[0.9, 0.05, 0.0], [0.05, 0.8, 0.05], [0.0, 0.1, 1.05]])
+    measured = camera(lighting, [10, -5, 3])
+
+    path = f"{DATA_DIR}/calibration.npz"
+    calibration = calibrate_from_wells(measured, reference_wells, reference_colours, path=path)
+    start = time.perf_counter()
+    corrected = calibration.apply(measured)
+    duration = time.perf_counter() - start
+
+    print(f"Mean error of all wells without correction: {np.abs(measured - true_colours).mean():.1f}")
+    print(
+        f"Mean error of all wells with correction: {np.abs(corrected - true_colours).mean():.1f} "
+        f"(applied in {1e6 * duration:.0f} us)\n"
+    )
+
+    # later in the day, the lighting has become warmer
+    drifted = camera(lighting * [1.1, 1.0, 0.85], [15, -5, 0])
+    print(
+        "Mean error after drift, with the old correction: "
+        f"{np.abs(calibration.apply(drifted) - true_colours).mean():.1f}"
+    )
+    calibration.check_drift(drifted, columns=12, tolerance=3.0)
+    print(
+        "Mean error after drift, with the refitted correction: "
+        f"{np.abs(calibration.apply(drifted) - true_colours).mean():.1f}\n"
+    )
+
+    # the refitted correction is in the cache, and reused for the same references
+    assert np.allclose(ColourCalibration.load(path).matrix, calibration.matrix)
+    cached = calibrate_from_wells(drifted, reference_wells, reference_colours, path=path)
+    assert np.allclose(cached.matrix, calibration.matrix)
+    print(f"The refitted correction was saved to {path} and is reused.")
+
+    # other reference colours (e.g. from another target session) do not reuse the cache
+    other = calibrate_from_wells(drifted, reference_wells, reference_colours + 10, path=path)
+    assert not np.allclose(other.matrix, calibration.matrix)
+    assert np.allclose(ColourCalibration.load(path).reference_colours, reference_colours + 10)
+
+    # the reference wells are on the first plate, so the same wells of a second plate are measured, and a photo of the
+    # second plate is not checked for drift
+    second_plate = rng.uniform(20, 235, (8, 12, 3))
+    wells = np.column_stack([np.ones(len(reference_wells), dtype=int), reference_wells])
+    flat_wells = reference_wells[:, 0] * 12 + reference_wells[:, 1]
+    matrix = calibration.matrix.copy()
+    result = measurement_result(
+        None, second_plate, [(None, None, None)], flat_wells, 3, PLATE, calibration, plate_indices=wells[:, 0]
+    )
+    assert len(result.measurements) == len(wells)
+    assert np.allclose(calibration.matrix, matrix)
+    print("The wells of the second plate at the reference positions are measured, without a drift check.")
+    try:
+        measurement_result(
+            None, drifted, [(None, None, None)], flat_wells, 3, PLATE, calibration, plate_indices=0 * wells[:, 0]
+        )
+    except ValueError as error:
+        print(f"The reference wells of the first plate are refused: {error}\n")
+    else:
+        raise AssertionError("The reference wells were measured as wells of the iteration.")
+
+    # the reference wells are never allocated to experiments
+    allocator = WellAllocator((8, 12), 1)
+    allocator.reserve(reference_wells)
+    wells = allocator.allocate(allocator.free_wells(), 1)
+    _, rows, columns = allocator.positions(wells)
+    used = set(zip(rows.tolist(), columns.tolist()))
+    assert len(wells) == 96 - len(reference_wells)
+    assert not used & set(map(tuple, reference_wells.tolist()))
+    print(f"{len(wells)} wells were allocated around the {len(reference_wells)} reserved reference wells.")
+
+    try:
+        WellAllocator((8, 12), 1, f"{DATA_DIR}/occupancy.csv").allocate(12, 1)
+        WellAllocator((8, 12), 1, f"{DATA_DIR}/occupancy.csv").reserve(reference_wells)
+    except ValueError as error:
+        print(f"Reference wells that are already used are refused: {error}")
+    else:
+        raise AssertionError("Reference wells that were already used were reserved.")
+
+    print("\nAll calibration checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+A script to test the camera capture service of the optobot package without a
+webcam, using a fake video source that "films" the test image with sensor
+noise, badly exposed warm-up frames and auto-exposure flicker.
+
+It compares the brightness of the first frames of a freshly opened camera with
+the frames served once the warm-up frames have been discarded and the exposure
+has been locked, and the noise of a single frame with that of an averaged frame.
+
+Run on the command line as: python -m tests.simulate_camera
+
+"""
+
+import time
+
+import numpy as np
+
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+
+IMAGE = "tests/test_data/test_image.jpg"
+
+
+def main():
+
+    base = FakeVideoSource(IMAGE, noise=0.0, warmup_frames=0, flicker=0.0).read()[1]
+    base = base.astype(float)
+
+    def error(frame):
+        return np.abs(frame.astype(float) - base).mean()
+
+    # a freshly opened camera, as take_photo used to open for every photo
+    source = FakeVideoSource(IMAGE, seed=0)
+    first_frames = [source.read()[1] for _ in range(3)]
+    print(
+        "Mean error of the first frames of a fresh camera: "
+        + ", ".join(f"{error(frame):.1f}" for frame in first_frames)
+    )
+
+    with CameraService(source=FakeVideoSource(IMAGE, seed=0), warmup_frames=10) as camera:
+        camera.calibrate(settle_time=0.5)
+        print(f"Locked camera settings: {camera.settings}")
+
+        start = time.monotonic()
+        frame = camera.latest_frame()
+        print(
+            f"Latest frame after warm-up: error {error(frame):.1f} "
+            f"(served in {1000 * (time.monotonic() - start):.2f} ms)"
+        )
+
+        frames = [camera.next_frame() for _ in range(5)]
+        print(
+            "Next frames with locked exposure: "
+            + ", ".join(f"{error(frame):.1f}" for frame in frames)
+        )
+
+        averaged = camera.averaged_frame(16)
+        print(f"Average of 16 frames: error {error(averaged):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+A script to test the stopping rules of the optobot package on a mock robot,
+with the liquid volumes serving as the measurements. Four optimisations are
+run, each stopped by a different rule of the convergence monitor: a
+measurement within the tolerance of the target, a plateau of the best error
+(for an objective without a target measurement), a surrogate model that
+expects no further improvement, and a budget of wells. In each case the
+optimisation returns the stopping rule instead of exiting the program, and the
+history of the iterations is read back from "convergence.csv".
+
+Run on the command line as: python -m tests.simulate_convergence
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.convergence import ConvergenceMonitor
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/convergence"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+
+
+def run(server, name, optimiser, target, objective_function, monitor, relative_tolerance=0.05):
+
+    model = OptimisationLoop(
+        objective_function=objective_function,
+        liquid_names=["water", "blue", "yellow", "red"],
+        measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+        target_measurement=target,
+        relative_tolerance=relative_tolerance,
+        population_size=6,
+        name=f"{DATA_DIR}/{name}",
+        measurement_function=volume_measurement,
+        robot=OT2Client(server.host, server.port),
+        monitor=monitor,
+    )
+    stop = model.optimise(SEARCH_SPACE, optimiser=optimiser, num_iterations=12)
+
+    history = pd.read_csv(f"{model.exp_data_dir}/convergence.csv")
+    print(f"optimise returned rule '{None if stop is None else stop.rule}', history from convergence.csv:")
+    print(history.round(3).to_string(index=False))
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    target = np.array([14.0, 20.0, 15.0])
+
+    def target_error(measurements):
+        return ((measurements - target) ** 2).sum(axis=1)
+
+    # an objective without a target measurement, whose best value (at 40 uL of each liquid) cannot be reached
+    def unreachable_error(measurements):
+        return np.sqrt(((measurements - 40.0) ** 2).sum(axis=1))
+
+    with MockOT2Server(run_duration=0.05) as server:
+        print("1. GP, stopping within 10% of the target:")
+        run(server, "tolerance", "GP", target, target_error, None, relative_tolerance=0.1)
+
+        print("\n2. GP without a target, stopping when the best error improves by 1% or less in 3 iterations:")
+        run(
+            server,
+            "plateau",
+            "GP",
+            None,
+            unreachable_error,
+            ConvergenceMonitor(plateau_iterations=3, min_improvement=0.01),
+        )
+
+        print("\n3. GP, stopping when the surrogate expects to improve the best error by less than 5:")
+        run(
+            server,
+            "expected_improvement",
+            "GP",
+            target,
+            target_error,
+            ConvergenceMonitor(min_expected_improvement=5.0),
+            relative_tolerance=0.0,
+        )
+
+        print("\n4. PSO, stopping after 24 wells:")
+        run(
+            server,
+            "budget",
+            "PSO",
+            target,
+            target_error,
+            ConvergenceMonitor(max_wells=24),
+            relative_tolerance=0.0,
+        )
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
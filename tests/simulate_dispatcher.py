@@ -0,0 +1,138 @@
+"""
+A script to test the multi-robot batch dispatcher of the optobot package without
+any robots present, using local stand-in robot workers that simulate the run
+time and return the input liquid volumes as the "measurements".
+
+The same number of batches is run with 1, 2 and 4 simulated robots, and the
+wall-clock time and the best error of each run are printed. The wall-clock time
+should drop close to linearly with the number of robots, as long as the
+simulated run time is long compared to the time the optimiser takes to propose
+a batch (as it is for real robot runs). The best error should not get much
+worse with more robots, no two batches handed out at the same time should
+share a point or overfill a well, and every well should be stored with the
+number of the batch it was allocated to. Finally, the transfer learning optimiser, which is told the
+measurements of every well, is shared between two robots.
+
+Run on the command line as: python -m tests.simulate_dispatcher
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+
+from optobot.automate import OptimisationLoop
+from optobot.dispatch import BatchDispatcher, LocalRobotWorker
+from optobot.optimisation.optimisers import make_optimiser
+from optobot.optimisation.transfer import TransferAskTell
+
+
+def main():
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    data_storage_folder = "tests/test_results_data"
+    liquid_names = ["water", "blue", "yellow", "red"]
+    measured_parameter_names = ["measured_red", "measured_green", "measured_blue"]
+    test_target_measurement = [14, 20, 15]
+    search_space = [[0.0, 30.0], [0.0, 30.0], [0.0, 30.0]]
+    population_size = 6
+    num_batches = 6
+    run_time = 4.0
+
+    def objective_function(measurements):
+        return ((measurements - test_target_measurement) ** 2).sum(axis=1)
+
+    def simulated_measurement(liquid_volumes):
+        # the input liquid volumes (without water) serve as the measurements
+        return liquid_volumes[:, 1:]
+
+    results = []
+    for num_robots in [1, 2, 4]:
+
+        robots = [
+            LocalRobotWorker(
+                f"robot_{i + 1}",
+                simulated_measurement,
+                wellplate_locs=[5],
+                run_time=run_time,
+            )
+            for i in range(num_robots)
+        ]
+
+        # one wellplate per robot
+        model = OptimisationLoop(
+            objective_function=objective_function,
+            liquid_names=liquid_names,
+            measured_parameter_names=measured_parameter_names,
+            target_measurement=test_target_measurement,
+            relative_tolerance=0.0,
+            population_size=population_size,
+            name=f"{data_storage_folder}/dispatcher/{num_robots}_robots",
+            measurement_function=simulated_measurement,
+            wellplate_locs=[5] * num_robots,
+            total_volume=60.0,
+        )
+
+        optimiser = make_optimiser("GP", search_space, population_size)
+        dispatcher = BatchDispatcher(model, optimiser, robots)
+        wall_time = dispatcher.run(num_batches)
+
+        volumes = model.all_data_df[["vol_blue", "vol_yellow", "vol_red"]].to_numpy(dtype=float)
+        best_error = model.all_data_df["error"].astype(float).min()
+        results.append((num_robots, wall_time, best_error))
+        print(
+            f"{num_robots} robot(s): {num_batches} batches in {wall_time:.1f} s "
+            f"(ideal {num_batches * run_time / num_robots:.0f} s), best error {best_error:.4f}\n"
+        )
+
+        # the first batches are all handed out before any result is back, and must not repeat each other
+        first = volumes[: num_robots * population_size]
+        assert len(np.unique(first, axis=0)) == len(first)
+
+        # the batches handed out around the pending first batch are designed to fit in a well
+        all_data = model.all_data_df.iloc[: model.num_wells_used]
+        iteration = all_data["iteration_number"].to_numpy(dtype=int)
+        assert np.all(all_data["vol_water"].to_numpy(dtype=float)[(iteration > 1) & (iteration <= num_robots)] >= 0)
+
+        # every well is stored with the number of the batch it was allocated to, whichever robot finished first
+        wells = np.flatnonzero(model.allocator.occupancy.ravel() > 0)
+        stored = model.liquid_volume_df.values.reshape(-1, model.num_liquids)[model.allocator.csv_indices(wells)]
+        batch_of = dict(zip(map(tuple, stored.astype(float).round(6)), model.allocator.occupancy.ravel()[wells]))
+        all_volumes = all_data[[f"vol_{name}" for name in liquid_names]].to_numpy(dtype=float).round(6)
+        assert all(batch_of[tuple(volume)] == number for volume, number in zip(all_volumes, iteration))
+
+    print("Robots  Wall time (s)  Best error")
+    for num_robots, wall_time, best_error in results:
+        print(f"{num_robots:>6}  {wall_time:>13.1f}  {best_error:>10.4f}")
+
+    # the transfer learning optimiser needs the measurements of every batch, starting from those of the last run
+    robots = [
+        LocalRobotWorker(f"robot_{i + 1}", simulated_measurement, wellplate_locs=[5], run_time=0.1)
+        for i in range(2)
+    ]
+    model = OptimisationLoop(
+        objective_function=objective_function,
+        liquid_names=liquid_names,
+        measured_parameter_names=measured_parameter_names,
+        target_measurement=test_target_measurement,
+        relative_tolerance=0.0,
+        population_size=population_size,
+        name=f"{data_storage_folder}/dispatcher/transfer",
+        measurement_function=simulated_measurement,
+        wellplate_locs=[5, 5],
+    )
+    optimiser = TransferAskTell(
+        search_space, objective_function, population_size, volumes, volumes, n_samples=8
+    )
+    num_past = len(optimiser.measurements)
+    BatchDispatcher(model, optimiser, robots).run(4)
+    print(f"\nTransfer learning on 2 robots: {len(optimiser.errors)} wells told with their measurements.")
+    assert len(optimiser.errors) == 4 * population_size
+    assert len(optimiser.measurements) == num_past + 4 * population_size
+
+    shutil.rmtree(data_storage_folder + "/dispatcher", ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+A script to test the historical-experiment index of the optobot package,
+without a camera or robot. First, the data of several past colour mixing
+experiments is simulated, and indexed. The time of a nearest-recipe lookup is
+measured, and a new experiment is added to the index incrementally. Finally,
+an optimisation towards a new target colour is run on a mock robot, with its
+first iteration seeded with the nearest recipes from the index.
+
+Run on the command line as: python -m tests.simulate_history
+
+"""
+
+import shutil
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.optimisation.history import HistoricalIndex
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+
+DATA_DIR = "tests/test_results_data/history"
+
+LIQUID_NAMES = ["water", "blue", "yellow", "red"]
+MEASURED_PARAMETER_NAMES = ["measured_red", "measured_green", "measured_blue"]
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TOTAL_VOLUME = 90.0
+
+# the absorbance of the blue, yellow and red dyes in the red, green and blue channels
+ABSORBANCE = np.array([[2.0, 0.3, 0.1], [0.1, 0.4, 2.2], [0.2, 2.0, 1.5]])
+
+
+def mix_colours(liquid_volumes):
+    """
+    Returns the RGB colour of wells of dyes (Beer-Lambert law), from the liquid volumes (water first).
+    """
+
+    fractions = liquid_volumes[:, 1:] / TOTAL_VOLUME
+    return 255 * np.exp(-fractions @ ABSORBANCE)
+
+
+def colour_measurement(
+    liquid_volumes, iteration_count, population_size, num_measured_parameters, exp_data_dir
+):
+    return mix_colours(liquid_volumes)
+
+
+def past_experiment(name, rng, num_iterations=4, batch_size=24):
+    """
+    Simulates the data of a past experiment, of random wells towards a random target colour.
+    """
+
+    target = rng.uniform(40, 220, 3)
+    loop = OptimisationLoop(
+        objective_function=lambda measurements: ((measurements - target) ** 2).sum(axis=1),
+        liquid_names=LIQUID_NAMES,
+        measured_parameter_names=MEASURED_PARAMETER_NAMES,
+        target_measurement=None,
+        name=f"{DATA_DIR}/{name}",
+    )
+    for i in range(num_iterations):
+        liquid_volumes = loop.add_water(rng.uniform(0, 30, (batch_size, 3)))
+        wells = loop.allocator.allocate(batch_size, i + 1)
+        loop.record(wells, liquid_volumes, mix_colours(liquid_volumes))
+
+    return loop.exp_data_dir
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    pd.set_option("display.max_columns", None)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    rng = np.random.default_rng(0)
+
+    for k in range(8):
+        past_experiment(f"past_{k}", rng)
+
+    index_path = f"{DATA_DIR}/history_index.npz"
+    index = HistoricalIndex(index_path, LIQUID_NAMES, MEASURED_PARAMETER_NAMES)
+    start = time.perf_counter()
+    num_read = index.update([DATA_DIR])
+    print(f"Indexed {len(index)} wells of {num_read} experiments in {1000 * (time.perf_counter() - start):.0f} ms.")
+
+    # the colour of a recipe that has not been tried before
+    target = mix_colours(np.array([[50.0, 12.0, 14.0, 14.0]]))[0].round(1)
+    num_queries = 1000
+    start = time.perf_counter()
+    for _ in range(num_queries):
+        index.nearest(target, k=8)
+    elapsed = (time.perf_counter() - start) / num_queries
+    print(f"\nNearest recipes to the target {target} ({1000 * elapsed:.3f} ms per lookup of 8 wells):")
+    print(index.nearest(target, k=4).drop(columns="experiment").round(1))
+
+    start = time.perf_counter()
+    for _ in range(num_queries):
+        index.tree.query(target, k=8)
+    print(f"(of which the KD-tree query takes {1000 * (time.perf_counter() - start) / num_queries:.3f} ms)")
+
+    start = time.perf_counter()
+    for _ in range(num_queries):
+        index.seed_points(target, 8)
+    print(f"seed_points of 8 wells: {1000 * (time.perf_counter() - start) / num_queries:.3f} ms per lookup")
+
+    # the index is reloaded from its file, and only the new experiment is read
+    past_experiment("past_new", rng)
+    index = HistoricalIndex(index_path, LIQUID_NAMES, MEASURED_PARAMETER_NAMES)
+    num_read = index.update([DATA_DIR])
+    print(f"\nAfter one more experiment: {num_read} file read, {len(index)} wells indexed.")
+
+    # a new experiment, with and without seeding its first iteration with the nearest recipes
+    with MockOT2Server(run_duration=0.05) as server:
+        for seed_points in [index.seed_points(target, 4), None]:
+            model = OptimisationLoop(
+                objective_function=lambda measurements: ((measurements - target) ** 2).sum(axis=1),
+                liquid_names=LIQUID_NAMES,
+                measured_parameter_names=MEASURED_PARAMETER_NAMES,
+                target_measurement=target,
+                relative_tolerance=0.05,
+                population_size=8,
+                name=f"{DATA_DIR}/new_target",
+                measurement_function=colour_measurement,
+                robot=OT2Client(server.host, server.port),
+            )
+            seeded = "seeded with the 4 nearest recipes" if seed_points is not None else "not seeded"
+            print(f"\nOptimisation with GP, the first iteration {seeded}:")
+            stop = model.optimise(
+                SEARCH_SPACE,
+                optimiser="GP",
+                num_iterations=8,
+                initial_design="sobol",
+                seed_points=seed_points,
+            )
+            print(f"Stopped by rule '{None if stop is None else stop.rule}' after {model.iteration_count} iteration(s).")
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+A script to test the space-filling initial designs of the optobot package,
+without a robot. Every design is generated for a search space whose upper
+bounds add up to more than the total volume of a well, and the script checks
+that each design has the requested number of points, stays inside the search
+space and the total volume, and includes the seed points first. The spread of
+the designs (their discrepancy and the smallest distance between two points)
+is compared with random sampling. Finally, a short optimisation on a mock robot
+is started from a Sobol design, and the wells of its first iteration are
+checked to fit in the total volume.
+
+Run on the command line as: python -m tests.simulate_initial_designs
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import pdist
+from scipy.stats import qmc
+
+from optobot.automate import OptimisationLoop
+from optobot.optimisation.initial_designs import DESIGNS, initial_design
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/initial_designs"
+
+# the upper bounds add up to more than the total volume, so some points have to be scaled back
+SEARCH_SPACE = [[0.0, 40.0], [5.0, 40.0], [0.0, 40.0]]
+TOTAL_VOLUME = 90.0
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    search_space = np.array(SEARCH_SPACE)
+    low, high = search_space[:, 0], search_space[:, 1]
+    seed_points = np.array([[10.0, 20.0, 30.0], [35.0, 35.0, 35.0]])
+
+    rows = []
+    for method in DESIGNS:
+        design = initial_design(SEARCH_SPACE, 24, method, total_volume=TOTAL_VOLUME, random_state=0)
+        assert design.shape == (24, 3)
+        assert np.all(design >= low - 1e-9) and np.all(design <= high + 1e-9)
+        assert np.all(design.sum(axis=1) <= TOTAL_VOLUME + 1e-9)
+
+        unit_design = (design - low) / (high - low)
+        rows.append(
+            {
+                "design": method,
+                "discrepancy": qmc.discrepancy(unit_design),
+                "min_distance": pdist(unit_design).min(),
+                "max_total_volume": design.sum(axis=1).max(),
+            }
+        )
+
+        # the seed points come first, scaled back into the total volume where needed
+        seeded = initial_design(
+            SEARCH_SPACE, 24, method, total_volume=TOTAL_VOLUME, seed_points=seed_points, random_state=0
+        )
+        assert seeded.shape == (24, 3)
+        assert np.allclose(seeded[0], seed_points[0])
+        assert seeded[1].sum() <= TOTAL_VOLUME + 1e-9
+
+    spread = pd.DataFrame(rows).set_index("design")
+    print("Spread of 24-point designs (in the unit cube; lower discrepancy and larger distance are better):")
+    print(spread.round(4))
+    assert spread.loc["sobol", "discrepancy"] < spread.loc["random", "discrepancy"]
+    assert spread.loc["lhs", "discrepancy"] < spread.loc["random", "discrepancy"]
+    assert spread.loc["maximin", "min_distance"] > spread.loc["random", "min_distance"]
+
+    try:
+        initial_design(SEARCH_SPACE, 8, "halton")
+    except ValueError as error:
+        print(f"\nAn unknown design is rejected: {error}")
+    else:
+        raise AssertionError("An unknown design was accepted.")
+
+    with MockOT2Server(run_duration=0.05) as server:
+        model = OptimisationLoop(
+            objective_function=lambda measurements: ((measurements - 15.0) ** 2).sum(axis=1),
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=[15.0, 15.0, 15.0],
+            relative_tolerance=0.0,
+            population_size=8,
+            name=f"{DATA_DIR}/sobol",
+            measurement_function=volume_measurement,
+            robot=OT2Client(server.host, server.port),
+            total_volume=TOTAL_VOLUME,
+        )
+        model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=2, initial_design="sobol")
+
+    all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+    first = all_data.loc[all_data["iteration_number"] == 1, ["vol_blue", "vol_yellow", "vol_red"]].to_numpy()
+    unit_first = (first - low) / (high - low)
+    print(
+        f"\nFirst iteration of the optimisation: {len(first)} wells, discrepancy "
+        f"{qmc.discrepancy(np.clip(unit_first, 0, 1)):.4f}, largest total volume {first.sum(axis=1).max():.1f} uL."
+    )
+    assert len(first) == 8
+    assert np.all(first.sum(axis=1) <= TOTAL_VOLUME + 1e-6)
+
+    print("\nAll initial design checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+A script to test the kinetic measurement mode of the optobot package without a
+webcam, using a fake video source in which the wells of one iteration change
+colour at a steady rate, as in an enzyme-activity assay.
+
+The frames are recorded into a memory-mapped store, the colour time series of
+the wells are extracted, and the measured initial rates are compared with the
+simulated rates. The script also checks that the frames are deleted once the
+time series have been saved.
+
+Run on the command line as: python -m tests.simulate_kinetics
+
+"""
+
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.fixed_grid import get_well_centres
+from optobot.colorimetric.kinetics import KineticMeasurement, feature_names
+
+IMAGE = "tests/test_data/test_image.jpg"
+DATA_DIR = "tests/test_results_data/kinetics_test"
+
+
+def main():
+
+    image = cv2.imread(IMAGE)
+    positions = get_well_centres(image)
+
+    # the wells of the current iteration: row B, with a different activity in each well
+    wells = np.stack([np.zeros(12, dtype=int), np.ones(12, dtype=int), np.arange(12)], axis=1)
+    rng = np.random.default_rng(0)
+    rates = rng.uniform(0.0, 20.0, len(wells))  # colour levels per second, in the blue channel
+    half_size = 10
+
+    def scene(t):
+        frame = image.astype(float)
+        for (_, row, column), rate in zip(wells, rates):
+            y, x = positions[row, column]
+            frame[y - half_size : y + half_size, x - half_size : x + half_size] = (
+                min(40 + rate * t, 255),
+                120,
+                120,
+            )
+        return frame
+
+    features = ("initial_rate", "change")
+    source = FakeVideoSource(scene, noise=2.0, warmup_frames=0, fps=20, seed=0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        camera.calibrate(settle_time=0.0)
+        measurement = KineticMeasurement(camera, duration=8.0, interval=0.2, features=features)
+        measurements = measurement(None, 0, len(wells), len(feature_names(features)), DATA_DIR, wells)
+
+    names = feature_names(features)
+    measured_rates = measurements[:, names.index("initial_rate_blue")]
+    print("Simulated rates: " + " ".join(f"{rate:5.1f}" for rate in rates))
+    print("Measured rates:  " + " ".join(f"{rate:5.1f}" for rate in measured_rates))
+
+    series = np.load(f"{DATA_DIR}/kinetics/series_iteration_0.npz")
+    print(
+        f"{len(series['times'])} frames were recorded; the time series of their wells take "
+        f"{os.path.getsize(f'{DATA_DIR}/kinetics/series_iteration_0.npz') / 1e6:.2f} MB on disk."
+    )
+    assert not os.path.exists(f"{DATA_DIR}/kinetics/frames_iteration_0.npy")
+    assert not os.path.exists(f"{DATA_DIR}/kinetics/frames_iteration_0_times.npy")
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+A script to test the well plate lattice fit of the optobot package on simulated
+well detections: a slightly rotated 8 x 12 plate of which only some wells are
+detected, with noisy positions and spurious detections. The fitted centres of
+all 96 wells are compared with the true centres.
+
+Run on the command line as: python -m tests.simulate_lattice
+
+"""
+
+import time
+
+import numpy as np
+
+from optobot.colorimetric.image_processing.lattice import fit_lattice
+
+
+def main():
+
+    rng = np.random.default_rng(0)
+    rows, columns = 8, 12
+
+    for detected_fraction, num_spurious in [(1.0, 0), (0.7, 10), (0.4, 30)]:
+        angle = np.deg2rad(rng.uniform(-10, 10))
+        pitch = 60.0
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        column_index, row_index = np.meshgrid(np.arange(columns), np.arange(rows))
+        grid = np.stack([column_index.ravel(), row_index.ravel()], axis=1)
+        true_centres = grid @ (pitch * rotation).T + [250, 150]
+
+        detected = rng.random(rows * columns) < detected_fraction
+        points = true_centres[detected] + rng.normal(0, 1.0, (detected.sum(), 2))
+        points = np.vstack([points, rng.uniform(0, 1200, (num_spurious, 2))])
+        points = rng.permutation(points)
+
+        start = time.perf_counter()
+        fit = fit_lattice(points, (rows, columns))
+        duration = time.perf_counter() - start
+
+        error = np.linalg.norm(fit.centres.reshape(-1, 2) - true_centres, axis=1)
+        print(
+            f"{detected.sum()} wells detected, {num_spurious} spurious detections: "
+            f"largest centre error {error.max():.2f} px, residual {fit.residual:.2f} px, "
+            f"quality {fit.quality:.2f} ({1000 * duration:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
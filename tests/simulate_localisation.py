@@ -0,0 +1,164 @@
+"""
+A script to test the automatic plate localisation of the optobot package
+without a camera. A simulated camera frame shows a slightly rotated well plate
+on the deck, next to other labware. The plate is located, the located corners
+are compared with the true corners, and the time to combine frames into a
+photo (which scales with the number of pixels) is compared for the whole frame
+and the plate's region of interest. The plate is then moved, to check that
+this is noticed, and the colours of its wells are read with get_colours, which
+watches them on the live feed and samples them at the located well lattice
+without asking for any input.
+
+Run on the command line as: python -m tests.simulate_localisation
+
+"""
+
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.colours import get_colours
+from optobot.colorimetric.image_capture.averaging import FrameAccumulator
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_capture.photo import take_photo
+from optobot.colorimetric.image_processing.contours import ContourDetection
+from optobot.colorimetric.image_processing.fixed_grid import PLATE, get_well_centres
+from optobot.colorimetric.image_processing.localisation import PlateLocator
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+
+OUTPUT_DIR = "tests/test_results_data"
+
+
+def deck_frame(plate_position, angle=1.0, pixels_per_mm=6.0, seed=0):
+    """
+    Draws a camera frame of the deck with the plate at plate_position (the
+    pixel position of its top-left corner) rotated by angle degrees. Returns
+    the frame, the true corners of the plate and the (BGR) colours of its wells.
+    """
+
+    rng = np.random.default_rng(seed)
+    frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+
+    # other labware: a reservoir and some loose tubes
+    cv2.rectangle(frame, (20, 40), (230, 680), (150, 150, 160), -1)
+    for x, y in rng.uniform([60, 100], [200, 650], (6, 2)).astype(int):
+        cv2.circle(frame, (int(x), int(y)), 14, (60, 60, 200), -1)
+
+    # the plate, drawn top-down and then placed on the deck
+    width = round(PLATE["width"] * pixels_per_mm)
+    height = round(PLATE["height"] * pixels_per_mm)
+    plate_image = np.full((height, width, 3), 225, dtype=np.uint8)
+    centres = get_well_centres(plate_image)
+    radius = int(PLATE["well_diameter"] / 2 * pixels_per_mm)
+    colours = rng.integers(40, 220, (PLATE["rows"] * PLATE["columns"], 3))
+    for (y, x), colour in zip(centres.reshape(-1, 2), colours):
+        cv2.circle(plate_image, (int(x), int(y)), radius, (180, 180, 180), 2)
+        cv2.circle(plate_image, (int(x), int(y)), radius - 2, colour.tolist(), -1)
+
+    rotation = cv2.getRotationMatrix2D((0, 0), -angle, 1.0)
+    rotation[:, 2] += plate_position
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    true_corners = corners @ rotation[:, :2].T + rotation[:, 2]
+
+    mask = np.full((height, width), 255, dtype=np.uint8)
+    warped = cv2.warpAffine(plate_image, rotation, (1280, 720))
+    warped_mask = cv2.warpAffine(mask, rotation, (1280, 720)) > 127
+    frame[warped_mask] = warped[warped_mask]
+
+    noise = rng.normal(0, 3, frame.shape)
+    frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+    return frame, true_corners, colours.reshape(PLATE["rows"], PLATE["columns"], 3)
+
+
+def time_averaging(frames, roi=None):
+    start = time.perf_counter()
+    accumulator = FrameAccumulator("median")
+    for frame in frames:
+        if roi is not None:
+            frame = frame[roi[1] : roi[3], roi[0] : roi[2]]
+        accumulator.add(frame)
+    accumulator.result()
+    return time.perf_counter() - start
+
+
+def main():
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    frame, true_corners, _ = deck_frame((420, 110))
+
+    locator = PlateLocator()
+    start = time.perf_counter()
+    corners = locator.locate(frame)
+    locate_time = time.perf_counter() - start
+    print(f"Located in {1000 * locate_time:.1f} ms.")
+    print(f"Largest corner error: {np.abs(corners - true_corners).max():.1f} px")
+
+    start = time.perf_counter()
+    for _ in range(20):
+        verified = locator.verify(frame)
+    print(
+        f"Verified (plate has not moved: {verified}) in "
+        f"{1000 * (time.perf_counter() - start) / 20:.1f} ms."
+    )
+
+    cropped = locator.crop(frame)
+    fraction = cropped.shape[0] * cropped.shape[1] / (frame.shape[0] * frame.shape[1])
+    print(f"\nThe region of interest has {100 * fraction:.0f}% of the pixels of the frame.")
+    frames = [frame] * 25
+    print(
+        f"Median of 25 frames: {1000 * time_averaging(frames):.0f} ms (frame), "
+        f"{1000 * time_averaging(frames, locator.roi):.0f} ms (region of interest)"
+    )
+
+    cropped_path = f"{OUTPUT_DIR}/localisation_roi.jpg"
+    cv2.imwrite(cropped_path, cropped)
+    print("Well detection on the region of interest:")
+    ContourDetection(cropped_path).auto_hough_circle_detection()
+    os.remove(cropped_path)
+
+    moved, moved_corners, moved_colours = deck_frame((380, 140))
+    print("\nPlate moved by (-40, 30) px:")
+    locator.update(moved)
+    print(f"Largest corner error: {np.abs(locator.corners - moved_corners).max():.1f} px")
+
+    # the same with a camera service, as get_colours uses it
+    path = f"{OUTPUT_DIR}/localisation_photo.jpg"
+    source = FakeVideoSource(moved, warmup_frames=0, flicker=0.0, seed=0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        take_photo(path, camera, num_frames=4, locator=locator)
+        print(f"\nAveraged photo of the plate only: {cv2.imread(path).shape[1::-1]} px")
+        os.remove(path)
+
+        # the wells are read at the located lattice, without the interactive well detection
+        data_dir = f"{OUTPUT_DIR}/localisation"
+        wells = np.array([(0, row, column) for row in range(PLATE["rows"]) for column in range(PLATE["columns"])])
+        colours = get_colours(
+            0, len(wells), 3, data_dir, wells, camera=camera, settle=True, settle_timeout=2.0, locator=locator
+        ).measurements
+    error = np.abs(colours - moved_colours[..., ::-1].reshape(-1, 3)).mean()
+    print(f"Mean colour error of get_colours at the located wells: {error:.1f}")
+    assert error < 5
+
+    # the wells were watched at the located lattice as well
+    trajectories = np.load(f"{data_dir}/settling/trajectories_iteration_0.npz")["colours"]
+    error = np.abs(trajectories[-1][:, ::-1] - colours).mean()
+    print(f"Mean difference between the watched and measured colours: {error:.1f}")
+    assert error < 5
+
+    # without a locator (or rectifier), the wells' positions on the live feed are not known
+    try:
+        get_colours(0, len(wells), 3, data_dir, wells, camera=camera, settle=True)
+    except ValueError as error:
+        print(f"Settling without a locator is refused: {error}")
+    else:
+        raise AssertionError("settle=True was accepted without a locator.")
+
+    wait_for_overlays()
+    shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+A script to test the multi-target mode of the optobot package on a mock robot,
+with the liquid volumes serving as the measurements. Three target colours are
+first optimised at once in one loop, which splits each batch among the targets
+by expected improvement and stops each target as it converges. The same
+targets are then optimised one after the other in separate single-target
+loops, and the number of wells used is compared. The optimisers are seeded, so
+the comparison is the same on every run.
+
+Run on the command line as: python -m tests.simulate_multi_target
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/multi_target"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TARGETS = np.array([[14.0, 20.0, 15.0], [25.0, 6.0, 10.0], [5.0, 12.0, 24.0]])
+
+
+def objective_function(measurements, target):
+    return ((measurements - target) ** 2).sum(axis=1)
+
+
+def make_loop(server, name, target):
+
+    return OptimisationLoop(
+        objective_function=objective_function,
+        liquid_names=["water", "blue", "yellow", "red"],
+        measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+        target_measurement=target,
+        relative_tolerance=0.1,
+        population_size=8,
+        name=f"{DATA_DIR}/{name}",
+        measurement_function=volume_measurement,
+        robot=OT2Client(server.host, server.port),
+        wellplate_locs=[5, 8],
+    )
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    with MockOT2Server(run_duration=0.05) as server:
+        print(f"Optimising {len(TARGETS)} targets at once, with 8 wells per iteration:")
+        model = make_loop(server, "all_targets", TARGETS)
+        stop = model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=20, random_state=0)
+        print(f"optimise returned rule '{None if stop is None else stop.rule}'.")
+
+        all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+        all_data = all_data[all_data["iteration_number"] > 0]
+        target_columns = [f"error_target_{k + 1}" for k in range(len(TARGETS))]
+        print("\nBest error of each target after each iteration (from all_data.csv):")
+        print(all_data.groupby("iteration_number")[target_columns].min().cummin().round(1))
+        shared_wells = model.num_wells_used
+
+        separate_wells = []
+        for k, target in enumerate(TARGETS):
+            print(f"\nOptimising target {k + 1} on its own:")
+            single = make_loop(server, f"target_{k + 1}", target)
+            single.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=20, random_state=0)
+            separate_wells.append(single.num_wells_used)
+
+    print(
+        f"\nWells used until every target converged: {shared_wells} with the targets sharing the plates, "
+        f"{sum(separate_wells)} ({' + '.join(map(str, separate_wells))}) in separate loops."
+    )
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
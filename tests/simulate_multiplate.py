@@ -0,0 +1,103 @@
+"""
+A script to test the multi-plate colour extraction of the optobot package
+without a camera. A simulated camera frame shows the plates in several deck
+slots at once, each well with a random colour. All plates are located and
+labelled with their slots, and the colours of all their wells are extracted in
+one pass and compared with the true colours. Finally,
+"get_multi_plate_colours" measures wells spread over both plates of a campaign
+from one photo.
+
+Run on the command line as: python -m tests.simulate_multiplate
+
+"""
+
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.colours import get_multi_plate_colours
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.fixed_grid import PLATE, get_well_centres
+from optobot.colorimetric.image_processing.localisation import (
+    deck_position,
+    locate_plates,
+    plate_colours,
+)
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+
+DATA_DIR = "tests/test_results_data/multiplate"
+
+
+def deck_frame(slots, pixels_per_mm=3.8, seed=0):
+    """
+    Draws a camera frame of the deck with a plate in each of the slots, and
+    returns it with the true RGB colours of the wells of each plate.
+    """
+
+    rng = np.random.default_rng(seed)
+    width = round(PLATE["width"] * pixels_per_mm)
+    height = round(PLATE["height"] * pixels_per_mm)
+
+    # the top-left corner of each plate in the frame, with a margin around the plates
+    positions = np.array([deck_position(slot) for slot in slots]) * pixels_per_mm
+    positions = positions - positions.min(axis=0) + 20
+    frame_size = (positions.max(axis=0) + [width + 20, height + 20]).astype(int)
+    frame = np.full((frame_size[1], frame_size[0], 3), 90, dtype=np.uint8)
+
+    true_colours = {}
+    radius = int(PLATE["well_diameter"] / 2 * pixels_per_mm)
+    for slot, (x0, y0) in zip(slots, positions.astype(int)):
+        plate_image = np.full((height, width, 3), 225, dtype=np.uint8)
+        colours = rng.integers(40, 220, (PLATE["rows"], PLATE["columns"], 3))
+        centres = get_well_centres(plate_image)
+        for (y, x), colour in zip(centres.reshape(-1, 2), colours.reshape(-1, 3)):
+            cv2.circle(plate_image, (int(x), int(y)), radius, (180, 180, 180), 2)
+            cv2.circle(plate_image, (int(x), int(y)), radius - 2, colour.tolist(), -1)
+        frame[y0 : y0 + height, x0 : x0 + width] = plate_image
+        # the colours are drawn as BGR
+        true_colours[slot] = colours[:, :, ::-1]
+
+    noise = rng.normal(0, 3, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8), true_colours
+
+
+def main():
+
+    for slots in [[5, 8], [4, 5, 6]]:
+        frame, true_colours = deck_frame(slots)
+        print(f"Slots {slots}, frame of {frame.shape[1]} x {frame.shape[0]} px:")
+
+        start = time.perf_counter()
+        lattices = locate_plates(frame, slots)
+        colours = plate_colours(frame, lattices)
+        elapsed = time.perf_counter() - start
+
+        for slot in slots:
+            error = np.abs(colours[slot] - true_colours[slot]).mean()
+            print(
+                f"  Slot {slot}: {lattices[slot].detected.sum()} wells detected, "
+                f"mean colour error {error:.1f}"
+            )
+        print(f"  All plates located and extracted in {1000 * elapsed:.0f} ms.\n")
+
+    # one iteration of a campaign on the plates in slots 5 and 8, with wells on both plates
+    slots = [5, 8]
+    frame, true_colours = deck_frame(slots)
+    wells = np.array([[0, 7, 10], [0, 7, 11], [1, 0, 0], [1, 0, 1]])
+    source = FakeVideoSource(frame, noise=0.0, warmup_frames=0, flicker=0.0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        measured = get_multi_plate_colours(
+            0, len(wells), 3, DATA_DIR, slots, wells=wells, camera=camera
+        ).measurements
+
+    expected = np.array([true_colours[slots[p]][r, c] for p, r, c in wells])
+    print(f"get_multi_plate_colours on slots {slots}: mean colour error {np.abs(measured - expected).mean():.1f}")
+
+    wait_for_overlays()
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
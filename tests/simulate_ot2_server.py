@@ -0,0 +1,91 @@
+"""
+A script to test the automated protocol upload of the optobot package without
+a robot present, using a local mock of the OT-2 robot server.
+
+First, a short optimisation is run in which every generated protocol is
+uploaded to the mock server, run and waited for, without any user input.
+Then the error reporting of the client is shown for a failed run and for a run
+that does not finish in time (which is stopped on the robot), and a run whose
+status requests fail a few times is waited for until it succeeds.
+
+Run on the command line as: python -m tests.simulate_ot2_server
+
+"""
+
+import shutil
+
+from optobot.automate import OptimisationLoop
+from optobot.ot2_client import OT2Client, OT2RunError
+from optobot.ot2_mock_server import MockOT2Server
+
+
+def main():
+
+    data_storage_folder = "tests/test_results_data/ot2_server"
+    liquid_names = ["water", "blue", "yellow", "red"]
+    measured_parameter_names = ["measured_red", "measured_green", "measured_blue"]
+    test_target_measurement = [14, 20, 15]
+    search_space = [[0.0, 30.0], [0.0, 30.0], [0.0, 30.0]]
+
+    def objective_function(measurements):
+        return ((measurements - test_target_measurement) ** 2).sum(axis=1)
+
+    def simulated_measurement(
+        liquid_volumes,
+        iteration_count,
+        population_size,
+        num_measured_parameters,
+        exp_data_dir,
+    ):
+        # the input liquid volumes (without water) serve as the measurements
+        return liquid_volumes[:, 1:]
+
+    with MockOT2Server(run_duration=1.0) as server:
+        robot = OT2Client(server.host, server.port)
+        print(f"Connected to {robot.health()['name']} at {robot.base_url}")
+
+        model = OptimisationLoop(
+            objective_function=objective_function,
+            liquid_names=liquid_names,
+            measured_parameter_names=measured_parameter_names,
+            target_measurement=test_target_measurement,
+            relative_tolerance=0.0,
+            population_size=12,
+            name=f"{data_storage_folder}/mock_robot_experiment",
+            measurement_function=simulated_measurement,
+            robot=robot,
+        )
+        model.optimise(search_space, optimiser="PSO", num_iterations=3)
+        print(f"{len(server.runs)} protocols were run on the mock robot.\n")
+
+        protocol_path = f"{model.exp_data_dir}/generated_ot2_script.py"
+
+        # a run that takes longer than the timeout
+        server.run_duration = 5.0
+        try:
+            robot.run_protocol(protocol_path, timeout=2.0)
+        except TimeoutError as error:
+            print(f"TimeoutError: {error}")
+        run_id = list(server.runs)[-1]
+        print(f"Status of the timed-out run on the robot: {robot.get_run(run_id)['status']}\n")
+        assert robot.get_run(run_id)["status"] == "stopped"
+
+        # a run whose first status requests fail (e.g. a dropped Wi-Fi connection)
+        server.run_duration = 1.0
+        server.fail_polls = 2
+        run_id = robot.run_protocol(protocol_path)
+        print(f"Run {run_id} succeeded after 2 failed status requests.\n")
+
+    # a run that fails
+    with MockOT2Server(run_duration=0.5, fail_runs=True) as server:
+        robot = OT2Client(server.host, server.port)
+        try:
+            robot.run_protocol(protocol_path)
+        except OT2RunError as error:
+            print(f"OT2RunError: {error}")
+
+    shutil.rmtree(data_storage_folder)
+
+
+if __name__ == "__main__":
+    main()
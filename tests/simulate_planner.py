@@ -0,0 +1,125 @@
+"""
+A script to test the budget planner of the optobot package. The schedule of
+batch sizes is projected when the wells, the reagents and the time are each
+the limiting resource, and the script checks that every schedule stays within
+its limit, that the batches shrink as the surrogate becomes confident, that
+they are multiples of the granularity, and that no wells are left over. An
+optimisation is then run on a mock robot with the planner, and the wells it
+used are checked against the budget, and again on a plate with reserved wells,
+which the planner leaves out.
+
+Run on the command line as: python -m tests.simulate_planner
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+
+from optobot.automate import OptimisationLoop
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from optobot.planner import BudgetPlanner
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/planner"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TOTAL_VOLUME = 90.0
+
+
+def check_schedule(name, planner, limit=None):
+    """
+    Prints the projected schedule of a planner, and checks it against the number of wells the limiting resource allows
+    (if it is the wells or the reagents).
+    """
+
+    schedule = planner.plan()
+    print(f"{name}: {schedule} ({sum(schedule)} wells)")
+
+    if limit is not None:
+        assert sum(schedule) <= limit
+        assert limit - sum(schedule) < planner.min_batch_size
+    assert all(size % planner.granularity == 0 for size in schedule)
+    assert all(size >= planner.min_batch_size for size in schedule)
+    assert all(size <= planner.max_batch_size for size in schedule[:-1])
+    assert np.all(np.diff(schedule[:-1]) <= 0)
+
+    return schedule
+
+
+def main():
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    # wells: two 96-well plates
+    planner = BudgetPlanner(192, min_batch_size=8, max_batch_size=48, granularity=8)
+    planner.set_volume_limits(SEARCH_SPACE, TOTAL_VOLUME)
+    check_schedule("Wells (192) limiting", planner, 192)
+
+    # reagents: 4.5 mL of the second dye, at most 30 uL per well
+    planner = BudgetPlanner(
+        192, min_batch_size=8, max_batch_size=48, granularity=8, reagent_volumes=[20000, 20000, 4500, 20000]
+    )
+    planner.set_volume_limits(SEARCH_SPACE, TOTAL_VOLUME)
+    check_schedule("Reagents (4.5 mL of yellow) limiting", planner, 4500 // 30)
+
+    # time: 2 hours, with 5 minutes per iteration and 20 seconds per well
+    planner = BudgetPlanner(192, min_batch_size=8, max_batch_size=48, granularity=8, time_budget=7200)
+    planner.set_volume_limits(SEARCH_SPACE, TOTAL_VOLUME)
+    schedule = check_schedule("Time (2 hours) limiting", planner)
+    duration = len(schedule) * planner.seconds_per_iteration + sum(schedule) * planner.seconds_per_well
+    print(f"  projected duration: {duration / 60:.0f} minutes")
+    assert sum(schedule) < 192
+    assert duration <= 7200
+
+    # a fixed batch size (e.g. the particle swarm)
+    print(f"Iterations of 24 wells that fit in 100 wells: {BudgetPlanner(100).num_iterations(24)}")
+    assert BudgetPlanner(100).num_iterations(24) == 4
+
+    # an optimisation that stops when 40 wells have been used
+    with MockOT2Server(run_duration=0.05) as server:
+        model = OptimisationLoop(
+            objective_function=lambda measurements: ((measurements - 15.0) ** 2).sum(axis=1),
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=[15.0, 15.0, 15.0],
+            relative_tolerance=0.0,
+            name=f"{DATA_DIR}/budget",
+            measurement_function=volume_measurement,
+            robot=OT2Client(server.host, server.port),
+        )
+        planner = BudgetPlanner(40, min_batch_size=4, max_batch_size=16, granularity=4)
+        model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=20, planner=planner)
+
+    print(f"\nBatches of the optimisation: {planner.batch_sizes} ({model.num_wells_used} wells of 40)")
+    assert model.num_wells_used == sum(planner.batch_sizes) == 40
+    assert planner.batch_sizes[0] == 16 and np.all(np.diff(planner.batch_sizes[:-1]) <= 0)
+
+    # a budget of the whole plate, on a plate with reserved wells, only plans for the free wells
+    reserved_wells = np.array([[row, column] for row in range(8) for column in (0, 11)])
+    with MockOT2Server(run_duration=0.05) as server:
+        model = OptimisationLoop(
+            objective_function=lambda measurements: ((measurements - 15.0) ** 2).sum(axis=1),
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=[15.0, 15.0, 15.0],
+            relative_tolerance=0.0,
+            name=f"{DATA_DIR}/reserved",
+            measurement_function=volume_measurement,
+            robot=OT2Client(server.host, server.port),
+            reserved_wells=reserved_wells,
+        )
+        planner = BudgetPlanner(96, min_batch_size=8, max_batch_size=32, granularity=8)
+        model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=20, planner=planner)
+
+    print(f"Batches with {len(reserved_wells)} reserved wells: {planner.batch_sizes} ({model.num_wells_used} wells)")
+    assert model.num_wells_used == sum(planner.batch_sizes) == 96 - len(reserved_wells)
+
+    print("\nAll planner checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
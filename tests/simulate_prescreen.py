@@ -0,0 +1,107 @@
+"""
+A script to test the in-silico pre-screening stage of the optobot package on a
+mock robot, with the liquid volumes serving as the measurements. First, the
+time to score a pool of 50,000 candidate points with a fitted GP surrogate is
+measured. An optimisation with the GP is then run with each batch asked from
+skopt directly, and with each batch chosen from a pre-screened candidate pool,
+and the wells used and the time spent choosing the batches are compared.
+
+Run on the command line as: python -m tests.simulate_prescreen
+
+"""
+
+import shutil
+import time
+import warnings
+
+import numpy as np
+from skopt.acquisition import gaussian_ei
+
+from optobot.automate import OptimisationLoop
+from optobot.optimisation import optimisers
+from optobot.optimisation.prescreen import Prescreener
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/prescreen"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TARGET = np.array([14.0, 20.0, 15.0])
+
+
+def objective_function(measurements):
+    return ((measurements - TARGET) ** 2).sum(axis=1)
+
+
+class TimedAskTell(optimisers.SkoptAskTell):
+    """
+    SkoptAskTell that adds up the time spent choosing the batches.
+    """
+
+    ask_time = 0.0
+
+    def ask(self, batch_size=None, pending=None):
+        start = time.perf_counter()
+        points = super().ask(batch_size, pending)
+        self.ask_time += time.perf_counter() - start
+        return points
+
+
+def main():
+
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(0)
+
+    # a GP surrogate fitted to 48 random wells
+    optimiser = optimisers.SkoptAskTell(SEARCH_SPACE, "GP", 12, random_state=0)
+    points = rng.uniform(0, 30, (48, 3))
+    optimiser.tell(points, objective_function(points))
+    opt = optimiser.opt
+    model, best_error = opt.models[-1], np.min(opt.yi)
+
+    prescreen = Prescreener(n_candidates=50000, total_volume=90.0)
+    candidates = prescreen.candidates(SEARCH_SPACE)
+    start = time.perf_counter()
+    scores = prescreen.score(
+        lambda points: -gaussian_ei(opt.space.transform(points.tolist()), model, best_error, xi=0.01),
+        candidates,
+    )
+    print(f"Scored {len(scores)} candidates with the GP in {time.perf_counter() - start:.3f} s.")
+    start = time.perf_counter()
+    batch = prescreen.select(
+        SEARCH_SPACE,
+        lambda points: -gaussian_ei(opt.space.transform(points.tolist()), model, best_error, xi=0.01),
+        12,
+    )
+    print(f"Chose a diverse batch of {len(batch)} wells from a new pool in {time.perf_counter() - start:.3f} s.")
+
+    with MockOT2Server(run_duration=0.05) as server:
+        for prescreen in [None, Prescreener(n_candidates=50000)]:
+            model = OptimisationLoop(
+                objective_function=objective_function,
+                liquid_names=["water", "blue", "yellow", "red"],
+                measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+                target_measurement=TARGET,
+                relative_tolerance=0.02,
+                population_size=8,
+                name=f"{DATA_DIR}/{'prescreen' if prescreen else 'ask'}",
+                measurement_function=volume_measurement,
+                robot=OT2Client(server.host, server.port),
+            )
+            optimiser = TimedAskTell(
+                SEARCH_SPACE, "GP", model.population_size, prescreen=prescreen, random_state=0
+            )
+            chosen = "from 50,000 pre-screened candidates" if prescreen else "asked from skopt"
+            print(f"\nOptimisation with GP, each batch {chosen}:")
+            stop = optimisers.run_optimisation(model, optimiser, num_iterations=12)
+            print(
+                f"Stopped by rule '{None if stop is None else stop.rule}' after {model.iteration_count} iteration(s) "
+                f"({model.num_wells_used} wells), {optimiser.ask_time:.1f} s spent choosing the batches."
+            )
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+A script to test the per-well quality checks of the optobot package without a
+camera or robot. First, a simulated plate with a bubble in one well, an empty
+well and a well with debris is scored, and the flagged wells are listed.
+Then "get_multi_plate_colours" measures wells on two plates and returns their
+quality along with their colours. Finally, a short optimisation is run on a mock robot
+with a measurement function whose wells sometimes fail: the failed wells are
+withheld from the optimiser and repeated in the next iteration's protocol.
+
+Run on the command line as: python -m tests.simulate_quality
+
+"""
+
+import shutil
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.colorimetric.colours import get_multi_plate_colours
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.localisation import locate_plates
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+from optobot.colorimetric.image_processing.quality import (
+    QUALITY_COLUMNS,
+    QualityThresholds,
+    well_quality,
+)
+from optobot.measurement import MeasurementResult
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.simulate_multiplate import deck_frame
+
+DATA_DIR = "tests/test_results_data/quality"
+
+
+def spoil_wells(frame, centres):
+    """
+    Draws a bubble into well A4, empties well A11 and puts a dark speck of debris into well C7.
+    """
+
+    (x, y), (x_empty, y_empty), (x_debris, y_debris) = np.round(
+        centres.reshape(-1, 2)[[3, 10, 30]]
+    ).astype(int)
+    cv2.circle(frame, (x + 2, y - 2), 4, (250, 250, 250), -1)
+    cv2.circle(frame, (x_empty, y_empty), 9, (225, 225, 225), -1)
+    cv2.circle(frame, (x_debris - 4, y_debris), 2, (20, 20, 20), -1)
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    thresholds = QualityThresholds()
+
+    # the quality metrics of a plate with three spoiled wells
+    frame, _ = deck_frame([5])
+    lattice = locate_plates(frame, [5])[5]
+    spoil_wells(frame, lattice.centres)
+
+    start = time.perf_counter()
+    metrics = thresholds.assess(
+        well_quality(frame, lattice.centres, lattice.pitch, lattice.points)
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"Quality of 96 wells measured in {1000 * elapsed:.1f} ms:")
+    print(metrics[QUALITY_COLUMNS].describe().loc[["mean", "min", "max"]].round(2))
+    print("\nWells that failed the checks (expected A4, A11 and C7):")
+    print(metrics[~metrics["passed"]].round(2))
+
+    # get_multi_plate_colours on two plates, returning the quality of the measured wells
+    slots = [5, 8]
+    frame, _ = deck_frame(slots)
+    lattice = locate_plates(frame, slots)[5]
+    spoil_wells(frame, lattice.centres)
+    wells = np.array([[0, 0, 2], [0, 0, 3], [0, 0, 10], [1, 0, 0]])
+    source = FakeVideoSource(frame, noise=0.0, warmup_frames=0, flicker=0.0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        quality = get_multi_plate_colours(
+            0,
+            len(wells),
+            3,
+            DATA_DIR,
+            slots,
+            wells=wells,
+            camera=camera,
+            quality=thresholds,
+        ).quality
+    print(f"\nget_multi_plate_colours on slots {slots}, wells A3, A4, A11 of slot 5 and A1 of slot 8:")
+    print(quality.round(2))
+    wait_for_overlays()
+    shutil.rmtree(DATA_DIR)
+
+    # an optimisation in which every fifth well fails, and is repeated in the next iteration
+    rng = np.random.default_rng(0)
+    target = np.array([14, 20, 15])
+
+    def objective_function(measurements):
+        return ((measurements - target) ** 2).sum(axis=1)
+
+    def flaky_measurement(
+        liquid_volumes, iteration_count, population_size, num_measured_parameters, exp_data_dir
+    ):
+        # the liquid volumes (without water) serve as the measurements
+        measurements = liquid_volumes[:, 1:]
+        quality = pd.DataFrame({"pixel_std": rng.uniform(2, 4, len(measurements))})
+        failed = rng.random(len(measurements)) < 0.2
+        quality.loc[failed, "pixel_std"] = 30.0
+        quality["passed"] = ~failed
+        return MeasurementResult(measurements, quality=quality)
+
+    with MockOT2Server(run_duration=0.1) as server:
+        model = OptimisationLoop(
+            objective_function=objective_function,
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=target,
+            relative_tolerance=0.0,
+            population_size=8,
+            name=f"{DATA_DIR}/flaky_experiment",
+            measurement_function=flaky_measurement,
+            robot=OT2Client(server.host, server.port),
+        )
+        print("\nOptimisation with GP, 8 new wells per iteration:")
+        model.optimise([[0.0, 30.0]] * 3, optimiser="GP", num_iterations=4)
+
+    quality_df = pd.read_csv(f"{model.exp_data_dir}/well_quality.csv", index_col=0)
+    summary = quality_df.groupby("iteration_number").agg(
+        wells=("well", "size"),
+        repeats=("repeat", lambda repeat: int((repeat > 0).sum())),
+        failed=("passed", lambda passed: int((~passed).sum())),
+    )
+    print("\nWells per iteration (from well_quality.csv):")
+    print(summary)
+
+    all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+    all_data = all_data[all_data["iteration_number"] > 0]
+    print(
+        f"{all_data['error'].notna().sum()} of {len(all_data)} wells were passed to the optimiser; "
+        f"{len(model.requeued)} failed well(s) are still waiting to be repeated."
+    )
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
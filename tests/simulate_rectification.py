@@ -0,0 +1,130 @@
+"""
+A script to test the image rectification of the optobot package without a
+camera. A top-down image of a well plate with a random colour in every well is
+seen by a simulated camera from an angle, through a distorting lens. The
+colours sampled by the fixed grid are compared with the true colours, with and
+without rectifying the camera image, and the time of one rectification (a
+single remap with the cached maps) is printed. The script checks that the
+cached maps are rebuilt when the lens calibration or the resolution changes,
+and that get_colours reads the wells of a rectified camera feed without
+detecting them or asking for any input.
+
+Run on the command line as: python -m tests.simulate_rectification
+
+"""
+
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.colours import get_colours as get_well_colours
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.fixed_grid import (
+    PLATE,
+    get_colours,
+    get_well_centres,
+)
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+from optobot.colorimetric.image_processing.rectification import get_rectifier
+
+CACHE = "tests/test_results_data/rectification_maps.npz"
+DATA_DIR = "tests/test_results_data/rectification"
+
+
+def main():
+
+    # a top-down image of the plate, 10 pixels per mm
+    pixels_per_mm = 10.0
+    plate_size = (round(PLATE["width"] * pixels_per_mm), round(PLATE["height"] * pixels_per_mm))
+    plate_image = np.full((plate_size[1], plate_size[0], 3), 230, dtype=np.uint8)
+    centres = get_well_centres(plate_image)
+    rng = np.random.default_rng(0)
+    true_colours = rng.integers(20, 235, (PLATE["rows"], PLATE["columns"], 3))
+    well_radius = int(PLATE["well_diameter"] / 2 * pixels_per_mm)
+    for (y, x), colour in zip(centres.reshape(-1, 2), true_colours.reshape(-1, 3)):
+        cv2.circle(plate_image, (int(x), int(y)), well_radius, colour.tolist(), -1)
+
+    # the simulated camera: the plate is seen at an angle, through a lens with barrel distortion
+    image_size = (1280, 720)
+    camera_matrix = np.array([[900.0, 0, 640], [0, 900.0, 360], [0, 0, 1]])
+    dist_coeffs = np.array([-0.25, 0.08, 0, 0, 0])
+    plate_corners = np.float32([[250, 120], [1060, 90], [1100, 640], [210, 610]])
+
+    # undistorted camera pixel -> plate image pixel, for every (distorted) camera pixel
+    x, y = np.meshgrid(np.arange(image_size[0]), np.arange(image_size[1]))
+    points = np.stack([x.ravel(), y.ravel()], axis=1).astype(np.float32).reshape(-1, 1, 2)
+    undistorted = cv2.undistortPoints(points, camera_matrix, dist_coeffs, P=camera_matrix)
+    to_plate = cv2.getPerspectiveTransform(
+        plate_corners,
+        np.float32([[0, 0], [plate_size[0], 0], [plate_size[0], plate_size[1]], [0, plate_size[1]]]),
+    )
+    source = cv2.perspectiveTransform(undistorted, to_plate).reshape(image_size[1], image_size[0], 2)
+    camera_image = cv2.remap(plate_image, source.astype(np.float32), None, cv2.INTER_LINEAR)
+
+    # the plate corners as they appear in the distorted camera image
+    distorted_corners, _ = cv2.projectPoints(
+        np.hstack([(plate_corners - camera_matrix[:2, 2]) / 900.0, np.ones((4, 1))]),
+        np.zeros(3),
+        np.zeros(3),
+        camera_matrix,
+        dist_coeffs,
+    )
+
+    def colour_error(image):
+        colours = get_colours(image.astype(float), get_well_centres(image))
+        return np.abs(colours - true_colours).mean()
+
+    if os.path.exists(CACHE):
+        os.remove(CACHE)
+
+    start = time.perf_counter()
+    rectifier = get_rectifier(
+        CACHE, image_size, distorted_corners.reshape(4, 2), camera_matrix, dist_coeffs
+    )
+    print(f"Maps built and cached in {time.perf_counter() - start:.2f} s.")
+
+    start = time.perf_counter()
+    rectifier = get_rectifier(CACHE)
+    print(f"Cached maps loaded in {1000 * (time.perf_counter() - start):.1f} ms.")
+
+    start = time.perf_counter()
+    for _ in range(20):
+        rectified = rectifier.rectify(camera_image)
+    print(f"One rectification takes {1000 * (time.perf_counter() - start) / 20:.1f} ms.\n")
+
+    print(f"Mean colour error of the fixed grid on the camera image: {colour_error(camera_image):.1f}")
+    print(f"Mean colour error of the fixed grid on the rectified image: {colour_error(rectified):.1f}\n")
+
+    # maps built for another lens calibration or resolution are not reused
+    corners = distorted_corners.reshape(4, 2)
+    same = get_rectifier(CACHE, image_size, corners, camera_matrix, dist_coeffs)
+    assert np.array_equal(same.map1, rectifier.map1)
+    no_lens = get_rectifier(CACHE, image_size, corners)
+    assert no_lens.camera_matrix is None and not np.array_equal(no_lens.map1, rectifier.map1)
+    finer = get_rectifier(CACHE, image_size, corners, camera_matrix, dist_coeffs, pixels_per_mm=5.0)
+    assert finer.output_size == (round(PLATE["width"] * 5), round(PLATE["height"] * 5))
+    print("The cached maps are rebuilt when the lens calibration or the resolution changes.")
+
+    # the colours of a rectified camera feed are read at the fixed grid, with no threshold prompt
+    rectifier = get_rectifier(CACHE, image_size, corners, camera_matrix, dist_coeffs)
+    wells = np.array([(0, row, column) for row in range(PLATE["rows"]) for column in range(PLATE["columns"])])
+    source = FakeVideoSource(camera_image, noise=1.0, warmup_frames=0, flicker=0.0, fps=0, seed=0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        camera.calibrate(settle_time=0.0)
+        result = get_well_colours(0, len(wells), 3, DATA_DIR, wells, camera=camera, rectifier=rectifier)
+    # the wells were drawn with true_colours as BGR values, and get_colours returns RGB
+    error = np.abs(result.measurements - true_colours[..., ::-1].reshape(-1, 3)).mean()
+    print(f"Mean colour error of get_colours with the rectifier: {error:.1f}")
+    assert error < 5
+
+    print("\nAll rectification checks passed.")
+    os.remove(CACHE)
+    wait_for_overlays()
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
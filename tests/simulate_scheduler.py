@@ -0,0 +1,94 @@
+"""
+A script to test the campaign scheduler of the optobot package on a mock
+robot, with the liquid volumes serving as the measurements. Two campaigns with
+different targets share one wellplate. Two rounds are run, each merging the
+batches of both campaigns into one protocol, and the script checks that the
+campaigns got separate wells, that each campaign stored only its own wells,
+and that the shared occupancy map is the only one left. A campaign with other
+labware is rejected.
+
+Run on the command line as: python -m tests.simulate_scheduler
+
+"""
+
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from optobot.scheduler import Campaign, CampaignScheduler
+from tests.mock_measurements import volume_measurement
+
+DATA_DIR = "tests/test_results_data/scheduler"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+
+
+def make_loop(name, target, labware="nest_96_wellplate_100ul_pcr_full_skirt"):
+
+    return OptimisationLoop(
+        objective_function=lambda measurements: ((measurements - target) ** 2).sum(axis=1),
+        liquid_names=["water", "blue", "yellow", "red"],
+        measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+        target_measurement=np.array(target),
+        relative_tolerance=0.0,
+        population_size=6,
+        name=f"{DATA_DIR}/{name}",
+        labware=labware,
+    )
+
+
+def main():
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    loops = [make_loop("campaign_a", [14.0, 20.0, 15.0]), make_loop("campaign_b", [25.0, 6.0, 10.0])]
+    campaigns = [Campaign(loop, SEARCH_SPACE, "GP", num_iterations=2, initial_design="sobol") for loop in loops]
+
+    with MockOT2Server(run_duration=0.05) as server:
+        scheduler = CampaignScheduler(
+            campaigns,
+            name=f"{DATA_DIR}/shared",
+            measurement_function=volume_measurement,
+            robot=OT2Client(server.host, server.port),
+        )
+        scheduler.run()
+
+    print(f"\nRounds run: {scheduler.round_count}")
+    assert scheduler.round_count == 2
+
+    occupancy = pd.read_csv(f"{scheduler.exp_data_dir}/well_occupancy.csv", index_col=0)
+    print("Shared occupancy map (round of each well):")
+    print(occupancy.to_string())
+    assert (occupancy.to_numpy() > 0).sum() == 2 * 2 * 6
+
+    # every campaign stored only its own wells (at their positions in its wellplate-shaped errors.csv)
+    used = []
+    for loop in loops:
+        errors = pd.read_csv(f"{loop.exp_data_dir}/errors.csv", index_col=0)
+        wells = [f"{row}{column}" for row, column in errors.stack().loc[lambda error: error != 0].index]
+        print(f"{os.path.basename(loop.exp_data_dir)}: {len(wells)} wells, {', '.join(wells)}")
+        assert len(wells) == 2 * 6
+        assert not os.path.exists(f"{loop.exp_data_dir}/well_occupancy.csv")
+        used.append(set(wells))
+    assert not used[0] & used[1]
+
+    try:
+        other_labware = make_loop("campaign_c", [5.0, 12.0, 24.0], "corning_384_wellplate_112ul_flat")
+        CampaignScheduler([campaigns[0], Campaign(other_labware, SEARCH_SPACE)], name=f"{DATA_DIR}/rejected")
+    except ValueError as error:
+        print(f"\nA campaign with other labware is rejected: {error}")
+    else:
+        raise AssertionError("A campaign with other labware was accepted.")
+
+    print("\nAll scheduler checks passed.")
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+A script to test the colour-settling detection of the optobot package without
+a webcam, using a fake video source in which the wells of one iteration change
+colour after mixing, each at its own rate, like diffusing dyes.
+
+The measurement is triggered as soon as every well of the iteration has
+settled, and the time this takes is compared with the time at which the
+slowest well actually settled.
+
+Run on the command line as: python -m tests.simulate_settling
+
+"""
+
+import cv2
+import numpy as np
+
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_capture.settling import wait_until_settled
+from optobot.colorimetric.image_processing.fixed_grid import get_well_centres
+
+IMAGE = "tests/test_data/test_image.jpg"
+
+
+def main():
+
+    image = cv2.imread(IMAGE)
+    positions = get_well_centres(image)
+
+    # the wells of the current iteration: row A
+    wells = np.stack([np.zeros(12, dtype=int), np.arange(12)], axis=1)
+    rng = np.random.default_rng(0)
+    time_constants = rng.uniform(0.5, 2.0, len(wells))
+    start_colours = rng.uniform(50, 200, (len(wells), 3))
+    final_colours = rng.uniform(50, 200, (len(wells), 3))
+    half_size = 10
+
+    def scene(t):
+        frame = image.astype(float)
+        progress = 1 - np.exp(-t / time_constants)
+        colours = start_colours + (final_colours - start_colours) * progress[:, None]
+        for (row, column), colour in zip(wells, colours):
+            y, x = positions[row, column]
+            frame[y - half_size : y + half_size, x - half_size : x + half_size] = colour
+        return frame
+
+    # the slowest well is within 1 colour level of its final colour after this time
+    largest_change = np.abs(final_colours - start_colours).max(axis=1)
+    settle_times = time_constants * np.log(largest_change / 1.0)
+    print(f"The slowest well settles (to within 1 level) after {settle_times.max():.1f} s.")
+
+    source = FakeVideoSource(scene, noise=1.0, warmup_frames=0, fps=10, seed=0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        camera.calibrate(settle_time=0.0)
+        detector = wait_until_settled(
+            camera,
+            positions,
+            wells,
+            radius=3,
+            tolerance=2.0,
+            window=2.0,
+            sample_interval=0.1,
+            timeout=60.0,
+        )
+
+    times, trajectories = detector.trajectory()
+    print(f"{len(times)} samples of {trajectories.shape[1]} wells were taken.")
+    print(
+        "Largest difference from the final colours: "
+        f"{np.abs(detector.colours() - final_colours).max():.1f} levels"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+A script to test the transfer learning warm start of the optobot package on a
+mock robot. First, the data of several past colour mixing experiments (towards
+other target colours) is simulated. An optimisation towards a new target colour
+is then run with the GP surrogate starting from nothing, and with a model of
+the measurements pre-trained on the past experiments, and the number of
+iterations until the target is reached is compared.
+
+Run on the command line as: python -m tests.simulate_transfer
+
+"""
+
+import shutil
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+
+DATA_DIR = "tests/test_results_data/transfer"
+
+LIQUID_NAMES = ["water", "blue", "yellow", "red"]
+MEASURED_PARAMETER_NAMES = ["measured_red", "measured_green", "measured_blue"]
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TOTAL_VOLUME = 90.0
+
+# the absorbance of the blue, yellow and red dyes in the red, green and blue channels
+ABSORBANCE = np.array([[2.0, 0.3, 0.1], [0.1, 0.4, 2.2], [0.2, 2.0, 1.5]])
+
+
+def mix_colours(liquid_volumes):
+    """
+    Returns the RGB colour of wells of dyes (Beer-Lambert law), from the liquid volumes (water first).
+    """
+
+    fractions = liquid_volumes[:, 1:] / TOTAL_VOLUME
+    return 255 * np.exp(-fractions @ ABSORBANCE)
+
+
+def colour_measurement(
+    liquid_volumes, iteration_count, population_size, num_measured_parameters, exp_data_dir
+):
+    return mix_colours(liquid_volumes)
+
+
+def past_experiment(name, rng, num_iterations=2, batch_size=24):
+    """
+    Simulates the data of a past experiment, of random wells towards a random target colour.
+    """
+
+    target = rng.uniform(40, 220, 3)
+    loop = OptimisationLoop(
+        objective_function=lambda measurements: ((measurements - target) ** 2).sum(axis=1),
+        liquid_names=LIQUID_NAMES,
+        measured_parameter_names=MEASURED_PARAMETER_NAMES,
+        target_measurement=None,
+        name=f"{DATA_DIR}/past/{name}",
+    )
+    for i in range(num_iterations):
+        liquid_volumes = loop.add_water(rng.uniform(0, 30, (batch_size, 3)))
+        wells = loop.allocator.allocate(batch_size, i + 1)
+        loop.record(wells, liquid_volumes, mix_colours(liquid_volumes))
+
+
+def main():
+
+    pd.set_option("display.width", 120)
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(0)
+
+    for k in range(4):
+        past_experiment(f"past_{k}", rng)
+
+    # the colour of a recipe that has not been tried before
+    target = mix_colours(np.array([[50.0, 12.0, 14.0, 14.0]]))[0].round(1)
+    print(f"New target colour: {target}")
+
+    with MockOT2Server(run_duration=0.05) as server:
+        for warm_start in [None, [f"{DATA_DIR}/past"]]:
+            model = OptimisationLoop(
+                objective_function=lambda measurements: ((measurements - target) ** 2).sum(axis=1),
+                liquid_names=LIQUID_NAMES,
+                measured_parameter_names=MEASURED_PARAMETER_NAMES,
+                target_measurement=target,
+                relative_tolerance=0.03,
+                population_size=8,
+                name=f"{DATA_DIR}/new_target",
+                measurement_function=colour_measurement,
+                robot=OT2Client(server.host, server.port),
+            )
+            started = "pre-trained on the past experiments" if warm_start else "starting from nothing"
+            print(f"\nOptimisation with GP, {started}:")
+            start = time.perf_counter()
+            stop = model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=10, warm_start=warm_start)
+            print(
+                f"Stopped by rule '{None if stop is None else stop.rule}' after {model.iteration_count} "
+                f"iteration(s) ({model.num_wells_used} wells, {time.perf_counter() - start:.1f} s)."
+            )
+
+            all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+            all_data = all_data[all_data["iteration_number"] > 0]
+            print("Best error after each iteration:")
+            print(all_data.groupby("iteration_number")["error"].min().cummin().round(1).to_string())
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
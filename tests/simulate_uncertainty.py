@@ -0,0 +1,186 @@
+"""
+A script to test how the optobot package uses the uncertainty of the
+measurements, without a camera or robot. First, "get_multi_plate_colours"
+returns the standard error of the colours of wells on simulated plates, some of
+which are noisier than the others, and its propagation through a colour
+calibration is checked. Then the GP optimiser is run on a colour mixing
+problem whose measurements are much noisier in one part of the search space,
+with and without the uncertainty as the noise of each point, and the true
+errors of the recommended liquid volumes are compared. Finally, a short
+optimisation is run on a mock robot: the uncertainty is stored in
+"all_data.csv" and, with noise_sigmas=2, the loop stops once the measurements
+are within noise of the target.
+
+Run on the command line as: python -m tests.simulate_uncertainty
+
+"""
+
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from optobot.automate import OptimisationLoop
+from optobot.colorimetric.calibration import ColourCalibration
+from optobot.colorimetric.colours import get_multi_plate_colours
+from optobot.colorimetric.image_capture.camera import CameraService, FakeVideoSource
+from optobot.colorimetric.image_processing.localisation import locate_plates
+from optobot.colorimetric.image_processing.overlays import wait_for_overlays
+from optobot.measurement import MeasurementResult
+from optobot.optimisation.optimisers import SkoptAskTell
+from optobot.ot2_client import OT2Client
+from optobot.ot2_mock_server import MockOT2Server
+from tests.simulate_multiplate import deck_frame
+
+DATA_DIR = "tests/test_results_data/uncertainty"
+
+SEARCH_SPACE = [[0.0, 30.0]] * 3
+TARGET = np.array([14.0, 20.0, 15.0])
+
+
+def objective_function(measurements):
+    return ((measurements - TARGET) ** 2).sum(axis=1)
+
+
+def measurement_noise(liquid_volumes):
+    """
+    The standard deviation of the measurements: small, except where there is little of the first liquid (as for a dye
+    that only gives a faint, noisy colour when diluted), which includes the target.
+    """
+
+    return np.where(liquid_volumes[:, :1] < 18.0, 6.0, 0.5) * np.ones((1, 3))
+
+
+def compare_noise_models(seed, use_noise, num_iterations=6, population_size=8):
+    """
+    Runs the GP on noisy measurements (the liquid volumes plus noise), and returns the true error of the liquid volumes
+    that the final surrogate predicts to be best among those measured.
+    """
+
+    rng = np.random.default_rng(seed)
+    optimiser = SkoptAskTell(SEARCH_SPACE, "GP", population_size)
+    optimiser.opt.rng.seed(seed)
+
+    for _ in range(num_iterations):
+        points = optimiser.ask()
+        std = measurement_noise(points)
+        measurements = points + rng.normal(0.0, std)
+        errors = objective_function(measurements)
+
+        # the uncertainty of a squared error, as propagated by OptimisationLoop
+        error_std = np.sqrt((4 * (measurements - TARGET) ** 2 * std**2 + 2 * std**4).sum(axis=1))
+        optimiser.tell(points, errors, error_std if use_noise else None)
+
+    told = np.array(optimiser.opt.Xi)
+    predicted = optimiser.opt.models[-1].predict(optimiser.opt.space.transform(told.tolist()))
+    best = told[np.argmin(predicted)]
+
+    return objective_function(best[np.newaxis])[0]
+
+
+def main():
+
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    # the standard error of the colours of wells A1 to A4, of which A2 and A4 are noisy
+    rng = np.random.default_rng(0)
+    slots = [5, 8]
+    frame, _ = deck_frame(slots)
+    lattice = locate_plates(frame, slots)[5]
+    for x, y in np.round(lattice.centres[0, [1, 3]]).astype(int):
+        patch = frame[y - 4 : y + 5, x - 4 : x + 5].astype(float)
+        frame[y - 4 : y + 5, x - 4 : x + 5] = np.clip(
+            patch + rng.normal(0, 15, patch.shape), 0, 255
+        ).astype(np.uint8)
+
+    wells = np.array([[0, 0, 0], [0, 0, 1], [0, 0, 2], [0, 0, 3]])
+    source = FakeVideoSource(frame, noise=0.0, warmup_frames=0, flicker=0.0)
+    with CameraService(source=source, warmup_frames=0) as camera:
+        result = get_multi_plate_colours(
+            0,
+            len(wells),
+            3,
+            DATA_DIR,
+            slots,
+            wells=wells,
+            camera=camera,
+            uncertainty=True,
+        )
+        # a calibration that doubles the contrast doubles the standard error of the colours as well
+        calibration = ColourCalibration(np.vstack([2 * np.eye(3), -128 * np.ones(3)]))
+        calibrated = get_multi_plate_colours(
+            1,
+            len(wells),
+            3,
+            DATA_DIR,
+            slots,
+            wells=wells,
+            camera=camera,
+            calibration=calibration,
+            uncertainty=True,
+        )
+    print("get_multi_plate_colours on wells A1 to A4 (A2 and A4 are noisy):")
+    print(
+        pd.DataFrame(
+            np.hstack([result.measurements, result.uncertainty]).round(2),
+            index=["A1", "A2", "A3", "A4"],
+            columns=["red", "green", "blue", "red_se", "green_se", "blue_se"],
+        )
+    )
+    assert np.allclose(calibrated.uncertainty, 2 * result.uncertainty)
+    print("With a calibration that doubles the contrast, the standard errors are doubled.")
+    wait_for_overlays()
+    shutil.rmtree(DATA_DIR)
+
+    # the GP with and without the uncertainty as the noise of each point
+    seeds = range(6)
+    results = pd.DataFrame(
+        {
+            "homoscedastic": [compare_noise_models(seed, False) for seed in seeds],
+            "heteroscedastic": [compare_noise_models(seed, True) for seed in seeds],
+        },
+        index=pd.Index(seeds, name="seed"),
+    )
+    print("\nTrue error of the liquid volumes recommended by the GP after 6 iterations of 8 wells:")
+    print(results.round(1))
+    print(results.median().rename("median").round(1).to_frame().T)
+
+    # an optimisation on a mock robot, which stops once the measurements are within noise of the target
+    rng = np.random.default_rng(1)
+
+    def noisy_measurement(
+        liquid_volumes, iteration_count, population_size, num_measured_parameters, exp_data_dir
+    ):
+        # the liquid volumes (without water) serve as the measurements
+        std = np.full((len(liquid_volumes), num_measured_parameters), 1.5)
+        return MeasurementResult(liquid_volumes[:, 1:] + rng.normal(0, std), std)
+
+    with MockOT2Server(run_duration=0.1) as server:
+        model = OptimisationLoop(
+            objective_function=objective_function,
+            liquid_names=["water", "blue", "yellow", "red"],
+            measured_parameter_names=["measured_red", "measured_green", "measured_blue"],
+            target_measurement=TARGET,
+            relative_tolerance=0.0,
+            population_size=8,
+            name=f"{DATA_DIR}/noisy_experiment",
+            measurement_function=noisy_measurement,
+            robot=OT2Client(server.host, server.port),
+            noise_sigmas=2.0,
+        )
+        print("\nOptimisation with GP, stopping within 2 standard deviations of the target:")
+        model.optimise(SEARCH_SPACE, optimiser="GP", num_iterations=10)
+
+    all_data = pd.read_csv(f"{model.exp_data_dir}/all_data.csv", index_col=0)
+    all_data = all_data[all_data["iteration_number"] > 0]
+    print(f"\nThe last wells of all_data.csv ({int(all_data['iteration_number'].max())} iterations):")
+    print(all_data.drop(columns=[f"vol_{name}" for name in model.liquid_names]).tail(4).round(2))
+
+    shutil.rmtree(DATA_DIR)
+
+
+if __name__ == "__main__":
+    main()
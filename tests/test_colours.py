@@ -2,15 +2,25 @@ import os
 
 from optobot.colorimetric.image_processing.contours_adapted import well_detection
 from optobot.colorimetric.image_processing.extrapolated_grid import ExtrapolatedGrid
+from optobot.colorimetric.image_processing.fixed_grid import PLATE
 
 
 def test_get_colours(
-    iteration_count, population_size, num_measured_parameters, data_dir
+    iteration_count,
+    population_size,
+    num_measured_parameters,
+    data_dir,
+    wells=None,
+    plate=PLATE,
 ):
     """
     Assuming the webcam is mounted to the top of the robot and ready to go, this function takes a picture of the wellplate,
     extracts the rgb-values of each of the wells (even if not all are filled), and returns the colors of only the wells that are part of this iteration.
 
+    If wells is given (an array of (wellplate index, row, column) per well, as passed by OptimisationLoop), the colours of exactly
+    those wells are returned.
+    plate is the geometry of the well plate (see optobot.labware.get_plate_geometry), 96 wells by default.
+
     """
 
     # get the start and end-indices to index a flattened color array. When the iteration count exceeds that of only one-wellplate, take the modulus such that the correct index is found.
@@ -33,7 +43,13 @@ def test_get_colours(
         # Repeats until desired result
         print("Type threshold (Default is 30):")
         threshold = int(input())
-        rgb_values = well_detection(captured_im_path, detected_wells_figs_path, threshold)
+        rgb_values = well_detection(
+            captured_im_path,
+            detected_wells_figs_path,
+            threshold,
+            plate["columns"],
+            plate["rows"],
+        )
 
         print("\nHappy with detection?")
         print(
@@ -43,11 +59,15 @@ def test_get_colours(
         if user == "y":
             inp = user
         elif user == "b":
-            planB_processor = ExtrapolatedGrid(captured_im_path, detected_wells_figs_path)
+            planB_processor = ExtrapolatedGrid(
+                captured_im_path,
+                detected_wells_figs_path,
+                grid_shape=(plate["rows"], plate["columns"]),
+            )
             rgb_values = planB_processor.run()
             # accounts for overlap for multiple well plates
-            start_index = start_index % (96 * num_measured_parameters)
-            end_index = end_index % (96 * num_measured_parameters)
+            start_index = start_index % (plate["wells"] * num_measured_parameters)
+            end_index = end_index % (plate["wells"] * num_measured_parameters)
             inp = "y"
         else:
             inp = ""
@@ -55,9 +75,16 @@ def test_get_colours(
         # to check the script works without the robot/actual data, uncomment the line below and comment out the 4 lines above.
         # rgb_values = np.random.rand(self.wellplate_shape[0], self.wellplate_shape[1], 3)
 
-        iteration_colours = rgb_values.flatten()[start_index:end_index]
-        iteration_colours = iteration_colours.reshape(
-            population_size, num_measured_parameters
-        )
+        if wells is not None:
+            # each image shows one wellplate, so index the wells by their row and column only
+            flat_wells = wells[:, 1] * plate["columns"] + wells[:, 2]
+            iteration_colours = rgb_values.reshape(-1, num_measured_parameters)[
+                flat_wells
+            ]
+        else:
+            iteration_colours = rgb_values.flatten()[start_index:end_index]
+            iteration_colours = iteration_colours.reshape(
+                population_size, num_measured_parameters
+            )
 
     return iteration_colours
@@ -109,6 +109,7 @@ def main():
         population_size,
         num_measured_parameters,
         data_dir,
+        wells=None,
     ):
         """
         The measurement function for measuring experimental products.
@@ -136,6 +137,10 @@ def main():
         data_dir : string
             The directory for storing the experimental data.
 
+        wells : np.ndarray, int[population_size, 3]
+            The (well plate index, row, column) of each well in the current
+            iteration.
+
         Returns
         -------
         np.ndarray, float[population_size, num_measured_parameters]
@@ -143,7 +148,7 @@ def main():
         """
 
         return test_get_colours(
-            iteration_count, population_size, num_measured_parameters, data_dir
+            iteration_count, population_size, num_measured_parameters, data_dir, wells
         )
     
     def test_measurement_function(